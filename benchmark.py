@@ -0,0 +1,628 @@
+import argparse
+import gzip
+import json
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Tuple
+from urllib.robotparser import RobotFileParser
+import requests
+from bs4 import BeautifulSoup, CData, NavigableString, Script, Stylesheet, TemplateString
+from scraper.aggregates import SiteReport, build_site_report, merge_site_reports
+from scraper.coverage import WordIndex, normalize_words
+from scraper.differential import create_analysis_modes, format_differences, read_golden_snapshot, run_differential, \
+    take_golden_snapshot, write_golden_snapshot
+from scraper.dns_cache import DnsCache
+from scraper.doc_analyser import DocAnalyser, DocTooLargeError, max_doc_size_for_memory
+from scraper.doc_fetcher import ConditionalFetch, create_http2_fetcher, create_pooled_fetcher
+from scraper.extractors import available_extractors, run_extractors
+from scraper.frontier import UrlFrontier
+from scraper.golden_corpus import generate_golden_corpus
+from scraper.load_testing import run_load_test
+from scraper.local_docs import analyse_local_docs, fetch_file_content, iter_warc_docs
+from scraper.monitor import CHANGED, PageMonitor
+from scraper.ngrams import SiteNgramStats, iter_ngrams
+from scraper.pipeline import AnalysisPipeline
+from scraper.robots import RobotsCache
+from scraper.server_farm import HostProfile, ServerFarm
+from scraper.service import AnalysisService, create_server
+from scraper.sitemap import iter_sitemap_urls
+from scraper.synthetic_docs import generate_html_doc
+from scraper.visible_text import get_visible_text
+
+
+def bench_warc(args: argparse.Namespace, work_dir: Path) -> None:
+    warc_file = work_dir / 'synthetic.warc'
+    with open(warc_file, 'wb') as file:
+        for page_index in range(args.pages):
+            body = generate_html_doc(args.seed + page_index, target_size=args.page_size)
+            http_block = b'HTTP/1.1 200 OK\r\nContent-Type: text/html\r\n\r\n' + body
+            file.write(
+                b'WARC/1.0\r\nWARC-Type: response\r\n'
+                + f'WARC-Target-URI: http://synthetic.test/{page_index}\r\n'.encode()
+                + f'Content-Length: {len(http_block)}\r\n\r\n'.encode()
+                + http_block + b'\r\n\r\n'
+            )
+    archive_size = warc_file.stat().st_size
+
+    # I/O only: walk every record and touch every payload byte
+    started_at = time.perf_counter()
+    payloads_size = sum(len(bytes(doc.payload)) for doc in iter_warc_docs(warc_file))
+    io_duration = time.perf_counter() - started_at
+
+    started_at = time.perf_counter()
+    summaries_count = sum(1 for _ in analyse_local_docs(DocAnalyser(fetch_file_content), iter_warc_docs(warc_file)))
+    analysis_duration = time.perf_counter() - started_at
+
+    print(f'Archive: {archive_size / 1e6:.1f} MB, {summaries_count} pages ({payloads_size / 1e6:.1f} MB of HTML)')
+    print(f'Records iteration: {io_duration:.3f}s ({archive_size / 1e6 / io_duration:.0f} MB/s)')
+    print(f'Full analysis: {analysis_duration:.3f}s ({summaries_count / analysis_duration:.1f} pages/s)')
+    print(f'I/O share of the analysis pass: {io_duration / analysis_duration:.1%}')
+
+
+def bench_sitemap(args: argparse.Namespace, work_dir: Path) -> None:
+    sitemap_file = work_dir / 'sitemap.xml.gz'
+    entries_count = 50_000
+    with gzip.open(sitemap_file, 'wt') as file:
+        file.write('<?xml version="1.0" encoding="UTF-8"?>')
+        file.write('<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">')
+        for index in range(entries_count):
+            file.write(f'<url><loc>http://synthetic.test/{index}</loc><lastmod>2017-11-05</lastmod></url>')
+        file.write('</urlset>')
+
+    tracemalloc.start()
+    started_at = time.perf_counter()
+    urls_count = sum(1 for _ in iter_sitemap_urls(str(sitemap_file)))
+    duration = time.perf_counter() - started_at
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f'Sitemap: {entries_count} entries ({sitemap_file.stat().st_size / 1e6:.1f} MB gzipped)')
+    print(f'Streaming parse: {duration:.3f}s ({urls_count / duration:.0f} URLs/s)')
+    print(f'Peak memory: {peak_memory / 1e3:.0f} KB')
+
+
+def bench_pipeline(args: argparse.Namespace, work_dir: Path) -> None:
+    pages = {f'http://synthetic.test/{index}': generate_html_doc(args.seed + index, target_size=args.page_size)
+             for index in range(args.pages)}
+
+    def doc_fetcher(url: str) -> bytes:
+        # Simulated network latency
+        time.sleep(0.02)
+        return pages[url]
+
+    for fetch_workers, parse_workers in ((8, 0), (8, 2), (16, 4)):
+        pipeline = AnalysisPipeline(DocAnalyser(doc_fetcher), fetch_workers=fetch_workers, parse_workers=parse_workers)
+        started_at = time.perf_counter()
+        results_count = sum(1 for _ in pipeline.run(pages))
+        duration = time.perf_counter() - started_at
+        print(f'{fetch_workers} fetchers, {parse_workers} parsing processes: {results_count / duration:.1f} pages/s')
+        for stage_stats in pipeline.stats():
+            print(f'  {stage_stats.name}: {stage_stats.utilization:.0%} busy, '
+                  f'input queue peak {stage_stats.max_input_queue_depth}/{stage_stats.input_queue_size}')
+
+
+def bench_memory(args: argparse.Namespace, work_dir: Path) -> None:
+    memory_budget = 32_000_000
+    # The peak memory per document byte, measured on a sample page (with a margin), gives the document size limit
+    sample_summary = DocAnalyser(None, measure_memory=True).analyse_doc(
+        generate_html_doc(args.seed, target_size=200_000)
+    )
+    peak_memory_per_doc_byte = 1.25 * sample_summary.peak_memory / sample_summary.doc_size
+    max_doc_size = max_doc_size_for_memory(memory_budget, peak_memory_per_doc_byte)
+    analyser = DocAnalyser(None, max_doc_size=max_doc_size, html_only=True, measure_memory=True)
+    print(f'Memory budget: {memory_budget / 1e6:.1f} MB per document, measured peak memory per document byte: '
+          f'{peak_memory_per_doc_byte:.1f} (with a 25% margin) -> documents up to {max_doc_size / 1e6:.2f} MB')
+
+    over_budget_count = 0
+    for page_index, size_ratio in enumerate((0.05, 0.25, 0.95, 2.5, 10)):
+        html_doc = generate_html_doc(args.seed + page_index + 1, target_size=int(size_ratio * max_doc_size))
+        started_at = time.perf_counter()
+        try:
+            summary = analyser.analyse_doc(html_doc)
+        except DocTooLargeError:
+            print(f'{len(html_doc) / 1e6:5.2f} MB page: rejected in {(time.perf_counter() - started_at) * 1e6:.0f}µs')
+            continue
+        over_budget_count += summary.peak_memory > memory_budget
+        print(f'{len(html_doc) / 1e6:5.2f} MB page: peak memory {summary.peak_memory / 1e6:.1f} MB '
+              f'({summary.peak_memory / memory_budget:.0%} of the budget, '
+              f'{summary.peak_memory / len(html_doc):.1f}x the page size)')
+    if over_budget_count:
+        print(f'Budget NOT held: {over_budget_count} documents went over it')
+    else:
+        print('Budget held: every analysed document stayed within it')
+
+
+def bench_service(args: argparse.Namespace, work_dir: Path) -> None:
+    rng = random.Random(args.seed)
+    pages = {f'http://synthetic.test/{index}': generate_html_doc(args.seed + index, target_size=args.page_size)
+             for index in range(args.pages)}
+
+    def doc_fetcher(url: str) -> bytes:
+        # Simulated network latency
+        time.sleep(0.05)
+        return pages[url]
+
+    service = AnalysisService(DocAnalyser(doc_fetcher), workers=8, cache_ttl=1)
+    server = create_server(service, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    service_url = f'http://127.0.0.1:{server.server_address[1]}/analyse'
+
+    # A few hot pages are requested much more often than the other ones
+    requested_urls = rng.choices(list(pages), weights=[1 / (rank + 1) for rank in range(len(pages))], k=1000)
+    clients_count = 32
+
+    def client(urls: list) -> None:
+        with requests.Session() as session:
+            for url in urls:
+                session.get(service_url, params={'url': url})
+
+    started_at = time.perf_counter()
+    clients = [threading.Thread(target=client, args=(requested_urls[index::clients_count],))
+               for index in range(clients_count)]
+    for client_thread in clients:
+        client_thread.start()
+    for client_thread in clients:
+        client_thread.join()
+    duration = time.perf_counter() - started_at
+    server.shutdown()
+    server.server_close()
+
+    metrics = service.metrics()
+    print(f'{len(requested_urls)} requests from {clients_count} clients: {len(requested_urls) / duration:.0f} requests/s')
+    print('Latency: ' + ', '.join(f'{name} {value}ms' for name, value in metrics['latency_ms'].items()))
+    print(f'Coalesced requests: {metrics["coalesced_requests"]}, cache hit rate: {metrics["cache"]["hit_rate"]:.1%}')
+
+
+def bench_robots(args: argparse.Namespace, work_dir: Path) -> None:
+    rng = random.Random(args.seed)
+    sections = [f'section-{index}' for index in range(100)]
+    robots_lines = ['User-agent: *']
+    for section in sections:
+        robots_lines.append(f'Disallow: /{section}/private/')
+        robots_lines.append(f'Allow: /{section}/private/public-{rng.randint(0, 99)}.html')
+        robots_lines.append(f'Disallow: /{section}/*.pdf$')
+    robots_txt = '\n'.join(robots_lines)
+    paths = [f'/{rng.choice(sections)}/{rng.choice(("private", "public", "docs"))}/page-{index}.'
+             f'{rng.choice(("html", "pdf"))}' for index in range(10_000)]
+
+    robots_cache = RobotsCache(robots_fetcher=lambda url, user_agent: (robots_txt, 200))
+    urls = [f'http://synthetic.test{path}' for path in paths]
+    robots_cache.is_allowed(urls[0])
+    started_at = time.perf_counter()
+    allowed_count = sum(robots_cache.is_allowed(url) for url in urls)
+    duration = time.perf_counter() - started_at
+    print(f'{len(robots_lines) - 1} rules, {len(urls)} checks: {duration / len(urls) * 1e6:.1f}µs per check '
+          f'({allowed_count} allowed, {robots_cache.fetches_count} robots.txt fetch)')
+
+    reference_parser = RobotFileParser()
+    reference_parser.parse(robots_lines)
+    started_at = time.perf_counter()
+    for url in urls:
+        reference_parser.can_fetch('*', url)
+    reference_duration = time.perf_counter() - started_at
+    print(f'urllib.robotparser (no wildcards support): {reference_duration / len(urls) * 1e6:.1f}µs per check')
+
+
+def bench_monitor(args: argparse.Namespace, work_dir: Path) -> None:
+    pages = {f'http://synthetic.test/page-{seed}': generate_html_doc(seed, args.page_size)
+             for seed in range(args.seed, args.seed + args.pages)}
+
+    def conditional_fetcher(url: str, etag: str = None, last_modified: str = None) -> ConditionalFetch:
+        # No validators: the monitor has to rely on its content fingerprints
+        return ConditionalFetch(modified=True, content=pages[url], etag=None, last_modified=None)
+
+    analyser = DocAnalyser(pages.get)
+    started_at = time.perf_counter()
+    for url in pages:
+        analyser.analyse(url)
+    full_pass_duration = time.perf_counter() - started_at
+    print(f'Full analysis pass: {full_pass_duration:.2f}s')
+
+    monitor = PageMonitor(str(work_dir / 'monitor.db'), analyser, conditional_fetcher, workers=1)
+    list(monitor.check(pages))
+    started_at = time.perf_counter()
+    list(monitor.check(pages))
+    unchanged_duration = time.perf_counter() - started_at
+    print(f'Monitoring cycle, unchanged pages: {unchanged_duration:.2f}s '
+          f'({unchanged_duration / full_pass_duration:.1%} of a full pass)')
+
+    rng = random.Random(args.seed)
+    for url in rng.sample(list(pages), len(pages) // 10):
+        pages[url] = pages[url].replace(b'</title>', b' (updated)</title>', 1)
+    started_at = time.perf_counter()
+    changed_count = sum(change.status == CHANGED for change in monitor.check(pages))
+    changed_duration = time.perf_counter() - started_at
+    print(f'Monitoring cycle, {changed_count} pages with a new title: {changed_duration:.2f}s '
+          f'({changed_duration / full_pass_duration:.1%} of a full pass)')
+    monitor.close()
+
+
+def bench_ngrams(args: argparse.Namespace, work_dir: Path) -> None:
+    analyser = DocAnalyser(None)
+    summaries = [analyser.analyse_doc(generate_html_doc(seed, args.page_size, zipf_exponent=1.1))
+                 for seed in range(args.seed, args.seed + args.pages)]
+
+    tracemalloc.start()
+    exact_counts = {n: Counter() for n in (2, 3)}
+    for summary in summaries:
+        words = summary.words
+        for n, counter in exact_counts.items():
+            counter.update(iter_ngrams(words, n))
+    exact_memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f'Exact counts: {sum(map(len, exact_counts.values()))} distinct n-grams, {exact_memory / 1e6:.1f} MB')
+
+    for error_rate in (0.01, 0.001, 0.0001):
+        tracemalloc.start()
+        site_stats = SiteNgramStats(sizes=(2, 3), error_rate=error_rate)
+        for summary in summaries:
+            site_stats.add(summary)
+        sketch_memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        recalls, max_errors = [], []
+        for n, counter in exact_counts.items():
+            top_ngrams = {ngram for ngram, count in counter.most_common(20)}
+            estimates = site_stats.most_common(n, 20)
+            recalls.append(len(top_ngrams & {estimate.item for estimate in estimates}) / len(top_ngrams))
+            max_errors.append(max(estimate.count - counter[estimate.item] for estimate in estimates) / site_stats.max_error(n))
+        print(f'Error rate {error_rate}: {sketch_memory / 1e6:.2f} MB ({sketch_memory / exact_memory:.1%} of exact), '
+              f'top 20 recall {min(recalls):.0%}, worst error at {max(max_errors):.0%} of the bound')
+
+
+def bench_approximate(args: argparse.Namespace, work_dir: Path) -> None:
+    for page_index, page_size in enumerate((1_000_000, 5_000_000, 20_000_000)):
+        html_doc = generate_html_doc(args.seed + page_index, target_size=page_size, zipf_exponent=1.1)
+        started_at = time.perf_counter()
+        exact_summary = DocAnalyser(None).analyse_doc(html_doc)
+        exact_duration = time.perf_counter() - started_at
+        started_at = time.perf_counter()
+        word_stats = DocAnalyser(None, approximate_above=0).analyse_doc(html_doc).word_stats
+        approximate_duration = time.perf_counter() - started_at
+        peak_memory = DocAnalyser(None, approximate_above=0, measure_memory=True).analyse_doc(html_doc).peak_memory
+
+        unique_words_error = word_stats.unique_word_count.value / exact_summary.unique_word_count - 1
+        exact_counts = dict(exact_summary.most_common_5_words)
+        top_words_errors = [estimate.value / exact_counts[word] - 1 for word, estimate in word_stats.most_common_5_words
+                            if word in exact_counts]
+        print(f'{len(html_doc) / 1e6:5.1f} MB page: exact {exact_duration:.2f}s, approximate {approximate_duration:.2f}s '
+              f'({exact_duration / approximate_duration:.1f}x faster), peak memory {peak_memory / 1e6:.1f} MB '
+              f'(decoded text and extracted links included)')
+        print(f'  unique words: {unique_words_error:+.1%} (bound ±{word_stats.unique_word_count.error}), '
+              f'top 5 words counts: {", ".join(f"{error:+.1%}" for error in top_words_errors)}')
+
+
+def bench_extractors(args: argparse.Namespace, work_dir: Path) -> None:
+    html_docs = [generate_html_doc(seed, args.page_size) for seed in range(args.seed, args.seed + args.pages)]
+    analyser = DocAnalyser(None, extractors=available_extractors())
+    extractors_count = len(analyser.create_extractors())
+    soups = [BeautifulSoup(html_doc, 'html.parser') for html_doc in html_docs]
+
+    def run_single_pass(extractor_names: Iterable[str]) -> float:
+        started_at = time.perf_counter()
+        for soup in soups:
+            run_extractors(soup, DocAnalyser(None, extractors=extractor_names).create_extractors())
+        return (time.perf_counter() - started_at) / len(soups)
+
+    run_single_pass(())
+    builtin_duration = run_single_pass(())
+    all_duration = run_single_pass(analyser.extractors)
+    started_at = time.perf_counter()
+    for soup in soups:
+        # What we used to do: one `find_all()` walk per extracted field
+        for extractor in analyser.create_extractors():
+            for tag in soup.find_all(extractor.tags):
+                extractor.handle_tag(tag)
+    walks_duration = (time.perf_counter() - started_at) / len(soups)
+    print(f'Built-in extractors (meta tags, links), single traversal: {builtin_duration * 1000:.2f}ms per page')
+    print(f'{extractors_count} extractors, single traversal: {all_duration * 1000:.2f}ms per page '
+          f'({all_duration / builtin_duration:.1f}x)')
+    print(f'{extractors_count} extractors, one walk each: {walks_duration * 1000:.2f}ms per page '
+          f'({walks_duration / builtin_duration:.1f}x)')
+
+    started_at = time.perf_counter()
+    summaries = [analyser.analyse_doc(html_doc) for html_doc in html_docs]
+    analysis_duration = (time.perf_counter() - started_at) / len(html_docs)
+    timings = Counter()
+    for summary in summaries:
+        timings.update(summary.extractor_timings)
+    print(f'Whole analysis with {extractors_count} extractors: {analysis_duration * 1000:.2f}ms per page, of which:')
+    for name, duration in timings.most_common():
+        print(f'  {name}: {duration / len(summaries) * 1000:.3f}ms')
+
+
+def bench_aggregates(args: argparse.Namespace, work_dir: Path) -> None:
+    workers_count = 4
+    analyser = DocAnalyser(None)
+    results = [(f'http://synthetic.test/page-{seed}', analyser.analyse_doc(generate_html_doc(seed, args.page_size,
+                                                                                          zipf_exponent=1.1)))
+               for seed in range(args.seed, args.seed + args.pages)]
+
+    # "Map": each worker builds the report of its share of the pages, and ships it serialised
+    started_at = time.perf_counter()
+    shipped_reports = [build_site_report(results[worker_index::workers_count]).to_bytes()
+                       for worker_index in range(workers_count)]
+    map_duration = time.perf_counter() - started_at
+    summaries_size = sum(len(json.dumps(summary.to_dict())) for url, summary in results)
+    print(f'{workers_count} workers: {map_duration / len(results) * 1000:.2f}ms per page, reports of '
+          f'{sum(map(len, shipped_reports)) / workers_count / 1000:.0f} KB each '
+          f'(vs {summaries_size / 1e6:.1f} MB of JSON summaries)')
+
+    # "Reduce"
+    started_at = time.perf_counter()
+    site_report = merge_site_reports(SiteReport.from_bytes(report_bytes) for report_bytes in shipped_reports)
+    print(f'Merge: {(time.perf_counter() - started_at) * 1000:.0f}ms')
+
+    exact_words = Counter(word for url, summary in results for word in summary.words)
+    top_words = [heavy_hitter.item for heavy_hitter in site_report.words.most_common(20)]
+    print(f'Distinct words: ~{site_report.unique_words.count():.0f} (exact: {len(exact_words)}), '
+          f'top 20 words recall: {len(set(top_words) & {word for word, count in exact_words.most_common(20)}) / 20:.0%}')
+
+
+def bench_http2(args: argparse.Namespace, work_dir: Path) -> None:
+    try:
+        from scraper.local_h2_server import LocalHttp2Server
+        create_http2_fetcher()
+    except ImportError:
+        print('Skipped: needs httpx[http2]')
+        return
+    concurrency = 32
+    response_delay = 0.05
+    pages = {f'/page-{seed}': ('text/html', generate_html_doc(seed, args.page_size))
+             for seed in range(args.seed, args.seed + args.pages)}
+
+    def fetch_all(doc_fetcher: Callable[[str], bytes], base_url: str) -> float:
+        started_at = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            fetched_size = sum(map(len, executor.map(doc_fetcher, (f'{base_url}{path}' for path in pages))))
+        assert fetched_size == sum(len(body) for content_type, body in pages.values())
+        return len(pages) / (time.perf_counter() - started_at)
+
+    http1_connections_count = 0
+
+    class Http1Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def setup(self):
+            nonlocal http1_connections_count
+            http1_connections_count += 1
+            super().setup()
+
+        def do_GET(self):
+            time.sleep(response_delay)
+            content_type, body = pages[self.path]
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    http1_server = ThreadingHTTPServer(('127.0.0.1', 0), Http1Handler)
+    threading.Thread(target=http1_server.serve_forever, daemon=True).start()
+    try:
+        for pool_size in (10, concurrency):
+            http1_connections_count = 0
+            pages_per_second = fetch_all(create_pooled_fetcher(pool_size=pool_size),
+                                         f'http://127.0.0.1:{http1_server.server_address[1]}')
+            print(f'HTTP/1.1, pool of {pool_size}: {pages_per_second:.1f} pages/s, '
+                  f'{http1_connections_count} connections')
+    finally:
+        http1_server.shutdown()
+        http1_server.server_close()
+
+    with LocalHttp2Server(pages, response_delay=response_delay) as http2_server:
+        pages_per_second = fetch_all(create_http2_fetcher(prior_knowledge=True), http2_server.url)
+        print(f'HTTP/2: {pages_per_second:.1f} pages/s, {http2_server.connections_count} connections')
+
+
+def bench_frontier(args: argparse.Namespace, work_dir: Path) -> None:
+    urls_count = 1_000_000
+    db_path = str(work_dir / 'frontier.db')
+    frontier = UrlFrontier(db_path, capacity=urls_count + 100_000)
+
+    tracemalloc.start()
+    started_at = time.perf_counter()
+    added_count = frontier.add(f'http://synthetic.test/section-{index % 1000}/page-{index}' for index in range(urls_count))
+    add_duration = time.perf_counter() - started_at
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'Added {added_count} URLs: {urls_count / add_duration:.0f} URLs/s, peak Python memory: {peak_memory / 1e6:.1f} MB '
+          f'(+ {Path(f"{db_path}.bloom").stat().st_size / 1e6:.1f} MB memory-mapped Bloom filter)')
+
+    started_at = time.perf_counter()
+    frontier.add(f'http://synthetic.test/section-{index % 1000}/page-{index}' for index in range(0, urls_count, 10))
+    false_positives_count = 100_000 - frontier.add(f'http://synthetic.test/other/page-{index}' for index in range(100_000))
+    print(f'Deduplication: {(urls_count // 10 + 100_000) / (time.perf_counter() - started_at):.0f} URLs/s, '
+          f'{false_positives_count / 100_000:.3%} of new URLs wrongly skipped')
+
+    started_at = time.perf_counter()
+    for _ in range(10):
+        for url in frontier.take(10_000):
+            frontier.mark_done(url)
+    print(f'Take and mark as done: {100_000 / (time.perf_counter() - started_at):.0f} URLs/s')
+    frontier.close()
+
+    started_at = time.perf_counter()
+    frontier = UrlFrontier(db_path, capacity=urls_count + 100_000)
+    stats = frontier.stats()
+    print(f'Resume: {(time.perf_counter() - started_at) * 1000:.0f}ms, {stats.pending} pending, {stats.done} done '
+          f'(database: {Path(db_path).stat().st_size / 1e6:.0f} MB)')
+    frontier.close()
+
+
+def bench_visible_text(args: argparse.Namespace, work_dir: Path) -> None:
+    # Modern pages: most of their bytes are inline scripts and styles
+    soups = [BeautifulSoup(generate_html_doc(seed, args.page_size, scripts_share=0.6), 'html.parser')
+             for seed in range(args.seed, args.seed + min(args.pages, 50))]
+
+    def old_tokenize(text: str) -> List[str]:
+        return [word.strip() for word in text.split(' ') if word]
+
+    # What the analyser used to do: before BeautifulSoup 4.10, `get_text()` included scripts and styles
+    all_string_types = (NavigableString, CData, Script, Stylesheet, TemplateString)
+    extractions = (
+        ('get_text() (BeautifulSoup < 4.10)', lambda soup: soup.get_text(types=all_string_types), old_tokenize),
+        ('get_text()', lambda soup: soup.get_text(), old_tokenize),
+        ('visible text', get_visible_text, str.split),
+    )
+    for name, extract_text, tokenize in extractions:
+        started_at = time.perf_counter()
+        texts = [extract_text(soup) for soup in soups]
+        extraction_duration = time.perf_counter() - started_at
+        started_at = time.perf_counter()
+        words_count = sum(sum(Counter(tokenize(text)).values()) for text in texts)
+        tokenization_duration = time.perf_counter() - started_at
+
+        tracemalloc.start()
+        Counter(tokenize(extract_text(soups[0])))
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f'{name}: {sum(map(len, texts)) / len(texts) / 1000:.0f} KB of text and {words_count // len(texts)} words '
+              f'per page, extraction: {extraction_duration / len(texts) * 1000:.2f}ms, tokenization: '
+              f'{tokenization_duration / len(texts) * 1000:.2f}ms, peak memory: {peak_memory / 1e3:.0f} KB')
+
+
+def bench_coverage(args: argparse.Namespace, work_dir: Path) -> None:
+    rng = random.Random(args.seed)
+    analyser = DocAnalyser(None)
+
+    def count_naively(words: List[str], phrases: List[Tuple[str, ...]]) -> List[int]:
+        # One pass over the words per keyword
+        return [sum(1 for index in range(len(words)) if tuple(words[index:index + len(phrase)]) == phrase)
+                for phrase in phrases]
+
+    for page_size in (50_000, 200_000, 800_000):
+        summary = analyser.analyse_doc(generate_html_doc(args.seed, page_size, zipf_exponent=1.1))
+        vocabulary = sorted(set(normalize_words(summary.body_content)))
+        for keywords_count in (10, 100, 500):
+            keywords = list(dict.fromkeys(' '.join(rng.sample(vocabulary, rng.choice((1, 1, 2, 3))))
+                                          for _ in range(keywords_count)))
+            started_at = time.perf_counter()
+            keyword_coverage = WordIndex(summary.body_content).keyword_coverage(keywords)
+            duration = time.perf_counter() - started_at
+
+            phrases = [tuple(normalize_words(keyword)) for keyword in keywords]
+            started_at = time.perf_counter()
+            naive_counts = count_naively(normalize_words(summary.body_content), phrases)
+            naive_duration = time.perf_counter() - started_at
+            assert [count for keyword, count in keyword_coverage.keywords] == naive_counts
+            print(f'{page_size / 1000:.0f} KB page, {keywords_count} keywords: {duration * 1000:.1f}ms '
+                  f'(one pass per keyword: {naive_duration * 1000:.0f}ms)')
+
+
+def bench_handoff(args: argparse.Namespace, work_dir: Path) -> None:
+    pages = {f'http://synthetic.test/{index}': generate_html_doc(args.seed + index, target_size=5_000_000)
+             for index in range(20)}
+    analysers = {
+        # Rejected as soon as they reach a parsing process: only the cost of handing them over is left
+        'handoff only': DocAnalyser(pages.get, max_doc_size=1),
+        'estimated': DocAnalyser(pages.get, approximate_above=1_000_000),
+    }
+
+    for analyser_label, analyser in analysers.items():
+        for label, share_bodies_above in (('pickled', None), ('shared memory', 256 * 1024)):
+            pipeline = AnalysisPipeline(analyser, fetch_workers=2, parse_workers=2, share_bodies_above=share_bodies_above)
+            started_at = time.perf_counter()
+            results_count = sum(1 for _ in pipeline.run(pages))
+            duration = time.perf_counter() - started_at
+            handoff_stats = pipeline.handoff.stats()
+            print(f'{analyser_label}, {label}: {results_count / duration:.1f} pages/s, '
+                  f'~{handoff_stats.estimated_copied_bytes_per_page / 1e6:.1f} MB copied per '
+                  f'{handoff_stats.body_bytes / handoff_stats.pages / 1e6:.1f} MB page')
+
+
+def bench_differential(args: argparse.Namespace, work_dir: Path) -> None:
+    analyser = DocAnalyser(None)
+    if args.update_golden:
+        golden_snapshot = read_golden_snapshot()
+        write_golden_snapshot(take_golden_snapshot(analyser.analyse_doc, golden_snapshot.seed,
+                                                   golden_snapshot.docs_per_category))
+        print('Golden summaries updated')
+    # The committed golden summaries are only those of their own seed: other corpora are compared to the reference
+    golden_snapshot = read_golden_snapshot()
+    golden_summaries = golden_snapshot.summaries if args.seed == golden_snapshot.seed else None
+    docs = generate_golden_corpus(args.seed)
+    print(f'{len(docs)} golden docs, {sum(len(doc.content) for doc in docs) / 1e6:.1f} MB')
+    for report in run_differential(docs, create_analysis_modes(analyser), analyser.analyse_doc,
+                                   golden_summaries=golden_summaries):
+        skipped_fields = ', '.join(sorted(report.skipped_fields)) or 'none'
+        print(f'{report.mode}: {report.speedup:.2f}x the reference speed, {report.differing_docs_count} docs differ '
+              f'(skipped fields: {skipped_fields})')
+        for line in format_differences(report):
+            print(f'  {line}')
+
+
+def bench_dns(args: argparse.Namespace, work_dir: Path) -> None:
+    # Each farm host gets its own name, resolved by a slow resolver which only answers 4 lookups at a time
+    resolver_latency = 0.05
+    resolver_slots = threading.BoundedSemaphore(4)
+
+    def slow_resolver(host: str) -> Tuple[List[str], None]:
+        with resolver_slots:
+            time.sleep(resolver_latency)
+        return ['127.0.0.1'], None
+
+    profiles = [HostProfile(latency=0.005)] * 20
+    for label, ttl in (('no cache', 0), ('cache', 300)):
+        with ServerFarm(profiles, pages_per_host=10, page_size=args.page_size, seed=args.seed,
+                        host_name='localhost') as farm:
+            urls = [url.replace('localhost:', f'host-{url.split(":")[2].split("/")[0]}.farm.test:')
+                    for url in farm.urls()]
+            dns_cache = DnsCache(ttl=ttl, resolver=slow_resolver)
+            report = run_load_test(farm, workers=16, pool_size=1, urls=urls, dns_cache=dns_cache)
+            dns_cache.shutdown()
+        dns_stats = report.dns_stats
+        print(f'{label}: {report.pages_per_second:.1f} pages/s, {report.connections} connections, '
+              f'{dns_stats.resolutions} resolutions ({dns_stats.resolution_seconds:.2f}s), {dns_stats.hit_rate:.0%} hits, '
+              f'{dns_stats.coalesced} coalesced, {dns_stats.saved_seconds:.2f}s saved')
+
+
+BENCHMARKS: Dict[str, Callable[[argparse.Namespace, Path], None]] = {
+    'warc': bench_warc,
+    'sitemap': bench_sitemap,
+    'pipeline': bench_pipeline,
+    'memory': bench_memory,
+    'service': bench_service,
+    'robots': bench_robots,
+    'monitor': bench_monitor,
+    'ngrams': bench_ngrams,
+    'approximate': bench_approximate,
+    'extractors': bench_extractors,
+    'aggregates': bench_aggregates,
+    'http2': bench_http2,
+    'frontier': bench_frontier,
+    'visible_text': bench_visible_text,
+    'coverage': bench_coverage,
+    'handoff': bench_handoff,
+    'differential': bench_differential,
+    'dns': bench_dns,
+}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Offline, reproducible benchmarks of the page analyser.')
+    parser.add_argument('benchmarks', nargs='*', help=f'benchmarks to run, among {", ".join(BENCHMARKS)} (default: all)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--pages', type=int, default=200)
+    parser.add_argument('--page-size', type=int, default=50_000, help='approximate size of synthetic pages, in bytes')
+    parser.add_argument('--update-golden', action='store_true',
+                        help='with the differential benchmark, snapshot the summaries of the current analysis as the '
+                             'golden ones, after an intended change of its results')
+    args = parser.parse_args()
+    unknown_benchmarks = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown_benchmarks:
+        parser.error(f'unknown benchmarks: {", ".join(sorted(unknown_benchmarks))}')
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        for name in args.benchmarks or BENCHMARKS:
+            print(f'== {name} ==')
+            BENCHMARKS[name](args, Path(work_dir))
+            print('')
@@ -0,0 +1,47 @@
+import argparse
+import itertools
+from scraper.dns_cache import DnsCache
+from scraper.load_testing import run_load_test
+from scraper.server_farm import ServerFarm, mixed_profiles
+
+arg_parser = argparse.ArgumentParser(
+    description='Load test of the batch analysis against a local farm of slow and flaky servers. '
+                'Give several values to an option to compare them.'
+)
+arg_parser.add_argument('--seed', type=int, default=0, help='the same seed gives the same farm, and the same responses')
+arg_parser.add_argument('--hosts', type=int, default=20)
+arg_parser.add_argument('--pages-per-host', type=int, default=20)
+arg_parser.add_argument('--page-size', type=int, default=20_000, help='approximate size of the pages, in bytes')
+arg_parser.add_argument('--workers', type=int, nargs='+', default=[8], help='pages fetched and analysed at the same time')
+arg_parser.add_argument('--pool-size', type=int, nargs='+', default=[10], help='connections kept alive per host')
+arg_parser.add_argument('--timeout', type=float, nargs='+', default=[5], help='fetch timeout, in seconds')
+arg_parser.add_argument('--host-name', default='127.0.0.1',
+                        help='host name of the servers in the URLs ("localhost": resolve it for each new connection)')
+arg_parser.add_argument('--dns-cache', choices=('off', 'on'), nargs='+', default=['off'],
+                        help='resolve each host once (and prefetch the hosts of the pages about to be fetched)')
+args = arg_parser.parse_args()
+
+profiles = mixed_profiles(args.hosts, seed=args.seed)
+for workers, pool_size, timeout, dns_cache in itertools.product(args.workers, args.pool_size, args.timeout,
+                                                                args.dns_cache):
+    # A new farm for each run, so that each run gets the same responses
+    with ServerFarm(profiles, pages_per_host=args.pages_per_host, page_size=args.page_size, seed=args.seed,
+                    host_name=args.host_name) as farm:
+        report = run_load_test(farm, workers=workers, pool_size=pool_size, timeout=timeout,
+                               dns_cache=DnsCache() if dns_cache == 'on' else None)
+
+    print(f'== {workers} workers, pool size {pool_size}, {timeout}s timeout, DNS cache {dns_cache} ==')
+    print(f'{report.pages} pages in {report.seconds:.1f}s: {report.pages_per_second:.1f} pages/s, '
+          f'{report.received_bytes / report.seconds / 1e6:.2f} MB/s, {report.connections} connections')
+    print('Fetch latency: ' + ', '.join(f'p{percentile} {value * 1000:.0f}ms'
+                                        for percentile, value in report.latency_percentiles.items()))
+    print(f'Analysed: {report.analysed}, not parsed: {sum(report.unparsed.values())} '
+          f'({report.saved_analysis_seconds * 1000:.0f}ms of analysis saved), failed: {sum(report.errors.values())} '
+          f'({report.error_rate:.1%})')
+    # Unparsed pages outcomes, then errors
+    for name, count in sorted({**report.unparsed, **report.errors}.items(), key=lambda item: -item[1]):
+        print(f' * {name}: {count}')
+    print('Servers: ' + ', '.join(f'{outcome} {count}' for outcome, count in sorted(report.server_outcomes.items())))
+    if report.dns_stats is not None:
+        print(f'DNS: {report.dns_stats.lookups} lookups, {report.dns_stats.hit_rate:.1%} hits, '
+              f'{report.dns_stats.coalesced} coalesced, {report.dns_stats.saved_seconds * 1000:.0f}ms saved')
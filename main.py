@@ -1,48 +1,313 @@
-
+import argparse
+import json
 import re
 import sys
-from pprint import pprint
-from scraper.doc_fetcher import fetch_url_content
-from scraper.doc_analyser import DocAnalyser, DocSummary
+import time
+from functools import partial
+from typing import Optional, Sequence, Set
+from scraper.approximate import WordStatsEstimate
+from scraper.batch import OutcomeStats, analyse_batch
+from scraper.doc_fetcher import StreamedFetch, create_pooled_fetcher, fetch_url_content, fetch_url_head, fetch_url_size, \
+    stream_url_content
+from scraper.doc_analyser import LINKS_FOUND, PARSED, DocAnalyser, DocLink, DocSummary
+from scraper.extractors import available_extractors
+from scraper.fast_paths import analyse_head_only, analyse_size_only
+from scraper.frontier import UrlFrontier, crawl_frontier
+from scraper.local_docs import fetch_file_content
+from scraper.ngrams import SiteNgramStats, most_common_ngrams
+from scraper.sitemap import iter_sitemap_urls, open_sitemap_stream, parse_w3c_datetime
 
-if len(sys.argv) < 2:
-    print('Usage: python main.py [URL]')
-    print('(or "make run URL=[URL]" from the Makefile)')
-    sys.exit(1)
 
-target_url: str = sys.argv[1]
+def fetch_doc_content(url: str, timeout: Optional[float] = None) -> bytes:
+    return fetch_file_content(url) if url.startswith('file://') else fetch_url_content(url, timeout=timeout)
 
-if not re.compile('^https?:\/\/').match(target_url):
-    print(f'"{target_url}" is not a valid URL (should start with "http(s)://")')
-    sys.exit(1)
 
-print('Fetching page content...')
+def print_doc_summary(doc_summary: DocSummary) -> None:
+    if 'page_title' not in doc_summary.skipped_fields:
+        print(f'Page title: {doc_summary.page_title}')
+    if 'doc_size' not in doc_summary.skipped_fields:
+        print(f'Page size: {doc_summary.doc_size} ({doc_summary.doc_size_human_friendly})')
+    if 'meta_tags' not in doc_summary.skipped_fields and 'body_content' in doc_summary.skipped_fields:
+        print_meta_tags(doc_summary)
+    if doc_summary.is_partial:
+        if doc_summary.word_stats is not None:
+            print_word_stats_estimate(doc_summary.word_stats)
+        if 'links' not in doc_summary.skipped_fields:
+            print_links(doc_summary)
+        print(f'(skipped: {", ".join(doc_summary.skipped_fields)})')
+        return
+
+    print_word_stats(doc_summary)
+
+    print_meta_tags(doc_summary)
+
+    print_links(doc_summary)
+
+    if doc_summary.extras is not None:
+        print_extras(doc_summary)
+
+
+def print_new_sections(doc_summary: DocSummary, printed_sections: Set[str]) -> None:
+    # For progressive analyses: prints the parts of a partial summary which were not printed yet
+    def is_new(section: str) -> bool:
+        if section in printed_sections or section in doc_summary.skipped_fields:
+            return False
+        printed_sections.add(section)
+        return True
+
+    if is_new('page_title'):
+        print(f'Page title: {doc_summary.page_title}')
+    if is_new('doc_size'):
+        print(f'Page size: {doc_summary.doc_size} ({doc_summary.doc_size_human_friendly})')
+    if is_new('meta_tags'):
+        print_meta_tags(doc_summary)
+    if is_new('links'):
+        print_links(doc_summary)
+    if doc_summary.extras is not None and is_new('extras'):
+        print_extras(doc_summary)
+    if doc_summary.word_stats is not None:
+        print_word_stats_estimate(doc_summary.word_stats)
+    elif is_new('body_content'):
+        print_word_stats(doc_summary)
+
+
+def print_word_stats(doc_summary: DocSummary) -> None:
+    print(f'Word count: {doc_summary.word_count}')
+    print(f'Unique word count: {doc_summary.unique_word_count}')
+
+    print('Most common words:')
+    for common_word in doc_summary.most_common_5_words:
+        print(f' * {common_word[0]} ({common_word[1]} times)')
+
+    for n, ngrams_name in ((2, 'bigrams'), (3, 'trigrams')):
+        print(f'Most common {ngrams_name}:')
+        for ngram, count in most_common_ngrams(doc_summary, n):
+            print(f' * {" ".join(ngram)} ({count} times)')
+
+    keyword_coverage = doc_summary.keyword_coverage
+    print(f'Meta keywords coverage: {keyword_coverage.covered_count} of {len(keyword_coverage.keywords)} keywords '
+          f'({keyword_coverage.coverage:.0%}) appear in the content')
+    for keyword, count in keyword_coverage.keywords:
+        print(f' * {keyword} ({count} times)' if count else f' * {keyword} (missing)')
+
+
+def print_meta_tags(doc_summary: DocSummary) -> None:
+    print('Meta tags:')
+    for meta_tag in doc_summary.meta_tags:
+        print(f' * {meta_tag.name} (value: {meta_tag.content})')
+
+
+def print_links(doc_summary: DocSummary) -> None:
+    print('Links:')
+    print_link_items(doc_summary.links)
+
+
+def print_link_items(links: Sequence[DocLink]) -> None:
+    for link in links:
+        print(f' * {link.text} (href: {link.href})')
+
+
+def print_extras(doc_summary: DocSummary) -> None:
+    for extractor_name, result in doc_summary.extras.items():
+        print(f'{extractor_name} (extracted in {doc_summary.extractor_timings[extractor_name] * 1000:.2f}ms):')
+        print(f' {json.dumps(result)}')
+
 
-doc_analyser = DocAnalyser(fetch_url_content)
-doc_summary: DocSummary = doc_analyser.analyse(target_url)
+def print_word_stats_estimate(word_stats: WordStatsEstimate) -> None:
+    print(f'Word count: {word_stats.word_count.value}')
+    print(f'Unique word count: ~{word_stats.unique_word_count.value} (±{word_stats.unique_word_count.error})')
+    print(f'Most common words (estimated from {word_stats.sample_rate:.0%} of the page):')
+    for word, estimate in word_stats.most_common_5_words:
+        print(f' * {word} (~{estimate.value} times, ±{estimate.error})')
 
-print('Page content fetched.')
 
-print('')
+def analyse_url(
+    target_url: str,
+    size_only: bool = False,
+    head_only: bool = False,
+    approximate_above: Optional[int] = None,
+    extractors: Sequence[str] = (),
+    timeout: Optional[float] = None,
+) -> None:
+    print('Fetching page content...')
 
-print(f'Page title: {doc_summary.page_title}')
-print(f'Page size: {doc_summary.doc_size} ({doc_summary.doc_size_human_friendly})')
-print(f'Word count: {doc_summary.word_count}')
-print(f'Unique word count: {doc_summary.unique_word_count}')
+    doc_analyser = DocAnalyser(partial(fetch_doc_content, timeout=timeout), approximate_above=approximate_above,
+                               extractors=extractors)
+    partial_analysis = None
+    if size_only:
+        partial_analysis = analyse_size_only(target_url, partial(fetch_url_size, timeout=timeout))
+    elif head_only:
+        partial_analysis = analyse_head_only(doc_analyser, target_url, partial(fetch_url_head, timeout=timeout))
+    doc_summary: DocSummary = partial_analysis.summary if partial_analysis else doc_analyser.analyse(target_url)
 
-print('Most common words:')
-for common_word in doc_summary.most_common_5_words:
-    print(f' * {common_word[0]} ({common_word[1]} times)')
+    print('Page content fetched.')
+    if partial_analysis is not None:
+        bytes_saved = partial_analysis.bytes_saved
+        print(f'{partial_analysis.bytes_received} bytes received, '
+              + (f'{bytes_saved} bytes saved' if bytes_saved is not None else 'unknown savings (no Content-Length)'))
 
-print('Meta keywords which do not appear in the content:')
-for missing_meta_keyword in doc_summary.missing_meta_keywords:
-    print(f' * {missing_meta_keyword}')
+    print('')
 
-print('Meta tags:')
-for meta_tag in doc_summary.meta_tags:
-    print(f' * {meta_tag.name} (value: {meta_tag.content})')
+    print_doc_summary(doc_summary)
+
+
+def analyse_url_progressively(
+    target_url: str,
+    approximate_above: Optional[int] = None,
+    extractors: Sequence[str] = (),
+    timeout: Optional[float] = None,
+) -> None:
+    # Each part of the summary is printed as soon as the analyser knows it: title and meta tags once the <head>
+    # is received, links as they are received, extras once the page is parsed, and word stats last.
+    print('Fetching page content...')
+    started_at = time.perf_counter()
+
+    doc_analyser = DocAnalyser(partial(fetch_doc_content, timeout=timeout), approximate_above=approximate_above,
+                               extractors=extractors)
+    if target_url.startswith('file://'):
+        streamed_fetch = StreamedFetch(chunks=iter([fetch_file_content(target_url)]), doc_size=None)
+    else:
+        streamed_fetch = stream_url_content(target_url, timeout=timeout)
+    printed_sections: Set[str] = set()
+    first_output_at = None
+    for event in doc_analyser.analyse_progressively(streamed_fetch.chunks, streamed_fetch.doc_size):
+        event_received_at = time.perf_counter()
+        if first_output_at is None:
+            first_output_at = event_received_at
+        print('')
+        print(f'[{event.name.replace("_", " ")} after {(event_received_at - started_at) * 1000:.0f}ms]')
+        if event.name == LINKS_FOUND:
+            # The complete links, once the page is parsed, are the same ones
+            if 'links' not in printed_sections:
+                print('Links:')
+                printed_sections.add('links')
+            print_link_items(event.links)
+            continue
+        print_new_sections(event.summary, printed_sections)
+
+    print('')
+    print(f'Time to first output: {(first_output_at - started_at) * 1000:.0f}ms, '
+          f'total: {(time.perf_counter() - started_at) * 1000:.0f}ms')
+
+
+def analyse_sitemap(
+    sitemap_location: str,
+    since: str,
+    workers: int,
+    frontier_path: Optional[str] = None,
+    timeout: Optional[float] = None,
+) -> None:
+    modified_since = None
+    if since is not None:
+        modified_since = parse_w3c_datetime(since)
+        if modified_since is None:
+            print(f'"{since}" is not a valid date (should look like "2017-11-05" or "2017-11-05T19:20:00+01:00")')
+            sys.exit(1)
+
+    # Error pages and non-HTML documents are not parsed
+    doc_analyser = DocAnalyser(create_pooled_fetcher(pool_size=workers, timeout=timeout, structured=True))
+    urls = iter_sitemap_urls(sitemap_location, modified_since=modified_since,
+                             opener=partial(open_sitemap_stream, timeout=timeout))
+    site_ngram_stats = SiteNgramStats(sizes=(2, 3))
+    outcome_stats = OutcomeStats()
+    frontier = None
+    if frontier_path is not None:
+        # Running the same command again (e.g. after a crash) skips the pages which were already analysed
+        frontier = UrlFrontier(frontier_path)
+        print(f'{frontier.add(urls)} new URLs, {frontier.stats().pending} pages to analyse')
+        results = crawl_frontier(frontier, doc_analyser, workers=workers)
+    else:
+        results = analyse_batch(doc_analyser, urls, workers=workers)
+    try:
+        for result in results:
+            if result.error is not None:
+                print(f'{result.url}: error ({result.error})')
+                continue
+            summary = result.summary
+            outcome_stats.add(summary)
+            if summary.outcome != PARSED:
+                print(f'{result.url}: not parsed ({summary.outcome}, HTTP {summary.status_code}, '
+                      f'{summary.content_type or "no content type"})')
+                continue
+            site_ngram_stats.add(summary)
+            print(f'{result.url}: "{summary.page_title}", {summary.doc_size_human_friendly}, {summary.word_count} words')
+    finally:
+        if frontier is not None:
+            frontier.close()
+
+    if outcome_stats.unparsed_count:
+        print(f'{outcome_stats.unparsed_count} pages not parsed, about {outcome_stats.saved_seconds:.2f}s of analysis '
+              f'saved')
+
+    if site_ngram_stats.pages_count == 0:
+        return
+    for n, ngrams_name in ((2, 'bigrams'), (3, 'trigrams')):
+        print(f'Most common {ngrams_name} on the whole site (counts may be overestimated by up to '
+              f'{site_ngram_stats.max_error(n):.0f}):')
+        for heavy_hitter in site_ngram_stats.most_common(n):
+            print(f' * {" ".join(heavy_hitter.item)} (~{heavy_hitter.count} times)')
+
+
+arg_parser = argparse.ArgumentParser(
+    usage='python main.py [URL]\n(or "make run URL=[URL]" from the Makefile)',
+)
+arg_parser.add_argument('url', nargs='?')
+arg_parser.add_argument('--sitemap', metavar='SITEMAP_URL', help='analyse every page of a sitemap (or sitemap index)')
+arg_parser.add_argument('--since', metavar='DATE', help='with --sitemap, only analyse pages modified since that date')
+arg_parser.add_argument('--size-only', action='store_true', help='only get the page size (using a HEAD request)')
+arg_parser.add_argument('--head-only', action='store_true', help='only analyse the page <head> (title and meta tags)')
+arg_parser.add_argument('--progressive', action='store_true',
+                        help='print each part of the analysis as soon as it is known (title and meta tags first)')
+arg_parser.add_argument('--approximate-above', type=int, metavar='SIZE',
+                        help='only estimate the words stats of pages bigger than SIZE bytes (much faster)')
+arg_parser.add_argument('--extract', metavar='EXTRACTOR', action='append', default=[],
+                        help=f'extract more data from the page, among: {", ".join(available_extractors())}')
+arg_parser.add_argument('--workers', type=int, default=8, help='with --sitemap, number of pages analysed in parallel')
+arg_parser.add_argument('--frontier', metavar='DB_PATH',
+                        help='with --sitemap, keep track of the analysed pages in this file, to resume interrupted runs')
+arg_parser.add_argument('--timeout', type=float, default=30,
+                        help='fetch timeout, in seconds (for the connection, and each wait for data)')
+args = arg_parser.parse_args()
+
+if args.sitemap is not None:
+    analyse_sitemap(args.sitemap, args.since, args.workers, frontier_path=args.frontier, timeout=args.timeout)
+    sys.exit(0)
+
+if args.url is None:
+    print('Usage: python main.py [URL]')
+    print('       python main.py --sitemap [SITEMAP_URL] [--since DATE]')
+    print('(or "make run URL=[URL]" from the Makefile)')
+    sys.exit(1)
+
+target_url: str = args.url
+
+if not re.compile('^(https?|file):\/\/').match(target_url):
+    print(f'"{target_url}" is not a valid URL (should start with "http(s)://" or "file://")')
+    sys.exit(1)
+
+if target_url.startswith('file://') and (args.size_only or args.head_only):
+    print('--size-only and --head-only are only available for "http(s)://" URLs')
+    sys.exit(1)
+
+unknown_extractors = set(args.extract) - set(available_extractors())
+if unknown_extractors:
+    print(f'Unknown extractors: {", ".join(sorted(unknown_extractors))}')
+    sys.exit(1)
+
+if args.progressive and (args.size_only or args.head_only):
+    print('--progressive can not be combined with --size-only or --head-only')
+    sys.exit(1)
 
-print('Links:')
-for link in doc_summary.links:
-    print(f' * {link.text} (href: {link.href})')
+if args.progressive:
+    analyse_url_progressively(target_url, approximate_above=args.approximate_above, extractors=args.extract,
+                              timeout=args.timeout)
+    sys.exit(0)
 
+analyse_url(
+    target_url,
+    size_only=args.size_only,
+    head_only=args.head_only,
+    approximate_above=args.approximate_above,
+    extractors=args.extract,
+    timeout=args.timeout,
+)
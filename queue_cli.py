@@ -0,0 +1,118 @@
+import argparse
+import json
+import os
+import socket
+import sys
+from scraper.aggregates import SiteReport, build_site_report, merge_site_reports
+from scraper.doc_analyser import DocAnalyser
+from scraper.doc_fetcher import fetch_url_content
+from scraper.sitemap import iter_sitemap_urls
+from scraper.work_queue import SqliteWorkQueue, run_worker, wait_until_drained
+
+
+def enqueue(queue: SqliteWorkQueue, args: argparse.Namespace) -> None:
+    urls = list(args.urls)
+    if args.urls_file is not None:
+        with open(args.urls_file) as urls_file:
+            urls.extend(line.strip() for line in urls_file if line.strip())
+    enqueued_count = queue.enqueue(urls)
+    if args.sitemap is not None:
+        enqueued_count += queue.enqueue(iter_sitemap_urls(args.sitemap))
+    print(f'{enqueued_count} URLs enqueued')
+
+
+def work(queue: SqliteWorkQueue, args: argparse.Namespace) -> None:
+    worker_id = args.worker_id or f'{socket.gethostname()}-{os.getpid()}'
+    site_report = SiteReport() if args.report is not None else None
+    processed_count = run_worker(
+        queue, DocAnalyser(fetch_url_content), worker_id,
+        batch_size=args.batch_size, lease_duration=args.lease_duration,
+        on_result=site_report.add if site_report is not None else None,
+    )
+    print(f'Worker {worker_id}: {processed_count} URLs processed')
+    if site_report is not None:
+        with open(args.report, 'wb') as report_file:
+            report_file.write(site_report.to_bytes())
+        print(f'Site report of this worker\'s pages written to {args.report}')
+
+
+def status(queue: SqliteWorkQueue, args: argparse.Namespace) -> None:
+    stats = wait_until_drained(queue) if args.wait else queue.stats()
+    print(f'Pending: {stats.pending}, leased: {stats.leased}, done: {stats.done}, failed: {stats.failed}')
+
+
+def results(queue: SqliteWorkQueue, args: argparse.Namespace) -> None:
+    # One JSON document per line
+    for url, summary in queue.results():
+        print(json.dumps({'url': url, 'summary': summary.to_dict()}))
+    for url, error in queue.failures():
+        print(json.dumps({'url': url, 'error': error}))
+
+
+def report(queue: SqliteWorkQueue, args: argparse.Namespace) -> None:
+    if args.report_files:
+        # Reports of each worker: the queue results are not needed
+        reports = []
+        for report_path in args.report_files:
+            with open(report_path, 'rb') as report_file:
+                reports.append(SiteReport.from_bytes(report_file.read()))
+        site_report = merge_site_reports(reports)
+    else:
+        site_report = build_site_report(queue.results())
+
+    print(f'Pages: {site_report.pages_count}')
+    print(f'Page size: median < {site_report.doc_sizes.quantile(0.5)} bytes, '
+          f'90th percentile < {site_report.doc_sizes.quantile(0.9)} bytes')
+    print(f'Word count: mean {site_report.word_counts.mean:.0f}, median < {site_report.word_counts.quantile(0.5)}')
+    print(f'Distinct words: ~{site_report.unique_words.count():.0f}')
+    print('Most common words:')
+    for heavy_hitter in site_report.words.most_common(10):
+        print(f' * {heavy_hitter.item} (~{heavy_hitter.count} times)')
+    print(f'Meta keywords coverage: {site_report.keywords_coverage:.1%} '
+          f'({site_report.pages_with_keywords_count} pages with meta keywords)')
+    print('Most often missing meta keywords:')
+    for heavy_hitter in site_report.missing_keywords.most_common(10):
+        print(f' * {heavy_hitter.item} (~{heavy_hitter.count} pages)')
+    print(f'Links: {site_report.internal_links_count} internal, {site_report.external_links_count} external, '
+          f'~{site_report.unique_link_targets.count():.0f} distinct targets, '
+          f'median out-degree < {site_report.out_degrees.quantile(0.5)}')
+    print('Most linked URLs:')
+    for heavy_hitter in site_report.link_targets.most_common(10):
+        print(f' * {heavy_hitter.item} (~{heavy_hitter.count} links)')
+
+
+arg_parser = argparse.ArgumentParser(description='Share one analysis job between several worker processes/nodes.')
+arg_parser.add_argument('db_path', help='path of the SQLite queue')
+arg_parser.add_argument('--max-attempts', type=int, default=3)
+commands = arg_parser.add_subparsers(dest='command')
+
+enqueue_parser = commands.add_parser('enqueue', help='enqueue URLs (coordinator)')
+enqueue_parser.add_argument('urls', nargs='*')
+enqueue_parser.add_argument('--urls-file', help='file with one URL per line')
+enqueue_parser.add_argument('--sitemap', help='enqueue every page of a sitemap (or sitemap index)')
+enqueue_parser.set_defaults(handler=enqueue)
+
+work_parser = commands.add_parser('work', help='lease and analyse URLs until the queue is drained (worker)')
+work_parser.add_argument('--worker-id')
+work_parser.add_argument('--batch-size', type=int, default=10)
+work_parser.add_argument('--lease-duration', type=float, default=300, help='in seconds')
+work_parser.add_argument('--report', metavar='REPORT_PATH', help='write the site report of this worker\'s pages there')
+work_parser.set_defaults(handler=work)
+
+status_parser = commands.add_parser('status', help='show the queue status')
+status_parser.add_argument('--wait', action='store_true', help='wait until every URL was processed')
+status_parser.set_defaults(handler=status)
+
+results_parser = commands.add_parser('results', help='dump the results as JSON lines')
+results_parser.set_defaults(handler=results)
+
+report_parser = commands.add_parser('report', help='site-wide statistics, from the queue results or workers\' reports')
+report_parser.add_argument('report_files', nargs='*', metavar='REPORT_PATH', help='reports written by "work --report"')
+report_parser.set_defaults(handler=report)
+
+args = arg_parser.parse_args()
+if args.command is None:
+    arg_parser.print_usage()
+    sys.exit(1)
+
+args.handler(SqliteWorkQueue(args.db_path, max_attempts=args.max_attempts), args)
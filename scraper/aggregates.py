@@ -0,0 +1,120 @@
+import json
+import zlib
+from collections import Counter
+from functools import reduce
+from typing import Any, Dict, Iterable, Tuple
+from urllib.parse import urljoin, urlparse
+from scraper.doc_analyser import DocSummary
+from scraper.sketches import HyperLogLog, LogHistogram, SpaceSaving
+
+
+class SiteReport:
+    # Site-wide statistics, built from any number of summaries in bounded memory. Reports built separately (by
+    # each worker process or node) merge into the report of all their pages, in any order, and serialise to a few
+    # hundred KB at most: summaries never have to be gathered in one place.
+    #
+    # Every part of the report is a counter, a histogram or a sketch:
+    #  - pages: document sizes and word counts distributions
+    #  - words: most frequent words (Space-Saving) and distinct words (HyperLogLog)
+    #  - meta keywords coverage: how many keywords don't appear in their page content, and which ones most often
+    #  - link graph: out-degrees distribution, most linked URLs (in-degrees), distinct link targets
+
+    def __init__(self, top_items_capacity: int = 2000, hll_precision: int = 14):
+        self.pages_count = 0
+        self.doc_sizes = LogHistogram()
+        self.word_counts = LogHistogram()
+        self.words = SpaceSaving(top_items_capacity)
+        self.unique_words = HyperLogLog(hll_precision)
+        self.pages_with_keywords_count = 0
+        self.keywords_count = 0
+        self.missing_keywords_count = 0
+        self.missing_keywords = SpaceSaving(top_items_capacity)
+        self.out_degrees = LogHistogram()
+        self.internal_links_count = 0
+        self.external_links_count = 0
+        self.link_targets = SpaceSaving(top_items_capacity)
+        self.unique_link_targets = HyperLogLog(hll_precision)
+
+    @property
+    def keywords_coverage(self) -> float:
+        # Share of the meta keywords which do appear in their page content
+        if self.keywords_count == 0:
+            return 1
+        return 1 - self.missing_keywords_count / self.keywords_count
+
+    def add(self, url: str, summary: DocSummary) -> None:
+        # Partial summaries only contribute the fields they have
+        self.pages_count += 1
+        if 'doc_size' not in summary.skipped_fields:
+            self.doc_sizes.add(summary.doc_size)
+
+        if 'body_content' not in summary.skipped_fields:
+            words = Counter(summary.words)
+            self.word_counts.add(sum(words.values()))
+            self.words.update(words)
+            self.unique_words.update(words)
+
+        if 'meta_tags' not in summary.skipped_fields and 'body_content' not in summary.skipped_fields:
+            keyword_coverage = summary.keyword_coverage
+            if keyword_coverage.keywords:
+                self.pages_with_keywords_count += 1
+                self.keywords_count += len(keyword_coverage.keywords)
+                missing_keywords = keyword_coverage.missing_keywords
+                self.missing_keywords_count += len(missing_keywords)
+                for keyword in missing_keywords:
+                    self.missing_keywords.add(keyword)
+
+        if 'links' not in summary.skipped_fields:
+            self.out_degrees.add(len(summary.links))
+            host = urlparse(url).netloc
+            link_targets = Counter()
+            for link in summary.links:
+                if link.href is None:
+                    continue
+                # Fragments point to the same page
+                target = urljoin(url, link.href).split('#', 1)[0]
+                if urlparse(target).netloc == host:
+                    self.internal_links_count += 1
+                else:
+                    self.external_links_count += 1
+                link_targets[target] += 1
+            self.link_targets.update(link_targets)
+            self.unique_link_targets.update(link_targets)
+
+    def merge(self, other: 'SiteReport') -> 'SiteReport':
+        merged = SiteReport.__new__(SiteReport)
+        for attribute, value in vars(self).items():
+            other_value = getattr(other, attribute)
+            setattr(merged, attribute, value + other_value if isinstance(value, int) else value.merge(other_value))
+        return merged
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {attribute: value if isinstance(value, int) else value.to_dict() for attribute, value in vars(self).items()}
+
+    @classmethod
+    def from_dict(cls, report_dict: Dict[str, Any]) -> 'SiteReport':
+        report = cls.__new__(cls)
+        for attribute, value in vars(cls()).items():
+            if isinstance(value, int):
+                setattr(report, attribute, report_dict[attribute])
+            else:
+                setattr(report, attribute, type(value).from_dict(report_dict[attribute]))
+        return report
+
+    def to_bytes(self) -> bytes:
+        return zlib.compress(json.dumps(self.to_dict(), separators=(',', ':')).encode('utf-8'))
+
+    @classmethod
+    def from_bytes(cls, report_bytes: bytes) -> 'SiteReport':
+        return cls.from_dict(json.loads(zlib.decompress(report_bytes)))
+
+
+def build_site_report(results: Iterable[Tuple[str, DocSummary]], **report_options) -> SiteReport:
+    report = SiteReport(**report_options)
+    for url, summary in results:
+        report.add(url, summary)
+    return report
+
+
+def merge_site_reports(reports: Iterable[SiteReport]) -> SiteReport:
+    return reduce(SiteReport.merge, reports)
@@ -0,0 +1,181 @@
+import math
+import re
+from collections import Counter
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple, Union
+from scraper.sketches import HyperLogLog, SpaceSaving
+from scraper.visible_text import INVISIBLE_ELEMENTS, TAG_PATTERN, strip_tags
+
+# Comments (which may contain tags, or ">"), CDATA sections and invisible elements. Like with html.parser, an
+# invisible element which is never closed hides the rest of the document.
+_IGNORED_MARKUP_PATTERN = re.compile(
+    rf'<!--.*?--\s*>|<!\[CDATA\[.*?\]\]>'
+    rf'|<(?P<element>{"|".join(sorted(INVISIBLE_ELEMENTS))})\b.*?(?:</(?P=element)\s*>|\Z)',
+    re.IGNORECASE | re.DOTALL,
+)
+# The same patterns, for markup which is scanned before being decoded (see `iter_text_blocks()`)
+_BYTES_PATTERNS = {
+    pattern: re.compile(pattern.pattern.encode('ascii'), pattern.flags & ~re.UNICODE)
+    for pattern in (_IGNORED_MARKUP_PATTERN, TAG_PATTERN)
+}
+# ~95% confidence
+_Z_SCORE = 1.96
+
+
+class Estimate(NamedTuple):
+    value: float
+    # Absolute error bound: the true value is in [value - error, value + error] (with ~95% confidence, for
+    # statistical estimates)
+    error: float
+
+
+class WordStatsEstimate(NamedTuple):
+    word_count: Estimate
+    unique_word_count: Estimate
+    most_common_5_words: List[Tuple[str, Estimate]]
+    sample_rate: float
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'word_count': self.word_count._asdict(),
+            'unique_word_count': self.unique_word_count._asdict(),
+            'most_common_5_words': [[word, estimate._asdict()] for word, estimate in self.most_common_5_words],
+            'sample_rate': self.sample_rate,
+        }
+
+    @classmethod
+    def from_dict(cls, word_stats_dict: Dict[str, Any]) -> 'WordStatsEstimate':
+        return cls(
+            word_count=Estimate(**word_stats_dict['word_count']),
+            unique_word_count=Estimate(**word_stats_dict['unique_word_count']),
+            most_common_5_words=[(word, Estimate(**estimate)) for word, estimate in word_stats_dict['most_common_5_words']],
+            sample_rate=word_stats_dict['sample_rate'],
+        )
+
+
+def iter_text_blocks(
+    html_doc: Union[str, bytes, memoryview],
+    start: int = 0,
+    block_size: int = 16_384,
+    encoding: str = 'utf-8',
+) -> Iterator[str]:
+    # Blocks of roughly `block_size` characters of the page markup, without comments and the content of invisible
+    # elements. Blocks are cut right before a tag, so that no tag is split between two blocks (words may be, see
+    # `estimate_word_stats()`).
+    # Documents which are still encoded (`bytes`, in an `encoding` whose markup is ASCII, e.g. UTF-8 or Shift_JIS)
+    # are scanned as they are, and only decoded one block at a time: "<" is never part of a multi-byte character in
+    # these encodings, and neither is the start of a block.
+    if isinstance(html_doc, str):
+        ignored_markup_pattern, tag_pattern = _IGNORED_MARKUP_PATTERN, TAG_PATTERN
+    else:
+        ignored_markup_pattern, tag_pattern = _BYTES_PATTERNS[_IGNORED_MARKUP_PATTERN], _BYTES_PATTERNS[TAG_PATTERN]
+    position = start
+    for ignored_markup in ignored_markup_pattern.finditer(html_doc, start):
+        yield from _split_in_blocks(html_doc, tag_pattern, position, ignored_markup.start(), block_size, encoding)
+        position = ignored_markup.end()
+    yield from _split_in_blocks(html_doc, tag_pattern, position, len(html_doc), block_size, encoding)
+
+
+def estimate_word_stats(
+    text_blocks: Iterable[str],
+    sample_rate: float = 0.2,
+    hll_precision: int = 12,
+    top_words_capacity: int = 1000,
+    max_exact_unique_words: int = 10_000,
+) -> WordStatsEstimate:
+    # Bounded memory word statistics, one block at a time:
+    #  - every block is tokenised: tokens are counted exactly, and so are distinct words, up to
+    #    `max_exact_unique_words` of them. Beyond that, they go into a HyperLogLog (distinct counts can't be
+    #    extrapolated from a sample).
+    #  - only `sample_rate` of the text, spread evenly over the page whatever the size of its blocks, is counted word
+    #    by word into a Space-Saving sketch: the frequencies of the top words in that sample are then applied to the
+    #    exact word count
+    if not 0 < sample_rate <= 1:
+        raise ValueError('The sample rate must be in ]0, 1]')
+    exact_unique_words: Optional[Set[str]] = set()
+    unique_words = HyperLogLog(hll_precision)
+    top_words = SpaceSaving(top_words_capacity)
+    word_count = sampled_word_count = 0
+    text_size = sampled_text_size = 0
+    for block_text_size, words in _iter_block_words(text_blocks):
+        word_count += len(words)
+        if exact_unique_words is not None:
+            exact_unique_words.update(words)
+            if len(exact_unique_words) > max_exact_unique_words:
+                unique_words.update(exact_unique_words)
+                exact_unique_words = None
+        else:
+            unique_words.update(set(words))
+        # The first block is always sampled, and then blocks are whenever the sample falls behind the sample rate
+        if sampled_text_size <= sample_rate * text_size:
+            sampled_text_size += block_text_size
+            sampled_word_count += len(words)
+            top_words.update(Counter(words))
+        text_size += block_text_size
+
+    most_common_5_words = []
+    for heavy_hitter in top_words.most_common(5):
+        frequency = heavy_hitter.count / sampled_word_count
+        # Sketch overestimation, plus the sampling error (normal approximation, with finite population correction)
+        sampling_error = _Z_SCORE * math.sqrt(
+            frequency * (1 - frequency) / sampled_word_count * (1 - sampled_word_count / word_count)
+        )
+        error = heavy_hitter.error / sampled_word_count + sampling_error
+        most_common_5_words.append(
+            (heavy_hitter.item, Estimate(value=round(frequency * word_count), error=math.ceil(error * word_count)))
+        )
+
+    if exact_unique_words is not None:
+        unique_word_count = Estimate(value=len(exact_unique_words), error=0)
+    else:
+        estimated_count = unique_words.count()
+        unique_word_count = Estimate(
+            value=round(estimated_count),
+            error=math.ceil(2 * unique_words.standard_error * estimated_count),
+        )
+    return WordStatsEstimate(
+        word_count=Estimate(value=word_count, error=0),
+        unique_word_count=unique_word_count,
+        most_common_5_words=most_common_5_words,
+        # The share of the words which were actually sampled
+        sample_rate=sampled_word_count / word_count if word_count else 1.0,
+    )
+
+
+def _split_in_blocks(
+    html_doc: Union[str, bytes, memoryview],
+    tag_pattern: re.Pattern,
+    start: int,
+    end: int,
+    block_size: int,
+    encoding: str,
+) -> Iterator[str]:
+    def decode(block: Union[str, bytes, memoryview]) -> str:
+        return block if isinstance(block, str) else str(block, encoding, 'replace')
+
+    # Tags are matched from the start, rather than looking for the next "<": attribute values may contain some
+    block_start = start
+    for tag in tag_pattern.finditer(html_doc, start, end):
+        if tag.start() - block_start >= block_size:
+            yield decode(html_doc[block_start:tag.start()])
+            block_start = tag.start()
+    if block_start < end:
+        yield decode(html_doc[block_start:end])
+
+
+def _iter_block_words(text_blocks: Iterable[str]) -> Iterator[Tuple[int, List[str]]]:
+    # The text size and words of each block, with the same tokenisation as `DocSummary.words`. Tags (and the
+    # elements skipped between blocks) don't always separate words: a word which goes on in the next block is only
+    # given with that block.
+    unfinished_word = ''
+    for text_block in text_blocks:
+        text = strip_tags(text_block)
+        words = text.split()
+        if unfinished_word:
+            if words and not text[:1].isspace():
+                words[0] = unfinished_word + words[0]
+            else:
+                words.insert(0, unfinished_word)
+        unfinished_word = words.pop() if words and not text[-1:].isspace() else ''
+        yield len(text), words
+    if unfinished_word:
+        yield 0, [unfinished_word]
@@ -0,0 +1,81 @@
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Deque, Iterable, Iterator, NamedTuple, Optional, Tuple
+from urllib.parse import urlsplit
+from scraper.dns_cache import DnsCache
+from scraper.doc_analyser import PARSED, DocAnalyser, DocSummary
+
+
+class BatchResult(NamedTuple):
+    url: str
+    summary: Optional[DocSummary]
+    error: Optional[Exception]
+
+
+def analyse_batch(
+    analyser: DocAnalyser,
+    urls: Iterable[str],
+    workers: int = 8,
+    dns_cache: Optional[DnsCache] = None,
+) -> Iterator[BatchResult]:
+    # URLs are pulled lazily from `urls` and results are yielded in the same order: at most `2 * workers` pages
+    # are in flight at any time, so that huge URL streams (sitemaps, frontiers...) never have to fit in memory.
+    # With the `dns_cache` of the analyser's fetcher, the hosts of the pages waiting for a worker are resolved
+    # in the meantime.
+    max_in_flight = 2 * workers
+    in_flight: Deque[Tuple[str, Future]] = deque()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for url in urls:
+            if dns_cache is not None:
+                dns_cache.prefetch([urlsplit(url).hostname or ''])
+            in_flight.append((url, executor.submit(analyser.analyse, url)))
+            if len(in_flight) >= max_in_flight:
+                yield _get_batch_result(*in_flight.popleft())
+
+        while in_flight:
+            yield _get_batch_result(*in_flight.popleft())
+
+
+class OutcomeStats:
+    # What became of the pages of a batch fetched as `FetchResponse`s (see `DocSummary.outcome`), and the analysis time
+    # saved by not parsing error pages and non-HTML documents: their size (when known, the average size of the parsed
+    # pages otherwise) at the average analysis speed of the parsed pages
+
+    def __init__(self):
+        self.outcomes: Counter = Counter()
+        self.parsed_bytes = 0
+        self.analysis_seconds = 0.0
+        self.unparsed_bytes = 0
+        self.unparsed_pages_of_unknown_size = 0
+
+    def add(self, summary: DocSummary) -> None:
+        if summary.outcome is None:
+            return
+        self.outcomes[summary.outcome] += 1
+        if summary.outcome == PARSED:
+            self.parsed_bytes += summary.doc_size
+            self.analysis_seconds += summary.timings['analysis']
+        elif 'doc_size' in summary.skipped_fields:
+            self.unparsed_pages_of_unknown_size += 1
+        else:
+            self.unparsed_bytes += summary.doc_size
+
+    @property
+    def unparsed_count(self) -> int:
+        return sum(self.outcomes.values()) - self.outcomes[PARSED]
+
+    @property
+    def saved_seconds(self) -> float:
+        parsed_count = self.outcomes[PARSED]
+        if parsed_count == 0 or self.parsed_bytes == 0:
+            return 0.0
+        unparsed_bytes = self.unparsed_bytes + self.unparsed_pages_of_unknown_size * self.parsed_bytes / parsed_count
+        return unparsed_bytes * self.analysis_seconds / self.parsed_bytes
+
+
+def _get_batch_result(url: str, future: Future) -> BatchResult:
+    try:
+        return BatchResult(url=url, summary=future.result(), error=None)
+    except Exception as e:
+        return BatchResult(url=url, summary=None, error=e)
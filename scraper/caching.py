@@ -0,0 +1,94 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+K = TypeVar('K', bound=Hashable)
+V = TypeVar('V')
+
+
+class TtlCache(Generic[K, V]):
+    # Thread-safe cache whose entries expire after `ttl` seconds, and which evicts its least recently used
+    # entries beyond `max_size`.
+
+    def __init__(self, ttl: float, max_size: int, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._clock = clock
+        self._entries: 'OrderedDict[K, Tuple[float, V]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= self._clock():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: K, value: V, ttl: Optional[float] = None) -> None:
+        expires_at = self._clock() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def __contains__(self, key: K) -> bool:
+        # Unlike `get()`, neither counted as a hit or a miss, nor refreshing the entry
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[0] > self._clock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class SingleFlight(Generic[K, V]):
+    # Concurrent calls for the same key share a single execution of `fn`: the first caller runs it, the other
+    # ones wait for its result (or its exception).
+
+    def __init__(self):
+        self.coalesced = 0
+        self._in_flight: Dict[K, Future] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: K, fn: Callable[[], V]) -> V:
+        with self._lock:
+            future = self._in_flight.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = self._in_flight[key] = Future()
+            else:
+                self.coalesced += 1
+
+        if not is_leader:
+            return future.result()
+
+        try:
+            result: Any = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._in_flight)
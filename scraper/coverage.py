@@ -0,0 +1,142 @@
+import re
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Sequence, Tuple
+
+# Words, including their inner apostrophes ("don't"). Hyphens separate words, so that "open-source" matches
+# the "open source" keyword.
+_WORD_PATTERN = re.compile(r"\w+(?:['’]\w+)*")
+
+
+class KeywordOccurrences(NamedTuple):
+    # As written in the keywords meta tag
+    keyword: str
+    count: int
+
+
+class KeywordCoverage(NamedTuple):
+    keywords: List[KeywordOccurrences]
+
+    @property
+    def covered_count(self) -> int:
+        return sum(1 for occurrences in self.keywords if occurrences.count > 0)
+
+    @property
+    def coverage(self) -> float:
+        # Share of the keywords which appear in the content
+        if not self.keywords:
+            return 1
+        return self.covered_count / len(self.keywords)
+
+    @property
+    def missing_keywords(self) -> List[str]:
+        return [occurrences.keyword for occurrences in self.keywords if occurrences.count == 0]
+
+
+class KeywordMatcher:
+    # Aho-Corasick automaton (Aho & Corasick, 1975) whose symbols are words rather than characters: all the
+    # occurrences of all the phrases are counted in a single pass over the words, whatever the number of phrases.
+
+    def __init__(self, phrases: Iterable[Tuple[str, ...]]):
+        self._transitions: List[Dict[str, int]] = [{}]
+        self._phrases_count = 0
+        # Indexes of the phrases ending at each state, including the ones reached through failure links
+        outputs: List[List[int]] = [[]]
+        for phrase_index, phrase in enumerate(phrases):
+            state = 0
+            for word in phrase:
+                if word not in self._transitions[state]:
+                    self._transitions[state][word] = len(self._transitions)
+                    self._transitions.append({})
+                    outputs.append([])
+                state = self._transitions[state][word]
+            outputs[state].append(phrase_index)
+            self._phrases_count += 1
+
+        # Failure links: the longest proper suffix of each state's phrase prefix which is a prefix of some phrase
+        self._failures = [0] * len(self._transitions)
+        states_queue = deque(self._transitions[0].values())
+        while states_queue:
+            state = states_queue.popleft()
+            for word, next_state in self._transitions[state].items():
+                failure = self._failures[state]
+                while failure and word not in self._transitions[failure]:
+                    failure = self._failures[failure]
+                self._failures[next_state] = self._transitions[failure].get(word, 0)
+                outputs[next_state] = outputs[next_state] + outputs[self._failures[next_state]]
+                states_queue.append(next_state)
+        self._outputs = outputs
+
+    def count(self, words: Iterable[str]) -> List[int]:
+        # Number of occurrences of each phrase, in the order they were given
+        counts = [0] * self._phrases_count
+        transitions, failures, outputs = self._transitions, self._failures, self._outputs
+        state = 0
+        for word in words:
+            while state and word not in transitions[state]:
+                state = failures[state]
+            state = transitions[state].get(word, 0)
+            for phrase_index in outputs[state]:
+                counts[phrase_index] += 1
+        return counts
+
+
+class WordIndex:
+    # The normalised words of a document, built once and matched against any number of keywords
+
+    def __init__(self, text: str, stem: bool = False):
+        self.stem = stem
+        self.words = normalize_words(text, stem=stem)
+
+    def keyword_coverage(self, keywords: Sequence[str]) -> KeywordCoverage:
+        return match_keywords(self.words, keywords, stem=self.stem)
+
+
+def get_keyword_coverage(text: str, keywords: Sequence[str], stem: bool = False) -> KeywordCoverage:
+    # For a text which is only matched once: its words are normalised on the fly rather than indexed, so that the
+    # memory needed doesn't grow with the text
+    return match_keywords(iter_normalized_words(text, stem=stem), keywords, stem=stem)
+
+
+def match_keywords(words: Iterable[str], keywords: Sequence[str], stem: bool = False) -> KeywordCoverage:
+    # Keywords can be phrases of several words. Keywords which are the same once normalised are only reported
+    # once, and keywords without any word (e.g. only punctuation) are ignored.
+    phrases: Dict[Tuple[str, ...], str] = {}
+    for keyword in keywords:
+        phrase = tuple(normalize_words(keyword, stem=stem))
+        if phrase and phrase not in phrases:
+            phrases[phrase] = keyword
+    counts = KeywordMatcher(phrases).count(words)
+    return KeywordCoverage(
+        keywords=[KeywordOccurrences(keyword=keyword, count=count) for keyword, count in zip(phrases.values(), counts)]
+    )
+
+
+def parse_keywords(keywords_content: str) -> List[str]:
+    # Keywords are normally comma-separated phrases, but some sites separate single words with spaces
+    separator = ',' if ',' in keywords_content else None
+    return [keyword.strip() for keyword in keywords_content.split(separator) if keyword.strip()]
+
+
+def normalize_words(text: str, stem: bool = False) -> List[str]:
+    # Case-folded, without the punctuation around words, and optionally stemmed
+    return list(iter_normalized_words(text, stem=stem))
+
+
+def iter_normalized_words(text: str, stem: bool = False) -> Iterator[str]:
+    # Same words as `normalize_words()`, one at a time. Words are found before being case-folded: case folding may
+    # turn a letter into several characters, which aren't all word characters ("İ" -> "i̇")
+    for word_match in _WORD_PATTERN.finditer(text):
+        word = word_match.group().casefold()
+        yield stem_word(word) if stem else word
+
+
+def stem_word(word: str) -> str:
+    # "S-stemmer" (Harman, 1991): only merges the plural and singular forms of English words, which keeps it
+    # conservative enough for keywords
+    if len(word) > 3 and word.endswith('ies') and not word.endswith(('eies', 'aies')):
+        return word[:-3] + 'y'
+    if len(word) > 3 and word.endswith('es') and not word.endswith(('aes', 'ees', 'oes')):
+        return word[:-1]
+    if len(word) > 2 and word.endswith('s') and not word.endswith(('us', 'ss')):
+        return word[:-1]
+    return word
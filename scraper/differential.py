@@ -0,0 +1,244 @@
+import gzip
+import json
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+from scraper.doc_analyser import ANALYSED, DocAnalyser, DocSummary, find_head_end
+from scraper.doc_fetcher import PartialFetch
+from scraper.fast_paths import analyse_head_only
+from scraper.golden_corpus import GoldenDoc, generate_golden_corpus
+
+# Fields which must be the same in every mode (unless the mode skips them)
+COMPARED_FIELDS = ('page_title', 'meta_tags', 'doc_size', 'body_content', 'links', 'extras')
+# Reference word stats which approximate analyses estimate instead (see `DocSummary.word_stats`)
+ESTIMATED_FIELDS = ('word_count', 'unique_word_count')
+# Not an analysis field: the mode failed on a document which the reference analyses, or the other way around
+ERROR_FIELD = 'error'
+
+# The name of the reference analysis' own report, when it is checked against golden summaries
+REFERENCE_MODE = 'reference'
+# Summaries of a golden corpus taken with the reference analysis, committed along with the code (see
+# `take_golden_snapshot()`)
+GOLDEN_SNAPSHOT_PATH = Path(__file__).parent / 'golden_summaries.json.gz'
+
+_PROGRESSIVE_CHUNK_SIZE = 4096
+
+AnalysisMode = Callable[[bytes], DocSummary]
+
+
+class FieldDifference(NamedTuple):
+    doc_name: str
+    field: str
+    # What the reference analysis found, and what the mode found
+    expected: Any
+    actual: Any
+
+
+class ModeReport(NamedTuple):
+    mode: str
+    docs_count: int
+    differences: List[FieldDifference]
+    # Number of documents on which the mode skipped each field
+    skipped_fields: Counter
+    seconds: float
+    reference_seconds: float
+
+    @property
+    def differing_docs_count(self) -> int:
+        return len({difference.doc_name for difference in self.differences})
+
+    @property
+    def differences_by_field(self) -> Counter:
+        return Counter(difference.field for difference in self.differences)
+
+    @property
+    def speedup(self) -> float:
+        return self.reference_seconds / self.seconds if self.seconds else 0.0
+
+
+class GoldenSnapshot(NamedTuple):
+    # The summaries of a golden corpus (see `generate_golden_corpus()`), by document name, as the reference analysis
+    # gave them when the snapshot was taken. Only the compared fields are kept, and the documents which the reference
+    # analysis failed on are left out.
+    seed: int
+    docs_per_category: int
+    summaries: Dict[str, DocSummary]
+
+    def generate_docs(self) -> List[GoldenDoc]:
+        return generate_golden_corpus(self.seed, self.docs_per_category)
+
+
+def take_golden_snapshot(reference: AnalysisMode, seed: int = 0, docs_per_category: int = 20) -> GoldenSnapshot:
+    # Only after an intended change of the reference analysis: the new snapshot is what every analysis is then
+    # checked against (see `run_differential()`)
+    summaries = {}
+    for doc in generate_golden_corpus(seed, docs_per_category):
+        summary, error, _ = _analyse_timed(reference, doc.content)
+        if summary is not None:
+            summaries[doc.name] = DocSummary.from_dict(_get_compared_fields(summary))
+    return GoldenSnapshot(seed=seed, docs_per_category=docs_per_category, summaries=summaries)
+
+
+def write_golden_snapshot(snapshot: GoldenSnapshot, path: Path = GOLDEN_SNAPSHOT_PATH) -> None:
+    # Byte for byte the same file for the same summaries, so that only real changes show up in the history
+    content = json.dumps({
+        'seed': snapshot.seed,
+        'docs_per_category': snapshot.docs_per_category,
+        'summaries': {name: _get_compared_fields(summary) for name, summary in snapshot.summaries.items()},
+    }, sort_keys=True, indent=1, ensure_ascii=False)
+    path.write_bytes(gzip.compress(content.encode('utf-8'), mtime=0))
+
+
+def read_golden_snapshot(path: Path = GOLDEN_SNAPSHOT_PATH) -> GoldenSnapshot:
+    snapshot_dict = json.loads(gzip.decompress(path.read_bytes()).decode('utf-8'))
+    return GoldenSnapshot(
+        seed=snapshot_dict['seed'],
+        docs_per_category=snapshot_dict['docs_per_category'],
+        summaries={name: DocSummary.from_dict(summary) for name, summary in snapshot_dict['summaries'].items()},
+    )
+
+
+def create_analysis_modes(analyser: DocAnalyser) -> Dict[str, AnalysisMode]:
+    # Every other way of analysing a document which is in memory, with the same settings as `analyser`
+    approximate_analyser = DocAnalyser(
+        None,
+        max_doc_size=analyser.max_doc_size,
+        html_only=analyser.html_only,
+        approximate_above=0,
+        approximate_sample_rate=analyser.approximate_sample_rate,
+        extractors=analyser.extractors,
+    )
+
+    def analyse_memoryview(html_doc: bytes) -> DocSummary:
+        return analyser.analyse_doc(memoryview(html_doc))
+
+    def analyse_progressively(html_doc: bytes) -> DocSummary:
+        chunks = (html_doc[start:start + _PROGRESSIVE_CHUNK_SIZE]
+                  for start in range(0, len(html_doc), _PROGRESSIVE_CHUNK_SIZE))
+        for event in analyser.analyse_progressively(chunks, doc_size=len(html_doc)):
+            if event.name == ANALYSED:
+                return event.summary
+        raise AssertionError('The progressive analysis never ended')
+
+    def analyse_head(html_doc: bytes) -> DocSummary:
+        return analyse_head_only(analyser, '', head_fetcher=lambda _: _fetch_head(html_doc)).summary
+
+    return {
+        'memoryview': analyse_memoryview,
+        'progressive': analyse_progressively,
+        'approximate': approximate_analyser.analyse_doc,
+        'head_only': analyse_head,
+    }
+
+
+def run_differential(
+    docs: Sequence[GoldenDoc],
+    modes: Dict[str, AnalysisMode],
+    reference: AnalysisMode,
+    golden_summaries: Optional[Dict[str, DocSummary]] = None,
+) -> List[ModeReport]:
+    # Analyses every document with the reference analysis and with every mode, and reports how each mode's
+    # summaries differ from the reference ones, field by field, and how fast each mode is.
+    # With `golden_summaries` (see `GoldenSnapshot`), the summaries are expected to be the golden ones rather than
+    # the ones of the current reference analysis, which gets its own report first (`REFERENCE_MODE`): a regression of
+    # the reference analysis shows there, and isn't taken for the expected result by the other modes.
+    references: List[Optional[DocSummary]] = []
+    reference_errors: List[Optional[Exception]] = []
+    reference_seconds = 0.0
+    for doc in docs:
+        summary, error, seconds = _analyse_timed(reference, doc.content)
+        references.append(summary)
+        reference_errors.append(error)
+        reference_seconds += seconds
+    if golden_summaries is not None:
+        modes = {REFERENCE_MODE: reference, **modes}
+        for index, doc in enumerate(docs):
+            # Documents which the reference analysis failed on have no golden summary: it's still their reference
+            if doc.name in golden_summaries:
+                references[index], reference_errors[index] = golden_summaries[doc.name], None
+
+    reports = []
+    for mode_name, mode in modes.items():
+        differences: List[FieldDifference] = []
+        skipped_fields: Counter = Counter()
+        mode_seconds = 0.0
+        for doc, expected, expected_error in zip(docs, references, reference_errors):
+            summary, error, seconds = _analyse_timed(mode, doc.content)
+            mode_seconds += seconds
+            if expected is None or summary is None:
+                # Both failing is fine, as long as they fail the same way
+                if type(expected_error) is not type(error):
+                    differences.append(FieldDifference(doc.name, ERROR_FIELD, _describe(expected_error), _describe(error)))
+                continue
+            skipped_fields.update(summary.skipped_fields)
+            differences.extend(compare_summaries(doc.name, expected, summary))
+        reports.append(ModeReport(
+            mode=mode_name,
+            docs_count=len(docs),
+            differences=differences,
+            skipped_fields=skipped_fields,
+            seconds=mode_seconds,
+            reference_seconds=reference_seconds,
+        ))
+    return reports
+
+
+def compare_summaries(doc_name: str, expected: DocSummary, actual: DocSummary) -> List[FieldDifference]:
+    # Skipped fields are not differences. Estimated word stats are, when the reference value is outside of
+    # their error bounds.
+    differences = [
+        FieldDifference(doc_name, field, getattr(expected, field), getattr(actual, field))
+        for field in COMPARED_FIELDS
+        if field not in actual.skipped_fields and getattr(expected, field) != getattr(actual, field)
+    ]
+    if actual.word_stats is not None:
+        for field in ESTIMATED_FIELDS:
+            estimate = getattr(actual.word_stats, field)
+            if abs(getattr(expected, field) - estimate.value) > estimate.error:
+                differences.append(FieldDifference(doc_name, field, getattr(expected, field), estimate))
+    return differences
+
+
+def format_differences(report: ModeReport, max_examples: int = 3, max_value_length: int = 80) -> Iterable[str]:
+    # Human-readable lines: the differing fields, with a few example documents for each
+    for field, count in report.differences_by_field.most_common():
+        yield f'{field}: {count} docs'
+        examples = [difference for difference in report.differences if difference.field == field][:max_examples]
+        for difference in examples:
+            yield f'  {difference.doc_name}: expected {_shorten(difference.expected, max_value_length)}, ' \
+                  f'got {_shorten(difference.actual, max_value_length)}'
+
+
+def _fetch_head(html_doc: bytes) -> PartialFetch:
+    # What `doc_fetcher.fetch_url_head()` would receive, for a server sending the document in one go
+    head_end = find_head_end(html_doc)
+    return PartialFetch(
+        content=html_doc[:head_end],
+        doc_size=len(html_doc),
+        bytes_received=head_end,
+        truncated=head_end < len(html_doc),
+    )
+
+
+def _analyse_timed(mode: AnalysisMode, html_doc: bytes) -> Tuple[Optional[DocSummary], Optional[Exception], float]:
+    started_at = time.perf_counter()
+    try:
+        summary, error = mode(html_doc), None
+    except Exception as e:
+        summary, error = None, e
+    return summary, error, time.perf_counter() - started_at
+
+
+def _get_compared_fields(summary: DocSummary) -> Dict[str, Any]:
+    summary_dict = summary.to_dict()
+    return {field: summary_dict[field] for field in COMPARED_FIELDS}
+
+
+def _describe(error: Optional[Exception]) -> Optional[str]:
+    return None if error is None else f'{type(error).__name__}: {error}'
+
+
+def _shorten(value: Any, max_length: int) -> str:
+    text = repr(value)
+    return text if len(text) <= max_length else f'{text[:max_length - 3]}...'
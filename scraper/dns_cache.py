@@ -0,0 +1,145 @@
+import ipaddress
+import socket
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Iterable, List, NamedTuple, Optional, Tuple, Union
+from scraper.caching import SingleFlight, TtlCache
+
+
+class DnsStats(NamedTuple):
+    lookups: int
+    hits: int
+    # Lookups which waited for the resolution of another lookup (or prefetch) of the same host
+    coalesced: int
+    resolutions: int
+    failures: int
+    resolution_seconds: float
+    # Resolutions avoided by the cache hits, at the average resolution time
+    saved_seconds: float
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            **self._asdict(),
+            'hit_rate': round(self.hit_rate, 4),
+            'resolution_seconds': round(self.resolution_seconds, 4),
+            'saved_seconds': round(self.saved_seconds, 4),
+        }
+
+
+def resolve_host(host: str) -> Tuple[List[str], Optional[float]]:
+    # Returns the host addresses, in the resolver's order of preference, and how long they can be kept (`None`: the
+    # system resolver doesn't tell us the records TTL)
+    addresses = []
+    for _, _, _, _, socket_address in socket.getaddrinfo(host, None, type=socket.SOCK_STREAM):
+        if socket_address[0] not in addresses:
+            addresses.append(socket_address[0])
+    return addresses, None
+
+
+class DnsCache:
+    # Each host is resolved once (concurrent lookups for a host share the same resolution), and its addresses kept
+    # for the TTL the resolver gives, or `ttl` seconds; at most `max_size` hosts are kept in memory. IP addresses
+    # are returned as is, without counting as lookups.
+
+    def __init__(
+        self,
+        ttl: float = 300,
+        failure_ttl: float = 30,
+        max_size: int = 10_000,
+        resolver: Callable[[str], Tuple[List[str], Optional[float]]] = resolve_host,
+        prefetch_workers: int = 8,
+    ):
+        # Unknown hosts are not looked up again for `failure_ttl` seconds: each lookup fails right away
+        self.failure_ttl = failure_ttl
+        self.prefetch_workers = prefetch_workers
+        self._resolver = resolver
+        self._cache: TtlCache[str, Union[List[str], socket.gaierror]] = TtlCache(ttl=ttl, max_size=max_size)
+        self._single_flight: SingleFlight[str, List[str]] = SingleFlight()
+        self._prefetch_executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._resolutions_count = 0
+        self._failures_count = 0
+        self._resolution_seconds = 0.0
+
+    def resolve(self, host: str) -> List[str]:
+        host = host.rstrip('.').lower()
+        if _is_ip_address(host):
+            return [host]
+        addresses = self._cache.get(host)
+        if addresses is None:
+            addresses = self._single_flight.do(host, lambda: self._resolve_uncached(host))
+        if isinstance(addresses, socket.gaierror):
+            raise socket.gaierror(*addresses.args)
+        return addresses
+
+    def prefetch(self, hosts: Iterable[str]) -> List[Future]:
+        # Starts resolving in the background the hosts which are not cached yet: fetches which need them before
+        # the end of their resolution wait for it instead of resolving them again
+        futures = []
+        for host in dict.fromkeys(host.rstrip('.').lower() for host in hosts):
+            if not host or _is_ip_address(host) or host in self._cache:
+                continue
+            if self._prefetch_executor is None:
+                with self._lock:
+                    if self._prefetch_executor is None:
+                        self._prefetch_executor = ThreadPoolExecutor(self.prefetch_workers,
+                                                                     thread_name_prefix='dns-prefetch')
+            futures.append(self._prefetch_executor.submit(self._prefetch_host, host))
+        return futures
+
+    def stats(self) -> DnsStats:
+        with self._lock:
+            resolutions_count, resolution_seconds = self._resolutions_count, self._resolution_seconds
+            failures_count = self._failures_count
+        average_resolution_seconds = resolution_seconds / resolutions_count if resolutions_count else 0.0
+        return DnsStats(
+            lookups=self._cache.hits + self._cache.misses,
+            hits=self._cache.hits,
+            coalesced=self._single_flight.coalesced,
+            resolutions=resolutions_count,
+            failures=failures_count,
+            resolution_seconds=resolution_seconds,
+            saved_seconds=self._cache.hits * average_resolution_seconds,
+        )
+
+    def shutdown(self) -> None:
+        if self._prefetch_executor is not None:
+            self._prefetch_executor.shutdown(wait=False, cancel_futures=True)
+
+    def _prefetch_host(self, host: str) -> None:
+        # The same host may have been queued several times before its first resolution
+        if host not in self._cache:
+            self._single_flight.do(host, lambda: self._resolve_uncached(host))
+
+    def _resolve_uncached(self, host: str) -> List[str]:
+        started_at = time.perf_counter()
+        try:
+            addresses, ttl = self._resolver(host)
+            if not addresses:
+                raise socket.gaierror(socket.EAI_NONAME, f'No address for {host}')
+        except socket.gaierror as e:
+            self._cache.set(host, e, ttl=self.failure_ttl)
+            self._count_resolution(started_at, failed=True)
+            raise
+        self._cache.set(host, addresses, ttl=ttl)
+        self._count_resolution(started_at, failed=False)
+        return addresses
+
+    def _count_resolution(self, started_at: float, failed: bool) -> None:
+        with self._lock:
+            self._resolutions_count += 1
+            self._failures_count += failed
+            self._resolution_seconds += time.perf_counter() - started_at
+
+
+def _is_ip_address(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host.strip('[]'))
+    except ValueError:
+        return False
+    return True
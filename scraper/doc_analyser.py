@@ -1,8 +1,19 @@
 
+import codecs
+import html
+import re
+import time
 from collections import Counter
-from typing import Callable, NamedTuple, Optional, List, Set, Tuple
-from bs4 import BeautifulSoup
+from html.parser import HTMLParser
+from typing import Any, Callable, Dict, Iterable, Iterator, NamedTuple, Optional, List, Sequence, Set, Tuple, Union
+from bs4 import BeautifulSoup, Tag
+from bs4.dammit import EncodingDetector, UnicodeDammit
 import humanfriendly
+from scraper.approximate import WordStatsEstimate, estimate_word_stats, iter_text_blocks
+from scraper.coverage import KeywordCoverage, KeywordOccurrences, get_keyword_coverage, parse_keywords
+from scraper.extractors import Extractor, get_extractor_class, run_extractors
+from scraper.profiling import SlowPageProfiler, shared_memory_tracing
+from scraper.visible_text import get_visible_text
 
 
 class DocMetaTag(NamedTuple):
@@ -15,20 +26,56 @@ class DocLink(NamedTuple):
     href: str
 
 
+class SkippedFieldError(ValueError):
+    # Not an `AttributeError`: `hasattr()` and `getattr()` with a default would silently take skipped fields for
+    # missing ones
+    pass
+
+
 class DocSummary(NamedTuple):
     page_title: str
     meta_tags: List[DocMetaTag]
     doc_size: int
     body_content: str
     links: List[DocLink]
+    # Peak memory allocated by the analysis, in bytes (only when the analyser measures it)
+    peak_memory: Optional[int] = None
+    # Partial analyses (see `scraper.fast_paths`) don't fill every field: skipped fields are `None`, and the
+    # properties which depend on them raise a `SkippedFieldError`.
+    skipped_fields: Tuple[str, ...] = ()
+    # Approximate analyses (see `DocAnalyser.approximate_above`) skip the body content, and only estimate its stats
+    word_stats: Optional[WordStatsEstimate] = None
+    # Results of the analyser's extra extractors (see `scraper.extractors`), by extractor name
+    extras: Optional[Dict[str, Any]] = None
+    # Time spent in each extractor (including the built-in "meta_tags" and "links" ones), in seconds
+    extractor_timings: Optional[Dict[str, float]] = None
+    # Only for documents fetched as a `FetchResponse`: what became of the page (`PARSED`, or why it was not parsed, in
+    # which case every analysis field is skipped), and how it was fetched
+    outcome: Optional[str] = None
+    status_code: Optional[int] = None
+    final_url: Optional[str] = None
+    redirects: Optional[List[str]] = None
+    content_type: Optional[str] = None
+    # Time to receive the response headers ("headers") and body ("body"), and to analyse it ("analysis", for parsed
+    # pages), in seconds
+    timings: Optional[Dict[str, float]] = None
+    # Occurrences of the keywords meta tag's keywords in the content, matched once by the analyser (see
+    # `keyword_coverage`). `None` for summaries built elsewhere, whose coverage is computed at each access.
+    keyword_occurrences: Optional[List[KeywordOccurrences]] = None
+
+    @property
+    def is_partial(self) -> bool:
+        return len(self.skipped_fields) > 0
 
     @property
     def doc_size_human_friendly(self) -> str:
+        self._require('doc_size')
         return humanfriendly.format_size(self.doc_size)
 
     @property
     def words(self) -> Tuple[str]:
-        return tuple([word.strip() for word in self.body_content.split(' ') if word])
+        self._require('body_content')
+        return tuple(self.body_content.split())
 
     @property
     def unique_words(self) -> Set[str]:
@@ -48,70 +95,734 @@ class DocSummary(NamedTuple):
         return counter.most_common(5)
 
     @property
-    def missing_meta_keywords(self) -> List[str]:
-        keywords = self.get_meta_by_name('keywords')
-        if keywords is None:
-            return []
-
-        missing_keywords = []
-        unique_words = self.unique_words
-        for keyword in keywords.content.split(' '):
-            if keyword not in unique_words:
-                missing_keywords.append(keyword)
+    def keyword_coverage(self) -> KeywordCoverage:
+        # Occurrences of each keyword of the keywords meta tag in the content, ignoring case and punctuation
+        self._require('body_content')
+        if self.keyword_occurrences is not None:
+            return KeywordCoverage(keywords=self.keyword_occurrences)
+        return KeywordCoverage(keywords=get_keyword_occurrences(self.meta_tags, self.body_content))
 
-        return missing_keywords
+    @property
+    def missing_meta_keywords(self) -> List[str]:
+        return self.keyword_coverage.missing_keywords
 
     def get_meta_by_name(self, name: str) -> Optional[DocMetaTag]:
+        self._require('meta_tags')
         for meta in self.meta_tags:
             if meta.name == name:
                 return meta
         return None
 
+    def to_dict(self) -> Dict[str, Any]:
+        # JSON-friendly representation, used to ship summaries between processes and nodes
+        summary_dict = self._asdict()
+        if self.meta_tags is not None:
+            summary_dict['meta_tags'] = [meta_tag._asdict() for meta_tag in self.meta_tags]
+        if self.links is not None:
+            summary_dict['links'] = [link._asdict() for link in self.links]
+        summary_dict['skipped_fields'] = list(self.skipped_fields)
+        if self.word_stats is not None:
+            summary_dict['word_stats'] = self.word_stats.to_dict()
+        if self.keyword_occurrences is not None:
+            summary_dict['keyword_occurrences'] = [occurrences._asdict() for occurrences in self.keyword_occurrences]
+        return summary_dict
+
+    @classmethod
+    def from_dict(cls, summary_dict: Dict[str, Any]) -> 'DocSummary':
+        summary_dict = dict(summary_dict)
+        if summary_dict['meta_tags'] is not None:
+            summary_dict['meta_tags'] = [DocMetaTag(**meta_tag) for meta_tag in summary_dict['meta_tags']]
+        if summary_dict['links'] is not None:
+            summary_dict['links'] = [DocLink(**link) for link in summary_dict['links']]
+        summary_dict['skipped_fields'] = tuple(summary_dict.get('skipped_fields', ()))
+        if summary_dict.get('word_stats') is not None:
+            summary_dict['word_stats'] = WordStatsEstimate.from_dict(summary_dict['word_stats'])
+        if summary_dict.get('keyword_occurrences') is not None:
+            summary_dict['keyword_occurrences'] = [
+                KeywordOccurrences(**occurrences) for occurrences in summary_dict['keyword_occurrences']
+            ]
+        return cls(**summary_dict)
+
+    def _require(self, field: str) -> None:
+        if field in self.skipped_fields:
+            raise SkippedFieldError(f'"{field}" was skipped by this partial analysis')
+
+
+def get_keyword_occurrences(meta_tags: List[DocMetaTag], body_content: str) -> List[KeywordOccurrences]:
+    # All the keywords are matched in a single pass over the content's words (see `coverage.KeywordMatcher`)
+    keywords_content = next((meta.content for meta in meta_tags if meta.name == 'keywords'), None)
+    if not keywords_content:
+        return []
+    return get_keyword_coverage(body_content, parse_keywords(keywords_content)).keywords
+
+
+HEAD_PARSED = 'head_parsed'
+LINKS_FOUND = 'links_found'
+LINKS_EXTRACTED = 'links_extracted'
+ANALYSED = 'analysed'
+
+
+class AnalysisEvent(NamedTuple):
+    # See `DocAnalyser.analyse_progressively()`
+    name: str
+    # Everything known so far: what isn't known yet is in `summary.skipped_fields`
+    summary: DocSummary
+    # Since the start of the analysis, in seconds
+    elapsed: float
+    # Only for LINKS_FOUND events: the links found in the part of the document received since the previous one
+    links: Optional[List[DocLink]] = None
+
+
+# What became of the pages fetched as a `FetchResponse` (see `DocSummary.outcome`)
+PARSED = 'parsed'
+ERROR_STATUS = 'error_status'
+NOT_HTML = 'not_html'
+BINARY_CONTENT = 'binary_content'
+
+HTML_CONTENT_TYPES = ('text/html', 'application/xhtml+xml')
+
+
+class FetchResponse(NamedTuple):
+    # What structured fetchers (see `doc_fetcher.fetch_url_response()`) give the analyser: the body, and how it was
+    # fetched, so that error pages and non-HTML documents are never parsed (see `get_response_outcome()`)
+
+    # Final URL, after the redirects
+    url: str
+    # URLs which redirected to `url`, the requested one first
+    redirects: List[str]
+    status_code: int
+    # Media type, lowercased, without parameters (`None` when the server didn't send any)
+    content_type: Optional[str]
+    # Empty when the body was not worth downloading (error statuses, non-HTML content types), and only the first bytes
+    # of binary bodies
+    content: bytes
+    # Whole document size, when the server told us (`None` otherwise)
+    doc_size: Optional[int]
+    # Time to receive the response headers ("headers") and body ("body"), in seconds
+    timings: Dict[str, float]
+
+
+# Signatures of common binary formats which are sometimes served in place of HTML pages
+_BINARY_SIGNATURES = (
+    b'%PDF-', b'\x89PNG', b'\xff\xd8\xff', b'GIF87a', b'GIF89a', b'PK\x03\x04', b'\x1f\x8b', b'RIFF',
+    b'OggS', b'ID3', b'\x00\x00\x01\x00', b'\x7fELF', b'MZ',
+)
+_BINARY_SNIFF_SIZE = 512
+
+
+def get_response_outcome(response: FetchResponse) -> str:
+    if not 200 <= response.status_code < 300:
+        return ERROR_STATUS
+    if response.content_type is not None and response.content_type not in HTML_CONTENT_TYPES:
+        return NOT_HTML
+    if looks_binary(response.content):
+        return BINARY_CONTENT
+    return PARSED
+
+
+def looks_binary(doc: Union[str, bytes, memoryview]) -> bool:
+    if isinstance(doc, str):
+        return False
+    head = bytes(doc[:_BINARY_SNIFF_SIZE])
+    # NUL bytes never show up in HTML (but they do in UTF-16 text, which has a BOM)
+    return head.startswith(_BINARY_SIGNATURES) or (b'\x00' in head and not head.startswith((b'\xff\xfe', b'\xfe\xff')))
+
+
+def find_head_end(html_doc: Union[str, bytes, bytearray, memoryview], complete: bool = True) -> Optional[int]:
+    # Where the <head> of a document ends: after its end tag, or else right before the first thing which can only be
+    # in the body (a body tag, or text), like browsers do. "</head>" in scripts, styles or comments doesn't count.
+    # For the beginning of a document which is still being received (`complete=False`), `None` until we know for
+    # sure.
+    head_token_pattern, body_start_pattern = _HEAD_PATTERNS[isinstance(html_doc, str)]
+    doc_start = html_doc[:_BINARY_SNIFF_SIZE]
+    if isinstance(doc_start, memoryview):
+        doc_start = doc_start.tobytes()
+    if isinstance(html_doc, str):
+        position = 1 if doc_start.startswith('\ufeff') else 0
+    elif doc_start.startswith(codecs.BOM_UTF8):
+        position = len(codecs.BOM_UTF8)
+    elif b'\x00' in doc_start:
+        # UTF-16 (or UTF-32) markup is not ASCII: as far as we can tell, the whole document is the head
+        return len(html_doc) if complete else None
+    else:
+        position = 0
+    while True:
+        head_token = head_token_pattern.match(html_doc, position)
+        if head_token is None:
+            break
+        position = head_token.end()
+    if complete or body_start_pattern.match(html_doc, position):
+        return position
+    return None
+
+
+# Peak memory allocations of a full analysis, per byte of document: about 15 on the synthetic pages of the "memory"
+# benchmark, with some margin
+PEAK_MEMORY_PER_DOC_BYTE = 20
+
+
+def max_doc_size_for_memory(memory_budget: int, peak_memory_per_doc_byte: float = PEAK_MEMORY_PER_DOC_BYTE) -> int:
+    # The `max_doc_size` which keeps each analysis' peak memory within `memory_budget` bytes: the parsed tree, not
+    # the raw document, is what takes most of the memory
+    return int(memory_budget / peak_memory_per_doc_byte)
+
+
+class DocTooLargeError(ValueError):
+    pass
+
+
+class UnsupportedContentError(ValueError):
+    pass
+
 
 class DocAnalyser:
 
-    def __init__(self, doc_fetcher: Callable):
+    def __init__(
+        self,
+        doc_fetcher: Callable,
+        max_doc_size: Optional[int] = None,
+        html_only: bool = False,
+        measure_memory: bool = False,
+        approximate_above: Optional[int] = None,
+        approximate_sample_rate: float = 0.2,
+        extractors: Sequence[str] = (),
+        profiler: Optional[SlowPageProfiler] = None,
+    ):
         self.doc_fetcher = doc_fetcher
+        # Memory budget: documents bigger than this (in bytes, or characters for `str` docs) are rejected before
+        # being parsed (see `max_doc_size_for_memory()`). Budget-aware fetchers abort the download even earlier.
+        self.max_doc_size = max_doc_size
+        # Rejects documents which are obviously binary (PDF, images, archives...) without parsing them
+        self.html_only = html_only
+        # Reports the analysis' peak memory allocations in `DocSummary.peak_memory`. This relies on `tracemalloc`,
+        # which slows the analysis down and is process-wide: concurrent analyses in threads share its tracing (see
+        # `profiling.SharedMemoryTracing`), and their peaks may include each other's.
+        self.measure_memory = measure_memory
+        # Documents bigger than this (in bytes) are not parsed into a tree: title, meta tags and links are extracted
+        # from the markup, and the word stats are only estimated (in `DocSummary.word_stats`). On top of the document
+        # itself, such an analysis only needs memory for its <head>, one block of text at a time, and its results:
+        # the meta tags and the links, which grow with their number, not with the size of the text. Documents are
+        # scanned before being decoded, unless their markup isn't ASCII (e.g. UTF-16) or their encoding can't be
+        # told without trying them all (see `_find_markup_encoding()`): those are decoded whole first.
+        self.approximate_above = approximate_above
+        self.approximate_sample_rate = approximate_sample_rate
+        # Names of registered extractors to run, on top of the meta tags and links ones. Unknown names are reported
+        # right away rather than at the first analysis.
+        for extractor_name in extractors:
+            get_extractor_class(extractor_name)
+        self.extractors = tuple(extractors)
+        # Captures the profiles of the slowest and most memory hungry pages analysed by `analyse()` (see
+        # `scraper.profiling`). It needs the doc after the analysis: with a profiler, the doc is not freed as soon as
+        # it has been parsed.
+        self.profiler = profiler
 
     def analyse(self, url: str) -> DocSummary:
-        html_doc: str = self.doc_fetcher(url)
+        # The fetched doc is not bound to any name here, so `analyse_doc()` holds its only reference and can free
+        # it as soon as it has been parsed.
+        if self.profiler is not None:
+            return self.profiler.profile(url, self.doc_fetcher(url), self.analyse_doc)
+        return self.analyse_doc(self.doc_fetcher(url))
+
+    def analyse_doc(self, html_doc: Union[str, bytes, memoryview, FetchResponse]) -> DocSummary:
+        started_at = time.perf_counter()
+        response = None
+        if isinstance(html_doc, FetchResponse):
+            outcome = get_response_outcome(html_doc)
+            if outcome != PARSED:
+                return _summarise_unparsed_response(html_doc, outcome)
+            # Only `html_doc` references the body from now on, so that it can still be freed once parsed
+            response, html_doc = html_doc._replace(content=b''), html_doc.content
+
+        doc_size = len(html_doc) if not isinstance(html_doc, memoryview) else html_doc.nbytes
+        if self.max_doc_size is not None and doc_size > self.max_doc_size:
+            raise DocTooLargeError(f'Document size ({doc_size}) exceeds the maximum size ({self.max_doc_size})')
+        if self.html_only and looks_binary(html_doc):
+            raise UnsupportedContentError('Document content is binary, not HTML')
+
+        # Stopped whatever happens: tracemalloc would otherwise slow the whole process down from then on
+        memory_baseline = shared_memory_tracing.start() if self.measure_memory else None
+        try:
+            if self.approximate_above is not None and doc_size > self.approximate_above:
+                doc_summary = self._analyse_doc_approximately(html_doc, doc_size)
+            else:
+                if isinstance(html_doc, memoryview):
+                    # BeautifulSoup only knows about `str` and `bytes`: memory-mapped or shared memory payloads are
+                    # decoded straight from their buffer, without a `bytes` copy of the whole document first
+                    html_doc = _decode_buffer(html_doc)
+                soup = BeautifulSoup(html_doc, 'html.parser')
+                del html_doc
+
+                extraction = run_extractors(soup, self.create_extractors())
+                meta_tags, body_content = extraction.results.pop('meta_tags'), get_visible_text(soup)
+                doc_summary = DocSummary(
+                    page_title=_get_page_title(soup),
+                    meta_tags=meta_tags,
+                    doc_size=doc_size,
+                    body_content=body_content,
+                    links=extraction.results.pop('links'),
+                    extras=extraction.results if self.extractors else None,
+                    extractor_timings=extraction.timings,
+                )
+
+                # Everything we need was extracted: the tree can go, it is by far the biggest object here
+                soup.decompose()
+                del soup
+                doc_summary = doc_summary._replace(
+                    keyword_occurrences=get_keyword_occurrences(meta_tags, body_content),
+                )
+        finally:
+            peak_memory = shared_memory_tracing.stop(memory_baseline) if memory_baseline is not None else None
+
+        if peak_memory is not None:
+            doc_summary = doc_summary._replace(peak_memory=peak_memory)
+        return doc_summary if response is None else _add_response(doc_summary, response, started_at)
+
+    def analyse_progressively(self, chunks: Iterable[bytes], doc_size: Optional[int] = None) -> Iterator[AnalysisEvent]:
+        # The same analysis as `analyse_doc()`, for a document received chunk by chunk (see
+        # `doc_fetcher.stream_url_content()`), given as events as soon as each part of the summary is known:
+        #  - HEAD_PARSED: title and meta tags, as soon as the whole <head> was received (see `find_head_end()`; not
+        #    sent for documents without any, or which end in it). `doc_size` is the expected document size, when known
+        #    before the download ends.
+        #  - LINKS_FOUND: the links of the body, in `event.links`, as they are received (the summary is the head's).
+        #    They come from a streaming parser, which builds no tree: the links of LINKS_EXTRACTED are the
+        #    reference ones, should a broken markup or encoding be understood differently. Documents whose head end
+        #    can't be found as they are received (e.g. UTF-16 ones) only get those.
+        #  - LINKS_EXTRACTED: once the whole document is received and parsed, everything but the body content (not
+        #    sent for approximate analyses)
+        #  - ANALYSED: the complete summary
+        # Peak memory is not measured here.
+        started_at = time.perf_counter()
+        received = bytearray()
+        head_parsed = False
+        known_summary = DocSummary(
+            page_title=None,
+            meta_tags=None,
+            doc_size=doc_size,
+            body_content=None,
+            links=None,
+            skipped_fields=('page_title', 'meta_tags', 'body_content', 'links') + (('doc_size',) if doc_size is None else ()),
+        )
+        links_parser = decoder = None
+        for chunk in chunks:
+            received += chunk
+            if self.max_doc_size is not None and len(received) > self.max_doc_size:
+                raise DocTooLargeError(f'Document size exceeds the maximum size ({self.max_doc_size})')
+            if not head_parsed:
+                if self.html_only and looks_binary(received):
+                    raise UnsupportedContentError('Document content is binary, not HTML')
+                head_end = find_head_end(received, complete=False)
+                if head_end is None:
+                    continue
+                head_parsed = True
+                # From now on, the links stream in: everything received so far is fed to their parser, in the encoding
+                # the head declares, if any
+                links_parser = _StreamingLinksParser()
+                decoder = codecs.getincrementaldecoder(_sniff_encoding(bytes(received[:_ENCODING_SNIFF_SIZE])))('replace')
+                chunk = bytes(received)
+                if head_end > 0:
+                    head_soup = BeautifulSoup(bytes(received[:head_end]), 'html.parser')
+                    known_summary = DocSummary(
+                        page_title=_get_page_title(head_soup),
+                        meta_tags=run_extractors(head_soup, [_MetaTagsExtractor()]).results['meta_tags'],
+                        doc_size=doc_size,
+                        body_content=None,
+                        links=None,
+                        skipped_fields=('body_content', 'links') + (('doc_size',) if doc_size is None else ()),
+                    )
+                    del head_soup
+                    yield AnalysisEvent(name=HEAD_PARSED, summary=known_summary,
+                                        elapsed=time.perf_counter() - started_at)
+
+            links_parser.feed(decoder.decode(chunk))
+            found_links = links_parser.pop_links()
+            if found_links:
+                yield AnalysisEvent(name=LINKS_FOUND, summary=known_summary, elapsed=time.perf_counter() - started_at,
+                                    links=found_links)
+
+        if links_parser is not None:
+            links_parser.feed(decoder.decode(b'', final=True))
+            links_parser.close()
+            found_links = links_parser.pop_links()
+            if found_links:
+                yield AnalysisEvent(name=LINKS_FOUND, summary=known_summary, elapsed=time.perf_counter() - started_at,
+                                    links=found_links)
+
+        html_doc = bytes(received)
+        del received
+        doc_size = len(html_doc)
+        if self.html_only and looks_binary(html_doc):
+            raise UnsupportedContentError('Document content is binary, not HTML')
+        if self.approximate_above is not None and doc_size > self.approximate_above:
+            doc_summary = self._analyse_doc_approximately(html_doc, doc_size)
+            yield AnalysisEvent(name=ANALYSED, summary=doc_summary, elapsed=time.perf_counter() - started_at)
+            return
+
         soup = BeautifulSoup(html_doc, 'html.parser')
+        del html_doc
+        extraction = run_extractors(soup, self.create_extractors())
+        doc_summary = DocSummary(
+            page_title=_get_page_title(soup),
+            meta_tags=extraction.results.pop('meta_tags'),
+            doc_size=doc_size,
+            body_content=None,
+            links=extraction.results.pop('links'),
+            skipped_fields=('body_content',),
+            extras=extraction.results if self.extractors else None,
+            extractor_timings=extraction.timings,
+        )
+        yield AnalysisEvent(name=LINKS_EXTRACTED, summary=doc_summary, elapsed=time.perf_counter() - started_at)
+
+        body_content = get_visible_text(soup)
+        soup.decompose()
+        del soup
+        doc_summary = doc_summary._replace(
+            body_content=body_content,
+            skipped_fields=(),
+            keyword_occurrences=get_keyword_occurrences(doc_summary.meta_tags, body_content),
+        )
+        yield AnalysisEvent(name=ANALYSED, summary=doc_summary, elapsed=time.perf_counter() - started_at)
+
+    def _analyse_doc_approximately(self, html_doc: Union[str, bytes, memoryview], doc_size: int) -> DocSummary:
+        encoding = None
+        if not isinstance(html_doc, str):
+            encoding = _find_markup_encoding(html_doc)
+            if encoding is None:
+                html_doc = UnicodeDammit(bytes(html_doc), is_html=True).unicode_markup or ''
+        head_tags_pattern, link_pattern = _APPROXIMATE_PATTERNS[isinstance(html_doc, str)]
+
+        def decode(markup: Union[str, bytes, memoryview, None]) -> Optional[str]:
+            # Only the pieces we keep, when the document is scanned before being decoded
+            return markup if markup is None or isinstance(markup, str) else str(markup, encoding, 'replace')
+
+        # Only the <head> is small enough to be worth a tree, along with the meta tags and titles found in the body
+        # (the full analysis finds them wherever they are)
+        body_start = find_head_end(html_doc)
+        head_soup = BeautifulSoup(
+            decode(html_doc[:body_start]) + ''.join(
+                decode(tag.group()) for tag in head_tags_pattern.finditer(html_doc, body_start) if tag.group('head_tag')
+            ),
+            'html.parser',
+        )
+
+        return DocSummary(
+            page_title=_get_page_title(head_soup),
+            meta_tags=run_extractors(head_soup, [_MetaTagsExtractor()]).results['meta_tags'],
+            doc_size=doc_size,
+            body_content=None,
+            links=[
+                DocLink(text=_get_link_text(decode(link.group(2))), href=_get_href(decode(link.group(1))))
+                for link in link_pattern.finditer(html_doc, body_start)
+            ],
+            # Without a tree of the whole document, the extra extractors can't run
+            skipped_fields=('body_content', 'extras') if self.extractors else ('body_content',),
+            word_stats=estimate_word_stats(
+                iter_text_blocks(html_doc, body_start, encoding=encoding or 'utf-8'),
+                sample_rate=self.approximate_sample_rate,
+            ),
+        )
+
+    def create_extractors(self) -> List[Extractor]:
+        return [_MetaTagsExtractor(), _LinksExtractor()] + [get_extractor_class(name)() for name in self.extractors]
+
+
+class _MetaTagsExtractor(Extractor):
+    name = 'meta_tags'
+    tags = ('meta',)
+
+    def __init__(self):
+        self._meta_tags = []
+
+    def handle_tag(self, meta: Tag) -> None:
+        content: str = meta.get('content')
+
+        # Try various <meta> tags types
+        name: str = meta.get('name')
+        if name is None:
+            name = meta.get('http-equiv')
+        if name is None:
+            name = meta.get('property')
+        if name is None and 'charset' in meta.attrs:
+            name = 'charset'
+            content = meta.get('charset')
+
+        self._meta_tags.append(DocMetaTag(name=name, content=content))
+
+    def result(self) -> List[DocMetaTag]:
+        return self._meta_tags
+
+
+class _LinksExtractor(Extractor):
+    name = 'links'
+    tags = ('a',)
+
+    def __init__(self):
+        self._links = []
+
+    def handle_tag(self, a: Tag) -> None:
+        self._links.append(DocLink(str(a.string) if a.string is not None else None, a.get('href')))
+
+    def result(self) -> List[DocLink]:
+        return self._links
+
+
+class _StreamingElement:
+    # An element of a link, for `_StreamingLinksParser`
+
+    def __init__(self, name: str, href: Optional[str] = None):
+        self.name = name
+        self.href = href
+        # Elements and strings
+        self.children: List[Union['_StreamingElement', str]] = []
+
+
+class _StreamingComment(str):
+    # Not merged with the strings around it, like BeautifulSoup's `Comment`s
+    pass
+
+
+# Elements which never have content
+_VOID_ELEMENTS = frozenset(('area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'param',
+                            'source', 'track', 'wbr'))
+
+
+class _StreamingLinksParser(HTMLParser):
+    # Finds the links of a document fed piece by piece, without a tree of the whole document: only the content of
+    # the links which are still open is kept, to give them the same text as `_LinksExtractor` (see `Tag.string`).
+    # BeautifulSoup's "html.parser" builder relies on the same `HTMLParser`, so that scripts, styles and character
+    # references are handled the same way.
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        # The innermost last, from the outermost open link
+        self._open_elements: List[_StreamingElement] = []
+        # In document order, `None` for the links which are still open
+        self._links: List[Optional[DocLink]] = []
+        self._open_links: List[Tuple[int, _StreamingElement]] = []
+
+    def pop_links(self) -> List[DocLink]:
+        # The links found since the previous call, as long as all the links before them are complete
+        complete_count = next((index for index, link in enumerate(self._links) if link is None), len(self._links))
+        links, self._links = self._links[:complete_count], self._links[complete_count:]
+        self._open_links = [(index - complete_count, link) for index, link in self._open_links]
+        return links
+
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        if tag != 'a' and not self._open_elements:
+            return
+        if tag == 'a':
+            # Like BeautifulSoup: the last value of repeated attributes, and an empty one for attributes without any
+            href = next((value or '' for name, value in reversed(attrs) if name == 'href'), None)
+            element = _StreamingElement(tag, href)
+            self._open_links.append((len(self._links), element))
+            self._links.append(None)
+        else:
+            element = _StreamingElement(tag)
+        if self._open_elements:
+            self._open_elements[-1].children.append(element)
+        if tag not in _VOID_ELEMENTS:
+            self._open_elements.append(element)
+
+    def handle_endtag(self, tag: str) -> None:
+        # Closes the innermost open element with this name, and whatever is open in it. End tags of elements which
+        # are not open are ignored.
+        names = [element.name for element in self._open_elements]
+        if tag not in names:
+            return
+        closed_count = len(names) - names[::-1].index(tag) - 1
+        del self._open_elements[closed_count:]
+        self._complete_links()
+
+    def handle_data(self, data: str) -> None:
+        if not self._open_elements:
+            return
+        children = self._open_elements[-1].children
+        if children and type(children[-1]) is str:
+            # Text split between pieces of the document, or around character references, is a single string
+            children[-1] += data
+        else:
+            children.append(data)
+
+    def handle_comment(self, data: str) -> None:
+        if self._open_elements:
+            self._open_elements[-1].children.append(_StreamingComment(data))
+
+    def close(self) -> None:
+        # The links still open end with the document
+        super().close()
+        self._open_elements = []
+        self._complete_links()
+
+    def _complete_links(self) -> None:
+        open_elements_ids = {id(element) for element in self._open_elements}
+        for index, link in self._open_links:
+            if id(link) not in open_elements_ids:
+                self._links[index] = DocLink(_get_streamed_string(link), link.href)
+        self._open_links = [(index, link) for index, link in self._open_links if id(link) in open_elements_ids]
+
+
+def _get_streamed_string(element: _StreamingElement) -> Optional[str]:
+    # Like BeautifulSoup's `Tag.string`: the only string of an element, possibly in nested elements
+    while len(element.children) == 1:
+        child = element.children[0]
+        if isinstance(child, str):
+            return str(child)
+        element = child
+    return None
+
+
+_TAG_ATTRIBUTES = r'(?:[^>"\']|"[^"]*"|\'[^\']*\')*'
+_HEAD_ELEMENTS = 'html|head|meta|link|base|script|style|title|noscript|template'
+# Whitespace, comments, doctypes, and the elements which are allowed in the <head> (whole, for those with content)
+_HEAD_TOKEN_SOURCE = (
+    r'\s+|<!--.*?--\s*>|<![^>]*>|<\?[^>]*>'
+    rf'|<(script|style|title|noscript|template)\b{_TAG_ATTRIBUTES}>.*?</\1\s*>'
+    rf'|</?(?:html|head|meta|link|base)\b{_TAG_ATTRIBUTES}>'
+)
+# Text, or a whole tag name which can't be in the <head>
+_BODY_START_SOURCE = rf'[^<\s]|<(?!/?(?:{_HEAD_ELEMENTS})\b)[a-zA-Z/][^\s/>]*[\s/>]'
+_HEAD_PATTERNS = {
+    is_str: (
+        re.compile(_HEAD_TOKEN_SOURCE if is_str else _HEAD_TOKEN_SOURCE.encode('ascii'), re.IGNORECASE | re.DOTALL),
+        re.compile(_BODY_START_SOURCE if is_str else _BODY_START_SOURCE.encode('ascii'), re.IGNORECASE),
+    )
+    for is_str in (True, False)
+}
+# Meta tags and titles (in "head_tag"), outside of comments, scripts and styles
+_HEAD_TAGS_PATTERN = re.compile(
+    rf'<!--.*?--\s*>|<(script|style)\b.*?</\1\s*>|(?P<head_tag><meta\b{_TAG_ATTRIBUTES}>|<title\b.*?</title\s*>)',
+    re.IGNORECASE | re.DOTALL,
+)
+_LINK_PATTERN = re.compile(r'<a(\s[^>]*)?>(.*?)</a\s*>', re.IGNORECASE | re.DOTALL)
+# For documents which are still encoded (see `_find_markup_encoding()`), and decoded ones
+_APPROXIMATE_PATTERNS = {
+    is_str: tuple(
+        pattern if is_str else re.compile(pattern.pattern.encode('ascii'), pattern.flags & ~re.UNICODE)
+        for pattern in (_HEAD_TAGS_PATTERN, _LINK_PATTERN)
+    )
+    for is_str in (True, False)
+}
+_TAG_PATTERN = re.compile(r'<[^>]*>')
+_HREF_PATTERN = re.compile(r'\bhref\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+))', re.IGNORECASE)
+
+
+def _get_page_title(soup: BeautifulSoup) -> Optional[str]:
+    # `NavigableString`s keep a reference to the whole soup tree: we only keep plain strings in the summary.
+    page_title = soup.title.string if soup.title else None
+    return str(page_title) if page_title is not None else None
+
+
+def _get_link_text(link_content: str) -> Optional[str]:
+    # Like BeautifulSoup's `Tag.string`: only links with a single text node (possibly in nested tags) have a text
+    texts = [text for text in _TAG_PATTERN.split(link_content) if text]
+    return html.unescape(texts[0]) if len(texts) == 1 else None
+
+
+def _get_href(link_attributes: Optional[str]) -> Optional[str]:
+    href = _HREF_PATTERN.search(link_attributes) if link_attributes else None
+    if href is None:
+        return None
+    return html.unescape(next(value for value in href.groups() if value is not None))
+
+
+def _summarise_unparsed_response(response: FetchResponse, outcome: str) -> DocSummary:
+    doc_summary = DocSummary(
+        page_title=None,
+        meta_tags=None,
+        doc_size=response.doc_size,
+        body_content=None,
+        links=None,
+        skipped_fields=('page_title', 'meta_tags', 'body_content', 'links') + (
+            ('doc_size',) if response.doc_size is None else ()
+        ),
+    )
+    return _add_response(doc_summary, response, None, outcome)
+
+
+def _add_response(doc_summary: DocSummary, response: FetchResponse, analysis_started_at: Optional[float],
+                  outcome: str = PARSED) -> DocSummary:
+    timings = dict(response.timings)
+    if analysis_started_at is not None:
+        timings['analysis'] = time.perf_counter() - analysis_started_at
+    return doc_summary._replace(
+        outcome=outcome,
+        status_code=response.status_code,
+        final_url=response.url,
+        redirects=response.redirects,
+        content_type=response.content_type,
+        timings=timings,
+    )
+
+
+_ENCODING_SNIFF_SIZE = 2048
+
+
+def _sniff_encoding(doc_start: bytes) -> str:
+    # For documents decoded as they are received: the byte order mark, then the declared encoding, then UTF-8
+    _, bom_encoding = EncodingDetector.strip_byte_order_mark(doc_start)
+    if bom_encoding is not None:
+        return bom_encoding
+    declared_encoding = EncodingDetector.find_declared_encoding(doc_start, is_html=True)
+    if declared_encoding is not None:
+        try:
+            return codecs.lookup(declared_encoding).name
+        except LookupError:
+            pass
+    return 'utf-8'
+
+
+_DECODING_CHUNK_SIZE = 64 * 1024
+# Encodings in which ASCII text is encoded as ASCII, but not markup: they switch to other character sets with escape
+# sequences, in which "<" may be part of a character
+_STATEFUL_ENCODINGS = ('utf-7', 'hz')
+
+
+def _find_markup_encoding(doc: Union[bytes, memoryview]) -> Optional[str]:
+    # The encoding of a document whose markup can be scanned before it is decoded: the same one as BeautifulSoup, for
+    # the common cases (see `_decode_buffer()`), as long as "<", ">", quotes and tag names are ASCII in it, and are
+    # never part of another character. `None` otherwise. The document is decoded a chunk at a time, to make sure it can
+    # be, but the result is not kept.
+    sniffed = bytes(doc[:_ENCODING_SNIFF_SIZE])
+    _, bom_encoding = EncodingDetector.strip_byte_order_mark(sniffed)
+    if bom_encoding is not None:
+        # UTF-16 and UTF-32 markup is not ASCII
+        candidates = ('utf-8-sig',) if bom_encoding == 'utf-8' else ()
+    else:
+        candidates = (EncodingDetector.find_declared_encoding(sniffed, is_html=True), 'utf-8')
+    for encoding in candidates:
+        if encoding is None:
+            continue
+        try:
+            codec_name = codecs.lookup(encoding).name
+        except LookupError:
+            continue
+        markup_sample = '<a href="/" class=\'x\'>\r\n\t</a>'
+        if codec_name.startswith('iso2022') or codec_name in _STATEFUL_ENCODINGS or \
+                markup_sample.encode(codec_name, 'replace') != markup_sample.encode('ascii'):
+            # BeautifulSoup would use it: it's not for us to pick another one
+            return None
+        decoder = codecs.getincrementaldecoder(codec_name)()
+        try:
+            for start in range(0, len(doc), _DECODING_CHUNK_SIZE):
+                decoder.decode(doc[start:start + _DECODING_CHUNK_SIZE])
+            decoder.decode(b'', final=True)
+        except UnicodeDecodeError:
+            continue
+        return codec_name
+    return None
+
 
-        doc_summary_dict = {
-            'page_title': soup.title.string if soup.title else None,
-            'meta_tags': self._get_meta_tags(soup),
-            'doc_size': len(html_doc),
-            'links': self._get_links(soup),
-        }
-        # BeautifulSoup's `get_text()` method is quite convenient, but it prefixes the `<body>` text content
-        # with the page title, which is not what we want.
-        # --> let's strip the title prefix from the `get_text()` result:
-        doc_summary_dict['body_content'] = soup.get_text()[
-            (len(doc_summary_dict['page_title']) if doc_summary_dict['page_title'] is not None else 0):
-        ]
-
-        return DocSummary(**doc_summary_dict)
-
-    @staticmethod
-    def _get_meta_tags(soup: BeautifulSoup) -> List[DocMetaTag]:
-        meta_tags = []
-        for meta in soup.find_all('meta'):
-            content: str = meta.get('content')
-
-            # Try various <meta> tags types
-            name: str = meta.get('name')
-            if name is None:
-                name = meta.get('http-equiv')
-            if name is None:
-                name = meta.get('property')
-            if name is None and 'charset' in meta.attrs:
-                name = 'charset'
-                content = meta.get('charset')
-
-            meta_tags.append(DocMetaTag(name=name, content=content))
-
-        return meta_tags
-
-    @staticmethod
-    def _get_links(soup: BeautifulSoup) -> List[DocLink]:
-        return [DocLink(a.string, a.get('href')) for a in soup.find_all('a')]
+def _decode_buffer(doc: memoryview) -> str:
+    # Same encodings as BeautifulSoup, in the same order, for the common cases: the byte order mark, then the
+    # declared encoding, then UTF-8. Anything else goes through UnicodeDammit, on a copy.
+    sniffed = bytes(doc[:_ENCODING_SNIFF_SIZE])
+    unmarked, bom_encoding = EncodingDetector.strip_byte_order_mark(sniffed)
+    if bom_encoding is not None:
+        return str(doc[len(sniffed) - len(unmarked):], bom_encoding, 'replace')
+    for encoding in (EncodingDetector.find_declared_encoding(sniffed, is_html=True), 'utf-8'):
+        if encoding is None:
+            continue
+        try:
+            return str(doc, encoding)
+        except (LookupError, UnicodeDecodeError):
+            continue
+    return UnicodeDammit(doc.tobytes(), is_html=True).unicode_markup or ''
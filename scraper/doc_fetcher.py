@@ -1,6 +1,355 @@
-
+import itertools
+import socket
+import time
+from functools import partial
+from typing import Callable, Dict, Iterable, Iterator, Mapping, NamedTuple, Optional, Union
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.exceptions import ConnectTimeoutError, NameResolutionError, NewConnectionError
+from scraper.dns_cache import DnsCache
+from scraper.doc_analyser import HTML_CONTENT_TYPES, PARSED, DocTooLargeError, FetchResponse, UnsupportedContentError, \
+    find_head_end, get_response_outcome, looks_binary
+
+_CHUNK_SIZE = 64 * 1024
+# Error responses up to this size are read (and dropped) rather than closing the connection they came on
+_DRAINED_BODY_MAX_SIZE = 64 * 1024
+_HEAD_CHUNK_SIZE = 8 * 1024
+# We want the actual document size, not the size of its compressed transfer
+_IDENTITY_ENCODING_HEADERS = {'Accept-Encoding': 'identity'}
+
+
+class PartialFetch(NamedTuple):
+    content: bytes
+    # Whole document size, when the server told us (`None` otherwise)
+    doc_size: Optional[int]
+    bytes_received: int
+    # Whether we stopped receiving the document before its end
+    truncated: bool
+
+
+def fetch_url_content(
+    url: str,
+    max_size: Optional[int] = None,
+    html_only: bool = False,
+    session: Optional[requests.Session] = None,
+    timeout: Optional[float] = None,
+) -> bytes:
+    # Without any limit we just download the whole body. Otherwise (use `functools.partial()` to get a
+    # `doc_fetcher` with limits) the body is streamed and the download is aborted as soon as we know we don't
+    # want it: non-HTML "Content-Type", too big "Content-Length", or too many bytes received.
+    # `timeout` bounds the connection, and every wait for data (not the whole download), in seconds.
+    http = session if session is not None else requests
+    if max_size is None and not html_only:
+        return http.get(url, timeout=timeout).content
+
+    with http.get(url, stream=True, timeout=timeout) as response:
+        _check_headers(url, response.headers, max_size, html_only)
+        if max_size is None:
+            return response.content
+        return _read_body(url, response.iter_content(chunk_size=_CHUNK_SIZE), max_size)
+
+
+def fetch_url_response(
+    url: str,
+    max_size: Optional[int] = None,
+    session: Optional[requests.Session] = None,
+    timeout: Optional[float] = None,
+) -> FetchResponse:
+    # Like `fetch_url_content()`, for the analyser to short-circuit what is not worth parsing: the body of error
+    # responses and non-HTML documents is not even downloaded, and the download of binary bodies served as HTML stops
+    # after their first chunk. Redirects are followed, and recorded.
+    http = session if session is not None else requests
+    started_at = time.perf_counter()
+    with http.get(url, stream=True, timeout=timeout) as response:
+        headers_received_at = time.perf_counter()
+        response_head = FetchResponse(
+            url=response.url,
+            redirects=[redirect.url for redirect in response.history],
+            status_code=response.status_code,
+            content_type=_get_content_type(response.headers),
+            content=b'',
+            doc_size=_get_content_length(response),
+            timings={},
+        )
+        if get_response_outcome(response_head) == PARSED:
+            _check_headers(url, response.headers, max_size, html_only=False)
+            content = _read_html_body(url, response.iter_content(chunk_size=_CHUNK_SIZE), max_size)
+        else:
+            content = b''
+            # Keeps the connection alive, unless that means receiving a big body
+            if response_head.doc_size is not None and response_head.doc_size <= _DRAINED_BODY_MAX_SIZE:
+                response.content
+    finished_at = time.perf_counter()
+    return response_head._replace(content=content, timings={
+        'headers': headers_received_at - started_at,
+        'body': finished_at - headers_received_at,
+    })
+
+
+def fetch_url_size(
+    url: str,
+    session: Optional[requests.Session] = None,
+    timeout: Optional[float] = None,
+) -> PartialFetch:
+    # Uses a HEAD request when the server gives us a "Content-Length" for it, and falls back to counting the bytes
+    # of a streamed GET (without keeping them) otherwise. Error responses raise an `HTTPError`: their size is not the
+    # page's. `timeout` is the same as `fetch_url_content()`'s.
+    http = session if session is not None else requests
+    response = http.head(url, headers=_IDENTITY_ENCODING_HEADERS, allow_redirects=True, timeout=timeout)
+    content_length = _get_content_length(response)
+    if response.ok and content_length is not None:
+        return PartialFetch(content=b'', doc_size=content_length, bytes_received=0, truncated=True)
+
+    # Some servers don't support HEAD requests: only the GET response tells
+    with http.get(url, headers=_IDENTITY_ENCODING_HEADERS, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        doc_size = sum(len(chunk) for chunk in response.iter_content(chunk_size=_CHUNK_SIZE))
+    return PartialFetch(content=b'', doc_size=doc_size, bytes_received=doc_size, truncated=False)
+
+
+def fetch_url_head(
+    url: str,
+    max_head_size: int = 256 * 1024,
+    session: Optional[requests.Session] = None,
+    timeout: Optional[float] = None,
+) -> PartialFetch:
+    # Streams the document only until the end of its <head> (where the analyser ends it, see `find_head_end()`), and
+    # then closes the connection: the rest of the document is never downloaded. Error responses raise an `HTTPError`:
+    # their head is not the page's. `timeout` is the same as `fetch_url_content()`'s.
+    http = session if session is not None else requests
+    with http.get(url, headers=_IDENTITY_ENCODING_HEADERS, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        content_length = _get_content_length(response)
+        received = bytearray()
+        for chunk in response.iter_content(chunk_size=_HEAD_CHUNK_SIZE):
+            received += chunk
+            head_end = find_head_end(received, complete=False)
+            if head_end is not None:
+                truncated = content_length is None or len(received) < content_length
+                return PartialFetch(
+                    # No need to drop the beginning of the body if we already have the whole document
+                    content=bytes(received[:head_end]) if truncated else bytes(received),
+                    doc_size=content_length,
+                    bytes_received=len(received),
+                    truncated=truncated,
+                )
+            if len(received) >= max_head_size:
+                break
+        else:
+            # No <head> end before the end of the document: we received all of it
+            return PartialFetch(content=bytes(received), doc_size=len(received), bytes_received=len(received),
+                                truncated=False)
+
+    return PartialFetch(content=bytes(received), doc_size=content_length, bytes_received=len(received), truncated=True)
+
+
+class StreamedFetch(NamedTuple):
+    chunks: Iterator[bytes]
+    # Whole document size, when the server told us (`None` otherwise)
+    doc_size: Optional[int]
+
+
+def stream_url_content(
+    url: str,
+    session: Optional[requests.Session] = None,
+    timeout: Optional[float] = None,
+) -> StreamedFetch:
+    # The response headers are received right away, and the body as `chunks` are consumed: this is what
+    # `DocAnalyser.analyse_progressively()` works on. `timeout` is the same as `fetch_url_content()`'s: it bounds
+    # each wait for a chunk too.
+    http = session if session is not None else requests
+    response = http.get(url, headers=_IDENTITY_ENCODING_HEADERS, stream=True, timeout=timeout)
+    return StreamedFetch(chunks=_iter_response_chunks(response), doc_size=_get_content_length(response))
+
+
+class ConditionalFetch(NamedTuple):
+    # `modified` is `False` (and `content` is `None`) when the server answered "304 Not Modified"
+    modified: bool
+    content: Optional[bytes]
+    etag: Optional[str]
+    last_modified: Optional[str]
+
+
+def fetch_url_if_modified(
+    url: str,
+    etag: Optional[str] = None,
+    last_modified: Optional[str] = None,
+    session: Optional[requests.Session] = None,
+    timeout: Optional[float] = None,
+) -> ConditionalFetch:
+    # `timeout` is the same as `fetch_url_content()`'s
+    http = session if session is not None else requests
+    headers = {}
+    if etag is not None:
+        headers['If-None-Match'] = etag
+    if last_modified is not None:
+        headers['If-Modified-Since'] = last_modified
+    response = http.get(url, headers=headers, timeout=timeout)
+    if response.status_code == 304:
+        return ConditionalFetch(modified=False, content=None, etag=etag, last_modified=last_modified)
+    response.raise_for_status()
+    return ConditionalFetch(
+        modified=True,
+        content=response.content,
+        etag=response.headers.get('ETag'),
+        last_modified=response.headers.get('Last-Modified'),
+    )
+
+
+def create_pooled_fetcher(
+    pool_size: int = 10,
+    max_size: Optional[int] = None,
+    html_only: bool = False,
+    timeout: Optional[float] = None,
+    dns_cache: Optional[DnsCache] = None,
+    structured: bool = False,
+) -> Callable[[str], Union[bytes, FetchResponse]]:
+    # A `doc_fetcher` which keeps up to `pool_size` connections alive per host, instead of opening a new
+    # connection (and doing a new TLS handshake) for each document. With a `dns_cache`, new connections get
+    # the host addresses from it instead of resolving them each time. `structured` fetchers give a `FetchResponse`
+    # (see `fetch_url_response()`), and always leave non-HTML documents out.
+    session = requests.Session()
+    if dns_cache is not None:
+        adapter = _DnsCachingAdapter(dns_cache, pool_connections=pool_size, pool_maxsize=pool_size)
+    else:
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    if structured:
+        return partial(fetch_url_response, max_size=max_size, session=session, timeout=timeout)
+    return partial(fetch_url_content, max_size=max_size, html_only=html_only, session=session, timeout=timeout)
+
+
+def create_http2_fetcher(
+    max_size: Optional[int] = None,
+    html_only: bool = False,
+    prior_knowledge: bool = False,
+    timeout: float = 30,
+) -> Callable[[str], bytes]:
+    # A `doc_fetcher` which multiplexes all the concurrent fetches to an origin over a single HTTP/2 connection,
+    # instead of one connection per in-flight request. HTTPS servers which don't speak HTTP/2 (as negotiated with
+    # ALPN) are fetched with HTTP/1.1; `prior_knowledge` forces cleartext HTTP/2 ("h2c") on "http://" URLs.
+    # Needs the optional `httpx[http2]` dependency.
+    try:
+        import httpx
+        client = httpx.Client(http1=not prior_knowledge, http2=True, timeout=timeout, follow_redirects=True)
+    except ImportError:
+        raise ImportError('The HTTP/2 fetcher needs the "httpx[http2]" package') from None
+    return partial(_fetch_url_content_with_httpx, client=client, max_size=max_size, html_only=html_only)
+
+
+class _DnsCachingAdapter(HTTPAdapter):
+
+    def __init__(self, dns_cache: DnsCache, **kwargs):
+        # Needed by `init_poolmanager()`, called by the parent constructor
+        self.dns_cache = dns_cache
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = _create_dns_caching_pool_classes(self.dns_cache)
+
+
+def _create_dns_caching_pool_classes(dns_cache: DnsCache) -> Dict[str, type]:
+
+    class DnsCachingHTTPConnection(HTTPConnection):
+        def _new_conn(self) -> socket.socket:
+            return _new_connection_with_dns_cache(self, dns_cache, super()._new_conn)
+
+    class DnsCachingHTTPSConnection(HTTPSConnection):
+        def _new_conn(self) -> socket.socket:
+            return _new_connection_with_dns_cache(self, dns_cache, super()._new_conn)
+
+    class DnsCachingHTTPConnectionPool(HTTPConnectionPool):
+        ConnectionCls = DnsCachingHTTPConnection
+
+    class DnsCachingHTTPSConnectionPool(HTTPSConnectionPool):
+        ConnectionCls = DnsCachingHTTPSConnection
+
+    return {'http': DnsCachingHTTPConnectionPool, 'https': DnsCachingHTTPSConnectionPool}
+
+
+def _new_connection_with_dns_cache(
+    connection: HTTPConnection,
+    dns_cache: DnsCache,
+    new_connection: Callable[[], socket.socket],
+) -> socket.socket:
+    # urllib3 only connects to `_dns_host`: the Host header, TLS SNI and certificate checks keep the host name.
+    # Each address is tried in turn, as `socket.create_connection()` does.
+    host = connection._dns_host
+    try:
+        addresses = dns_cache.resolve(host)
+    except socket.gaierror as e:
+        raise NameResolutionError(connection.host, connection, e) from e
+    for address in addresses[:-1]:
+        try:
+            return _connect_to_address(connection, host, address, new_connection)
+        except (ConnectTimeoutError, NewConnectionError):
+            pass
+    return _connect_to_address(connection, host, addresses[-1], new_connection)
+
+
+def _connect_to_address(
+    connection: HTTPConnection,
+    host: str,
+    address: str,
+    new_connection: Callable[[], socket.socket],
+) -> socket.socket:
+    connection._dns_host = address
+    try:
+        return new_connection()
+    finally:
+        connection._dns_host = host
+
+
+def _fetch_url_content_with_httpx(url: str, client, max_size: Optional[int], html_only: bool) -> bytes:
+    with client.stream('GET', url) as response:
+        _check_headers(url, response.headers, max_size, html_only)
+        if max_size is None:
+            return response.read()
+        return _read_body(url, response.iter_bytes(chunk_size=_CHUNK_SIZE), max_size)
+
+
+def _check_headers(url: str, headers: Mapping[str, str], max_size: Optional[int], html_only: bool) -> None:
+    content_type = _get_content_type(headers)
+    if html_only and content_type is not None and content_type not in HTML_CONTENT_TYPES:
+        raise UnsupportedContentError(f'Unsupported content type "{content_type}" for {url}')
+
+    content_length = headers.get('Content-Length')
+    if max_size is not None and content_length is not None and content_length.isdigit() and int(content_length) > max_size:
+        raise DocTooLargeError(f'Document size ({content_length}) exceeds the maximum size ({max_size}) for {url}')
+
+
+def _read_body(url: str, chunks: Iterable[bytes], max_size: Optional[int]) -> bytes:
+    body = bytearray()
+    for chunk in chunks:
+        body += chunk
+        if max_size is not None and len(body) > max_size:
+            raise DocTooLargeError(f'Document size exceeds the maximum size ({max_size}) for {url}')
+    return bytes(body)
+
+
+def _read_html_body(url: str, chunks: Iterable[bytes], max_size: Optional[int]) -> bytes:
+    chunks = iter(chunks)
+    first_chunk = next(chunks, b'')
+    if looks_binary(first_chunk):
+        return first_chunk
+    return _read_body(url, itertools.chain((first_chunk,), chunks), max_size)
+
+
+def _get_content_type(headers: Mapping[str, str]) -> Optional[str]:
+    return headers.get('Content-Type', '').split(';')[0].strip().lower() or None
+
+
+def _iter_response_chunks(response: requests.Response) -> Iterator[bytes]:
+    with response:
+        yield from response.iter_content(chunk_size=_CHUNK_SIZE)
 
 
-def fetch_url_content(url: str) -> str:
-    return requests.get(url).content
+def _get_content_length(response: requests.Response) -> Optional[int]:
+    if 'Content-Encoding' in response.headers and response.headers['Content-Encoding'] != 'identity':
+        return None
+    content_length = response.headers.get('Content-Length', '')
+    return int(content_length) if content_length.isdigit() else None
@@ -0,0 +1,224 @@
+import json
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple, Type
+from bs4 import BeautifulSoup, Tag
+
+# Extractors results go in `DocSummary.extras`, next to these fields
+_RESERVED_NAMES = ('page_title', 'meta_tags', 'doc_size', 'body_content', 'links')
+
+
+class Extractor(ABC):
+    # An extractor gets a fresh instance for each analysed document. During the document's single traversal it is
+    # handed every tag whose name is in `tags`, in document order, and then gives its result - which must be
+    # JSON-friendly (lists, dicts, strings, numbers...) for the summaries to be shippable.
+    name: str = ''
+    tags: Tuple[str, ...] = ()
+
+    @abstractmethod
+    def handle_tag(self, tag: Tag) -> None:
+        pass
+
+    @abstractmethod
+    def result(self) -> Any:
+        pass
+
+
+class Extraction(NamedTuple):
+    results: Dict[str, Any]
+    # Time spent in each extractor, in seconds
+    timings: Dict[str, float]
+    traversal_seconds: float
+
+
+_EXTRACTORS: Dict[str, Type[Extractor]] = {}
+
+
+def register_extractor(extractor_class: Type[Extractor]) -> Type[Extractor]:
+    # Can be used as a class decorator
+    name = extractor_class.name
+    if not name or name in _RESERVED_NAMES:
+        raise ValueError(f'Invalid extractor name "{name}"')
+    if name in _EXTRACTORS and _EXTRACTORS[name] is not extractor_class:
+        raise ValueError(f'An extractor named "{name}" is already registered')
+    _EXTRACTORS[name] = extractor_class
+    return extractor_class
+
+
+def get_extractor_class(name: str) -> Type[Extractor]:
+    try:
+        return _EXTRACTORS[name]
+    except KeyError:
+        raise ValueError(f'Unknown extractor "{name}" (available: {", ".join(available_extractors())})') from None
+
+
+def available_extractors() -> List[str]:
+    return sorted(_EXTRACTORS)
+
+
+def run_extractors(soup: BeautifulSoup, extractors: Sequence[Extractor]) -> Extraction:
+    # A single walk of the whole tree, whatever the number of extractors: each tag is dispatched to the
+    # extractors which asked for its name.
+    handlers: Dict[str, List[Extractor]] = {}
+    for extractor in extractors:
+        for tag_name in extractor.tags:
+            handlers.setdefault(tag_name, []).append(extractor)
+    timings = {extractor.name: 0.0 for extractor in extractors}
+
+    perf_counter = time.perf_counter
+    started_at = perf_counter()
+    for element in soup.descendants:
+        # Strings, comments... have no name
+        tag_handlers = handlers.get(element.name) if element.name is not None else None
+        if tag_handlers is None:
+            continue
+        for extractor in tag_handlers:
+            extractor_started_at = perf_counter()
+            extractor.handle_tag(element)
+            timings[extractor.name] += perf_counter() - extractor_started_at
+
+    results = {}
+    for extractor in extractors:
+        extractor_started_at = perf_counter()
+        results[extractor.name] = extractor.result()
+        timings[extractor.name] += perf_counter() - extractor_started_at
+    traversal_seconds = perf_counter() - started_at - sum(timings.values())
+
+    return Extraction(results=results, timings=timings, traversal_seconds=traversal_seconds)
+
+
+def _has_rel(tag: Tag, rel: str) -> bool:
+    # `rel` is a multi-valued attribute: BeautifulSoup gives us a list
+    return rel in (value.lower() for value in tag.get('rel') or ())
+
+
+@register_extractor
+class HeadingsExtractor(Extractor):
+    name = 'headings'
+    tags = ('h1', 'h2', 'h3', 'h4', 'h5', 'h6')
+
+    def __init__(self):
+        self._headings = []
+
+    def handle_tag(self, tag: Tag) -> None:
+        self._headings.append({'level': int(tag.name[1]), 'text': ' '.join(tag.get_text().split())})
+
+    def result(self) -> List[Dict[str, Any]]:
+        return self._headings
+
+
+@register_extractor
+class ImagesExtractor(Extractor):
+    name = 'images'
+    tags = ('img',)
+
+    def __init__(self):
+        self._images = []
+
+    def handle_tag(self, tag: Tag) -> None:
+        self._images.append({'src': tag.get('src'), 'alt': tag.get('alt')})
+
+    def result(self) -> List[Dict[str, Optional[str]]]:
+        return self._images
+
+
+@register_extractor
+class CanonicalUrlExtractor(Extractor):
+    name = 'canonical_url'
+    tags = ('link',)
+
+    def __init__(self):
+        self._canonical_url = None
+
+    def handle_tag(self, tag: Tag) -> None:
+        # The first one wins
+        if self._canonical_url is None and _has_rel(tag, 'canonical'):
+            self._canonical_url = tag.get('href')
+
+    def result(self) -> Optional[str]:
+        return self._canonical_url
+
+
+@register_extractor
+class HreflangExtractor(Extractor):
+    name = 'hreflang'
+    tags = ('link',)
+
+    def __init__(self):
+        self._alternates = {}
+
+    def handle_tag(self, tag: Tag) -> None:
+        if tag.get('hreflang') and _has_rel(tag, 'alternate'):
+            self._alternates[tag['hreflang']] = tag.get('href')
+
+    def result(self) -> Dict[str, Optional[str]]:
+        return self._alternates
+
+
+@register_extractor
+class JsonLdExtractor(Extractor):
+    name = 'json_ld'
+    tags = ('script',)
+
+    def __init__(self):
+        self._items = []
+
+    def handle_tag(self, tag: Tag) -> None:
+        if (tag.get('type') or '').lower() != 'application/ld+json' or tag.string is None:
+            return
+        try:
+            self._items.append(json.loads(tag.string))
+        except ValueError:
+            # Broken JSON-LD is quite common, and shouldn't break the analysis
+            pass
+
+    def result(self) -> List[Any]:
+        return self._items
+
+
+@register_extractor
+class HtmlLangExtractor(Extractor):
+    name = 'html_lang'
+    tags = ('html',)
+
+    def __init__(self):
+        self._lang = None
+
+    def handle_tag(self, tag: Tag) -> None:
+        if self._lang is None:
+            self._lang = tag.get('lang')
+
+    def result(self) -> Optional[str]:
+        return self._lang
+
+
+@register_extractor
+class ScriptsExtractor(Extractor):
+    name = 'scripts'
+    tags = ('script',)
+
+    def __init__(self):
+        self._sources = []
+
+    def handle_tag(self, tag: Tag) -> None:
+        if tag.get('src'):
+            self._sources.append(tag['src'])
+
+    def result(self) -> List[str]:
+        return self._sources
+
+
+@register_extractor
+class StylesheetsExtractor(Extractor):
+    name = 'stylesheets'
+    tags = ('link',)
+
+    def __init__(self):
+        self._hrefs = []
+
+    def handle_tag(self, tag: Tag) -> None:
+        if tag.get('href') and _has_rel(tag, 'stylesheet'):
+            self._hrefs.append(tag['href'])
+
+    def result(self) -> List[str]:
+        return self._hrefs
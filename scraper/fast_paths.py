@@ -0,0 +1,47 @@
+from typing import Callable, NamedTuple, Optional
+from scraper.doc_analyser import DocAnalyser, DocSummary
+from scraper.doc_fetcher import PartialFetch, fetch_url_head, fetch_url_size
+
+_SIZE_ONLY_SKIPPED_FIELDS = ('page_title', 'meta_tags', 'body_content', 'links')
+_HEAD_ONLY_SKIPPED_FIELDS = ('body_content', 'links')
+
+
+class PartialAnalysis(NamedTuple):
+    summary: DocSummary
+    bytes_received: int
+    # Whole document size, when the server told us
+    doc_size: Optional[int]
+
+    @property
+    def bytes_saved(self) -> Optional[int]:
+        # Compared to fetching the whole document (`None` when we can't know the document size)
+        if self.doc_size is None:
+            return None
+        return self.doc_size - self.bytes_received
+
+
+def analyse_size_only(url: str, size_fetcher: Callable[[str], PartialFetch] = fetch_url_size) -> PartialAnalysis:
+    fetch = size_fetcher(url)
+    summary = DocSummary(
+        page_title=None,
+        meta_tags=None,
+        doc_size=fetch.doc_size,
+        body_content=None,
+        links=None,
+        skipped_fields=_SIZE_ONLY_SKIPPED_FIELDS,
+    )
+    return PartialAnalysis(summary=summary, bytes_received=fetch.bytes_received, doc_size=fetch.doc_size)
+
+
+def analyse_head_only(
+    analyser: DocAnalyser,
+    url: str,
+    head_fetcher: Callable[[str], PartialFetch] = fetch_url_head,
+) -> PartialAnalysis:
+    # Title and meta tags only: the page body is neither downloaded nor parsed
+    fetch = head_fetcher(url)
+    summary = analyser.analyse_doc(fetch.content)
+    if fetch.truncated:
+        skipped_fields = _HEAD_ONLY_SKIPPED_FIELDS + (('doc_size',) if fetch.doc_size is None else ())
+        summary = summary._replace(doc_size=fetch.doc_size, body_content=None, links=None, skipped_fields=skipped_fields)
+    return PartialAnalysis(summary=summary, bytes_received=fetch.bytes_received, doc_size=fetch.doc_size)
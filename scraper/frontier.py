@@ -0,0 +1,222 @@
+import mmap
+import sqlite3
+from contextlib import contextmanager
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Tuple
+from scraper.batch import BatchResult, analyse_batch
+from scraper.doc_analyser import DocAnalyser
+from scraper.sketches import BloomFilter
+
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+_ADD_BATCH_SIZE = 10_000
+
+
+class FrontierStats(NamedTuple):
+    pending: int
+    done: int
+    failed: int
+
+
+class UrlFrontier:
+    # A disk-backed frontier for long batch and crawl runs, in a fixed amount of memory whatever its number of URLs:
+    #  - every URL ever added is a row of a SQLite table, with its state. Rows are only appended, in the order
+    #    URLs are taken, and every state change is committed right away: reopening the frontier after a crash
+    #    resumes the run where it stopped (only the URLs which were being analysed at that time are taken again).
+    #  - URLs are deduplicated with a Bloom filter, in a memory-mapped file next to the database: about 1.8 bytes
+    #    per URL of `capacity` at the default `false_positive_rate`. That's the share of new URLs wrongly taken for
+    #    already added ones - and thus skipped - as long as fewer than `capacity` URLs were added.
+    #
+    # Not thread-safe: it is meant to be driven by a single thread (see `crawl_frontier()`).
+
+    def __init__(
+        self,
+        db_path: str,
+        capacity: int = 10_000_000,
+        false_positive_rate: float = 0.001,
+        max_attempts: int = 3,
+        cache_size: int = 64 * 1024 * 1024,
+        checkpoint_interval: int = 100_000,
+    ):
+        self.max_attempts = max_attempts
+        # Number of added URLs after which the Bloom filter is written to disk (see `checkpoint()`)
+        self.checkpoint_interval = checkpoint_interval
+        self._db = sqlite3.connect(db_path, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        # With WAL, this still never corrupts the database: at worst the last commits are lost on a power failure
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(f'PRAGMA cache_size=-{cache_size // 1024}')
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS frontier_urls (
+                id INTEGER PRIMARY KEY,
+                url TEXT NOT NULL,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT
+            )
+        """)
+        # Only holds the pending URLs, however many URLs are done
+        self._db.execute(f"CREATE INDEX IF NOT EXISTS frontier_pending_urls ON frontier_urls (id) WHERE state = '{PENDING}'")
+        # Counters (counting the rows of huge tables is slow), and the last URL whose bits are in the filter file
+        self._db.execute('CREATE TABLE IF NOT EXISTS frontier_meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+        self._db.executemany(
+            'INSERT OR IGNORE INTO frontier_meta (key, value) VALUES (?, 0)',
+            [(PENDING,), (DONE,), (FAILED,), ('bloom_synced_id',)],
+        )
+
+        bloom_path = Path(f'{db_path}.bloom')
+        bloom_size = BloomFilter.size_in_bytes(capacity, false_positive_rate)
+        if bloom_path.exists() and bloom_path.stat().st_size != bloom_size:
+            raise ValueError(f'{bloom_path} was created for another capacity or false positive rate')
+        self._bloom_file = open(bloom_path, 'a+b')
+        self._bloom_file.truncate(bloom_size)
+        self._bloom_bits = mmap.mmap(self._bloom_file.fileno(), bloom_size)
+        self._seen = BloomFilter(capacity, false_positive_rate, bits=self._bloom_bits)
+        # The filter bits of the URLs added since the last checkpoint may not have reached the disk before a crash
+        for (url,) in self._db.execute('SELECT url FROM frontier_urls WHERE id > ?', (self._get_meta('bloom_synced_id'),)):
+            self._seen.add(url)
+        self._unsynced_count = 0
+
+        # Taken URLs (and their id) which are not done or failed yet
+        self._in_flight: Dict[str, int] = {}
+        self._last_taken_id = 0
+
+    def __enter__(self) -> 'UrlFrontier':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __contains__(self, url: str) -> bool:
+        # Whether the URL was ever added (false positives included)
+        return url in self._seen
+
+    def add(self, urls: Iterable[str]) -> int:
+        # Only adds the URLs never seen before, and returns their number. `urls` is consumed lazily.
+        added_count = 0
+        urls = iter(urls)
+        while True:
+            batch = list(islice(urls, _ADD_BATCH_SIZE))
+            if not batch:
+                return added_count
+            new_urls = list(dict.fromkeys(url for url in batch if url not in self._seen))
+            with self._transaction():
+                self._db.executemany(
+                    'INSERT INTO frontier_urls (url, state) VALUES (?, ?)', [(url, PENDING) for url in new_urls]
+                )
+                self._increment(PENDING, len(new_urls))
+            # Only once they are committed: a crash must not leave URLs in the filter which are not in the table
+            self._seen.update(new_urls)
+            added_count += len(new_urls)
+            self._unsynced_count += len(new_urls)
+            if self._unsynced_count >= self.checkpoint_interval:
+                self.checkpoint()
+
+    def take(self, count: int) -> List[str]:
+        # The next pending URLs, in the order they were added. They stay pending until they are marked as done
+        # or failed, so that they are taken again if the run is interrupted in the meantime.
+        rows = self._db.execute(
+            'SELECT id, url FROM frontier_urls WHERE state = ? AND id > ? ORDER BY id LIMIT ?',
+            (PENDING, self._last_taken_id, count)
+        ).fetchall()
+        for url_id, url in rows:
+            self._in_flight[url] = url_id
+            self._last_taken_id = url_id
+        return [url for url_id, url in rows]
+
+    def mark_done(self, url: str) -> None:
+        url_id = self._in_flight.pop(url)
+        with self._transaction():
+            self._db.execute('UPDATE frontier_urls SET state = ?, error = NULL WHERE id = ?', (DONE, url_id))
+            self._increment(PENDING, -1)
+            self._increment(DONE, 1)
+
+    def mark_failed(self, url: str, error: str) -> None:
+        # Failed URLs go back to the end of the frontier, until they reach `max_attempts`
+        url_id = self._in_flight.pop(url)
+        with self._transaction():
+            attempts = self._db.execute('SELECT attempts FROM frontier_urls WHERE id = ?', (url_id,)).fetchone()[0] + 1
+            if attempts >= self.max_attempts:
+                self._db.execute(
+                    'UPDATE frontier_urls SET state = ?, attempts = ?, error = ? WHERE id = ?',
+                    (FAILED, attempts, error, url_id)
+                )
+                self._increment(PENDING, -1)
+                self._increment(FAILED, 1)
+            else:
+                self._db.execute(
+                    'UPDATE frontier_urls SET id = (SELECT MAX(id) + 1 FROM frontier_urls), attempts = ?, error = ? '
+                    'WHERE id = ?',
+                    (attempts, error, url_id)
+                )
+
+    def stats(self) -> FrontierStats:
+        return FrontierStats(pending=self._get_meta(PENDING), done=self._get_meta(DONE), failed=self._get_meta(FAILED))
+
+    def failures(self) -> Iterator[Tuple[str, str]]:
+        yield from self._db.execute('SELECT url, error FROM frontier_urls WHERE state = ? ORDER BY id', (FAILED,))
+
+    def checkpoint(self) -> None:
+        # Writes the Bloom filter to disk, so that reopening the frontier doesn't have to rebuild its latest bits
+        self._bloom_bits.flush()
+        with self._transaction():
+            self._db.execute(
+                'UPDATE frontier_meta SET value = (SELECT COALESCE(MAX(id), 0) FROM frontier_urls) '
+                "WHERE key = 'bloom_synced_id'"
+            )
+        self._unsynced_count = 0
+
+    def close(self) -> None:
+        self.checkpoint()
+        self._bloom_bits.close()
+        self._bloom_file.close()
+        self._db.close()
+
+    def _get_meta(self, key: str) -> int:
+        return self._db.execute('SELECT value FROM frontier_meta WHERE key = ?', (key,)).fetchone()[0]
+
+    def _increment(self, key: str, delta: int) -> None:
+        self._db.execute('UPDATE frontier_meta SET value = value + ? WHERE key = ?', (delta, key))
+
+    @contextmanager
+    def _transaction(self) -> Iterator[None]:
+        self._db.execute('BEGIN')
+        try:
+            yield
+        except BaseException:
+            self._db.execute('ROLLBACK')
+            raise
+        self._db.execute('COMMIT')
+
+
+def crawl_frontier(
+    frontier: UrlFrontier,
+    analyser: DocAnalyser,
+    workers: int = 8,
+    batch_size: int = 100,
+) -> Iterator[BatchResult]:
+    # Analyses the pending URLs of the frontier until there are none left, and records their outcome. URLs added to
+    # the frontier while iterating over the results (e.g. the links of analysed pages) are analysed too.
+    while frontier.stats().pending > 0:
+        results_count = 0
+        for result in analyse_batch(analyser, _iter_pending_urls(frontier, batch_size), workers=workers):
+            if result.error is None:
+                frontier.mark_done(result.url)
+            else:
+                frontier.mark_failed(result.url, f'{type(result.error).__name__}: {result.error}')
+            results_count += 1
+            yield result
+        # The remaining pending URLs were taken by someone else, and are not done yet
+        if results_count == 0:
+            return
+
+
+def _iter_pending_urls(frontier: UrlFrontier, batch_size: int) -> Iterator[str]:
+    while True:
+        urls = frontier.take(batch_size)
+        if not urls:
+            return
+        yield from urls
@@ -0,0 +1,242 @@
+import random
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple
+from scraper.synthetic_docs import generate_html_doc
+
+_WORDS = (
+    'once upon a time there were three little sisters and their names were Elsie Lacie Tillie they lived at the '
+    'bottom of well'
+).split(' ')
+# Words which are not ASCII, for the encodings
+_INTERNATIONAL_WORDS = {
+    'latin': ['café', 'naïve', 'crème', 'brûlée', 'façade', 'über', 'Straße', 'año', 'élève'],
+    'cyrillic': ['жили', 'были', 'три', 'сестры'],
+    'greek': ['μια', 'φορά', 'κι', 'έναν', 'καιρό'],
+    'japanese': ['昔々', 'ある', '所に', '三人の', '姉妹が'],
+}
+
+
+class GoldenDoc(NamedTuple):
+    # e.g. "broken/0042", which is also its path (without the ".html" suffix) in a corpus directory
+    name: str
+    content: bytes
+
+
+def generate_golden_corpus(seed: int = 0, docs_per_category: int = 50) -> List[GoldenDoc]:
+    # Deterministic corpus of small but adversarial pages, to check that every analysis mode agrees with the
+    # reference one (see `scraper.differential`): broken markup, odd encodings, huge attribute lists, deeply nested
+    # DOMs, tricky content (entities, invisible elements, "</head>" in scripts...), and regular synthetic pages.
+    docs = []
+    for category, generate in _CATEGORIES.items():
+        for index in range(docs_per_category):
+            rng = random.Random(f'{seed}/{category}/{index}')
+            docs.append(GoldenDoc(name=f'{category}/{index:04d}', content=generate(rng)))
+    return docs
+
+
+def write_corpus(docs: List[GoldenDoc], directory: Path) -> None:
+    for doc in docs:
+        path = directory / f'{doc.name}.html'
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(doc.content)
+
+
+def read_corpus(directory: Path) -> List[GoldenDoc]:
+    # Any tree of ".html" files, e.g. a generated corpus with real pages added to it
+    return [
+        GoldenDoc(name=path.relative_to(directory).with_suffix('').as_posix(), content=path.read_bytes())
+        for path in sorted(directory.rglob('*.html'))
+    ]
+
+
+def _generate_synthetic_doc(rng: random.Random) -> bytes:
+    return generate_html_doc(
+        rng.randrange(1_000_000),
+        target_size=rng.choice((1_000, 5_000, 20_000, 50_000)),
+        links_ratio=rng.choice((0, 0.05, 0.3)),
+        zipf_exponent=rng.choice((0, 1.1)),
+        scripts_share=rng.choice((0, 0, 0.5, 0.9)),
+    )
+
+
+def _generate_broken_doc(rng: random.Random) -> bytes:
+    breakages: List[Callable[[], str]] = [
+        lambda: '<p>unclosed paragraph<p>another one<div><span>and a span',
+        lambda: '</div></span></p> stray end tags </html> in the middle',
+        lambda: f'<a href=/{_words(rng, 1)}/{rng.randint(0, 99)} class=unquoted>{_words(rng, 2)}</a>',
+        lambda: f'<a href>{_words(rng, 2)}</a><a>{_words(rng, 1)}</a><a href="">{_words(rng, 1)}</a>',
+        lambda: f'<a href="/outer">{_words(rng, 2)} <a href="/inner">{_words(rng, 2)}</a> after</a>',
+        lambda: f'{_words(rng, 3)} a < b && c > d {_words(rng, 3)}',
+        lambda: f'<TITLE>{_words(rng, 2)}</TITLE><META NAME=Keywords CONTENT="{_words(rng, 3)}">',
+        lambda: f'<title>{_words(rng, 2)}</title>',
+        lambda: f'<meta name="description" content="{_words(rng, 5)}">',
+        lambda: f'<b><i>{_words(rng, 3)}</b></i> misnested',
+        lambda: f'<table><tr><td>{_words(rng, 2)}<td>{_words(rng, 2)}</table>',
+        lambda: f'<!-- {_words(rng, 3)} <p>commented out</p> -- > still a comment? -->',
+        lambda: '<p>' * rng.randint(10, 200) + _words(rng, 5),
+        lambda: f'<img src="/{_words(rng, 1)}.png" alt="{_words(rng, 2)}"/><br/><hr/>',
+        lambda: f'<div id="a" id="b" class="c" class="d">{_words(rng, 3)}</div>',
+        lambda: f'<{_words(rng, 1)}-element>{_words(rng, 2)}</{_words(rng, 1)}-element>',
+    ]
+    head = f'<title>{_words(rng, 3)}</title>' if rng.random() < 0.7 else ''
+    body = [breakage() for breakage in rng.choices(breakages, k=rng.randint(2, 8))]
+    body.insert(rng.randint(0, len(body)), f'<p>{_words(rng, 20)}</p>')
+
+    parts = []
+    if rng.random() < 0.7:
+        parts.append('<!DOCTYPE html>')
+    if rng.random() < 0.8:
+        parts.append('<html>')
+    if rng.random() < 0.7:
+        parts.append('<head>' + head + ('</head>' if rng.random() < 0.7 else ''))
+    else:
+        # No <head> at all, or only its content
+        parts.append(head)
+    parts.append(('<body>' if rng.random() < 0.7 else '') + '\n'.join(body))
+    doc = ''.join(parts)
+    # Cut anywhere, even in the middle of a tag, or of an attribute value
+    if rng.random() < 0.3:
+        doc = doc[:rng.randint(len(doc) // 2, len(doc))]
+    elif rng.random() < 0.5:
+        doc += '</body></html>'
+    return doc.encode('utf-8')
+
+
+def _generate_encoded_doc(rng: random.Random) -> bytes:
+    encoding, declaration, script = rng.choice([
+        ('utf-8', '', 'latin'),
+        ('utf-8', '<meta charset="utf-8">', 'cyrillic'),
+        ('utf-8', '<meta http-equiv="Content-Type" content="text/html; charset=UTF-8">', 'japanese'),
+        ('utf-8-sig', '', 'greek'),
+        ('utf-16', '', 'japanese'),
+        ('utf-16-be', '', 'latin'),
+        ('iso-8859-1', '<meta charset="iso-8859-1">', 'latin'),
+        ('cp1252', '<meta http-equiv="content-type" content="text/html; charset=windows-1252">', 'latin'),
+        # Undeclared, left to the guesswork
+        ('cp1252', '', 'latin'),
+        ('koi8-r', '<meta charset="koi8-r">', 'cyrillic'),
+        ('iso-8859-7', '<meta charset="iso-8859-7">', 'greek'),
+        ('shift_jis', '<meta charset="Shift_JIS">', 'japanese'),
+        ('euc-jp', '<meta http-equiv="Content-Type" content="text/html; charset=euc-jp">', 'japanese'),
+        # Declared wrongly, or unknown
+        ('iso-8859-1', '<meta charset="utf-8">', 'latin'),
+        ('utf-8', '<meta charset="x-unknown-charset">', 'latin'),
+    ])
+    words = _INTERNATIONAL_WORDS[script] + _WORDS
+
+    def text(count: int) -> str:
+        return ' '.join(rng.choices(words, k=count))
+
+    # UTF-16 docs can't declare anything else than what their byte order mark says
+    declaration = '' if encoding.startswith('utf-16') else declaration
+    doc = (
+        f'<html><head>{declaration}<title>{text(3)}</title><meta name="keywords" content="{text(4)}"></head><body>'
+        + ''.join(f'<p>{text(rng.randint(5, 30))} <a href="/{rng.choice(words)}">{text(2)}</a></p>'
+                  for _ in range(rng.randint(1, 20)))
+        + '</body></html>'
+    )
+    content = doc.encode(encoding, 'replace')
+    if encoding == 'utf-8' and rng.random() < 0.3:
+        # Invalid UTF-8 bytes in the middle of the text
+        position = content.index(b'<p>') + 3
+        content = content[:position] + b'\xff\xc3\x28 ' + content[position:]
+    return content
+
+
+def _generate_attributes_doc(rng: random.Random) -> bytes:
+    def attributes(count: int) -> str:
+        return ' '.join(f'data-{_words(rng, 1)}-{index}="{_words(rng, rng.randint(0, 3))}"' for index in range(count))
+
+    parts = [
+        f'<html><head><title {attributes(rng.randint(0, 500))}>{_words(rng, 3)}</title>',
+        f'<meta name="keywords" content="{_words(rng, 5)}" {attributes(rng.randint(0, 2_000))}>',
+        f'<meta {attributes(rng.randint(0, 50))} name="description" content="{_words(rng, rng.randint(100, 5_000))}">',
+        '</head><body>',
+    ]
+    for _ in range(rng.randint(1, 10)):
+        element = rng.choice(('div', 'p', 'span', 'a', 'img', 'input'))
+        href = f' href=" /{_words(rng, 1)}?a=1&amp;b={rng.randint(0, 9)} "' if element == 'a' else ''
+        # ">" in attribute values must not end the tag
+        tricky = f' title="a > b" onclick="if (x > 1) {{ y = \'<p>\' }}"' if rng.random() < 0.3 else ''
+        parts.append(f'<{element}{href}{tricky} {attributes(rng.choice((1, 10, 100, 1_000)))}>{_words(rng, 5)}</{element}>')
+    parts.append(f'<div class="{"x" * rng.randint(1_000, 50_000)}">{_words(rng, 10)}</div>')
+    parts.append('</body></html>')
+    return ''.join(parts).encode('utf-8')
+
+
+def _generate_nested_doc(rng: random.Random) -> bytes:
+    depth = rng.choice((50, 200, 500, 2_000))
+    element = rng.choice(('div', 'span', 'b', 'section', 'blockquote'))
+    opening = []
+    for level in range(depth):
+        # Some text and links on the way down
+        text = f'{_words(rng, 2)} ' if rng.random() < 0.05 else ''
+        link = f'<a href="/level/{level}">{_words(rng, 1)}</a>' if rng.random() < 0.02 else ''
+        opening.append(f'<{element}>{text}{link}')
+    # Lists in lists, or tables in tables
+    nested_list = '<ul><li>' * rng.randint(1, 200) + _words(rng, 3)
+    closing = f'</{element}>' * (depth if rng.random() < 0.5 else rng.randint(0, depth))
+    return (
+        f'<html><head><title>{_words(rng, 3)}</title></head><body>'
+        + ''.join(opening) + f'<p>{_words(rng, 10)}</p>' + closing + nested_list + f'<p>{_words(rng, 5)}</p>'
+        + '</body></html>'
+    ).encode('utf-8')
+
+
+def _generate_tricky_content_doc(rng: random.Random) -> bytes:
+    head_items: List[Callable[[], str]] = [
+        lambda: f'<title>{_words(rng, 2)} &amp; {_words(rng, 1)} &lt;3 &#x1F600; &foo; &#0;</title>',
+        lambda: f'<title>  {_words(rng, 2)}\n\t{_words(rng, 2)}  </title>',
+        lambda: f'<title><b>{_words(rng, 2)}</b></title>',
+        lambda: '<script>var s = "</head><body>not the body";</script>',
+        lambda: '<!-- </head> in a comment -->',
+        lambda: f'<style>body::after {{ content: "</head>{_words(rng, 2)}" }}</style>',
+        lambda: f'<meta name="keywords" content="{_words(rng, 2)}, {_words(rng, 2)},,  ,{_words(rng, 1)}">',
+        lambda: f'<meta name="KEYWORDS" content="{_words(rng, 3)}">',
+        lambda: f'<meta property="og:title" content="{_words(rng, 3)}">',
+        lambda: '<meta name="empty">',
+        lambda: f'<noscript><p>{_words(rng, 3)}</p></noscript>',
+    ]
+    body_items: List[Callable[[], str]] = [
+        lambda: f'<p>{_words(rng, 3)}&nbsp;{_words(rng, 2)} &amp;amp; &copy &#169; &#xa9; &unknown;</p>',
+        lambda: f'<script>document.write("</div><p>{_words(rng, 2)}</p>"); var t = "</scr" + "ipt>";</script>',
+        lambda: '<script type="application/ld+json">{"@type": "Article", "name": "</p>"}</script>',
+        lambda: f'<style>.a > .b {{ color: red }}</style>{_words(rng, 2)}',
+        lambda: f'<noscript>{_words(rng, 3)}</noscript><template><p>{_words(rng, 3)}</p></template>',
+        lambda: f'<textarea>{_words(rng, 2)} <b>not bold</b></textarea>',
+        lambda: f'<pre>  {_words(rng, 3)}\n    {_words(rng, 3)}</pre>',
+        lambda: f'<![CDATA[ {_words(rng, 3)} ]]>',
+        lambda: f'<!--[if IE]><p>{_words(rng, 3)}</p><![endif]-->',
+        lambda: f'<svg><title>{_words(rng, 2)}</title><text>{_words(rng, 2)}</text></svg>',
+        lambda: f'<math><mi>x</mi><mo>=</mo><mn>{rng.randint(0, 9)}</mn></math>',
+        lambda: f'<iframe srcdoc="<p>{_words(rng, 2)}</p>"></iframe>',
+        lambda: f'<p>{_words(rng, 2)}</p><p>{_words(rng, 2)}</p><div>{_words(rng, 1)}</div>{_words(rng, 1)}<br>{_words(rng, 1)}',
+        lambda: f'{_words(rng, 1)}<span>{_words(rng, 1)}</span>{_words(rng, 1)}<b>{_words(rng, 1)}</b>',
+        lambda: f'<a href="javascript:void(0)">{_words(rng, 1)}</a><a href="#top"><img alt="top"></a>',
+        lambda: f'<a href="/x"> \n {_words(rng, 2)} <span> {_words(rng, 1)} </span>\n</a>',
+        lambda: f'<a href="/y">{_words(rng, 1)}<script>var a = 1;</script></a>',
+        lambda: f'<p>{_odd_whitespace_words(rng)}</p>',
+        lambda: f'<p>don\'t won’t {_words(rng, 2)}-{_words(rng, 1)} {_words(rng, 1)}.{_words(rng, 1)}</p>',
+    ]
+    head = ''.join(item() for item in rng.choices(head_items, k=rng.randint(1, 6)))
+    body = ''.join(item() for item in rng.choices(body_items, k=rng.randint(1, 12)))
+    return f'<!DOCTYPE html><html><head>{head}</head><body>{body}</body></html>'.encode('utf-8')
+
+
+def _words(rng: random.Random, count: int) -> str:
+    return ' '.join(rng.choices(_WORDS, k=count))
+
+
+def _odd_whitespace_words(rng: random.Random) -> str:
+    # Non-breaking and zero width spaces, tabs, Windows line breaks
+    return ''.join(rng.choice(('\u200b', '\xa0', ' ', '\t', '\r\n')) + word for word in rng.choices(_WORDS, k=6))
+
+
+_CATEGORIES: Dict[str, Callable[[random.Random], bytes]] = {
+    'synthetic': _generate_synthetic_doc,
+    'broken': _generate_broken_doc,
+    'encodings': _generate_encoded_doc,
+    'attributes': _generate_attributes_doc,
+    'nesting': _generate_nested_doc,
+    'tricky': _generate_tricky_content_doc,
+}
@@ -0,0 +1,103 @@
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional
+from scraper.batch import OutcomeStats, analyse_batch
+from scraper.dns_cache import DnsCache, DnsStats
+from scraper.doc_analyser import PARSED, DocAnalyser, FetchResponse
+from scraper.doc_fetcher import create_pooled_fetcher
+from scraper.server_farm import ServerFarm
+
+LATENCY_PERCENTILES = (50, 90, 99, 100)
+
+
+class LoadTestReport(NamedTuple):
+    pages: int
+    # Pages parsed, and pages which were not worth it, by outcome (see `DocSummary.outcome`)
+    analysed: int
+    unparsed: Dict[str, int]
+    # Estimated analysis time saved by not parsing the latter (see `OutcomeStats`)
+    saved_analysis_seconds: float
+    # Pages which failed, by exception type
+    errors: Dict[str, int]
+    seconds: float
+    received_bytes: int
+    # Time to fetch each page (the whole body, or the error), in seconds, by percentile
+    latency_percentiles: Dict[int, float]
+    # What the servers did during the run (see `scraper.server_farm`), and the connections the client opened
+    server_outcomes: Dict[str, int]
+    connections: int
+    # `None` without a DNS cache
+    dns_stats: Optional[DnsStats] = None
+
+    @property
+    def pages_per_second(self) -> float:
+        return self.pages / self.seconds if self.seconds else 0.0
+
+    @property
+    def error_rate(self) -> float:
+        return sum(self.errors.values()) / self.pages if self.pages else 0.0
+
+
+def run_load_test(
+    farm: ServerFarm,
+    workers: int = 8,
+    pool_size: int = 10,
+    timeout: Optional[float] = None,
+    max_size: Optional[int] = None,
+    urls: Optional[List[str]] = None,
+    dns_cache: Optional[DnsCache] = None,
+) -> LoadTestReport:
+    # Analyses the pages of a running farm (all of them by default) with the batch analysis and a pooled fetcher
+    # tuned with these settings
+    fetcher = create_pooled_fetcher(pool_size=pool_size, max_size=max_size, timeout=timeout, dns_cache=dns_cache,
+                                    structured=True)
+    latencies: List[float] = []
+    received_bytes = [0]
+    lock = threading.Lock()
+
+    def timed_fetcher(url: str) -> FetchResponse:
+        started_at = time.perf_counter()
+        response = None
+        try:
+            response = fetcher(url)
+            return response
+        finally:
+            with lock:
+                latencies.append(time.perf_counter() - started_at)
+                received_bytes[0] += len(response.content) if response is not None else 0
+
+    analyser = DocAnalyser(timed_fetcher, max_doc_size=max_size, html_only=True)
+    outcomes_before, connections_before = farm.outcomes(), farm.connections_count
+    urls = farm.urls() if urls is None else urls
+    errors: Counter = Counter()
+    outcome_stats = OutcomeStats()
+    started_at = time.perf_counter()
+    for result in analyse_batch(analyser, urls, workers=workers, dns_cache=dns_cache):
+        if result.error is None:
+            outcome_stats.add(result.summary)
+        else:
+            errors[type(result.error).__name__] += 1
+    seconds = time.perf_counter() - started_at
+
+    latencies.sort()
+    return LoadTestReport(
+        pages=len(urls),
+        analysed=outcome_stats.outcomes[PARSED],
+        unparsed={outcome: count for outcome, count in outcome_stats.outcomes.items() if outcome != PARSED},
+        saved_analysis_seconds=outcome_stats.saved_seconds,
+        errors=dict(errors),
+        seconds=seconds,
+        received_bytes=received_bytes[0],
+        latency_percentiles={percentile: _percentile(latencies, percentile) for percentile in LATENCY_PERCENTILES},
+        server_outcomes=dict(farm.outcomes() - outcomes_before),
+        connections=farm.connections_count - connections_before,
+        dns_stats=dns_cache.stats() if dns_cache is not None else None,
+    )
+
+
+def _percentile(sorted_values: List[float], percentile: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(percentile / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
@@ -0,0 +1,330 @@
+import mmap
+import zlib
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, NamedTuple, Optional, Tuple, Union
+from urllib.parse import unquote, urlparse
+from scraper.doc_analyser import DocAnalyser, DocSummary
+
+_GZIP_MAGIC = b'\x1f\x8b'
+# Magic number and "deflate" compression method: where we look for the next member after a damaged one
+_GZIP_MEMBER_START = _GZIP_MAGIC + b'\x08'
+_GZIP_READ_CHUNK_SIZE = 64 * 1024
+_HEADERS_END = b'\r\n\r\n'
+# Where we look for the next record after a damaged one (records start with their "WARC/1.x" version line)
+_RECORD_START = b'\r\nWARC/'
+# zlib window bits for each "Content-Encoding": "deflate" is supposed to have a zlib header, but many servers send
+# raw deflate data
+_CONTENT_ENCODING_WBITS = {
+    'gzip': (zlib.MAX_WBITS | 16,),
+    'x-gzip': (zlib.MAX_WBITS | 16,),
+    'deflate': (zlib.MAX_WBITS, -zlib.MAX_WBITS),
+}
+
+
+class LocalDoc(NamedTuple):
+    url: str
+    # A view on the memory-mapped file: it is only valid until the next document is requested from the iterator
+    # (use `bytes(payload)` to keep it around).
+    payload: memoryview
+
+
+class WarcRecord(NamedTuple):
+    record_type: str
+    target_uri: Optional[str]
+    headers: Dict[str, str]
+    http_status: Optional[int]
+    http_headers: Dict[str, str]
+    # For "response" records this is the HTTP body, without its transfer and content encodings (chunked, gzip or
+    # deflate: `http_headers` are left as they were archived), for other records the whole record block.
+    payload: memoryview
+
+
+def fetch_file_content(url: str) -> bytes:
+    # A `doc_fetcher` for local files, which accepts both "file://" URLs and plain paths.
+    return path_from_url(url).read_bytes()
+
+
+def path_from_url(url: str) -> Path:
+    if url.startswith('file://'):
+        return Path(unquote(urlparse(url).path))
+    return Path(url)
+
+
+def iter_html_files(directory: Union[str, Path], patterns: Tuple[str, ...] = ('*.html', '*.htm')) -> Iterator[LocalDoc]:
+    paths = sorted({path for pattern in patterns for path in Path(directory).rglob(pattern) if path.is_file()})
+    for path in paths:
+        with open(path, 'rb') as file:
+            if path.stat().st_size == 0:
+                yield LocalDoc(url=path.absolute().as_uri(), payload=memoryview(b''))
+                continue
+            mapped_file = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        payload = memoryview(mapped_file)
+        try:
+            yield LocalDoc(url=path.absolute().as_uri(), payload=payload)
+        finally:
+            _release(payload, mapped_file)
+
+
+def iter_warc_records(
+    path: Union[str, Path],
+    on_damaged_member: Optional[Callable[[int, Exception], None]] = None,
+    on_damaged_record: Optional[Callable[[int, Exception], None]] = None,
+) -> Iterator[WarcRecord]:
+    # Damaged gzip members of compressed WARCs (corrupt or truncated ones) don't end the iteration: the records they
+    # hold which could not be decompressed whole are skipped, the iteration goes on from the next member, and
+    # `on_damaged_member()` is given the offset of the member in the file and the error. Neither do records whose
+    # "Content-Length" is not a length: they are skipped, the iteration goes on from the next "WARC/" version line,
+    # and `on_damaged_record()` is given the offset of the record in the (decompressed) archive and the error.
+    with open(path, 'rb') as file:
+        is_gzipped = file.read(2) == _GZIP_MAGIC
+        file.seek(0, 2)
+        if file.tell() == 0:
+            return
+        mapped_file = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    view = memoryview(mapped_file)
+    try:
+        if is_gzipped:
+            yield from _iter_gzipped_records(mapped_file, view, on_damaged_member, on_damaged_record)
+        else:
+            yield from _iter_records_in(mapped_file, on_damaged_record)
+    finally:
+        _release(view, mapped_file)
+
+
+def iter_warc_docs(
+    path: Union[str, Path],
+    on_damaged_member: Optional[Callable[[int, Exception], None]] = None,
+    on_damaged_record: Optional[Callable[[int, Exception], None]] = None,
+) -> Iterator[LocalDoc]:
+    for record in iter_warc_records(path, on_damaged_member, on_damaged_record):
+        if record.record_type != 'response' or record.target_uri is None:
+            continue
+        if record.http_status is not None and not 200 <= record.http_status < 300:
+            continue
+        yield LocalDoc(url=record.target_uri, payload=record.payload)
+
+
+def analyse_local_docs(analyser: DocAnalyser, docs: Iterable[LocalDoc]) -> Iterator[Tuple[str, DocSummary]]:
+    for doc in docs:
+        yield doc.url, analyser.analyse_doc(doc.payload)
+
+
+def _iter_records_in(
+    buffer: Union[bytes, mmap.mmap],
+    on_damaged_record: Optional[Callable[[int, Exception], None]],
+    buffer_offset: int = 0,
+) -> Iterator[WarcRecord]:
+    # `buffer_offset` is where the buffer starts in the archive, for the damaged records' offsets
+    view = memoryview(buffer)
+    buffer_size = len(buffer)
+    position = 0
+    try:
+        while position < buffer_size:
+            headers_end = buffer.find(_HEADERS_END, position)
+            if headers_end == -1:
+                break
+            version_line, headers = _parse_headers(buffer[position:headers_end])
+            if not version_line.startswith('WARC/'):
+                raise ValueError(f'Invalid WARC record at offset {position}: "{version_line[:20]}"')
+
+            block_start = headers_end + len(_HEADERS_END)
+            content_length = _parse_content_length(headers)
+            if content_length is None:
+                if on_damaged_record is not None:
+                    on_damaged_record(buffer_offset + position, _invalid_content_length_error(headers))
+                next_record_start = buffer.find(_RECORD_START, headers_end)
+                position = next_record_start + 2 if next_record_start != -1 else buffer_size
+                continue
+            block_end = block_start + content_length
+            record_type = headers.get('warc-type', '')
+            http_status, http_headers, payload = None, {}, view[block_start:block_end]
+            if record_type == 'response':
+                http_headers_end = buffer.find(_HEADERS_END, block_start, block_end)
+                if http_headers_end != -1:
+                    status_line, http_headers = _parse_headers(buffer[block_start:http_headers_end])
+                    http_status = _parse_http_status(status_line)
+                    payload = _decode_http_payload(view[http_headers_end + len(_HEADERS_END):block_end], http_headers)
+
+            yield WarcRecord(
+                record_type=record_type,
+                target_uri=headers.get('warc-target-uri'),
+                headers=headers,
+                http_status=http_status,
+                http_headers=http_headers,
+                payload=payload,
+            )
+
+            # Records are separated by two CRLF sequences
+            position = block_end
+            while buffer[position:position + 2] == b'\r\n':
+                position += 2
+    finally:
+        try:
+            view.release()
+        except BufferError:
+            pass
+
+
+def _decode_http_payload(payload: memoryview, http_headers: Dict[str, str]) -> memoryview:
+    # Responses are archived as they were sent. Decoding them costs a copy, so only encoded payloads pay for it, and
+    # payloads which turn out not to be encoded after all (some crawlers store them decoded, with the original
+    # headers) are kept as they are.
+    is_chunked = 'chunked' in http_headers.get('transfer-encoding', '').lower()
+    content_encoding = http_headers.get('content-encoding', '').strip().lower()
+    if not is_chunked and content_encoding not in _CONTENT_ENCODING_WBITS:
+        return payload
+
+    body = bytes(payload)
+    if is_chunked:
+        dechunked_body = _decode_chunked(body)
+        body = dechunked_body if dechunked_body is not None else body
+    for wbits in _CONTENT_ENCODING_WBITS.get(content_encoding, ()):
+        try:
+            # Unlike `zlib.decompress()`, a decompressor gives us what it can of truncated payloads
+            body = zlib.decompressobj(wbits).decompress(body)
+            break
+        except zlib.error:
+            continue
+    return memoryview(body)
+
+
+def _decode_chunked(body: bytes) -> Optional[bytes]:
+    # `None` when the body doesn't even start with a chunk. Trailers are dropped, and truncated bodies keep what
+    # was received.
+    chunks = []
+    position = 0
+    while position < len(body):
+        size_end = body.find(b'\r\n', position)
+        size_line = body[position:size_end] if size_end != -1 else b''
+        try:
+            # "1a3;name=value": chunk extensions are ignored
+            chunk_size = int(size_line.split(b';', 1)[0], 16)
+        except ValueError:
+            chunk_size = -1
+        if chunk_size < 0:
+            # Not a chunk, or a truncated one
+            return b''.join(chunks) if chunks else None
+        if chunk_size == 0:
+            break
+        chunk_start = size_end + 2
+        chunks.append(body[chunk_start:chunk_start + chunk_size])
+        position = chunk_start + chunk_size + 2
+    return b''.join(chunks)
+
+
+def _iter_gzipped_records(
+    mapped_file: mmap.mmap,
+    view: memoryview,
+    on_damaged_member: Optional[Callable[[int, Exception], None]],
+    on_damaged_record: Optional[Callable[[int, Exception], None]],
+) -> Iterator[WarcRecord]:
+    # Compressed WARCs are normally made of one gzip member per record, but some are a single member: either way,
+    # the records are decompressed a chunk at a time, and each one is copied out of the decompressed stream (we
+    # can't avoid a copy here) as soon as it is complete. Only one record at a time is in memory.
+    buffer = bytearray()
+    # Where the buffer starts in the decompressed archive
+    buffer_offset = 0
+
+    def drop(size: int) -> None:
+        nonlocal buffer_offset
+        del buffer[:size]
+        buffer_offset += size
+
+    for data in _iter_gunzipped(mapped_file, view, on_damaged_member):
+        if data is None:
+            # The record in progress is lost with the damaged member
+            drop(len(buffer))
+            continue
+        buffer += data
+        while True:
+            # Records are separated by two CRLF sequences
+            while buffer[:2] == b'\r\n':
+                drop(2)
+            headers_end = buffer.find(_HEADERS_END)
+            if headers_end == -1:
+                break
+            _, headers = _parse_headers(buffer[:headers_end])
+            content_length = _parse_content_length(headers)
+            if content_length is None:
+                next_record_start = buffer.find(_RECORD_START, headers_end)
+                if next_record_start == -1:
+                    break
+                if on_damaged_record is not None:
+                    on_damaged_record(buffer_offset, _invalid_content_length_error(headers))
+                drop(next_record_start + 2)
+                continue
+            record_end = headers_end + len(_HEADERS_END) + content_length
+            if record_end > len(buffer):
+                break
+            record = bytes(buffer[:record_end])
+            drop(record_end)
+            yield from _iter_records_in(record, on_damaged_record, buffer_offset - record_end)
+
+    # A record shorter than it claims, at the end of the archive: what we have of it
+    if buffer:
+        yield from _iter_records_in(bytes(buffer), on_damaged_record, buffer_offset)
+
+
+def _iter_gunzipped(
+    mapped_file: mmap.mmap,
+    view: memoryview,
+    on_damaged_member: Optional[Callable[[int, Exception], None]],
+) -> Iterator[Optional[bytes]]:
+    # The decompressed data of all the gzip members, in chunks of bounded size, and `None` after a damaged member
+    position = 0
+    while position < len(view):
+        member_start = position
+        decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        try:
+            while not decompressor.eof:
+                if position >= len(view):
+                    raise EOFError('Compressed file ended before the end-of-stream marker was reached')
+                chunk = view[position:position + _GZIP_READ_CHUNK_SIZE]
+                data = decompressor.decompress(chunk, _GZIP_READ_CHUNK_SIZE)
+                position += len(chunk) - len(decompressor.unconsumed_tail) - len(decompressor.unused_data)
+                if data:
+                    yield data
+        except (zlib.error, EOFError) as e:
+            if on_damaged_member is not None:
+                on_damaged_member(member_start, e)
+            yield None
+            # Not before what was already decompressed
+            next_member_start = mapped_file.find(_GZIP_MEMBER_START, max(position, member_start + 1))
+            position = next_member_start if next_member_start != -1 else len(view)
+
+
+def _parse_headers(raw_headers: bytes) -> Tuple[str, Dict[str, str]]:
+    lines = bytes(raw_headers).decode('utf-8', errors='replace').split('\r\n')
+    headers = {}
+    for line in lines[1:]:
+        name, separator, value = line.partition(':')
+        if separator:
+            headers[name.strip().lower()] = value.strip()
+    return lines[0].strip(), headers
+
+
+def _parse_content_length(headers: Dict[str, str]) -> Optional[int]:
+    # `None` when it is not a length (records without any are empty)
+    content_length = headers.get('content-length', '0')
+    return int(content_length) if content_length.isascii() and content_length.isdigit() else None
+
+
+def _invalid_content_length_error(headers: Dict[str, str]) -> ValueError:
+    return ValueError(f'Invalid WARC record Content-Length: "{headers["content-length"][:20]}"')
+
+
+def _parse_http_status(status_line: str) -> Optional[int]:
+    parts = status_line.split(' ', 2)
+    if len(parts) < 2 or not parts[1].isdigit():
+        return None
+    return int(parts[1])
+
+
+def _release(view: memoryview, mapped_file: mmap.mmap) -> None:
+    # If the caller kept a slice of a payload around we can't unmap the file: the garbage collector will do it.
+    try:
+        view.release()
+        mapped_file.close()
+    except BufferError:
+        pass
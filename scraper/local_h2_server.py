@@ -0,0 +1,122 @@
+import asyncio
+import threading
+from typing import Mapping, Optional, Set, Tuple
+import h2.config
+import h2.connection
+import h2.events
+import h2.exceptions
+
+
+class LocalHttp2Server:
+    # A minimal cleartext HTTP/2 ("h2c", prior knowledge) server for tests and benchmarks, serving static pages
+    # - `(content_type, body)` by path - from its own thread. Each response waits `response_delay` seconds, to
+    # simulate a distant server, and responses of a same connection are sent concurrently (multiplexed).
+    # Needs the optional `h2` dependency.
+
+    def __init__(self, pages: Mapping[str, Tuple[str, bytes]], response_delay: float = 0):
+        self.pages = pages
+        self.response_delay = response_delay
+        self.url: Optional[str] = None
+        self.connections_count = 0
+        self.requests_count = 0
+        self._loop = asyncio.new_event_loop()
+        self._started = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self) -> 'LocalHttp2Server':
+        self._thread.start()
+        self._started.wait()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        server = self._loop.run_until_complete(asyncio.start_server(self._handle_connection, '127.0.0.1', 0))
+        self.url = f'http://127.0.0.1:{server.sockets[0].getsockname()[1]}'
+        self._started.set()
+        self._loop.run_forever()
+
+        server.close()
+        tasks = asyncio.all_tasks(self._loop)
+        for task in tasks:
+            task.cancel()
+        self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self._loop.close()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections_count += 1
+        connection = h2.connection.H2Connection(h2.config.H2Configuration(client_side=False, header_encoding='utf-8'))
+        connection.initiate_connection()
+        writer.write(connection.data_to_send())
+        # Responses waiting for the client to open its flow control window wait for this
+        window_updated = asyncio.Event()
+        responses: Set[asyncio.Task] = set()
+        try:
+            while True:
+                data = await reader.read(65_536)
+                if not data:
+                    break
+                for event in connection.receive_data(data):
+                    if isinstance(event, h2.events.RequestReceived):
+                        path = dict(event.headers)[':path'].split('?')[0]
+                        response = asyncio.ensure_future(
+                            self._respond(connection, writer, event.stream_id, path, window_updated)
+                        )
+                        responses.add(response)
+                        response.add_done_callback(responses.discard)
+                    elif isinstance(event, h2.events.DataReceived):
+                        connection.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                    elif isinstance(event, h2.events.WindowUpdated):
+                        window_updated.set()
+                writer.write(connection.data_to_send())
+        except (ConnectionError, asyncio.CancelledError):
+            # Cancelled when the server stops
+            pass
+        finally:
+            for response in responses:
+                response.cancel()
+            writer.close()
+
+    async def _respond(
+        self,
+        connection: h2.connection.H2Connection,
+        writer: asyncio.StreamWriter,
+        stream_id: int,
+        path: str,
+        window_updated: asyncio.Event,
+    ) -> None:
+        if self.response_delay:
+            await asyncio.sleep(self.response_delay)
+        self.requests_count += 1
+        status, content_type, body = ('200', *self.pages[path]) if path in self.pages else ('404', 'text/plain', b'')
+        try:
+            connection.send_headers(stream_id, [
+                (':status', status),
+                ('content-type', content_type),
+                ('content-length', str(len(body))),
+            ])
+            position = 0
+            while True:
+                chunk_size = min(
+                    connection.local_flow_control_window(stream_id),
+                    connection.max_outbound_frame_size,
+                    len(body) - position,
+                )
+                if chunk_size == 0 and position < len(body):
+                    window_updated.clear()
+                    writer.write(connection.data_to_send())
+                    await window_updated.wait()
+                    continue
+                chunk_end = position + chunk_size
+                connection.send_data(stream_id, body[position:chunk_end], end_stream=chunk_end == len(body))
+                writer.write(connection.data_to_send())
+                position = chunk_end
+                if position == len(body):
+                    return
+                await writer.drain()
+        except h2.exceptions.StreamClosedError:
+            # The client reset the stream, e.g. because the document is too large
+            pass
@@ -0,0 +1,262 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+from bs4.dammit import UnicodeDammit
+from scraper.doc_analyser import DocAnalyser, DocSummary, find_head_end
+from scraper.doc_fetcher import ConditionalFetch, fetch_url_if_modified
+
+NEW = 'new'
+CHANGED = 'changed'
+UNCHANGED = 'unchanged'
+NOT_MODIFIED = 'not_modified'
+ERROR = 'error'
+
+
+class PageFingerprint(NamedTuple):
+    etag: Optional[str]
+    last_modified: Optional[str]
+    doc_hash: str
+    head_hash: str
+    body_hash: str
+    links_hash: str
+    text_hash: str
+    summary: DocSummary
+
+
+class FieldChange(NamedTuple):
+    field: str
+    old: Any
+    new: Any
+    # For list fields (meta tags, links, words), what was added and removed
+    added: Tuple = ()
+    removed: Tuple = ()
+
+
+class PageChange(NamedTuple):
+    url: str
+    status: str
+    changes: List[FieldChange]
+    # Sections of the page whose markup changed since the previous check ("head" and/or "body"), which made it
+    # analysed again
+    reanalysed_sections: Tuple[str, ...] = ()
+    # What changed since the previous check, according to the fingerprints: the "head" markup, and the "links" and
+    # "text" extracted from the body (a body whose markup changed, but neither of them, is not worth looking at)
+    changed_sections: Tuple[str, ...] = ()
+    error: Optional[str] = None
+
+
+class PageMonitor:
+    # Keeps a fingerprint of each monitored page: the hash of the whole document, of its <head> and <body>
+    # sections (the <head> ends where the analyser says, see `find_head_end()`), and of the extracted links and
+    # text. Each check uses a conditional GET, stops right there if the document didn't change, and otherwise only
+    # analyses it again if the markup of one of its sections did.
+    #
+    # Pages are always analysed whole: the head and body can't be analysed on their own, as a parser may find some
+    # of the title and meta tags after the end of the head, and the body depends on what the head left open.
+
+    def __init__(
+        self,
+        db_path: str,
+        analyser: Optional[DocAnalyser] = None,
+        conditional_fetcher: Callable[..., ConditionalFetch] = fetch_url_if_modified,
+        workers: int = 8,
+    ):
+        self.analyser = analyser if analyser is not None else DocAnalyser(None)
+        self.workers = workers
+        self._conditional_fetcher = conditional_fetcher
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS monitored_pages (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                doc_hash TEXT NOT NULL,
+                head_hash TEXT NOT NULL,
+                body_hash TEXT NOT NULL,
+                links_hash TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                summary TEXT NOT NULL,
+                checked_at REAL NOT NULL,
+                changed_at REAL NOT NULL
+            )
+        """)
+        self._db.commit()
+
+    def check(self, urls: Iterable[str]) -> Iterator[PageChange]:
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            yield from executor.map(self.check_page, urls)
+
+    def check_page(self, url: str) -> PageChange:
+        fingerprint = self.get_fingerprint(url)
+        try:
+            fetch = self._conditional_fetcher(
+                url,
+                etag=fingerprint.etag if fingerprint else None,
+                last_modified=fingerprint.last_modified if fingerprint else None,
+            )
+        except Exception as e:
+            return PageChange(url=url, status=ERROR, changes=[], error=f'{type(e).__name__}: {e}')
+
+        if not fetch.modified:
+            self._touch(url)
+            return PageChange(url=url, status=NOT_MODIFIED, changes=[])
+
+        content = fetch.content if isinstance(fetch.content, bytes) else fetch.content.encode('utf-8')
+        doc_hash = _hash(content)
+        if fingerprint is not None and doc_hash == fingerprint.doc_hash:
+            self._touch(url, fetch.etag, fetch.last_modified)
+            return PageChange(url=url, status=UNCHANGED, changes=[])
+
+        html_doc = UnicodeDammit(content, is_html=True).unicode_markup or ''
+        head_end = find_head_end(html_doc)
+        head_hash, body_hash = _hash(html_doc[:head_end].encode('utf-8')), _hash(html_doc[head_end:].encode('utf-8'))
+        reanalysed_sections = tuple(
+            section
+            for section, old_hash, new_hash in (
+                ('head', fingerprint.head_hash if fingerprint else None, head_hash),
+                ('body', fingerprint.body_hash if fingerprint else None, body_hash),
+            )
+            if old_hash != new_hash
+        )
+        if reanalysed_sections:
+            try:
+                summary = self.analyser.analyse_doc(html_doc)
+            except Exception as e:
+                return PageChange(url=url, status=ERROR, changes=[], error=f'{type(e).__name__}: {e}')
+        else:
+            summary = fingerprint.summary
+        # The size of the document as it was received, not decoded
+        summary = summary._replace(doc_size=len(content))
+        new_fingerprint = PageFingerprint(
+            etag=fetch.etag,
+            last_modified=fetch.last_modified,
+            doc_hash=doc_hash,
+            head_hash=head_hash,
+            body_hash=body_hash,
+            links_hash=_hash(json.dumps(summary.to_dict()['links']).encode('utf-8')),
+            # Analysers may skip the body content (approximate analyses)
+            text_hash=_hash((summary.body_content or '').encode('utf-8')),
+            summary=summary,
+        )
+
+        if fingerprint is None:
+            self._save(url, new_fingerprint, changed=True)
+            return PageChange(url=url, status=NEW, changes=[], reanalysed_sections=reanalysed_sections)
+        changed_sections = tuple(
+            section
+            for section, old_hash, new_hash in (
+                ('head', fingerprint.head_hash, new_fingerprint.head_hash),
+                ('links', fingerprint.links_hash, new_fingerprint.links_hash),
+                ('text', fingerprint.text_hash, new_fingerprint.text_hash),
+            )
+            if old_hash != new_hash
+        )
+        changes = diff_summaries(fingerprint.summary, summary)
+        self._save(url, new_fingerprint, changed=bool(changes))
+        return PageChange(
+            url=url,
+            status=CHANGED if changes else UNCHANGED,
+            changes=changes,
+            reanalysed_sections=reanalysed_sections,
+            changed_sections=changed_sections,
+        )
+
+    def get_fingerprint(self, url: str) -> Optional[PageFingerprint]:
+        with self._lock:
+            row = self._db.execute(
+                'SELECT etag, last_modified, doc_hash, head_hash, body_hash, links_hash, text_hash, summary '
+                'FROM monitored_pages WHERE url = ?', (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        return PageFingerprint(*row[:-1], summary=DocSummary.from_dict(json.loads(row[-1])))
+
+    def close(self) -> None:
+        self._db.close()
+
+    def _save(self, url: str, fingerprint: PageFingerprint, changed: bool) -> None:
+        now = time.time()
+        with self._lock:
+            # `changed_at` is when the summary last changed, not the document
+            row = None if changed else \
+                self._db.execute('SELECT changed_at FROM monitored_pages WHERE url = ?', (url,)).fetchone()
+            self._db.execute(
+                'INSERT OR REPLACE INTO monitored_pages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (
+                    url,
+                    *fingerprint[:-1],
+                    json.dumps(fingerprint.summary.to_dict()),
+                    now,
+                    row[0] if row else now,
+                )
+            )
+            self._db.commit()
+
+    def _touch(self, url: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> None:
+        with self._lock:
+            self._db.execute(
+                'UPDATE monitored_pages SET checked_at = ?, etag = COALESCE(?, etag), '
+                'last_modified = COALESCE(?, last_modified) WHERE url = ?',
+                (time.time(), etag, last_modified, url)
+            )
+            self._db.commit()
+
+
+def diff_summaries(old: DocSummary, new: DocSummary) -> List[FieldChange]:
+    changes = []
+    for field in ('page_title', 'doc_size'):
+        if getattr(old, field) != getattr(new, field):
+            changes.append(FieldChange(field=field, old=getattr(old, field), new=getattr(new, field)))
+
+    for field in ('meta_tags', 'links'):
+        old_items, new_items = getattr(old, field), getattr(new, field)
+        if old_items == new_items:
+            continue
+        if old_items is None or new_items is None:
+            # Skipped on one side only (see `_diff_skipped_field()`)
+            changes.append(_diff_skipped_field(old, new, field, len))
+            continue
+        old_items_set, new_items_set = set(old_items), set(new_items)
+        changes.append(FieldChange(
+            field=field,
+            old=len(old_items),
+            new=len(new_items),
+            added=tuple(item for item in new_items if item not in old_items_set),
+            removed=tuple(item for item in old_items if item not in new_items_set),
+        ))
+
+    if 'body_content' in old.skipped_fields or 'body_content' in new.skipped_fields:
+        # Nothing to compare when both analyses skipped the text (e.g. approximate ones)
+        if 'body_content' not in old.skipped_fields or 'body_content' not in new.skipped_fields:
+            changes.append(_diff_skipped_field(old, new, 'body_content', lambda text: len(text.split())))
+    elif old.body_content != new.body_content:
+        # For the text, we give the old and new word counts and the words which appeared or disappeared
+        old_words, new_words = old.unique_words, new.unique_words
+        changes.append(FieldChange(
+            field='body_content',
+            old=old.word_count,
+            new=new.word_count,
+            added=tuple(sorted(new_words - old_words)),
+            removed=tuple(sorted(old_words - new_words)),
+        ))
+
+    return changes
+
+
+def _diff_skipped_field(old: DocSummary, new: DocSummary, field: str, measure: Callable[[Any], int]) -> FieldChange:
+    # A field which one of the analyses skipped: its size on the side which has it, and `None` on the other
+    old_value, new_value = getattr(old, field), getattr(new, field)
+    return FieldChange(
+        field=field,
+        old=measure(old_value) if old_value is not None else None,
+        new=measure(new_value) if new_value is not None else None,
+    )
+
+
+def _hash(content: bytes) -> str:
+    return hashlib.blake2b(content, digest_size=16).hexdigest()
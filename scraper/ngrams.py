@@ -0,0 +1,41 @@
+from collections import Counter
+from itertools import islice
+from typing import Iterable, Iterator, List, Sequence, Tuple
+from scraper.doc_analyser import DocSummary
+from scraper.sketches import HeavyHitter, SpaceSaving
+
+Ngram = Tuple[str, ...]
+
+
+def iter_ngrams(words: Sequence[str], n: int) -> Iterator[Ngram]:
+    return zip(*(islice(words, offset, None) for offset in range(n)))
+
+
+def count_ngrams(summary: DocSummary, n: int) -> Counter:
+    # Exact counts, for a single page
+    return Counter(iter_ngrams(summary.words, n))
+
+
+def most_common_ngrams(summary: DocSummary, n: int, count: int = 5) -> List[Tuple[Ngram, int]]:
+    return count_ngrams(summary, n).most_common(count)
+
+
+class SiteNgramStats:
+    # Site-wide n-gram counts, in bounded memory: each page is counted exactly, then added to one sketch per n-gram
+    # size. Memory only depends on `error_rate`, never on the number of pages.
+
+    def __init__(self, sizes: Iterable[int] = (1, 2, 3), error_rate: float = 0.0005):
+        self.sketches = {n: SpaceSaving.for_error_rate(error_rate) for n in sizes}
+        self.pages_count = 0
+
+    def add(self, summary: DocSummary) -> None:
+        words = summary.words
+        for n, sketch in self.sketches.items():
+            sketch.update(Counter(iter_ngrams(words, n)))
+        self.pages_count += 1
+
+    def most_common(self, n: int, count: int = 5) -> List[HeavyHitter]:
+        return self.sketches[n].most_common(count)
+
+    def max_error(self, n: int) -> float:
+        return self.sketches[n].max_error
@@ -0,0 +1,392 @@
+import copy
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Deque, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+from scraper.batch import BatchResult
+from scraper.doc_analyser import PARSED, DocAnalyser, DocSummary, FetchResponse, get_response_outcome
+
+_END_OF_STREAM = object()
+_QUEUE_POLL_INTERVAL = 0.1
+# An estimate, not a measure: a body submitted to a process pool is pickled into a buffer, read from the pipe into
+# another one by the worker, and unpickled there into a third one (the pickling overhead, a few bytes, is left out)
+_ESTIMATED_PICKLED_BODY_COPIES = 3
+
+
+class StageStats(NamedTuple):
+    name: str
+    workers: int
+    items: int
+    busy_seconds: float
+    wall_seconds: float
+    # Peak depth of the queue this stage reads from, and its capacity
+    max_input_queue_depth: int
+    input_queue_size: int
+
+    @property
+    def utilization(self) -> float:
+        if self.wall_seconds == 0 or self.workers == 0:
+            return 0.0
+        return self.busy_seconds / (self.wall_seconds * self.workers)
+
+
+class HandoffStats(NamedTuple):
+    # Bodies handed over to the parsing processes, and the bytes copied on their way there: exactly the body size for
+    # bodies written into shared memory, but estimated for pickled ones (see `_ESTIMATED_PICKLED_BODY_COPIES`), whose
+    # copies happen inside the process pool
+    pages: int
+    body_bytes: int
+    estimated_copied_bytes: int
+
+    @property
+    def estimated_copied_bytes_per_page(self) -> float:
+        return self.estimated_copied_bytes / self.pages if self.pages else 0.0
+
+
+class SharedBody(NamedTuple):
+    # What is pickled instead of a body put in shared memory: a few dozen bytes, whatever the body size
+    segment_name: str
+    size: int
+    # The response the body came from, without its content, for bodies fetched as a `FetchResponse`
+    response: Optional[FetchResponse] = None
+
+
+class BodyHandoff:
+    # Submits bodies to a parsing pool. Bodies larger than `share_above` bytes are written once into a shared memory
+    # segment, which the parsing process analyses in place (through a memoryview), instead of being pickled and
+    # copied three times on their way there. Smaller ones are not worth the extra system calls.
+    # `share_above=None` pickles every body, and so are fetch responses which won't be parsed (see
+    # `get_response_outcome()`): they come with their first bytes at most.
+
+    def __init__(self, share_above: Optional[int] = 256 * 1024):
+        self.share_above = share_above
+        self._pages = 0
+        self._body_bytes = 0
+        self._estimated_copied_bytes = 0
+        self._lock = threading.Lock()
+
+    def submit(self, parsing_pool: ProcessPoolExecutor, html_doc: Any) -> Future:
+        # The future's result is a `(summary, parsing duration in seconds)` tuple
+        response = None
+        if isinstance(html_doc, FetchResponse):
+            if get_response_outcome(html_doc) != PARSED:
+                return parsing_pool.submit(_parse_in_worker, html_doc)
+            response, html_doc = html_doc._replace(content=b''), html_doc.content
+
+        size = html_doc.nbytes if isinstance(html_doc, memoryview) else len(html_doc)
+        if self.share_above is None or size <= self.share_above or isinstance(html_doc, str):
+            self._count(size, _ESTIMATED_PICKLED_BODY_COPIES * size)
+            if response is not None:
+                html_doc = response._replace(content=html_doc)
+            return parsing_pool.submit(_parse_in_worker, html_doc)
+
+        segment = SharedMemory(create=True, size=size)
+        try:
+            segment.buf[:size] = html_doc
+            future = parsing_pool.submit(
+                _parse_shared_body_in_worker,
+                SharedBody(segment_name=segment.name, size=size, response=response),
+            )
+        except BaseException:
+            _release_segment(segment)
+            raise
+        # Whether the body was analysed, failed, or was cancelled
+        future.add_done_callback(lambda _: _release_segment(segment))
+        self._count(size, size)
+        return future
+
+    def stats(self) -> HandoffStats:
+        with self._lock:
+            return HandoffStats(
+                pages=self._pages,
+                body_bytes=self._body_bytes,
+                estimated_copied_bytes=self._estimated_copied_bytes,
+            )
+
+    def _count(self, body_bytes: int, estimated_copied_bytes: int) -> None:
+        with self._lock:
+            self._pages += 1
+            self._body_bytes += body_bytes
+            self._estimated_copied_bytes += estimated_copied_bytes
+
+
+class AnalysisPipeline:
+    # fetch (I/O thread pool) --> parse (process pool) --> consumer (the caller, iterating over `run()`)
+    #
+    # Stages are connected by bounded queues: when parsing can't keep up, fetchers block on the full queue
+    # instead of piling fetched bodies up in memory, and the same goes for a slow consumer.
+
+    def __init__(
+        self,
+        analyser: DocAnalyser,
+        fetch_workers: int = 8,
+        parse_workers: Optional[int] = None,
+        fetched_queue_size: int = 16,
+        results_queue_size: int = 64,
+        share_bodies_above: Optional[int] = 256 * 1024,
+    ):
+        self.analyser = analyser
+        self.fetch_workers = fetch_workers
+        # `parse_workers=0` parses in the pipeline's own dispatcher thread, without any child process
+        self.parse_workers = (os.cpu_count() or 1) if parse_workers is None else parse_workers
+        self.fetched_queue_size = fetched_queue_size
+        self.results_queue_size = results_queue_size
+        self.handoff = BodyHandoff(share_bodies_above)
+        self._meters = {}
+
+    def run(self, urls: Iterable[str]) -> Iterator[BatchResult]:
+        stop = threading.Event()
+        urls_queue = queue.Queue(maxsize=2 * self.fetch_workers)
+        fetched_queue = queue.Queue(maxsize=self.fetched_queue_size)
+        results_queue = queue.Queue(maxsize=self.results_queue_size)
+        self._meters = {
+            'fetch': _StageMeter(self.fetch_workers, urls_queue),
+            'parse': _StageMeter(max(self.parse_workers, 1), fetched_queue),
+            'consume': _StageMeter(1, results_queue),
+        }
+        feeder_errors: List[Exception] = []
+
+        threads = [threading.Thread(target=self._feed_urls, args=(urls, urls_queue, stop, feeder_errors))]
+        remaining_fetchers = [self.fetch_workers]
+        remaining_fetchers_lock = threading.Lock()
+        threads.extend(
+            threading.Thread(
+                target=self._fetch_docs,
+                args=(urls_queue, fetched_queue, stop, remaining_fetchers, remaining_fetchers_lock),
+            )
+            for _ in range(self.fetch_workers)
+        )
+        threads.append(threading.Thread(target=self._parse_docs, args=(fetched_queue, results_queue, stop)))
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        consume_meter = self._meters['consume']
+        try:
+            while True:
+                item = _get(results_queue, stop)
+                if item is _END_OF_STREAM:
+                    break
+                started_at = time.perf_counter()
+                yield item
+                consume_meter.add(time.perf_counter() - started_at)
+        finally:
+            stop.set()
+            for meter in self._meters.values():
+                meter.finish()
+            for thread in threads:
+                thread.join()
+
+        if feeder_errors:
+            raise feeder_errors[0]
+
+    def stats(self) -> List[StageStats]:
+        return [meter.stats(name) for name, meter in self._meters.items()]
+
+    def _feed_urls(self, urls: Iterable[str], urls_queue: queue.Queue, stop: threading.Event,
+                   errors: List[Exception]) -> None:
+        try:
+            for url in urls:
+                if not _put(urls_queue, url, stop, self._meters['fetch']):
+                    return
+        except Exception as e:
+            errors.append(e)
+        for _ in range(self.fetch_workers):
+            _put(urls_queue, _END_OF_STREAM, stop)
+
+    def _fetch_docs(self, urls_queue: queue.Queue, fetched_queue: queue.Queue, stop: threading.Event,
+                    remaining_fetchers: List[int], remaining_fetchers_lock: threading.Lock) -> None:
+        meter = self._meters['fetch']
+        while True:
+            url = _get(urls_queue, stop)
+            if url is _END_OF_STREAM or url is None:
+                break
+            started_at = time.perf_counter()
+            try:
+                item = (url, self.analyser.doc_fetcher(url), None)
+            except Exception as e:
+                item = (url, None, e)
+            meter.add(time.perf_counter() - started_at)
+            if not _put(fetched_queue, item, stop, self._meters['parse']):
+                return
+
+        # The last fetcher standing closes the stream
+        with remaining_fetchers_lock:
+            remaining_fetchers[0] -= 1
+            if remaining_fetchers[0] == 0:
+                _put(fetched_queue, _END_OF_STREAM, stop)
+
+    def _parse_docs(self, fetched_queue: queue.Queue, results_queue: queue.Queue, stop: threading.Event) -> None:
+        meter = self._meters['parse']
+        consume_meter = self._meters['consume']
+        if self.parse_workers > 0:
+            executor = create_parsing_pool(self.analyser, self.parse_workers)
+
+            def submit(html_doc: Any) -> Future:
+                return self.handoff.submit(executor, html_doc)
+        else:
+            executor = None
+
+            def submit(html_doc: Any) -> Future:
+                future = Future()
+                try:
+                    future.set_result(_analyse_timed(self.analyser, html_doc))
+                except Exception as e:
+                    future.set_exception(e)
+                return future
+
+        # We keep at most 2 docs per parsing process in flight, the other ones wait in the bounded queue
+        in_flight: Deque[Tuple[str, Future]] = deque()
+        max_in_flight = 2 * max(self.parse_workers, 1)
+
+        def flush_oldest() -> bool:
+            url, future = in_flight.popleft()
+            result, busy_seconds = _get_parse_result(url, future)
+            meter.add(busy_seconds)
+            return _put(results_queue, result, stop, consume_meter)
+
+        try:
+            while True:
+                item = _get(fetched_queue, stop)
+                if item is _END_OF_STREAM or item is None:
+                    break
+                url, html_doc, fetch_error = item
+                if fetch_error is not None:
+                    if not _put(results_queue, BatchResult(url=url, summary=None, error=fetch_error), stop, consume_meter):
+                        return
+                    continue
+
+                try:
+                    future = submit(html_doc)
+                except Exception as e:
+                    # E.g. `BrokenProcessPool` once a parsing process died: the doc is reported as failed, like
+                    # the docs which were in flight in the pool
+                    future = Future()
+                    future.set_exception(e)
+                in_flight.append((url, future))
+                if len(in_flight) >= max_in_flight and not flush_oldest():
+                    return
+
+            while in_flight:
+                if not flush_oldest():
+                    return
+        finally:
+            # The consumer would wait for the end of the stream forever otherwise
+            _put(results_queue, _END_OF_STREAM, stop)
+            if executor is not None:
+                executor.shutdown(wait=True, cancel_futures=True)
+
+
+class _StageMeter:
+
+    def __init__(self, workers: int, input_queue: queue.Queue):
+        self.workers = workers
+        self.input_queue = input_queue
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.max_input_queue_depth = 0
+        self._started_at = time.perf_counter()
+        self._finished_at = None
+        self._lock = threading.Lock()
+
+    def add(self, busy_seconds: float) -> None:
+        with self._lock:
+            self.items += 1
+            self.busy_seconds += busy_seconds
+
+    def sample_queue_depth(self) -> None:
+        depth = self.input_queue.qsize()
+        if depth > self.max_input_queue_depth:
+            self.max_input_queue_depth = depth
+
+    def finish(self) -> None:
+        self._finished_at = time.perf_counter()
+
+    def stats(self, name: str) -> StageStats:
+        with self._lock:
+            return StageStats(
+                name=name,
+                workers=self.workers,
+                items=self.items,
+                busy_seconds=self.busy_seconds,
+                wall_seconds=(self._finished_at or time.perf_counter()) - self._started_at,
+                max_input_queue_depth=self.max_input_queue_depth,
+                input_queue_size=self.input_queue.maxsize,
+            )
+
+
+def create_parsing_pool(analyser: DocAnalyser, workers: int) -> ProcessPoolExecutor:
+    # The doc fetcher is not needed (and often not picklable) in the parsing processes, and neither is the profiler
+    # (parsing processes only use `analyse_doc()`)
+    parsing_analyser = copy.copy(analyser)
+    parsing_analyser.doc_fetcher = None
+    parsing_analyser.profiler = None
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_parse_worker, initargs=(parsing_analyser,))
+
+
+_worker_analyser: Optional[DocAnalyser] = None
+
+
+def _init_parse_worker(analyser: DocAnalyser) -> None:
+    global _worker_analyser
+    _worker_analyser = analyser
+
+
+def _parse_in_worker(html_doc: Any) -> Tuple[DocSummary, float]:
+    return _analyse_timed(_worker_analyser, html_doc)
+
+
+def _parse_shared_body_in_worker(shared_body: SharedBody) -> Tuple[DocSummary, float]:
+    segment = SharedMemory(shared_body.segment_name)
+    try:
+        with segment.buf[:shared_body.size] as html_doc:
+            if shared_body.response is not None:
+                return _analyse_timed(_worker_analyser, shared_body.response._replace(content=html_doc))
+            return _analyse_timed(_worker_analyser, html_doc)
+    finally:
+        segment.close()
+
+
+def _release_segment(segment: SharedMemory) -> None:
+    segment.close()
+    segment.unlink()
+
+
+def _analyse_timed(analyser: DocAnalyser, html_doc: Any) -> Tuple[DocSummary, float]:
+    started_at = time.perf_counter()
+    summary = analyser.analyse_doc(html_doc)
+    return summary, time.perf_counter() - started_at
+
+
+def _get_parse_result(url: str, future: Future) -> Tuple[BatchResult, float]:
+    try:
+        summary, busy_seconds = future.result()
+        return BatchResult(url=url, summary=summary, error=None), busy_seconds
+    except Exception as e:
+        return BatchResult(url=url, summary=None, error=e), 0.0
+
+
+def _put(target_queue: queue.Queue, item: Any, stop: threading.Event, meter: _StageMeter = None) -> bool:
+    # Blocking put (this is where backpressure happens), which gives up if the pipeline is stopped
+    while not stop.is_set():
+        try:
+            target_queue.put(item, timeout=_QUEUE_POLL_INTERVAL)
+        except queue.Full:
+            continue
+        if meter is not None:
+            meter.sample_queue_depth()
+        return True
+    return False
+
+
+def _get(source_queue: queue.Queue, stop: threading.Event) -> Any:
+    while not stop.is_set():
+        try:
+            return source_queue.get(timeout=_QUEUE_POLL_INTERVAL)
+        except queue.Empty:
+            continue
+    return None
@@ -0,0 +1,273 @@
+import cProfile
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, List, NamedTuple, Optional, Tuple, Union
+from bs4 import BeautifulSoup
+
+_ALLOCATION_SITES_COUNT = 30
+
+
+class SharedMemoryTracing:
+    # tracemalloc is process-wide: its users (analyses measuring their peak memory, profile captures) share a single
+    # tracing, which the first one starts (unless it was already on) and the last one stops. The peak is only reset
+    # when nobody else is using it: concurrent users get peaks which may include their neighbours', but which are
+    # never reset, or stopped, under them.
+
+    def __init__(self):
+        self._users = 0
+        self._started = False
+        self._lock = threading.Lock()
+
+    def start(self) -> int:
+        # Returns the traced memory at the start, to give back to `stop()`
+        with self._lock:
+            if self._users == 0:
+                if tracemalloc.is_tracing():
+                    tracemalloc.reset_peak()
+                else:
+                    tracemalloc.start()
+                    self._started = True
+            self._users += 1
+            return tracemalloc.get_traced_memory()[0]
+
+    def stop(self, baseline: int) -> int:
+        # Returns the growth of the peak traced memory since `start()`
+        with self._lock:
+            peak = tracemalloc.get_traced_memory()[1]
+            self._users -= 1
+            if self._users == 0 and self._started:
+                tracemalloc.stop()
+                self._started = False
+            return max(peak - baseline, 0)
+
+
+shared_memory_tracing = SharedMemoryTracing()
+
+
+class ProfileCapture(NamedTuple):
+    url: Optional[str]
+    # Thresholds the page exceeded, e.g. "latency 3.20s > 2.0s"
+    reasons: List[str]
+    seconds: float
+    # Peak memory of the analysis above the memory in use when it started, in bytes (`None` where it can't be
+    # measured)
+    memory_growth: Optional[int]
+    doc_size: int
+    captured_at: float
+    directory: Path
+
+
+class SlowPageProfiler:
+    # Opt-in hook around the analyses of a `DocAnalyser` (see its `profiler`), cheap enough to be left on in
+    # production: each analysis is only timed, and its peak memory measured. That's the peak traced by the analysis
+    # itself when its analyser measures memory (see `DocAnalyser.measure_memory`), and otherwise the peak resident
+    # memory of the process, which is reset to the current one at the start of each analysis (on Linux only: elsewhere,
+    # only the latency threshold applies). Pages above a threshold are analysed a second time under cProfile and tracemalloc, in
+    # a background thread (the slow request isn't made twice as slow), and saved for offline reproduction, in a
+    # directory per capture:
+    #   capture.json      URL, exceeded thresholds, duration and memory
+    #   page.html.gz      the page itself
+    #   profile.pstats    cProfile stats, for `python -m pstats` or any pstats viewer
+    #   allocations.txt   biggest allocation sites of the parse tree, and the peak memory of the whole analysis
+    #
+    # Captures don't pile up: at most one at a time and one per `min_interval` seconds (the other slow pages are
+    # only counted in `skipped_count`), and the oldest captures are deleted beyond `max_captures` or
+    # `max_total_size` bytes. The peak resident memory is the whole process': with concurrent analyses, a page may be
+    # blamed for its neighbours', or have its own peak reset by them. It also misses the memory which the process
+    # already holds, freed by earlier analyses and reused by this one: `measure_memory` is more accurate.
+
+    def __init__(
+        self,
+        directory: Union[str, Path],
+        latency_threshold: Optional[float] = 5.0,
+        memory_threshold: Optional[int] = 256 * 1024 * 1024,
+        max_captures: int = 20,
+        max_total_size: int = 500 * 1024 * 1024,
+        min_interval: float = 60,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.directory = Path(directory)
+        self.latency_threshold = latency_threshold
+        self.memory_threshold = memory_threshold
+        self.max_captures = max_captures
+        self.max_total_size = max_total_size
+        self.min_interval = min_interval
+        self.skipped_count = 0
+        # Of the latest capture which failed
+        self.last_error: Optional[Exception] = None
+        self._clock = clock
+        self._last_capture_at: Optional[float] = None
+        self._capture_thread: Optional[threading.Thread] = None
+        self._capture_lock = threading.Lock()
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def profile(self, url: Optional[str], html_doc: Any, analyse: Callable[[Any], Any]) -> Any:
+        started_at = time.perf_counter()
+        resident_memory_before = _reset_peak_resident_memory()
+        summary = analyse(html_doc)
+        seconds = time.perf_counter() - started_at
+        memory_growth = getattr(summary, 'peak_memory', None)
+        if memory_growth is None and resident_memory_before is not None:
+            peak_resident_memory = _get_peak_resident_memory()
+            if peak_resident_memory is not None:
+                memory_growth = max(peak_resident_memory - resident_memory_before, 0)
+
+        reasons = []
+        if self.latency_threshold is not None and seconds > self.latency_threshold:
+            reasons.append(f'latency {seconds:.2f}s > {self.latency_threshold}s')
+        if self.memory_threshold is not None and memory_growth is not None and memory_growth > self.memory_threshold:
+            reasons.append(f'peak memory growth {memory_growth} bytes > {self.memory_threshold} bytes')
+        if reasons:
+            self._start_capture(url, html_doc, analyse, reasons, seconds, memory_growth)
+        return summary
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        # Waits for the end of the capture in progress, if any: whether it ended
+        with self._capture_lock:
+            capture_thread = self._capture_thread
+        if capture_thread is None:
+            return True
+        capture_thread.join(timeout)
+        return not capture_thread.is_alive()
+
+    def captures(self) -> List[ProfileCapture]:
+        # Oldest first
+        captures = []
+        for capture_directory in self._capture_directories():
+            capture_dict = json.loads((capture_directory / 'capture.json').read_text())
+            captures.append(ProfileCapture(
+                url=capture_dict['url'],
+                reasons=capture_dict['reasons'],
+                seconds=capture_dict['seconds'],
+                memory_growth=capture_dict['memory_growth'],
+                doc_size=capture_dict['doc_size'],
+                captured_at=capture_dict['captured_at'],
+                directory=capture_directory,
+            ))
+        return captures
+
+    def _start_capture(self, url: Optional[str], html_doc: Any, analyse: Callable[[Any], Any], reasons: List[str],
+                       seconds: float, memory_growth: Optional[int]) -> None:
+        now = self._clock()
+        with self._capture_lock:
+            too_soon = self._last_capture_at is not None and now - self._last_capture_at < self.min_interval
+            if too_soon or (self._capture_thread is not None and self._capture_thread.is_alive()):
+                self.skipped_count += 1
+                return
+            self._last_capture_at = now
+            self._capture_thread = threading.Thread(
+                target=self._capture,
+                args=(url, html_doc, analyse, reasons, seconds, memory_growth),
+                name='profile-capture',
+                daemon=True,
+            )
+            self._capture_thread.start()
+
+    def _capture(self, url: Optional[str], html_doc: Any, analyse: Callable[[Any], Any], reasons: List[str],
+                 seconds: float, memory_growth: Optional[int]) -> None:
+        url_hash = hashlib.sha1((url or '').encode('utf-8')).hexdigest()[:8]
+        name = f'{time.time_ns()}-{url_hash}'
+        # Written under a hidden name first: half-written captures are never listed
+        work_directory = self.directory / f'.{name}'
+        try:
+            # Only the body of structured fetch responses (see `doc_analyser.FetchResponse`)
+            html_doc = getattr(html_doc, 'content', html_doc)
+            content = html_doc.encode('utf-8') if isinstance(html_doc, str) else bytes(html_doc)
+            work_directory.mkdir()
+
+            call_profile, traced_peak_memory, allocation_sites = _profile_analysis(content, analyse)
+            call_profile.dump_stats(str(work_directory / 'profile.pstats'))
+            (work_directory / 'allocations.txt').write_text(
+                f'Peak traced memory of the analysis: {traced_peak_memory} bytes\n'
+                f'Biggest allocation sites of the parse tree:\n' + ''.join(f'{site}\n' for site in allocation_sites)
+            )
+            with gzip.open(work_directory / 'page.html.gz', 'wb') as page_file:
+                page_file.write(content)
+            (work_directory / 'capture.json').write_text(json.dumps({
+                'url': url,
+                'reasons': reasons,
+                'seconds': seconds,
+                'memory_growth': memory_growth,
+                'doc_size': len(content),
+                'captured_at': time.time(),
+            }, indent=2))
+            work_directory.rename(self.directory / name)
+            self._delete_old_captures()
+        except Exception as e:
+            # Nobody would hear about it otherwise (e.g. when the disk is full)
+            shutil.rmtree(work_directory, ignore_errors=True)
+            self.last_error = e
+
+    def _capture_directories(self) -> List[Path]:
+        # Names start with the capture time
+        return sorted(path for path in self.directory.iterdir() if path.is_dir() and not path.name.startswith('.'))
+
+    def _delete_old_captures(self) -> None:
+        # Except the latest one, whatever its size
+        capture_directories = self._capture_directories()
+        sizes = [sum(path.stat().st_size for path in directory.iterdir()) for directory in capture_directories]
+        while len(capture_directories) > 1 and (
+            len(capture_directories) > self.max_captures or sum(sizes) > self.max_total_size
+        ):
+            shutil.rmtree(capture_directories.pop(0), ignore_errors=True)
+            sizes.pop(0)
+
+
+def _profile_analysis(
+    content: bytes,
+    analyse: Callable[[Any], Any],
+) -> Tuple[cProfile.Profile, int, List[tracemalloc.StatisticDiff]]:
+    # Concurrent analyses (in other threads) may be traced too: their allocations are mixed with the capture's
+    baseline = shared_memory_tracing.start()
+    try:
+        call_profile = cProfile.Profile()
+        call_profile.enable()
+        try:
+            analyse(content)
+        finally:
+            call_profile.disable()
+        traced_peak_memory = tracemalloc.get_traced_memory()[1] - baseline
+
+        # The analysis frees its parse tree before returning, and that's where most of the memory goes
+        before_parsing = tracemalloc.take_snapshot()
+        soup = BeautifulSoup(content, 'html.parser')
+        allocation_sites = tracemalloc.take_snapshot().compare_to(before_parsing, 'lineno')[:_ALLOCATION_SITES_COUNT]
+        soup.decompose()
+    finally:
+        shared_memory_tracing.stop(baseline)
+    return call_profile, traced_peak_memory, allocation_sites
+
+
+def _reset_peak_resident_memory() -> Optional[int]:
+    # Resets the process' resident memory high-water mark (Linux >= 4.0), which `getrusage()` can't do: returns the
+    # resident memory it was reset to, in bytes, or `None` when it can't be done
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs_file:
+            clear_refs_file.write('5')
+        with open('/proc/self/statm') as statm_file:
+            resident_pages = int(statm_file.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return resident_pages * _PAGE_SIZE
+
+
+def _get_peak_resident_memory() -> Optional[int]:
+    # Since the latest `_reset_peak_resident_memory()`, in bytes
+    try:
+        with open('/proc/self/status') as status_file:
+            for line in status_file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
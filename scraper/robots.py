@@ -0,0 +1,244 @@
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Pattern, Tuple
+from urllib.parse import urlsplit
+import requests
+from scraper.caching import SingleFlight, TtlCache
+
+# Special trie keys (the other keys are single characters)
+_TERMINAL = None
+_WILDCARD_RULES = 0
+# We only read the beginning of huge robots.txt files, like Google does (500 KiB)
+_MAX_ROBOTS_TXT_SIZE = 500 * 1024
+_PRODUCT_TOKEN_PATTERN = re.compile(r'[a-zA-Z_-]+')
+
+
+class DisallowedByRobotsError(Exception):
+    pass
+
+
+class RobotsRules:
+    # Allow/Disallow rules of the robots.txt group which applies to our user agent, compiled for fast lookups:
+    # rules go into a character trie, so that a lookup only walks the URL path once. Rules with wildcards are
+    # compiled into regexes, hung on the trie node of their literal prefix: we only try the ones which can match.
+    # As in RFC 9309, the most specific (longest) matching rule wins, and "Allow" wins ties.
+
+    def __init__(self, rules: List[Tuple[bool, str]], crawl_delay: Optional[float] = None):
+        self.crawl_delay = crawl_delay
+        self._trie: Dict[Any, Any] = {}
+        for allow, path_pattern in rules:
+            is_wildcard = '*' in path_pattern or path_pattern.endswith('$')
+            literal_prefix = re.split(r'[*$]', path_pattern, 1)[0] if is_wildcard else path_pattern
+            node = self._trie
+            for char in literal_prefix:
+                node = node.setdefault(char, {})
+            if is_wildcard:
+                node.setdefault(_WILDCARD_RULES, []).append(
+                    (len(path_pattern), allow, _compile_wildcard_pattern(path_pattern))
+                )
+            else:
+                # Allow wins over Disallow for the very same path
+                node[_TERMINAL] = node.get(_TERMINAL, False) or allow
+
+    @classmethod
+    def allow_all(cls) -> 'RobotsRules':
+        return cls([])
+
+    @classmethod
+    def disallow_all(cls) -> 'RobotsRules':
+        return cls([(False, '/')])
+
+    def is_allowed(self, path: str) -> bool:
+        best_length, best_allow = -1, True
+        candidate_wildcard_rules = []
+        node = self._trie
+        depth = 0
+        while node is not None:
+            if _TERMINAL in node:
+                best_length, best_allow = depth, node[_TERMINAL]
+            if _WILDCARD_RULES in node:
+                candidate_wildcard_rules.extend(node[_WILDCARD_RULES])
+            if depth == len(path):
+                break
+            node = node.get(path[depth])
+            depth += 1
+
+        for length, allow, pattern in candidate_wildcard_rules:
+            if length >= best_length and (length > best_length or allow) and pattern.match(path):
+                best_length, best_allow = length, allow
+
+        return best_allow
+
+
+class _Group:
+
+    def __init__(self):
+        self.user_agents: List[str] = []
+        self.rules: List[Tuple[bool, str]] = []
+        self.crawl_delay: Optional[float] = None
+
+
+def parse_robots_txt(content: str, user_agent: str) -> RobotsRules:
+    groups: List[_Group] = []
+    current_group: Optional[_Group] = None
+    for line in content.splitlines():
+        line = line.split('#', 1)[0].strip()
+        field, separator, value = line.partition(':')
+        if not separator:
+            continue
+        field, value = field.strip().lower(), value.strip()
+
+        if field == 'user-agent':
+            # Consecutive "User-agent" lines share the same group
+            if current_group is None or current_group.rules or current_group.crawl_delay is not None:
+                current_group = _Group()
+                groups.append(current_group)
+            # An empty user agent is no user agent (and not a substring of every one): its group applies to nobody
+            if value:
+                current_group.user_agents.append(value.lower())
+        elif current_group is None:
+            continue
+        elif field in ('allow', 'disallow'):
+            # An empty "Disallow:" means that everything is allowed
+            if value:
+                current_group.rules.append((field == 'allow', value))
+        elif field == 'crawl-delay':
+            try:
+                current_group.crawl_delay = float(value)
+            except ValueError:
+                pass
+
+    # The groups of our product token apply (as in RFC 9309, "bot" is not "PlumBot"), "*" is the fallback
+    agent_token = _get_product_token(user_agent)
+    matching_agents = {
+        ua
+        for group in groups
+        for ua in group.user_agents
+        if ua != '*' and agent_token and _get_product_token(ua) == agent_token
+    }
+    matching_groups = [group for group in groups if matching_agents.intersection(group.user_agents)] or \
+        [group for group in groups if '*' in group.user_agents]
+
+    rules = [rule for group in matching_groups for rule in group.rules]
+    crawl_delays = [group.crawl_delay for group in matching_groups if group.crawl_delay is not None]
+    return RobotsRules(rules, crawl_delay=max(crawl_delays) if crawl_delays else None)
+
+
+def fetch_robots_txt(robots_url: str, user_agent: str) -> Tuple[Optional[str], int]:
+    # Returns the robots.txt content (`None` if there is none), and its HTTP status code
+    with requests.get(robots_url, headers={'User-Agent': user_agent}, stream=True, timeout=10) as response:
+        if response.status_code >= 400:
+            return None, response.status_code
+        content = response.raw.read(_MAX_ROBOTS_TXT_SIZE, decode_content=True)
+        # robots.txt files are UTF-8 (RFC 9309), whatever the charset which requests guesses ("text/plain" without
+        # any is ISO-8859-1 to requests)
+        return content.decode('utf-8', errors='replace'), response.status_code
+
+
+class RobotsCache:
+    # Each host's robots.txt is fetched once (concurrent lookups for a host share the same fetch), compiled,
+    # and kept for `ttl` seconds; at most `max_size` hosts are kept in memory.
+
+    def __init__(
+        self,
+        user_agent: str = 'python-requests',
+        ttl: float = 24 * 3600,
+        unavailable_ttl: float = 300,
+        max_size: int = 10_000,
+        robots_fetcher: Callable[[str, str], Tuple[Optional[str], int]] = fetch_robots_txt,
+    ):
+        self.user_agent = user_agent
+        # When robots.txt can't be fetched (server errors, network errors), we assume that the whole site is
+        # disallowed, but only for `unavailable_ttl` seconds.
+        self.unavailable_ttl = unavailable_ttl
+        self.fetches_count = 0
+        self._robots_fetcher = robots_fetcher
+        self._cache: TtlCache[str, RobotsRules] = TtlCache(ttl=ttl, max_size=max_size)
+        self._single_flight: SingleFlight[str, RobotsRules] = SingleFlight()
+
+    def is_allowed(self, url: str) -> bool:
+        split_url = urlsplit(url)
+        path = split_url.path or '/'
+        if split_url.query:
+            path = f'{path}?{split_url.query}'
+        return self.rules_for(url).is_allowed(path)
+
+    def crawl_delay(self, url: str) -> Optional[float]:
+        return self.rules_for(url).crawl_delay
+
+    def rules_for(self, url: str) -> RobotsRules:
+        split_url = urlsplit(url)
+        origin = f'{split_url.scheme}://{split_url.netloc}'.lower()
+        rules = self._cache.get(origin)
+        if rules is None:
+            rules = self._single_flight.do(origin, lambda: self._fetch_rules(origin))
+        return rules
+
+    @property
+    def hit_rate(self) -> float:
+        return self._cache.hit_rate
+
+    def _fetch_rules(self, origin: str) -> RobotsRules:
+        self.fetches_count += 1
+        try:
+            content, status_code = self._robots_fetcher(f'{origin}/robots.txt', self.user_agent)
+        except requests.RequestException:
+            content, status_code = None, 599
+
+        ttl = None
+        if status_code >= 500:
+            rules, ttl = RobotsRules.disallow_all(), self.unavailable_ttl
+        elif content is None:
+            # No robots.txt (4xx): everything is allowed
+            rules = RobotsRules.allow_all()
+        else:
+            rules = parse_robots_txt(content, self.user_agent)
+        self._cache.set(origin, rules, ttl=ttl)
+        return rules
+
+
+def create_robots_aware_fetcher(
+    doc_fetcher: Callable[[str], Any],
+    robots_cache: RobotsCache,
+    respect_crawl_delay: bool = True,
+    max_hosts: int = 10_000,
+) -> Callable[[str], Any]:
+    # A `doc_fetcher` wrapper which refuses URLs disallowed by robots.txt and, for hosts which ask for a
+    # "Crawl-delay", spaces out consecutive fetches (concurrent fetchers wait for their turn). The next fetch times
+    # of the hosts are forgotten once they have passed, and at most `max_hosts` are kept (the least recently fetched
+    # ones are forgotten first).
+    next_fetch_times: TtlCache[str, float] = TtlCache(ttl=0, max_size=max_hosts)
+    lock = threading.Lock()
+
+    def robots_aware_fetcher(url: str) -> Any:
+        if not robots_cache.is_allowed(url):
+            raise DisallowedByRobotsError(f'{url} is disallowed by robots.txt')
+
+        crawl_delay = robots_cache.crawl_delay(url) if respect_crawl_delay else None
+        if crawl_delay:
+            host = urlsplit(url).netloc.lower()
+            with lock:
+                now = time.monotonic()
+                fetch_time = max(now, next_fetch_times.get(host, now))
+                next_fetch_times.set(host, fetch_time + crawl_delay, ttl=fetch_time + crawl_delay - now)
+            if fetch_time > now:
+                time.sleep(fetch_time - now)
+
+        return doc_fetcher(url)
+
+    return robots_aware_fetcher
+
+
+def _get_product_token(user_agent: str) -> str:
+    # "PlumBot/1.0 (+http://plum.com/bot)" -> "plumbot": robots.txt groups are matched case-insensitively on it
+    match = _PRODUCT_TOKEN_PATTERN.match(user_agent.strip())
+    return match.group().lower() if match else ''
+
+
+def _compile_wildcard_pattern(path_pattern: str) -> Pattern:
+    anchored = path_pattern.endswith('$')
+    if anchored:
+        path_pattern = path_pattern[:-1]
+    regex = '.*'.join(re.escape(part) for part in path_pattern.split('*'))
+    return re.compile(regex + ('$' if anchored else ''))
@@ -0,0 +1,225 @@
+import math
+import random
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, NamedTuple, Optional, Sequence
+from scraper.synthetic_docs import generate_html_doc
+
+# What the servers did with each request
+SERVED = 'served'
+REDIRECTED = 'redirected'
+SERVER_ERROR = 'server_error'
+RESET = 'reset'
+STALLED = 'stalled'
+NOT_FOUND = 'not_found'
+
+_BANDWIDTH_TICK = 0.05
+
+
+class HostProfile(NamedTuple):
+    # Median time before responding, in seconds, and the spread of its log-normal distribution (0: constant)
+    latency: float = 0.02
+    latency_sigma: float = 0.5
+    # Bytes per second, for each response (`None`: as fast as the loopback goes)
+    bandwidth: Optional[int] = None
+    # Share of the requests answered with a 503
+    error_rate: float = 0
+    # Share of the requests whose connection is closed without any response
+    reset_rate: float = 0
+    # Share of the responses which stop for `stall_duration` seconds in the middle of their body
+    stall_rate: float = 0
+    stall_duration: float = 10
+    # Share of the pages only reached through a chain of 1 to `max_redirects` redirects
+    redirect_rate: float = 0
+    max_redirects: int = 3
+
+
+def mixed_profiles(hosts_count: int, seed: int = 0) -> List[HostProfile]:
+    # A web-like mix: mostly fast hosts, some slow ones with little bandwidth, some flaky ones, a few which stall,
+    # and redirects everywhere
+    rng = random.Random(seed)
+    profiles = []
+    for _ in range(hosts_count):
+        kind = rng.choices(('fast', 'slow', 'flaky', 'stalling'), weights=(60, 20, 12, 8))[0]
+        redirect_rate = rng.choice((0, 0, 0.1, 0.5))
+        if kind == 'fast':
+            profiles.append(HostProfile(latency=rng.uniform(0.005, 0.05), redirect_rate=redirect_rate))
+        elif kind == 'slow':
+            profiles.append(HostProfile(latency=rng.uniform(0.2, 0.8), latency_sigma=1,
+                                        bandwidth=rng.choice((50_000, 200_000)), redirect_rate=redirect_rate))
+        elif kind == 'flaky':
+            profiles.append(HostProfile(latency=rng.uniform(0.01, 0.2), error_rate=rng.uniform(0.05, 0.3),
+                                        reset_rate=rng.uniform(0, 0.1), redirect_rate=redirect_rate))
+        else:
+            profiles.append(HostProfile(latency=rng.uniform(0.01, 0.1), stall_rate=rng.uniform(0.05, 0.3),
+                                        stall_duration=rng.choice((2, 10, 30)), redirect_rate=redirect_rate))
+    return profiles
+
+
+class ServerFarm:
+    # Local stand-in for the web, for load tests: one HTTP/1.1 server per virtual host (each on its own loopback
+    # port, so that clients see them as different origins), serving generated pages at "/pages/<index>" with the
+    # latency, bandwidth and failures of its `HostProfile`.
+    #
+    # Everything is decided from `seed`, the host, the path and how many times it was requested before: the same
+    # requests get the same responses from one run to the other, whatever the order they arrive in.
+
+    def __init__(
+        self,
+        profiles: Sequence[HostProfile],
+        pages_per_host: int = 100,
+        page_size: int = 20_000,
+        seed: int = 0,
+        host_name: str = '127.0.0.1',
+    ):
+        self.profiles = list(profiles)
+        self.pages_per_host = pages_per_host
+        self.page_size = page_size
+        self.seed = seed
+        # In the URLs: e.g. "localhost" to have the clients resolve it, the servers only listen on 127.0.0.1
+        self.host_name = host_name
+        self.hosts: List[str] = []
+        self.connections_count = 0
+        self._outcomes: Counter = Counter()
+        self._requests_counts: Counter = Counter()
+        self._pages: Dict[tuple, bytes] = {}
+        self._servers: List[ThreadingHTTPServer] = []
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> 'ServerFarm':
+        for host_index, profile in enumerate(self.profiles):
+            server = ThreadingHTTPServer(('127.0.0.1', 0), self._create_handler(host_index, profile))
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            self._servers.append(server)
+            self.hosts.append(f'http://{self.host_name}:{server.server_address[1]}')
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        # Each shutdown waits for its server's polling loop: all at once
+        stopping_threads = [threading.Thread(target=server.shutdown) for server in self._servers]
+        for thread in stopping_threads:
+            thread.start()
+        for thread in stopping_threads:
+            thread.join()
+        for server in self._servers:
+            server.server_close()
+
+    def urls(self) -> List[str]:
+        # Every page of every host, with the hosts interleaved (like a crawl frontier), in a seeded order
+        urls = [f'{host}/pages/{page_index}' for page_index in range(self.pages_per_host) for host in self.hosts]
+        random.Random(self.seed).shuffle(urls)
+        return urls
+
+    def outcomes(self) -> Counter:
+        with self._lock:
+            return Counter(self._outcomes)
+
+    def _create_handler(self, host_index: int, profile: HostProfile) -> type:
+        farm = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive connections, as real servers
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                with farm._lock:
+                    farm.connections_count += 1
+
+            def do_GET(self):
+                try:
+                    farm._respond(self, host_index, profile)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client gave up, e.g. on a timeout
+                    self.close_connection = True
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def _respond(self, handler: BaseHTTPRequestHandler, host_index: int, profile: HostProfile) -> None:
+        path = handler.path
+        with self._lock:
+            nth_request = self._requests_counts[host_index, path]
+            self._requests_counts[host_index, path] += 1
+        rng = random.Random(f'{self.seed}/{host_index}/{path}/{nth_request}')
+        time.sleep(profile.latency * math.exp(rng.gauss(0, profile.latency_sigma)))
+
+        # "/pages/<index>", or "/redirects/<remaining redirects>/pages/<index>"
+        parts = path.strip('/').split('/')
+        is_redirected = len(parts) == 4 and parts[0] == 'redirects' and parts[1].isdigit()
+        remaining_redirects = int(parts[1]) if is_redirected else None
+        page_index = parts[-1] if len(parts) >= 2 and parts[-2] == 'pages' else ''
+        if not page_index.isdigit() or int(page_index) >= self.pages_per_host:
+            self._count(NOT_FOUND)
+            return _send(handler, 404, b'Not found')
+
+        if rng.random() < profile.reset_rate:
+            self._count(RESET)
+            handler.close_connection = True
+            return
+        if rng.random() < profile.error_rate:
+            self._count(SERVER_ERROR)
+            return _send(handler, 503, b'Service unavailable')
+        page_rng = _page_random(self.seed, host_index, page_index)
+        if remaining_redirects is None and page_rng.random() < profile.redirect_rate:
+            remaining_redirects = page_rng.randint(1, profile.max_redirects)
+        if remaining_redirects:
+            self._count(REDIRECTED)
+            location = f'/redirects/{remaining_redirects - 1}/pages/{page_index}'
+            return _send(handler, 302, b'', headers={'Location': location})
+
+        body = self._get_page(host_index, int(page_index))
+        stall_at = rng.randrange(len(body)) if rng.random() < profile.stall_rate else None
+        self._count(SERVED if stall_at is None else STALLED)
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'text/html; charset=utf-8')
+        handler.send_header('Content-Length', str(len(body)))
+        handler.end_headers()
+        chunk_size = max(1024, int(profile.bandwidth * _BANDWIDTH_TICK)) if profile.bandwidth else len(body)
+        position = 0
+        while position < len(body):
+            chunk_end = min(position + chunk_size, len(body))
+            if stall_at is not None and position <= stall_at < chunk_end:
+                handler.wfile.write(body[position:stall_at])
+                handler.wfile.flush()
+                time.sleep(profile.stall_duration)
+                position = stall_at
+                stall_at = None
+                continue
+            handler.wfile.write(body[position:chunk_end])
+            position = chunk_end
+            if profile.bandwidth:
+                handler.wfile.flush()
+                time.sleep(_BANDWIDTH_TICK)
+
+    def _get_page(self, host_index: int, page_index: int) -> bytes:
+        key = (host_index, page_index)
+        if key not in self._pages:
+            page_seed = zlib.crc32(f'{self.seed}/{host_index}/{page_index}'.encode('utf-8'))
+            self._pages[key] = generate_html_doc(page_seed, target_size=self.page_size)
+        return self._pages[key]
+
+    def _count(self, outcome: str) -> None:
+        with self._lock:
+            self._outcomes[outcome] += 1
+
+
+def _page_random(seed: int, host_index: int, page_index: str) -> random.Random:
+    # Whether a page is behind redirects, and how many, doesn't change from one request to the other
+    return random.Random(f'{seed}/{host_index}/{page_index}/redirects')
+
+
+def _send(handler: BaseHTTPRequestHandler, status: int, body: bytes, headers: Optional[Dict[str, str]] = None) -> None:
+    handler.send_response(status)
+    for name, value in (headers or {}).items():
+        handler.send_header(name, value)
+    handler.send_header('Content-Type', 'text/plain')
+    handler.send_header('Content-Length', str(len(body)))
+    handler.end_headers()
+    handler.wfile.write(body)
@@ -0,0 +1,208 @@
+import json
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Deque, Dict, Optional
+from urllib.parse import parse_qs, urlparse
+import requests
+from scraper.caching import SingleFlight, TtlCache
+from scraper.dns_cache import DnsCache
+from scraper.doc_analyser import DocAnalyser, DocSummary, DocTooLargeError, UnsupportedContentError
+from scraper.pipeline import BodyHandoff, create_parsing_pool
+
+_LATENCY_WINDOW_SIZE = 1000
+
+
+class AnalysisService:
+
+    def __init__(
+        self,
+        analyser: DocAnalyser,
+        workers: int = 8,
+        parse_processes: int = 0,
+        cache_ttl: float = 60,
+        cache_size: int = 1000,
+        share_bodies_above: Optional[int] = 256 * 1024,
+        dns_cache: Optional[DnsCache] = None,
+    ):
+        self.analyser = analyser
+        # The one of the analyser's fetcher, if any: only for its metrics
+        self.dns_cache = dns_cache
+        # At most `workers` pages are fetched and parsed at the same time, other requests wait in line
+        self.workers = workers
+        self.cache: TtlCache[str, bytes] = TtlCache(ttl=cache_ttl, max_size=cache_size)
+        self.single_flight: SingleFlight[str, bytes] = SingleFlight()
+        # With `parse_processes=0` parsing happens in the request threads, which is fine for small loads
+        self.parse_processes = parse_processes
+        self._parsing_pool = create_parsing_pool(analyser, parse_processes) if parse_processes > 0 else None
+        self._parsing_pool_lock = threading.Lock()
+        self._handoff = BodyHandoff(share_bodies_above)
+        self._slots = threading.BoundedSemaphore(workers)
+        self._lock = threading.Lock()
+        self._latencies: Deque[float] = deque(maxlen=_LATENCY_WINDOW_SIZE)
+        self._requests_count = 0
+        self._errors_count = 0
+        self._waiting_count = 0
+        self._running_count = 0
+
+    def analyse(self, url: str, include_body: bool = False) -> bytes:
+        # Returns the JSON-encoded analysis: this is also what we cache, so that cache hits cost nothing
+        started_at = time.perf_counter()
+        failed = False
+        try:
+            cache_key = f'{url}#body' if include_body else url
+            response = self.cache.get(cache_key)
+            if response is None:
+                response = self.single_flight.do(cache_key, lambda: self._analyse_uncached(url, include_body, cache_key))
+            return response
+        except Exception:
+            failed = True
+            raise
+        finally:
+            with self._lock:
+                self._requests_count += 1
+                self._errors_count += failed
+                self._latencies.append(time.perf_counter() - started_at)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            return {
+                'requests': self._requests_count,
+                'errors': self._errors_count,
+                'latency_ms': {
+                    f'p{percentile}': round(_percentile(latencies, percentile) * 1000, 2)
+                    for percentile in (50, 90, 95, 99, 100)
+                },
+                'queue_depth': self._waiting_count,
+                'in_progress': self._running_count,
+                'workers': self.workers,
+                'coalesced_requests': self.single_flight.coalesced,
+                'cache': {'size': len(self.cache), 'hit_rate': round(self.cache.hit_rate, 4)},
+                'estimated_copied_bytes_per_page': round(self._handoff.stats().estimated_copied_bytes_per_page),
+                'dns': self.dns_cache.stats().to_dict() if self.dns_cache is not None else None,
+            }
+
+    def shutdown(self) -> None:
+        with self._parsing_pool_lock:
+            if self._parsing_pool is not None:
+                self._parsing_pool.shutdown()
+        if self.dns_cache is not None:
+            self.dns_cache.shutdown()
+
+    def _analyse_uncached(self, url: str, include_body: bool, cache_key: str) -> bytes:
+        with self._lock:
+            self._waiting_count += 1
+        with self._slots:
+            with self._lock:
+                self._waiting_count -= 1
+                self._running_count += 1
+            try:
+                if self._parsing_pool is not None:
+                    summary = self._parse(self.analyser.doc_fetcher(url))
+                else:
+                    summary = self.analyser.analyse(url)
+            finally:
+                with self._lock:
+                    self._running_count -= 1
+        response = json.dumps(summary_to_response(url, summary, include_body)).encode('utf-8')
+        self.cache.set(cache_key, response)
+        return response
+
+    def _parse(self, html_doc: Any) -> DocSummary:
+        parsing_pool = self._parsing_pool
+        try:
+            summary, _ = self._handoff.submit(parsing_pool, html_doc).result()
+        except BrokenProcessPool:
+            # A single dead worker (OOM killer, crashing parser...) breaks the whole pool, and every later request with
+            # it: the pool is replaced, and the page parsed again once (it may well be the one killing the workers)
+            summary, _ = self._handoff.submit(self._replace_parsing_pool(parsing_pool), html_doc).result()
+        return summary
+
+    def _replace_parsing_pool(self, broken_pool: ProcessPoolExecutor) -> ProcessPoolExecutor:
+        with self._parsing_pool_lock:
+            # The requests which were parsing along with this one find the same broken pool: only one replaces it
+            if self._parsing_pool is broken_pool:
+                broken_pool.shutdown(wait=False)
+                self._parsing_pool = create_parsing_pool(self.analyser, self.parse_processes)
+            return self._parsing_pool
+
+
+def summary_to_response(url: str, summary: DocSummary, include_body: bool = False) -> Dict[str, Any]:
+    response = summary.to_dict()
+    if not include_body:
+        del response['body_content']
+    response['url'] = url
+    if 'doc_size' not in summary.skipped_fields:
+        response['doc_size_human_friendly'] = summary.doc_size_human_friendly
+    # Approximate analyses only have estimates of the words stats, in `word_stats`
+    if 'body_content' not in summary.skipped_fields:
+        response.update({
+            'word_count': summary.word_count,
+            'unique_word_count': summary.unique_word_count,
+            'most_common_5_words': summary.most_common_5_words,
+            'missing_meta_keywords': summary.missing_meta_keywords,
+        })
+    return response
+
+
+def create_server(service: AnalysisService, host: str = '127.0.0.1', port: int = 8080) -> ThreadingHTTPServer:
+    # GET /analyse?url=...[&body=1]  -> JSON analysis of the page
+    # GET /metrics                   -> latency percentiles, queue depth, cache, coalescing, body copies and DNS stats
+    # GET /health
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            request_url = urlparse(self.path)
+            if request_url.path == '/health':
+                self._send_json(200, b'{"status": "ok"}')
+            elif request_url.path == '/metrics':
+                self._send_json(200, json.dumps(service.metrics()).encode('utf-8'))
+            elif request_url.path == '/analyse':
+                self._analyse(parse_qs(request_url.query))
+            else:
+                self._send_error(404, 'Not found')
+
+        def _analyse(self, query: Dict[str, list]) -> None:
+            target_url: Optional[str] = query.get('url', [None])[0]
+            if target_url is None or not re.match(r'^https?://', target_url):
+                self._send_error(400, 'The "url" parameter is missing or is not a valid URL (should start with "http(s)://")')
+                return
+            include_body = query.get('body', ['0'])[0] in ('1', 'true')
+            try:
+                self._send_json(200, service.analyse(target_url, include_body))
+            except (DocTooLargeError, UnsupportedContentError) as e:
+                self._send_error(422, str(e))
+            except requests.RequestException as e:
+                self._send_error(502, f'Could not fetch {target_url}: {e}')
+            except Exception as e:
+                self._send_error(500, f'{type(e).__name__}: {e}')
+
+        def _send_error(self, status: int, message: str) -> None:
+            self._send_json(status, json.dumps({'error': message}).encode('utf-8'))
+
+        def _send_json(self, status: int, body: bytes) -> None:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    return server
+
+
+def _percentile(sorted_values: list, percentile: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(percentile / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
@@ -0,0 +1,121 @@
+import gzip
+import io
+import re
+from datetime import datetime, timezone
+from typing import BinaryIO, Callable, Iterator, NamedTuple, Optional, Set, Tuple
+from xml.etree import ElementTree
+import requests
+from scraper.local_docs import path_from_url
+
+_GZIP_MAGIC = b'\x1f\x8b'
+# W3C Datetime, as used by sitemaps: "2017-11-05", "2017-11-05T19:20+01:00", "2017-11-05T19:20:30.45Z"...
+_W3C_DATETIME_PATTERN = re.compile(
+    r'^(\d{4})-(\d{2})-(\d{2})(?:T(\d{2}):(\d{2})(?::(\d{2})(?:\.\d+)?)?(Z|[+-]\d{2}:?\d{2})?)?$'
+)
+
+
+class SitemapEntry(NamedTuple):
+    loc: str
+    lastmod: Optional[datetime]
+
+
+def open_sitemap_stream(location: str, timeout: Optional[float] = None) -> BinaryIO:
+    # `timeout` bounds the connection, and every wait for data while the sitemap is parsed (not the whole download),
+    # in seconds
+    if re.match(r'^https?://', location):
+        response = requests.get(location, stream=True, timeout=timeout)
+        response.raise_for_status()
+        # Let urllib3 handle any "Content-Encoding: gzip", gzipped sitemap *files* are handled below
+        response.raw.decode_content = True
+        return response.raw
+    return open(path_from_url(location), 'rb')
+
+
+def iter_sitemap_urls(
+    location: str,
+    modified_since: Optional[datetime] = None,
+    opener: Callable[[str], BinaryIO] = open_sitemap_stream,
+) -> Iterator[str]:
+    for entry in iter_sitemap_entries(location, modified_since, opener):
+        yield entry.loc
+
+
+def iter_sitemap_entries(
+    location: str,
+    modified_since: Optional[datetime] = None,
+    opener: Callable[[str], BinaryIO] = open_sitemap_stream,
+) -> Iterator[SitemapEntry]:
+    # Entries without a <lastmod> (or with an invalid one) are always kept, since we can't tell whether they changed
+    # or not.
+    if modified_since is not None and modified_since.tzinfo is None:
+        modified_since = modified_since.replace(tzinfo=timezone.utc)
+    return _iter_sitemap_entries(location, modified_since, opener, {location})
+
+
+def parse_w3c_datetime(value: str) -> Optional[datetime]:
+    match = _W3C_DATETIME_PATTERN.match(value.strip())
+    if match is None:
+        return None
+    year, month, day, hour, minute, second, tz = match.groups()
+    try:
+        parsed = datetime(int(year), int(month), int(day), int(hour or 0), int(minute or 0), int(second or 0))
+        if tz is None or tz == 'Z':
+            return parsed.replace(tzinfo=timezone.utc)
+        return datetime.strptime(f'{parsed.isoformat()}{tz.replace(":", "")}', '%Y-%m-%dT%H:%M:%S%z')
+    except ValueError:
+        # Well-formed, but not a date: "2017-13-45", "2017-11-05T25:00"...
+        return None
+
+
+def _iter_sitemap_entries(
+    location: str,
+    modified_since: Optional[datetime],
+    opener: Callable[[str], BinaryIO],
+    visited_sitemaps: Set[str],
+) -> Iterator[SitemapEntry]:
+    for tag_name, entry in _iter_sitemap_elements(location, opener):
+        if modified_since is not None and entry.lastmod is not None and entry.lastmod < modified_since:
+            # For a sitemap index this skips the whole child sitemap, since none of its pages changed either
+            continue
+        if tag_name == 'sitemap':
+            # Sitemap indexes listing themselves, one another or the same sitemap twice are read only once
+            if entry.loc not in visited_sitemaps:
+                visited_sitemaps.add(entry.loc)
+                yield from _iter_sitemap_entries(entry.loc, modified_since, opener, visited_sitemaps)
+        else:
+            yield entry
+
+
+def _iter_sitemap_elements(location: str, opener: Callable[[str], BinaryIO]) -> Iterator[Tuple[str, SitemapEntry]]:
+    with opener(location) as raw_stream:
+        stream = raw_stream if hasattr(raw_stream, 'peek') else io.BufferedReader(raw_stream)
+        # Gzipped sitemaps are detected from their content, whatever their file extension
+        if stream.peek(2)[:2] == _GZIP_MAGIC:
+            stream = gzip.GzipFile(fileobj=stream)
+
+        # `iterparse()` reads the stream chunk by chunk, and we drop each <url>/<sitemap> element once we
+        # have read it: memory usage doesn't depend on the number of entries.
+        root = None
+        for event, element in ElementTree.iterparse(stream, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = element
+                continue
+            tag_name = _local_name(element.tag)
+            if tag_name not in ('url', 'sitemap'):
+                continue
+            loc, lastmod = None, None
+            for child in element:
+                child_name = _local_name(child.tag)
+                if child_name == 'loc' and child.text:
+                    loc = child.text.strip()
+                elif child_name == 'lastmod' and child.text:
+                    lastmod = parse_w3c_datetime(child.text)
+            root.clear()
+            if loc:
+                yield tag_name, SitemapEntry(loc=loc, lastmod=lastmod)
+
+
+def _local_name(tag: str) -> str:
+    # Strips the XML namespace: "{http://www.sitemaps.org/schemas/sitemap/0.9}url" -> "url"
+    return tag.rsplit('}', 1)[-1]
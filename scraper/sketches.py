@@ -0,0 +1,305 @@
+import base64
+import hashlib
+import heapq
+import math
+from typing import Any, Dict, Hashable, Iterable, List, MutableSequence, NamedTuple, Optional, Tuple
+
+
+class HeavyHitter(NamedTuple):
+    item: Hashable
+    # Estimated count, which is never lower than the true count...
+    count: int
+    # ...and overestimates it by at most `error`
+    error: int
+
+    @property
+    def guaranteed_count(self) -> int:
+        return self.count - self.error
+
+
+class SpaceSaving:
+    # "Space-Saving" heavy hitters sketch (Metwally, Agrawal & El Abbadi, 2005): at most `capacity` items are
+    # tracked, and when a new item comes in while the sketch is full it replaces the item with the lowest count,
+    # inheriting that count as its possible error. Every estimated count overestimates the true one by at most
+    # `total / capacity`, and every item whose true count is above that is guaranteed to be tracked.
+    #
+    # The lowest count is found with a min-heap holding one entry per tracked item, whose counts are only
+    # updated lazily, when an outdated entry reaches the top of the heap.
+
+    def __init__(self, capacity: int):
+        if capacity < 1:
+            raise ValueError('The sketch capacity must be at least 1')
+        self.capacity = capacity
+        self.total = 0
+        self._counts: Dict[Hashable, int] = {}
+        self._errors: Dict[Hashable, int] = {}
+        self._heap: List[Tuple[int, Hashable]] = []
+
+    @classmethod
+    def for_error_rate(cls, error_rate: float) -> 'SpaceSaving':
+        # `error_rate` is the maximum overestimation of a count, as a fraction of the total count
+        if not 0 < error_rate <= 1:
+            raise ValueError('The error rate must be in ]0, 1]')
+        return cls(math.ceil(1 / error_rate))
+
+    @property
+    def max_error(self) -> float:
+        return self.total / self.capacity
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def add(self, item: Hashable, count: int = 1) -> None:
+        self.total += count
+        counts = self._counts
+        if item in counts:
+            # Its heap entry is now outdated: it will be fixed when it reaches the top of the heap
+            counts[item] += count
+            return
+        if len(counts) < self.capacity:
+            counts[item] = count
+            self._errors[item] = 0
+        else:
+            evicted_item, evicted_count = self._pop_min()
+            del counts[evicted_item], self._errors[evicted_item]
+            counts[item] = evicted_count + count
+            self._errors[item] = evicted_count
+        heapq.heappush(self._heap, (counts[item], item))
+
+    def update(self, counts: Dict[Hashable, int]) -> None:
+        # Weighted updates keep the same error bound, and are much cheaper when a page is counted exactly first
+        for item, count in counts.items():
+            self.add(item, count)
+
+    def most_common(self, count: int = 5) -> List[HeavyHitter]:
+        top_items = heapq.nlargest(count, self._counts.items(), key=lambda item_count: item_count[1])
+        return [HeavyHitter(item=item, count=item_count, error=self._errors[item]) for item, item_count in top_items]
+
+    def merge(self, other: 'SpaceSaving') -> 'SpaceSaving':
+        # Mergeable summaries (Agarwal et al., 2012): an item missing from a full sketch may still have been seen
+        # up to that sketch's lowest count times, so that's what it gets from it. Only the top `capacity` items are
+        # kept, and counts still overestimate by at most `total / capacity`, whatever the merge order.
+        if other.capacity != self.capacity:
+            raise ValueError('Only sketches of the same capacity can be merged')
+        self_floor, other_floor = self._floor(), other._floor()
+        merged_items = {}
+        for item in dict.fromkeys([*self._counts, *other._counts]):
+            merged_items[item] = (
+                self._counts.get(item, self_floor) + other._counts.get(item, other_floor),
+                self._errors.get(item, self_floor) + other._errors.get(item, other_floor),
+            )
+        top_items = heapq.nlargest(self.capacity, merged_items.items(), key=lambda item_stats: item_stats[1][0])
+        return self._from_items(self.capacity, self.total + other.total, [(item, *stats) for item, stats in top_items])
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'capacity': self.capacity,
+            'total': self.total,
+            'items': [[item, count, self._errors[item]] for item, count in self._counts.items()],
+        }
+
+    @classmethod
+    def from_dict(cls, sketch_dict: Dict[str, Any]) -> 'SpaceSaving':
+        # JSON turned tuple items (n-grams) into lists
+        return cls._from_items(sketch_dict['capacity'], sketch_dict['total'], [
+            (tuple(item) if isinstance(item, list) else item, count, error)
+            for item, count, error in sketch_dict['items']
+        ])
+
+    @classmethod
+    def _from_items(cls, capacity: int, total: int, items: List[Tuple[Hashable, int, int]]) -> 'SpaceSaving':
+        sketch = cls(capacity)
+        sketch.total = total
+        sketch._counts = {item: count for item, count, error in items}
+        sketch._errors = {item: error for item, count, error in items}
+        sketch._heap = [(count, item) for item, count, error in items]
+        heapq.heapify(sketch._heap)
+        return sketch
+
+    def _floor(self) -> int:
+        # Upper bound of the count of any item this sketch doesn't track
+        if len(self._counts) < self.capacity:
+            return 0
+        return min(self._counts.values())
+
+    def _pop_min(self) -> Tuple[Hashable, int]:
+        heap, counts = self._heap, self._counts
+        while True:
+            item_count, item = heap[0]
+            if counts[item] == item_count:
+                heapq.heappop(heap)
+                return item, item_count
+            heapq.heapreplace(heap, (counts[item], item))
+
+
+class HyperLogLog:
+    # Cardinality estimator (Flajolet et al., 2007): items are hashed, the first `precision` bits of the hash pick a
+    # register, which keeps the longest run of leading zeros seen in the remaining bits. It uses 2^precision bytes
+    # whatever the number of items, and its standard error is 1.04 / sqrt(2^precision).
+
+    def __init__(self, precision: int = 12):
+        if not 4 <= precision <= 16:
+            raise ValueError('The precision must be between 4 and 16')
+        self.precision = precision
+        self._registers = bytearray(1 << precision)
+
+    @property
+    def standard_error(self) -> float:
+        # Relative to the estimated count
+        return 1.04 / math.sqrt(len(self._registers))
+
+    def add(self, item: str) -> None:
+        item_hash = hash64(item)
+        remaining_bits = 64 - self.precision
+        register_index = item_hash >> remaining_bits
+        rank = remaining_bits - (item_hash & ((1 << remaining_bits) - 1)).bit_length() + 1
+        if rank > self._registers[register_index]:
+            self._registers[register_index] = rank
+
+    def update(self, items: Iterable[str]) -> None:
+        for item in items:
+            self.add(item)
+
+    def count(self) -> float:
+        registers_count = len(self._registers)
+        alpha = 0.7213 / (1 + 1.079 / registers_count)
+        estimate = alpha * registers_count ** 2 / sum(2.0 ** -register for register in self._registers)
+        empty_registers_count = self._registers.count(0)
+        if estimate <= 2.5 * registers_count and empty_registers_count > 0:
+            # Small cardinalities: "linear counting" of the empty registers is much more accurate
+            return registers_count * math.log(registers_count / empty_registers_count)
+        return estimate
+
+    def merge(self, other: 'HyperLogLog') -> 'HyperLogLog':
+        # Exactly what a single sketch would have given for both sets of items
+        if other.precision != self.precision:
+            raise ValueError('Only sketches of the same precision can be merged')
+        merged = HyperLogLog(self.precision)
+        merged._registers = bytearray(map(max, self._registers, other._registers))
+        return merged
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'precision': self.precision, 'registers': base64.b64encode(self._registers).decode('ascii')}
+
+    @classmethod
+    def from_dict(cls, sketch_dict: Dict[str, Any]) -> 'HyperLogLog':
+        sketch = cls(sketch_dict['precision'])
+        sketch._registers = bytearray(base64.b64decode(sketch_dict['registers']))
+        return sketch
+
+
+class LogHistogram:
+    # Distribution of positive values, in power of 2 buckets: [0, 1[, [1, 2[, [2, 4[, [4, 8[... Quantiles are thus
+    # known within a factor 2, with a few dozen buckets at most.
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self._buckets: Dict[int, int] = {}
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0
+
+    def add(self, value: float) -> None:
+        bucket = int(value).bit_length()
+        self._buckets[bucket] = self._buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += value
+
+    def quantile(self, q: float) -> int:
+        # Upper bound of the bucket which holds the q-quantile
+        rank = q * self.count
+        seen_count = 0
+        for bucket in sorted(self._buckets):
+            seen_count += self._buckets[bucket]
+            if seen_count >= rank:
+                return 2 ** bucket
+        return 0
+
+    def buckets(self) -> List[Tuple[int, int, int]]:
+        # (lower bound, upper bound, count)
+        return [(2 ** (bucket - 1) if bucket else 0, 2 ** bucket, self._buckets[bucket]) for bucket in sorted(self._buckets)]
+
+    def merge(self, other: 'LogHistogram') -> 'LogHistogram':
+        merged = LogHistogram()
+        merged.count = self.count + other.count
+        merged.total = self.total + other.total
+        merged._buckets = dict(self._buckets)
+        for bucket, count in other._buckets.items():
+            merged._buckets[bucket] = merged._buckets.get(bucket, 0) + count
+        return merged
+
+    def to_dict(self) -> Dict[str, Any]:
+        # JSON object keys are strings: buckets go in a list
+        return {'count': self.count, 'total': self.total, 'buckets': sorted(self._buckets.items())}
+
+    @classmethod
+    def from_dict(cls, histogram_dict: Dict[str, Any]) -> 'LogHistogram':
+        histogram = cls()
+        histogram.count = histogram_dict['count']
+        histogram.total = histogram_dict['total']
+        histogram._buckets = {bucket: count for bucket, count in histogram_dict['buckets']}
+        return histogram
+
+
+class BloomFilter:
+    # Set membership in a fixed number of bits (Bloom, 1970): each item sets `hashes_count` bits of the array, and
+    # is reported as added when all its bits are set. There are no false negatives, and as long as at most
+    # `capacity` items were added, at most a share `error_rate` of the other items are wrongly reported as added.
+    # The bits can live in any writable buffer of `size_in_bytes()` bytes, e.g. a memory-mapped file.
+
+    def __init__(self, capacity: int, error_rate: float = 0.001, bits: Optional[MutableSequence[int]] = None):
+        if capacity < 1 or not 0 < error_rate < 1:
+            raise ValueError('The capacity must be at least 1, and the error rate in ]0, 1[')
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.bits_count = 8 * self.size_in_bytes(capacity, error_rate)
+        self.hashes_count = max(1, round(self.bits_count / capacity * math.log(2)))
+        if bits is None:
+            bits = bytearray(self.bits_count // 8)
+        elif len(bits) != self.bits_count // 8:
+            raise ValueError(f'The bits buffer must be {self.bits_count // 8} bytes long')
+        self._bits = bits
+
+    @staticmethod
+    def size_in_bytes(capacity: int, error_rate: float) -> int:
+        return math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2 / 8)
+
+    def add(self, item: str) -> None:
+        bits = self._bits
+        for position in self._positions(item):
+            bits[position >> 3] |= 1 << (position & 7)
+
+    def update(self, items: Iterable[str]) -> None:
+        for item in items:
+            self.add(item)
+
+    def __contains__(self, item: str) -> bool:
+        bits = self._bits
+        for position in self._positions(item):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def merge(self, other: 'BloomFilter') -> 'BloomFilter':
+        # The filter of both sets of items
+        if (other.capacity, other.error_rate) != (self.capacity, self.error_rate):
+            raise ValueError('Only filters of the same capacity and error rate can be merged')
+        merged = BloomFilter(self.capacity, self.error_rate)
+        merged._bits = bytearray(
+            (int.from_bytes(self._bits, 'little') | int.from_bytes(other._bits, 'little')).to_bytes(len(self._bits), 'little')
+        )
+        return merged
+
+    def _positions(self, item: str) -> List[int]:
+        # "Double hashing" (Kirsch & Mitzenmacher, 2006): 2 hashes are enough to derive all the others
+        item_hash = int.from_bytes(hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest(), 'big')
+        first_hash, second_hash = item_hash >> 64, item_hash & 0xFFFF_FFFF_FFFF_FFFF | 1
+        bits_count = self.bits_count
+        return [(first_hash + i * second_hash) % bits_count for i in range(self.hashes_count)]
+
+
+def hash64(item: str) -> int:
+    # Unlike `hash()`, this is stable across processes
+    return int.from_bytes(hashlib.blake2b(item.encode('utf-8'), digest_size=8).digest(), 'big')
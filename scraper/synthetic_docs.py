@@ -0,0 +1,62 @@
+import random
+from typing import List
+
+_VOCABULARY = (
+    'once upon a time there were three little sisters and their names were Elsie Lacie Tillie they lived at the '
+    'bottom of well python programming language object oriented web free open source software license '
+    'documentation download community design philosophy loose coupling less code quick development explicit '
+    'better than implicit consistency models include relevant domain logic SQL efficiency templates'
+).split(' ')
+
+_META_NAMES = ('description', 'author', 'viewport', 'robots', 'generator', 'theme-color')
+
+
+def generate_html_doc(
+    seed: int,
+    target_size: int = 20_000,
+    links_ratio: float = 0.05,
+    zipf_exponent: float = 0,
+    scripts_share: float = 0,
+) -> bytes:
+    # Deterministic synthetic page of roughly `target_size` bytes, so that benchmarks are reproducible offline.
+    # Words are picked uniformly, unless a `zipf_exponent` gives them a natural language-like skewed distribution.
+    # Modern pages are mostly inline scripts and styles: `scripts_share` adds them, for that share of the page size.
+    rng = random.Random(seed)
+    vocabulary = _VOCABULARY + [f'word{index}' for index in range(rng.randint(50, 500))]
+    word_weights = [1 / rank ** zipf_exponent for rank in range(1, len(vocabulary) + 1)] if zipf_exponent else None
+
+    head = [
+        f'<title>Synthetic page {seed}</title>',
+        '<meta charset="utf-8">',
+        f'<meta name="keywords" content="{" ".join(rng.sample(_VOCABULARY, 8))}">',
+    ]
+    head.extend(f'<meta name="{name}" content="{" ".join(rng.choices(vocabulary, k=6))}">'
+                for name in rng.sample(_META_NAMES, 3))
+
+    body: List[str] = []
+    body_size = 0
+    while body_size < target_size:
+        words = []
+        for word in rng.choices(vocabulary, weights=word_weights, k=rng.randint(20, 120)):
+            if rng.random() < links_ratio:
+                word = f'<a href="/{word}/{rng.randint(0, 10_000)}">{word}</a>'
+            words.append(word)
+        paragraph = f'<p>{" ".join(words)}</p>'
+        if rng.random() < 0.3:
+            paragraph = f'<div class="section-{rng.randint(0, 9)}">{paragraph}</div>'
+        body.append(paragraph)
+        body_size += len(paragraph)
+
+    scripts_size = 0
+    while scripts_size < scripts_share / (1 - scripts_share) * body_size:
+        # Minified-like code, with no spaces
+        statements = ';'.join(f'var {rng.choice(vocabulary)}{index}=f({rng.randint(0, 10_000)},"{rng.choice(vocabulary)}")'
+                              for index in range(rng.randint(100, 500)))
+        script = f'<script>{statements}</script>' if rng.random() < 0.8 else f'<style>.{statements}</style>'
+        body.insert(rng.randint(0, len(body)), script)
+        scripts_size += len(script)
+
+    return (
+        '<!DOCTYPE html>\n<html lang="en">\n<head>\n' + '\n'.join(head) + '\n</head>\n<body>\n'
+        + '\n'.join(body) + '\n</body>\n</html>\n'
+    ).encode('utf-8')
@@ -0,0 +1,51 @@
+from scraper.aggregates import SiteReport, build_site_report, merge_site_reports
+from scraper.doc_analyser import DocAnalyser
+
+_test_pages = {
+    'http://dummy.com/': '<html><head><title>Home</title><meta name="keywords" content="plum fairy"></head>'
+                         '<body>Hello plum <a href="/about">About</a> <a href="https://other.com/">Other</a></body></html>',
+    'http://dummy.com/about': '<html><head><meta name="keywords" content="plum tree"></head>'
+                              '<body>About plum <a href="/">Home</a> <a href="/#top">Top</a></body></html>',
+    'http://dummy.com/contact': '<html><body>Contact <a href="/about">About</a></body></html>',
+}
+
+
+def _results():
+    analyser = DocAnalyser(_test_pages.get)
+    return [(url, analyser.analyse(url)) for url in _test_pages]
+
+
+def test_site_report():
+    sut = build_site_report(_results())
+
+    assert sut.pages_count == 3
+    assert sut.doc_sizes.count == 3
+    assert sut.word_counts.total == 10
+    assert round(sut.unique_words.count()) == 7
+    assert sut.words.most_common(1)[0] == ('About', 3, 0)
+    assert sut.pages_with_keywords_count == 2
+    assert sut.keywords_count == 4
+    assert sut.keywords_coverage == 0.5
+    assert {hh.item for hh in sut.missing_keywords.most_common(5)} == {'fairy', 'tree'}
+    assert sut.internal_links_count == 4
+    assert sut.external_links_count == 1
+    assert {(hh.item, hh.count) for hh in sut.link_targets.most_common(2)} == {
+        ('http://dummy.com/', 2), ('http://dummy.com/about', 2)
+    }
+    assert round(sut.unique_link_targets.count()) == 3
+
+
+def test_site_report_merge():
+    results = _results()
+    # One report per "worker", shipped over the wire
+    reports = [SiteReport.from_bytes(build_site_report([result]).to_bytes()) for result in results]
+
+    sut = merge_site_reports(reports)
+
+    reference = build_site_report(results)
+    sut_dict, reference_dict = sut.to_dict(), reference.to_dict()
+    for attribute in ('words', 'missing_keywords', 'link_targets'):
+        # Ties between items may come in a different order
+        assert sorted(sut_dict.pop(attribute)['items']) == sorted(reference_dict.pop(attribute)['items'])
+    assert sut_dict == reference_dict
+    assert len(sut.to_bytes()) < 20_000
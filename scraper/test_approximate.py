@@ -0,0 +1,155 @@
+import json
+import tracemalloc
+import pytest
+from scraper.approximate import estimate_word_stats, iter_text_blocks
+from scraper.differential import create_analysis_modes, read_golden_snapshot, run_differential
+from scraper.doc_analyser import DocAnalyser, DocLink, DocSummary, SkippedFieldError
+from scraper.synthetic_docs import generate_html_doc
+
+
+def test_iter_text_blocks():
+    html_doc = '<p>Once upon a time</p><script>var plum = "<p>";</script><p>there were</p><style>p {}</style><p>three</p>'
+
+    blocks = list(iter_text_blocks(html_doc, block_size=4))
+
+    assert ''.join(blocks) == '<p>Once upon a time</p><p>there were</p><p>three</p>'
+    assert all(block.startswith('<') for block in blocks)
+    assert list(iter_text_blocks(html_doc, start=html_doc.index('<p>three'))) == ['<p>three</p>']
+    # Comments (which end at "-- >" too), "<" in attribute values, and unclosed invisible elements
+    html_doc = '<p>Once <!-- <p>upon -- > a --> time</p><p title="<p>">there</p><script>var plum = 1;'
+    blocks = list(iter_text_blocks(html_doc, block_size=1))
+    assert ''.join(blocks) == '<p>Once  a --> time</p><p title="<p>">there</p>'
+    assert '<p title="<p>">there' in blocks
+
+
+def test_estimate_word_stats():
+    text_blocks = ['<p>once upon a time</p>', '<p>once upon a plum</p>', '<p>once</p>']
+
+    sut = estimate_word_stats(text_blocks, sample_rate=1)
+
+    assert sut.word_count.value == 9
+    assert sut.unique_word_count.value == 5
+    assert sut.most_common_5_words[0] == ('once', (3, 0))
+
+    with pytest.raises(ValueError):
+        estimate_word_stats(text_blocks, sample_rate=0)
+
+    # Words split between blocks, character references
+    sut = estimate_word_stats(['<p>on', 'ce <b>up</b>', '<i>on</i>', ' a&nbsp;time &amp;</p>'], sample_rate=1)
+    assert sut.word_count.value == 5 and sut.unique_word_count.value == 5
+    assert sorted(word for word, _ in sut.most_common_5_words) == ['&', 'a', 'once', 'time', 'upon']
+
+
+def test_estimate_word_stats_sampling():
+    # The sample is spread over the text, whatever the blocks sizes: tiny blocks between scripts don't take it all
+    text_blocks = [' ', '<p>plum</p>', ' '] * 100 + ['<p>' + 'once upon a time ' * 100 + '</p>'] * 10
+
+    sut = estimate_word_stats(text_blocks, sample_rate=0.2, max_exact_unique_words=2)
+
+    assert sut.word_count == (4100, 0)
+    assert 0.1 < sut.sample_rate < 0.3
+    assert {word for word, _ in sut.most_common_5_words} == {'once', 'upon', 'a', 'time', 'plum'}
+    for word, estimate in sut.most_common_5_words:
+        assert abs(estimate.value - (100 if word == 'plum' else 1000)) <= estimate.error
+    # Beyond `max_exact_unique_words`, distinct words are estimated
+    assert abs(sut.unique_word_count.value - 5) <= sut.unique_word_count.error
+
+
+def test_approximate_analysis():
+    html_doc = generate_html_doc(42, target_size=1_000_000, zipf_exponent=1.1)
+    exact_summary = DocAnalyser(None).analyse_doc(html_doc)
+
+    sut = DocAnalyser(None, approximate_above=500_000).analyse_doc(html_doc)
+
+    assert sut.page_title == exact_summary.page_title
+    assert sut.meta_tags == exact_summary.meta_tags
+    assert sut.links == exact_summary.links
+    assert sut.doc_size == exact_summary.doc_size
+    assert sut.skipped_fields == ('body_content',)
+    with pytest.raises(SkippedFieldError):
+        sut.word_count
+    with pytest.raises(SkippedFieldError):
+        hasattr(sut, 'word_count')
+
+    word_stats = sut.word_stats
+    assert word_stats.word_count.value == pytest.approx(exact_summary.word_count, rel=0.001)
+    assert abs(word_stats.unique_word_count.value - exact_summary.unique_word_count) <= word_stats.unique_word_count.error
+    assert [word for word, estimate in word_stats.most_common_5_words][:3] == \
+        [word for word, count in exact_summary.most_common_5_words][:3]
+    for (word, estimate), (_, exact_count) in zip(word_stats.most_common_5_words, exact_summary.most_common_5_words):
+        assert abs(estimate.value - exact_count) <= estimate.error
+
+    assert DocSummary.from_dict(json.loads(json.dumps(sut.to_dict()))) == sut
+
+    # Small pages are still analysed exactly
+    assert DocAnalyser(None, approximate_above=500_000).analyse_doc(html_doc[:10_000]).word_stats is None
+
+
+def test_approximate_links():
+    html_doc = (
+        '<html><head><title>Hello Plum!</title></head><body>'
+        '<a href="/one">One &amp; only</a><A class="plum" HREF=\'/two\'>Two</A>'
+        '<a href=/three><b>Three</b></a><a name="anchor">Anchor</a></body></html>'
+    )
+
+    sut = DocAnalyser(None, approximate_above=0).analyse_doc(html_doc)
+
+    assert sut.links == [
+        DocLink('One & only', '/one'),
+        DocLink('Two', '/two'),
+        DocLink('Three', '/three'),
+        DocLink('Anchor', None),
+    ]
+    assert sut.links == DocAnalyser(None).analyse_doc(html_doc).links
+
+
+def test_approximate_analysis_agrees_with_the_reference():
+    # Everything but the links: nested and unclosed links are only parsed properly in a tree
+    analyser = DocAnalyser(None)
+    modes = {'approximate': create_analysis_modes(analyser)['approximate']}
+
+    golden_snapshot = read_golden_snapshot()
+
+    reference_report, report = run_differential(golden_snapshot.generate_docs(), modes, analyser.analyse_doc,
+                                                golden_summaries=golden_snapshot.summaries)
+
+    assert not reference_report.differences
+    assert set(report.differences_by_field) <= {'links'}
+
+
+def test_approximate_analysis_without_head_end():
+    html_doc = '<html><head><title>Hello Plum</title><meta name="keywords" content="plum">' \
+               '<p>Once upon a time</p><meta name="description" content="fairy tale"></html>'
+    exact_summary = DocAnalyser(None).analyse_doc(html_doc)
+
+    sut = DocAnalyser(None, approximate_above=0).analyse_doc(html_doc)
+
+    assert (sut.page_title, sut.meta_tags) == (exact_summary.page_title, exact_summary.meta_tags)
+    assert sut.word_stats.word_count == (4, 0)
+    assert [word for word, _ in sut.word_stats.most_common_5_words] == ['Once', 'upon', 'a', 'time']
+
+
+@pytest.mark.parametrize('encoding', ['utf-8', 'shift_jis'])
+def test_approximate_analysis_of_encoded_docs(encoding: str):
+    html_doc = generate_html_doc(42, target_size=2_000_000, links_ratio=0.001).decode().replace(
+        '<meta charset="utf-8">', f'<meta charset="{encoding}">', 1
+    ).replace('Synthetic page 42', 'スモモ', 1).replace('<p>', '<p>すもももももももものうち ', 100)
+    analyser = DocAnalyser(None, approximate_above=0)
+    expected = analyser.analyse_doc(html_doc)
+    encoded_doc = html_doc.encode(encoding)
+
+    tracemalloc.start()
+    try:
+        sut = analyser.analyse_doc(memoryview(encoded_doc))
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    assert sut.page_title == 'スモモ'
+    assert (sut.meta_tags, sut.links) == (expected.meta_tags, expected.links)
+    # Blocks are cut after as many bytes, rather than characters: only the sampled counts may differ
+    assert sut.word_stats.word_count == expected.word_stats.word_count
+    assert sut.word_stats.unique_word_count == expected.word_stats.unique_word_count
+    assert analyser.analyse_doc(encoded_doc) == sut
+    # The document is not decoded whole
+    assert peak_memory < len(encoded_doc) / 4
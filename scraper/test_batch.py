@@ -0,0 +1,54 @@
+import pytest
+from scraper.batch import OutcomeStats, analyse_batch
+from scraper.doc_analyser import NOT_HTML, PARSED, DocAnalyser, DocSummary, FetchResponse
+
+
+def test_analyse_batch():
+    def doc_fetcher(url: str) -> str:
+        if url.endswith('/broken'):
+            raise IOError('Connection reset')
+        return f'<html><head><title>{url}</title></head><body>Once upon a time</body></html>'
+
+    urls = [f'http://dummy.com/{index}' for index in range(30)] + ['http://dummy.com/broken']
+
+    results = list(analyse_batch(DocAnalyser(doc_fetcher), iter(urls), workers=3))
+
+    assert [result.url for result in results] == urls
+    assert [result.summary.page_title for result in results[:-1]] == urls[:-1]
+    assert results[-1].summary is None and isinstance(results[-1].error, IOError)
+
+
+def test_analyse_batch_pulls_urls_lazily():
+    pulled_urls = []
+
+    def urls():
+        for index in range(1000):
+            pulled_urls.append(index)
+            yield f'http://dummy.com/{index}'
+
+    results = analyse_batch(DocAnalyser(lambda url: '<html></html>'), urls(), workers=2)
+    next(results)
+
+    assert len(pulled_urls) <= 5
+
+
+def test_outcome_stats():
+    def doc_fetcher(url: str) -> FetchResponse:
+        is_pdf = url.endswith('.pdf')
+        return FetchResponse(
+            url=url, redirects=[], status_code=200, content_type='application/pdf' if is_pdf else 'text/html',
+            content=b'' if is_pdf else b'<html><body>' + b'Once upon a time ' * 1000 + b'</body></html>',
+            doc_size=100_000 if url.endswith('/big.pdf') else None, timings={'headers': 0.1, 'body': 0.2},
+        )
+
+    urls = ['http://dummy.com/page', 'http://dummy.com/big.pdf', 'http://dummy.com/small.pdf']
+    sut = OutcomeStats()
+    for result in analyse_batch(DocAnalyser(doc_fetcher), urls, workers=2):
+        sut.add(result.summary)
+        # Unparsed pages outcomes survive serialisation
+        assert DocSummary.from_dict(result.summary.to_dict()) == result.summary
+
+    assert sut.outcomes == {PARSED: 1, NOT_HTML: 2}
+    assert sut.unparsed_count == 2 and sut.unparsed_bytes == 100_000 and sut.unparsed_pages_of_unknown_size == 1
+    # The big PDF is counted at its size, and the other one at the size of the parsed page
+    assert sut.saved_seconds == pytest.approx((100_000 / sut.parsed_bytes + 1) * sut.analysis_seconds)
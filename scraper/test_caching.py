@@ -0,0 +1,63 @@
+import threading
+import time
+import pytest
+from scraper.caching import SingleFlight, TtlCache
+
+
+def test_ttl_cache_expiry():
+    now = [0.0]
+    sut = TtlCache(ttl=10, max_size=100, clock=lambda: now[0])
+    sut.set('a', 1)
+    sut.set('b', 2, ttl=20)
+
+    assert sut.get('a') == 1
+    now[0] = 15
+    assert sut.get('a') is None
+    assert sut.get('b') == 2
+    assert (sut.hits, sut.misses) == (2, 1)
+
+
+def test_ttl_cache_max_size():
+    sut = TtlCache(ttl=10, max_size=2)
+    sut.set('a', 1)
+    sut.set('b', 2)
+    sut.get('a')
+    sut.set('c', 3)
+
+    # "b" was the least recently used entry
+    assert len(sut) == 2
+    assert (sut.get('a'), sut.get('b'), sut.get('c')) == (1, None, 3)
+
+
+def test_single_flight():
+    calls = []
+    sut = SingleFlight()
+
+    def slow_call():
+        calls.append(1)
+        time.sleep(0.1)
+        return 'result'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(sut.do('key', slow_call))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == ['result'] * 5
+    assert len(calls) == 1
+    assert sut.coalesced == 4
+    assert sut.in_flight == 0
+
+
+def test_single_flight_exception():
+    sut = SingleFlight()
+
+    def failing_call():
+        raise IOError('Connection reset')
+
+    with pytest.raises(IOError):
+        sut.do('key', failing_call)
+    # Failures are not remembered
+    assert sut.do('key', lambda: 'result') == 'result'
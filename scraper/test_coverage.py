@@ -0,0 +1,58 @@
+from scraper.coverage import (
+    KeywordMatcher, KeywordOccurrences, WordIndex, get_keyword_coverage, iter_normalized_words, normalize_words,
+    parse_keywords, stem_word,
+)
+
+
+def test_normalize_words():
+    assert normalize_words('Once upon a TIME, there were "three" open-source sisters... Don\'t!') == \
+        ['once', 'upon', 'a', 'time', 'there', 'were', 'three', 'open', 'source', 'sisters', "don't"]
+    assert normalize_words('Little sisters and their puppies', stem=True) == ['little', 'sister', 'and', 'their', 'puppy']
+    # Words are case-folded once found, as a whole
+    assert normalize_words('İSTANBUL Straße') == ['i̇stanbul', 'strasse']
+    assert get_keyword_coverage('Visit İSTANBUL', ['İstanbul']).covered_count == 1
+    for text in ('Once upon a TIME, in the STRAẞE... Don\'t!', 'Little sisters and their puppies', 'İstanbul'):
+        for stem in (False, True):
+            assert list(iter_normalized_words(text, stem=stem)) == normalize_words(text, stem=stem)
+
+
+def test_stem_word():
+    assert [stem_word(word) for word in ('sisters', 'puppies', 'boxes', 'class', 'virus', 'is', 'python')] == \
+        ['sister', 'puppy', 'boxe', 'class', 'virus', 'is', 'python']
+
+
+def test_parse_keywords():
+    assert parse_keywords('Python, open source,web frameworks , ,Django') == ['Python', 'open source', 'web frameworks', 'Django']
+    # Space-separated keywords
+    assert parse_keywords('Python programming  language') == ['Python', 'programming', 'language']
+    assert parse_keywords('') == []
+
+
+def test_keyword_matcher():
+    sut = KeywordMatcher([('a', 'b'), ('b',), ('b', 'c', 'd'), ('c',), ('a', 'b', 'c', 'e')])
+
+    assert sut.count(['a', 'b', 'c', 'd', 'a', 'b', 'c', 'e', 'b']) == [2, 3, 1, 2, 1]
+    assert sut.count([]) == [0, 0, 0, 0, 0]
+
+
+def test_keyword_coverage():
+    text = 'Python is an open-source programming language. Open source web frameworks are written in PYTHON!'
+
+    sut = WordIndex(text).keyword_coverage(['Python', 'open source', 'web framework', 'python', 'Django', '...'])
+
+    assert sut.keywords == [
+        KeywordOccurrences('Python', 2),
+        KeywordOccurrences('open source', 2),
+        KeywordOccurrences('web framework', 0),
+        KeywordOccurrences('Django', 0),
+    ]
+    assert sut.covered_count == 2
+    assert sut.coverage == 0.5
+    assert sut.missing_keywords == ['web framework', 'Django']
+
+    sut = WordIndex(text, stem=True).keyword_coverage(['web framework'])
+    assert sut.keywords == [KeywordOccurrences('web framework', 1)]
+    assert WordIndex(text).keyword_coverage([]).coverage == 1
+    # Matched once, without an index
+    assert get_keyword_coverage(text, ['Python', 'open source', 'Django']).keywords == \
+        WordIndex(text).keyword_coverage(['Python', 'open source', 'Django']).keywords
@@ -0,0 +1,79 @@
+from pathlib import Path
+from scraper.approximate import Estimate, WordStatsEstimate
+from scraper.doc_analyser import DocAnalyser, DocSummary
+from scraper.differential import ERROR_FIELD, REFERENCE_MODE, FieldDifference, compare_summaries, \
+    create_analysis_modes, read_golden_snapshot, run_differential, take_golden_snapshot, write_golden_snapshot
+from scraper.golden_corpus import generate_golden_corpus, read_corpus, write_corpus
+
+
+def test_golden_corpus(tmp_path: Path):
+    docs = generate_golden_corpus(seed=1, docs_per_category=5)
+
+    assert docs == generate_golden_corpus(seed=1, docs_per_category=5)
+    assert len(docs) == len({doc.name for doc in docs}) == 30
+    write_corpus(docs, tmp_path)
+    assert read_corpus(tmp_path) == sorted(docs)
+
+
+def test_exact_modes_agree_with_the_golden_summaries():
+    # These modes are only faster (or earlier) ways to get the very same summaries as the reference analysis, which
+    # must still give the golden ones (see `take_golden_snapshot()` after an intended change)
+    analyser = DocAnalyser(None)
+    modes = {name: mode for name, mode in create_analysis_modes(analyser).items() if name in ('memoryview', 'progressive')}
+    golden_snapshot = read_golden_snapshot()
+
+    reports = run_differential(golden_snapshot.generate_docs(), modes, analyser.analyse_doc,
+                               golden_summaries=golden_snapshot.summaries)
+
+    assert [report.mode for report in reports] == [REFERENCE_MODE, 'memoryview', 'progressive']
+    for report in reports:
+        assert report.docs_count == 120
+        assert report.differences == []
+        assert report.seconds > 0 and report.speedup > 0
+
+
+def test_golden_snapshot(tmp_path: Path):
+    analyser = DocAnalyser(None)
+    golden_snapshot = take_golden_snapshot(analyser.analyse_doc, seed=1, docs_per_category=2)
+    write_golden_snapshot(golden_snapshot, tmp_path / 'golden.json.gz')
+    assert read_golden_snapshot(tmp_path / 'golden.json.gz') == golden_snapshot
+    assert len(golden_snapshot.summaries) == 12 and golden_snapshot.summaries['broken/0001'].extractor_timings is None
+
+    # A regression of the reference analysis is not taken for the expected result
+    golden_summaries = {**golden_snapshot.summaries, 'synthetic/0000': DocSummary(
+        page_title='Hello Plum!', meta_tags=[], doc_size=100, body_content='Once upon a time', links=[],
+    )}
+    modes = {'memoryview': create_analysis_modes(analyser)['memoryview']}
+    reports = run_differential(golden_snapshot.generate_docs(), modes, analyser.analyse_doc,
+                               golden_summaries=golden_summaries)
+    for report in reports:
+        assert {(difference.doc_name, difference.field) for difference in report.differences} == \
+            {('synthetic/0000', field) for field in ('page_title', 'doc_size', 'body_content', 'links', 'meta_tags')}
+
+
+def test_compare_summaries():
+    expected = DocSummary(page_title='Hello Plum!', meta_tags=[], doc_size=100, body_content='Once upon a time once',
+                          links=[])
+
+    assert compare_summaries('doc', expected, expected._replace(extractor_timings={'links': 0.1})) == []
+    assert compare_summaries('doc', expected, expected._replace(page_title='Hello')) == \
+        [FieldDifference('doc', 'page_title', 'Hello Plum!', 'Hello')]
+    # Skipped fields are not compared, and estimates only differ outside of their error bounds
+    word_stats = WordStatsEstimate(word_count=Estimate(6, 1), unique_word_count=Estimate(2, 1), most_common_5_words=[],
+                                   sample_rate=1)
+    approximate = expected._replace(body_content=None, skipped_fields=('body_content',), word_stats=word_stats)
+    assert compare_summaries('doc', expected, approximate) == \
+        [FieldDifference('doc', 'unique_word_count', 5, Estimate(2, 1))]
+
+
+def test_run_differential_errors():
+    docs = generate_golden_corpus(docs_per_category=1)
+
+    def failing_mode(html_doc: bytes) -> DocSummary:
+        raise ValueError('Not implemented')
+
+    report, = run_differential(docs, {'failing': failing_mode}, DocAnalyser(None).analyse_doc)
+
+    assert report.differing_docs_count == len(docs)
+    assert report.differences_by_field == {ERROR_FIELD: len(docs)}
+    assert report.differences[0].expected is None and report.differences[0].actual == 'ValueError: Not implemented'
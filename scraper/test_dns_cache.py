@@ -0,0 +1,113 @@
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator, List, Optional, Tuple
+import pytest
+import requests
+from scraper.batch import analyse_batch
+from scraper.dns_cache import DnsCache
+from scraper.doc_analyser import DocAnalyser
+from scraper.doc_fetcher import create_pooled_fetcher
+
+
+class FakeResolver:
+
+    def __init__(self, ttl: Optional[float] = None):
+        self.ttl = ttl
+        self.resolved_hosts: List[str] = []
+        self.unblocked = threading.Event()
+        self.unblocked.set()
+
+    def __call__(self, host: str) -> Tuple[List[str], Optional[float]]:
+        self.unblocked.wait()
+        self.resolved_hosts.append(host)
+        if host.endswith('.invalid'):
+            raise socket.gaierror(socket.EAI_NONAME, 'Name or service not known')
+        # The first address is not listening
+        return (['127.0.0.2', '127.0.0.1'] if host.startswith('two.') else ['127.0.0.1']), self.ttl
+
+
+@pytest.fixture
+def server_port() -> Iterator[int]:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = f'<html><head><title>{self.headers["Host"]}</title></head><body>Hello</body></html>'.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.01}, daemon=True).start()
+    yield server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+def test_dns_cache():
+    resolver = FakeResolver()
+    sut = DnsCache(max_size=2, resolver=resolver)
+
+    assert sut.resolve('plum.test') == ['127.0.0.1']
+    assert sut.resolve('Plum.test.') == ['127.0.0.1']
+    assert sut.resolve('127.0.0.3') == ['127.0.0.3']
+    for _ in range(2):
+        with pytest.raises(socket.gaierror):
+            sut.resolve('unknown.invalid')
+    # The least recently used host was evicted
+    sut.resolve('two.test')
+    sut.resolve('plum.test')
+
+    assert resolver.resolved_hosts == ['plum.test', 'unknown.invalid', 'two.test', 'plum.test']
+    stats = sut.stats()
+    assert (stats.lookups, stats.hits, stats.resolutions, stats.failures) == (6, 2, 4, 1)
+    assert stats.hit_rate == 2 / 6 and stats.saved_seconds > 0
+
+
+def test_dns_cache_ttl():
+    resolver = FakeResolver(ttl=0)
+    sut = DnsCache(resolver=resolver)
+
+    sut.resolve('plum.test')
+    sut.resolve('plum.test')
+
+    assert resolver.resolved_hosts == ['plum.test', 'plum.test']
+
+
+def test_dns_cache_coalescing_and_prefetch():
+    resolver = FakeResolver()
+    resolver.unblocked.clear()
+    sut = DnsCache(resolver=resolver)
+
+    futures = sut.prefetch(['plum.test', 'plum.test', 'two.test', '127.0.0.1'])
+    assert len(futures) == 2
+    with ThreadPoolExecutor(4) as executor:
+        lookups = [executor.submit(sut.resolve, 'plum.test') for _ in range(4)]
+        while sut.stats().coalesced < 4:
+            time.sleep(0.001)
+        resolver.unblocked.set()
+        assert [lookup.result() for lookup in lookups] == [['127.0.0.1']] * 4
+
+    assert sorted(resolver.resolved_hosts) == ['plum.test', 'two.test']
+    assert sut.prefetch(['plum.test', 'two.test']) == []
+    sut.shutdown()
+
+
+def test_pooled_fetcher_with_dns_cache(server_port: int):
+    dns_cache = DnsCache(resolver=FakeResolver())
+    analyser = DocAnalyser(create_pooled_fetcher(dns_cache=dns_cache, timeout=5))
+    urls = [f'http://{host}:{server_port}/{index}' for index in range(5) for host in ('plum.test', 'two.test')]
+
+    results = list(analyse_batch(analyser, urls, workers=2, dns_cache=dns_cache))
+
+    # The Host header (and TLS certificate checks) keep the host name
+    assert [result.summary.page_title for result in results] == [url.split('/')[2] for url in urls]
+    assert dns_cache.stats().resolutions == 2
+    with pytest.raises(requests.ConnectionError, match='Failed to resolve'):
+        analyser.doc_fetcher('http://unknown.invalid/')
@@ -1,6 +1,12 @@
 
+import codecs
+import json
+import tracemalloc
 from typing import Callable
-from scraper.doc_analyser import DocAnalyser
+import pytest
+from scraper.doc_analyser import ANALYSED, HEAD_PARSED, LINKS_EXTRACTED, LINKS_FOUND, DocAnalyser, DocLink, DocMetaTag, DocSummary, \
+    DocTooLargeError, UnsupportedContentError, find_head_end, max_doc_size_for_memory
+from scraper.synthetic_docs import generate_html_doc
 
 
 def test_parsing_title():
@@ -79,6 +85,19 @@ def test_parsing_body_content():
     assert doc_summary.body_content == 'Once upon a time there were three little sisters'
 
 
+def test_parsing_body_content_without_invisible_elements():
+    html_doc = (
+        '<html><head><title>Hello Plum!</title><script>var plum = 1;</script></head><body><p>Once upon a time</p>'
+        '<script>document.write("there were three");</script><style>p { color: plum; }</style>'
+        '<noscript>Please enable JavaScript</noscript><div>little sisters</div></body></html>'
+    )
+
+    sut = DocAnalyser(_doc_fetcher_mock(html_doc))
+    doc_summary = sut.analyse('http://dummy.com')
+
+    assert doc_summary.words == ('Once', 'upon', 'a', 'time', 'little', 'sisters')
+
+
 def test_parsing_word_count():
     html_doc = '<html><head><title>Hello Plum!</title></head><body>Once upon a time there were three little sisters</body></html>'
 
@@ -127,6 +146,25 @@ def test_parsing_missing_keywords():
     assert doc_summary.missing_meta_keywords == ['programming', 'language', 'object', 'oriented', 'software', 'license', 'download']
 
 
+def test_keyword_coverage():
+    html_doc = (
+        '<html><head><meta name="keywords" content="Python, open source, Web frameworks, Django"></head>'
+        '<body><p>Python is an open-source programming language.</p><p>Open source web frameworks: python!</p></body></html>'
+    )
+
+    sut = DocAnalyser(_doc_fetcher_mock(html_doc))
+    doc_summary = sut.analyse('http://dummy.com')
+
+    assert [tuple(occurrences) for occurrences in doc_summary.keyword_coverage.keywords] == \
+        [('Python', 2), ('open source', 2), ('Web frameworks', 1), ('Django', 0)]
+    assert doc_summary.missing_meta_keywords == ['Django']
+    # Matched once by the analyser, and shipped with the summary
+    assert doc_summary.keyword_occurrences == doc_summary.keyword_coverage.keywords
+    assert DocSummary.from_dict(doc_summary.to_dict()).keyword_occurrences == doc_summary.keyword_occurrences
+    # Summaries built elsewhere compute it on demand
+    assert doc_summary._replace(keyword_occurrences=None).missing_meta_keywords == ['Django']
+
+
 def test_parsing_links():
     html_doc = """
     <html>
@@ -152,6 +190,209 @@ def test_parsing_links():
         assert doc_summary.links[link_index].text == expected[0] and doc_summary.links[link_index].href == expected[1]
 
 
+def test_summary_serialisation():
+    sut = DocAnalyser(_doc_fetcher_mock(_test_real_doc_content))
+    doc_summary = sut.analyse('https://docs.djangoproject.com/en/1.11/misc/design-philosophies/')
+
+    assert DocSummary.from_dict(json.loads(json.dumps(doc_summary.to_dict()))) == doc_summary
+
+
+def test_max_doc_size():
+    html_doc = '<html><head><title>Hello Plum!</title></head><body>Once upon a time there were three little sisters</body></html>'
+
+    assert DocAnalyser(_doc_fetcher_mock(html_doc), max_doc_size=len(html_doc)).analyse('http://dummy.com').word_count == 9
+    with pytest.raises(DocTooLargeError):
+        DocAnalyser(_doc_fetcher_mock(html_doc), max_doc_size=len(html_doc) - 1).analyse('http://dummy.com')
+
+
+def test_html_only():
+    sut = DocAnalyser(_doc_fetcher_mock(b'%PDF-1.4 ...'), html_only=True)
+    with pytest.raises(UnsupportedContentError):
+        sut.analyse('http://dummy.com')
+
+    sut = DocAnalyser(_doc_fetcher_mock(b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR'), html_only=True)
+    with pytest.raises(UnsupportedContentError):
+        sut.analyse('http://dummy.com')
+
+    sut = DocAnalyser(_doc_fetcher_mock(b'<html><head><title>Hello Plum!</title></head></html>'), html_only=True)
+    assert sut.analyse('http://dummy.com').page_title == 'Hello Plum!'
+
+
+def test_analyse_memoryview():
+    sut = DocAnalyser(None)
+    html_docs = [
+        '<html><head><title>Caf\u00e9</title></head><body>Cr\u00e8me br\u00fbl\u00e9e</body></html>'.encode('utf-8'),
+        '<html><head><meta charset="iso-8859-1"><title>Caf\u00e9</title></head><body>Cr\u00e8me</body></html>'.encode('latin-1'),
+        '\ufeff<html><head><title>Caf\u00e9</title></head></html>'.encode('utf-16'),
+    ]
+    for html_doc in html_docs:
+        doc_summary = sut.analyse_doc(memoryview(html_doc))
+        assert doc_summary._replace(extractor_timings=None) == sut.analyse_doc(html_doc)._replace(extractor_timings=None)
+        assert doc_summary.page_title == 'Caf\u00e9'
+
+    # Neither UTF-8 nor declared: guessed the same way
+    html_doc = '<html><head><title>Caf\u00e9 cr\u00e8me</title></head></html>'.encode('cp1252')
+    assert sut.analyse_doc(memoryview(html_doc))._replace(extractor_timings=None) == \
+        sut.analyse_doc(html_doc)._replace(extractor_timings=None)
+
+
+def test_memory_budget():
+    memory_budget = 8_000_000
+    max_doc_size = max_doc_size_for_memory(memory_budget)
+    sut = DocAnalyser(None, max_doc_size=max_doc_size, measure_memory=True)
+
+    html_doc = generate_html_doc(42, target_size=int(0.95 * max_doc_size))
+    assert len(html_doc) <= max_doc_size
+    assert sut.analyse_doc(html_doc).peak_memory <= memory_budget
+    with pytest.raises(DocTooLargeError):
+        sut.analyse_doc(generate_html_doc(42, target_size=2 * max_doc_size))
+
+
+def test_measure_memory(monkeypatch: pytest.MonkeyPatch):
+    sut = DocAnalyser(_doc_fetcher_mock(_test_real_doc_content))
+    assert sut.analyse('http://dummy.com').peak_memory is None
+
+    sut = DocAnalyser(_doc_fetcher_mock(_test_real_doc_content), measure_memory=True)
+    doc_summary = sut.analyse('http://dummy.com')
+    # The soup tree is much bigger than the doc itself
+    assert doc_summary.peak_memory > doc_summary.doc_size
+    assert not tracemalloc.is_tracing()
+
+    # Rejected documents are never traced, and failed analyses stop tracing too
+    with pytest.raises(DocTooLargeError):
+        DocAnalyser(None, max_doc_size=10, measure_memory=True).analyse_doc(_test_real_doc_content)
+    with pytest.raises(UnsupportedContentError):
+        DocAnalyser(None, html_only=True, measure_memory=True).analyse_doc(b'%PDF-1.4 ...')
+    monkeypatch.setattr('scraper.doc_analyser.get_visible_text', _raise_memory_error)
+    with pytest.raises(MemoryError):
+        DocAnalyser(None, measure_memory=True).analyse_doc(_test_real_doc_content)
+    assert not tracemalloc.is_tracing()
+
+
+def test_analyse_progressively():
+    html_doc = (
+        b'<html><head><title>Hello Plum!</title><meta name="keywords" content="plum"></head>'
+        b'<body>Once upon a time there were <a href="/sisters">three little sisters</a></body></html>'
+    )
+    # The end of head marker is split between two chunks
+    head_end = html_doc.index(b'</head>') + 3
+    chunks = [html_doc[:head_end], html_doc[head_end:head_end + 10], html_doc[head_end + 10:]]
+    received_chunks = []
+
+    def iter_chunks():
+        for chunk in chunks:
+            received_chunks.append(chunk)
+            yield chunk
+
+    sut = DocAnalyser(None)
+    events = []
+    for event in sut.analyse_progressively(iter_chunks(), doc_size=len(html_doc)):
+        events.append((event, len(received_chunks)))
+
+    assert [(event.name, received_chunks_count) for event, received_chunks_count in events] == \
+        [(HEAD_PARSED, 2), (LINKS_FOUND, 3), (LINKS_EXTRACTED, 3), (ANALYSED, 3)]
+    head_summary = events[0][0].summary
+    assert head_summary.page_title == 'Hello Plum!'
+    assert head_summary.meta_tags == [DocMetaTag('keywords', 'plum')]
+    assert head_summary.doc_size == len(html_doc)
+    assert head_summary.skipped_fields == ('body_content', 'links')
+    assert events[1][0].links == [DocLink('three little sisters', '/sisters')]
+    assert events[1][0].summary == head_summary
+    assert events[2][0].summary.links == [DocLink('three little sisters', '/sisters')]
+    assert events[2][0].summary.skipped_fields == ('body_content',)
+    assert events[3][0].summary._replace(extractor_timings=None) == \
+        sut.analyse_doc(html_doc)._replace(extractor_timings=None)
+    assert [event.elapsed for event, _ in events] == sorted(event.elapsed for event, _ in events)
+
+    # Without a <head>, everything comes once the whole document is received
+    events = list(sut.analyse_progressively(iter([b'<p>Once upon', b' a time</p>'])))
+    assert [event.name for event in events] == [LINKS_EXTRACTED, ANALYSED]
+    assert events[-1].summary.word_count == 4
+
+    with pytest.raises(DocTooLargeError):
+        list(DocAnalyser(None, max_doc_size=100).analyse_progressively(iter(chunks)))
+
+
+def test_analyse_progressively_streamed_links():
+    html_doc = (
+        '<html><head><meta charset="utf-8"><title>Hello Plum!</title></head><body>'
+        '<p><a href="/once">Once &amp; <b>upon</b></a> a <a href="/time"><em>tímé</em></a></p>'
+        '<script>document.write("<a href=/script>not a link</a>")</script>'
+        '<a href="/outer">outer <a href="/inner">inner</a></a><!-- <a href="/comment"></a> -->'
+        '<p><a href="/unclosed"><!-- only a comment --></p></body></html>'
+    ).encode('utf-8')
+    sut = DocAnalyser(None)
+
+    # The links come as they are received, whatever the chunks boundaries, and they are the ones of the whole document
+    for chunk_size in (1, 7, 64):
+        chunks = [html_doc[start:start + chunk_size] for start in range(0, len(html_doc), chunk_size)]
+        received_sizes = []
+
+        def iter_chunks():
+            for chunk in chunks:
+                yield chunk
+                received_sizes.append(len(chunk))
+
+        found_links = []
+        for event in sut.analyse_progressively(iter_chunks()):
+            if event.name == LINKS_FOUND:
+                assert event.summary.page_title == 'Hello Plum!'
+                found_links += [(link, sum(received_sizes)) for link in event.links]
+            elif event.name == LINKS_EXTRACTED:
+                assert [link for link, _ in found_links] == event.summary.links
+        assert [link for link, _ in found_links] == [
+            DocLink(None, '/once'),
+            DocLink('tímé', '/time'),
+            DocLink(None, '/outer'),
+            DocLink('inner', '/inner'),
+            DocLink(' only a comment ', '/unclosed'),
+        ]
+        assert found_links[0][1] < len(html_doc) // 2
+
+
+def test_analyse_progressively_head_end():
+    head = b'<html><head><title>Hello Plum!</title><script>var s = "</head>";</script><!-- </head> -->' \
+           b'<meta name="keywords" content="plum">'
+    body = b'<body>Once upon a time</body></html>'
+    sut = DocAnalyser(None)
+
+    # "</head>" in a script or a comment doesn't end the <head>, and neither does a missing one
+    for html_doc in (head + b'</head>' + body, head + body):
+        events = list(sut.analyse_progressively(iter([html_doc[:40], html_doc[40:len(head)], html_doc[len(head):]])))
+        assert events[0].name == HEAD_PARSED
+        assert events[0].summary.page_title == 'Hello Plum!'
+        assert events[0].summary.meta_tags == [DocMetaTag('keywords', 'plum')]
+
+
+def test_find_head_end():
+    head = '<!DOCTYPE html><html lang="en"><head><title>Hello Plum!</title><meta name="keywords" content="a > b">'
+    script = '<script>var s = "</head><body>";</script><!-- </head> -->'
+
+    assert find_head_end(head + '</head><body>Once') == len(head + '</head>')
+    assert find_head_end(head + script + '</head>\n<body>Once') == len(head + script + '</head>\n')
+    # Without "</head>", the <head> ends where the body content starts
+    assert find_head_end(head + script + '<body>Once') == len(head + script)
+    assert find_head_end(head + '<p>Once') == find_head_end(head + 'Once') == len(head)
+    assert find_head_end((head + '<div>Once').encode('utf-8')) == len(head)
+    assert find_head_end(head) == len(head)
+
+    # The beginning of a document still being received: "<di" may well be the beginning of the body, or not
+    assert find_head_end(head + '<scri', complete=False) is None
+    assert find_head_end(head + '<di', complete=False) is None
+    assert find_head_end(head + '<div>', complete=False) == len(head)
+    assert find_head_end(head.encode('utf-8') + b'Once', complete=False) == len(head)
+
+    # Byte order marks are not the body's text, and UTF-16 markup can't be searched as bytes
+    assert find_head_end(codecs.BOM_UTF8 + (head + '<div>').encode('utf-8')) == len(codecs.BOM_UTF8 + head.encode('utf-8'))
+    utf16_doc = (head + '<div>Once').encode('utf-16')
+    assert find_head_end(utf16_doc) == len(utf16_doc)
+    assert find_head_end(utf16_doc, complete=False) is None
+
+
+def _raise_memory_error(*args):
+    raise MemoryError()
+
+
 def _doc_fetcher_mock(expected_fetched_doc: str) ->Callable:
     def mock(url: str) ->str:
         return expected_fetched_doc
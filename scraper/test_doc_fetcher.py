@@ -0,0 +1,136 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, Tuple
+import pytest
+from scraper.doc_analyser import BINARY_CONTENT, ERROR_STATUS, NOT_HTML, PARSED, DocAnalyser, DocTooLargeError, \
+    UnsupportedContentError
+from scraper.doc_fetcher import create_http2_fetcher, create_pooled_fetcher, fetch_url_content, fetch_url_response, \
+    stream_url_content
+
+_test_pages: Dict[str, Tuple[str, bytes]] = {
+    '/page.html': ('text/html; charset=utf-8', b'<html><head><title>Hello Plum!</title></head><body>Once upon a time</body></html>'),
+    '/big.html': ('text/html', b'<html><body>' + b'Once upon a time ' * 10_000 + b'</body></html>'),
+    '/doc.pdf': ('application/pdf', b'%PDF-1.4 ...'),
+    # Served as HTML by mistake
+    '/photo.html': ('text/html', b'\x89PNG\r\n\x1a\n' + bytes(500_000)),
+}
+_test_redirects = {'/old.html': '/moved.html', '/moved.html': '/page.html'}
+
+
+@pytest.fixture
+def server_url() -> Iterator[str]:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split('?')[0]
+            if path in _test_redirects:
+                self.send_response(301)
+                self.send_header('Location', _test_redirects[path])
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            status, (content_type, body) = (200, _test_pages[path]) if path in _test_pages else \
+                (404, ('text/html', b'<html><head><title>Not found</title></head></html>'))
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            # Without a Content-Length, the size limit can only be enforced while streaming
+            if 'chunked' not in self.path:
+                self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.01}, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+def test_fetch_url_content(server_url: str):
+    assert fetch_url_content(f'{server_url}/page.html') == _test_pages['/page.html'][1]
+    assert fetch_url_content(f'{server_url}/page.html', max_size=1000, html_only=True) == _test_pages['/page.html'][1]
+
+
+def test_fetch_url_content_with_max_size(server_url: str):
+    with pytest.raises(DocTooLargeError):
+        fetch_url_content(f'{server_url}/big.html', max_size=1000)
+    with pytest.raises(DocTooLargeError):
+        fetch_url_content(f'{server_url}/big.html?chunked', max_size=1000)
+
+
+def test_fetch_url_content_html_only(server_url: str):
+    with pytest.raises(UnsupportedContentError):
+        fetch_url_content(f'{server_url}/doc.pdf', html_only=True)
+
+    sut = DocAnalyser(partial(fetch_url_content, max_size=1000, html_only=True))
+    assert sut.analyse(f'{server_url}/page.html').page_title == 'Hello Plum!'
+
+
+def test_fetch_url_response(server_url: str):
+    response = fetch_url_response(f'{server_url}/old.html')
+    assert response.url == f'{server_url}/page.html'
+    assert response.redirects == [f'{server_url}/old.html', f'{server_url}/moved.html']
+    assert (response.status_code, response.content_type) == (200, 'text/html')
+    assert response.content == _test_pages['/page.html'][1]
+    assert set(response.timings) == {'headers', 'body'}
+
+    # Only the first bytes of binary bodies, and none of error pages and non-HTML documents
+    response = fetch_url_response(f'{server_url}/photo.html')
+    assert 0 < len(response.content) < response.doc_size == len(_test_pages['/photo.html'][1])
+    response = fetch_url_response(f'{server_url}/missing.html')
+    assert (response.status_code, response.content) == (404, b'')
+    response = fetch_url_response(f'{server_url}/doc.pdf')
+    assert (response.content_type, response.content) == ('application/pdf', b'')
+    with pytest.raises(DocTooLargeError):
+        fetch_url_response(f'{server_url}/big.html?chunked', max_size=1000)
+
+
+def test_analyse_fetch_responses(server_url: str):
+    sut = DocAnalyser(create_pooled_fetcher(structured=True))
+
+    summary = sut.analyse(f'{server_url}/moved.html')
+    assert summary.page_title == 'Hello Plum!' and summary.outcome == PARSED
+    assert (summary.final_url, summary.redirects) == (f'{server_url}/page.html', [f'{server_url}/moved.html'])
+    assert summary.timings['analysis'] > 0
+
+    for path, outcome, status_code in (('/missing.html', ERROR_STATUS, 404), ('/doc.pdf', NOT_HTML, 200),
+                                       ('/photo.html', BINARY_CONTENT, 200)):
+        summary = sut.analyse(f'{server_url}{path}')
+        assert (summary.outcome, summary.status_code) == (outcome, status_code)
+        assert summary.page_title is None and 'body_content' in summary.skipped_fields
+        assert 'analysis' not in summary.timings
+
+
+def test_stream_url_content(server_url: str):
+    sut = stream_url_content(f'{server_url}/big.html')
+
+    assert sut.doc_size == len(_test_pages['/big.html'][1])
+    assert b''.join(sut.chunks) == _test_pages['/big.html'][1]
+    assert stream_url_content(f'{server_url}/big.html?chunked').doc_size is None
+
+
+def test_http2_fetcher():
+    pytest.importorskip('httpx')
+    pytest.importorskip('h2')
+    from scraper.local_h2_server import LocalHttp2Server
+
+    with LocalHttp2Server(_test_pages, response_delay=0.05) as server:
+        sut = create_http2_fetcher(max_size=100_000, html_only=True, prior_knowledge=True)
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            bodies = list(executor.map(sut, [f'{server.url}/page.html'] * 16))
+        assert bodies == [_test_pages['/page.html'][1]] * 16
+        # All the concurrent fetches went through a single multiplexed connection
+        assert server.connections_count == 1
+
+        with pytest.raises(UnsupportedContentError):
+            sut(f'{server.url}/doc.pdf')
+        with pytest.raises(DocTooLargeError):
+            create_http2_fetcher(max_size=1000, prior_knowledge=True)(f'{server.url}/big.html')
+        assert create_http2_fetcher(prior_knowledge=True)(f'{server.url}/big.html') == _test_pages['/big.html'][1]
+
+        assert DocAnalyser(sut).analyse(f'{server.url}/page.html').page_title == 'Hello Plum!'
@@ -0,0 +1,101 @@
+import json
+import pytest
+from bs4 import BeautifulSoup, Tag
+from scraper.doc_analyser import DocAnalyser, DocSummary
+from scraper.extractors import Extractor, available_extractors, register_extractor, run_extractors
+
+_test_page = """<!DOCTYPE html>
+<html lang="en">
+<head>
+    <title>Hello Plum!</title>
+    <link rel="canonical" href="https://plum.com/hello">
+    <link rel="alternate" hreflang="fr" href="https://plum.com/fr/bonjour">
+    <link rel="Alternate" hreflang="de" href="https://plum.com/de/hallo">
+    <link rel="stylesheet" href="/style.css">
+    <script src="/app.js"></script>
+    <script type="application/ld+json">{"@type": "Article", "headline": "Hello Plum!"}</script>
+    <script type="application/ld+json">{broken</script>
+</head>
+<body>
+    <h1>Hello <em>Plum</em>!</h1>
+    <h2>Once upon a time</h2>
+    <img src="/plum.png" alt="A plum">
+    <img src="/fairy.png">
+</body>
+</html>
+"""
+
+
+def test_extractors():
+    sut = DocAnalyser(None, extractors=available_extractors())
+    summary = sut.analyse_doc(_test_page)
+
+    assert summary.extras == {
+        'canonical_url': 'https://plum.com/hello',
+        'headings': [{'level': 1, 'text': 'Hello Plum!'}, {'level': 2, 'text': 'Once upon a time'}],
+        'hreflang': {'fr': 'https://plum.com/fr/bonjour', 'de': 'https://plum.com/de/hallo'},
+        'html_lang': 'en',
+        'images': [{'src': '/plum.png', 'alt': 'A plum'}, {'src': '/fairy.png', 'alt': None}],
+        'json_ld': [{'@type': 'Article', 'headline': 'Hello Plum!'}],
+        'scripts': ['/app.js'],
+        'stylesheets': ['/style.css'],
+    }
+    assert set(summary.extractor_timings) == {'meta_tags', 'links'} | set(available_extractors())
+    assert DocSummary.from_dict(json.loads(json.dumps(summary.to_dict()))).extras == summary.extras
+
+    # Without any extra extractor
+    assert DocAnalyser(None).analyse_doc(_test_page).extras is None
+
+    with pytest.raises(ValueError):
+        DocAnalyser(None, extractors=['plum'])
+
+
+def test_single_traversal():
+    handled_tags = []
+
+    class TracingExtractor(Extractor):
+        tags = ('p', 'a')
+
+        def __init__(self, name: str):
+            self.name = name
+
+        def handle_tag(self, tag: Tag) -> None:
+            handled_tags.append((self.name, tag.name, tag.get_text()))
+
+        def result(self) -> int:
+            return len([handled_tag for handled_tag in handled_tags if handled_tag[0] == self.name])
+
+    soup = BeautifulSoup('<p>one</p><div><a>two</a><p>three</p></div>', 'html.parser')
+    extraction = run_extractors(soup, [TracingExtractor('first'), TracingExtractor('second')])
+
+    # Both extractors see each tag in turn, in document order
+    assert handled_tags == [
+        ('first', 'p', 'one'), ('second', 'p', 'one'),
+        ('first', 'a', 'two'), ('second', 'a', 'two'),
+        ('first', 'p', 'three'), ('second', 'p', 'three'),
+    ]
+    assert extraction.results == {'first': 3, 'second': 3}
+    assert set(extraction.timings) == {'first', 'second'}
+    assert extraction.traversal_seconds > 0
+
+
+def test_register_extractor():
+    class LinksExtractor(Extractor):
+        name = 'links'
+
+    class HeadingsExtractor(Extractor):
+        name = 'headings'
+
+    with pytest.raises(ValueError):
+        register_extractor(LinksExtractor)
+    with pytest.raises(ValueError):
+        register_extractor(HeadingsExtractor)
+
+
+def test_approximate_analysis_skips_extras():
+    sut = DocAnalyser(None, approximate_above=0, extractors=['headings'])
+
+    summary = sut.analyse_doc(_test_page)
+
+    assert summary.extras is None
+    assert summary.skipped_fields == ('body_content', 'extras')
@@ -0,0 +1,161 @@
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator
+import pytest
+import requests
+from bs4.dammit import UnicodeDammit
+from scraper.differential import create_analysis_modes, read_golden_snapshot, run_differential
+from scraper.doc_analyser import DocAnalyser, SkippedFieldError, find_head_end
+from scraper.doc_fetcher import fetch_url_head, fetch_url_if_modified, fetch_url_size, stream_url_content
+from scraper.fast_paths import analyse_head_only, analyse_size_only
+
+_test_page = (
+    b'<html><head><title>Hello Plum!</title><meta name="keywords" content="plum fairy"></head>'
+    b'<body>' + b'<p>Once upon a time there were three little sisters</p>' * 5000 + b'</body></html>'
+)
+_test_short_page = b'<html><body>Once upon a time</body></html>'
+# Browsers end the <head> at the first body element
+_test_unclosed_head_page = _test_page.replace(b'</head>', b'')
+_test_error_page = b'<html><head><title>Not Found</title></head><body>Nothing here</body></html>'
+
+
+@pytest.fixture
+def server_url() -> Iterator[str]:
+    stalled_responses_released = threading.Event()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_HEAD(self):
+            self._send_headers()
+
+        def do_GET(self):
+            self._send_headers()
+            if self.path.startswith('/stalled'):
+                # The headers come, but the body never does
+                self.wfile.flush()
+                stalled_responses_released.wait(timeout=10)
+                return
+            try:
+                self.wfile.write(self._page())
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def _page(self) -> bytes:
+            if self.path.startswith('/missing'):
+                return _test_error_page
+            if self.path.startswith('/unclosed'):
+                return _test_unclosed_head_page
+            return _test_short_page if self.path.startswith('/short') else _test_page
+
+        def _send_headers(self):
+            self.send_response(404 if self.path.startswith('/missing') else 200)
+            self.send_header('Content-Type', 'text/html')
+            # Dynamic pages often don't have any Content-Length
+            if not self.path.endswith(('dynamic', 'stalled')):
+                self.send_header('Content-Length', str(len(self._page())))
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.01}, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    stalled_responses_released.set()
+    server.shutdown()
+    server.server_close()
+
+
+def test_analyse_size_only(server_url: str):
+    result = analyse_size_only(f'{server_url}/page')
+
+    assert result.summary.doc_size == len(_test_page)
+    assert result.summary.doc_size_human_friendly == '275.11 KB'
+    assert result.bytes_received == 0
+    assert result.bytes_saved == len(_test_page)
+    assert result.summary.page_title is None
+    with pytest.raises(SkippedFieldError):
+        result.summary.word_count
+
+    # Without Content-Length we have to count the bytes
+    result = analyse_size_only(f'{server_url}/dynamic')
+    assert result.summary.doc_size == len(_test_page)
+    assert result.bytes_saved == 0
+
+
+def test_analyse_head_only(server_url: str):
+    result = analyse_head_only(DocAnalyser(None), f'{server_url}/page')
+
+    assert result.summary.page_title == 'Hello Plum!'
+    assert result.summary.get_meta_by_name('keywords').content == 'plum fairy'
+    assert result.summary.doc_size == len(_test_page)
+    assert result.summary.skipped_fields == ('body_content', 'links')
+    assert result.summary.links is None
+    with pytest.raises(SkippedFieldError):
+        result.summary.missing_meta_keywords
+    assert result.bytes_received < len(_test_page) / 10
+    assert result.bytes_saved == len(_test_page) - result.bytes_received
+
+    result = analyse_head_only(DocAnalyser(None), f'{server_url}/page?dynamic')
+    assert result.summary.skipped_fields == ('body_content', 'links', 'doc_size')
+    assert result.bytes_saved is None
+
+
+def test_analyse_head_only_without_head(server_url: str):
+    # No <head> at all: we get the whole document, and thus a complete summary
+    result = analyse_head_only(DocAnalyser(None), f'{server_url}/short')
+
+    assert not result.summary.is_partial
+    assert result.summary.word_count == 4
+    assert result.bytes_saved == 0
+
+
+def test_analyse_head_without_head_end(server_url: str):
+    result = analyse_head_only(DocAnalyser(None), f'{server_url}/unclosed')
+
+    assert result.summary.page_title == 'Hello Plum!'
+    assert result.summary.get_meta_by_name('keywords').content == 'plum fairy'
+    assert result.summary.skipped_fields == ('body_content', 'links')
+    assert result.bytes_received < len(_test_unclosed_head_page) / 10
+
+
+def test_analyse_error_pages(server_url: str):
+    # The title of a 404 page is not the page's
+    with pytest.raises(requests.HTTPError):
+        analyse_head_only(DocAnalyser(None), f'{server_url}/missing')
+    with pytest.raises(requests.HTTPError):
+        analyse_size_only(f'{server_url}/missing')
+    with pytest.raises(requests.HTTPError):
+        analyse_size_only(f'{server_url}/missing?dynamic')
+
+
+def test_fast_paths_timeout(server_url: str):
+    # A stalled server doesn't hang the fast paths
+    for fetch in (
+        lambda url: fetch_url_size(url, timeout=0.2),
+        lambda url: fetch_url_head(url, timeout=0.2),
+        lambda url: list(stream_url_content(url, timeout=0.2).chunks),
+        lambda url: fetch_url_if_modified(url, timeout=0.2),
+    ):
+        with pytest.raises((requests.Timeout, requests.ConnectionError)):
+            fetch(f'{server_url}/stalled')
+
+
+def test_analyse_head_only_agrees_with_the_reference():
+    # Except where the head can't tell: meta tags and titles in the body, and encodings guessed from the whole document
+    def is_in_head(html_doc: bytes) -> bool:
+        head = html_doc[:find_head_end(html_doc)]
+        return not re.search(rb'<(?:title|meta)\b', html_doc[len(head):], re.IGNORECASE) and \
+            UnicodeDammit(head, is_html=True).original_encoding == UnicodeDammit(html_doc, is_html=True).original_encoding
+
+    golden_snapshot = read_golden_snapshot()
+    docs = [doc for doc in golden_snapshot.generate_docs() if is_in_head(doc.content)]
+    analyser = DocAnalyser(None)
+    modes = {'head_only': create_analysis_modes(analyser)['head_only']}
+
+    reference_report, report = run_differential(docs, modes, analyser.analyse_doc,
+                                                golden_summaries=golden_snapshot.summaries)
+
+    assert len(docs) >= 60
+    assert not reference_report.differences
+    assert not report.differences_by_field
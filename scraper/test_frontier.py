@@ -0,0 +1,72 @@
+from pathlib import Path
+from scraper.doc_analyser import DocAnalyser
+from scraper.frontier import FrontierStats, UrlFrontier, crawl_frontier
+
+
+def test_add_and_take(tmp_path: Path):
+    sut = UrlFrontier(str(tmp_path / 'frontier.db'), capacity=1000)
+
+    assert sut.add(['http://dummy.com/1', 'http://dummy.com/2', 'http://dummy.com/1', 'http://dummy.com/3']) == 3
+    # Already added URLs are ignored, even once they are done
+    assert sut.add(['http://dummy.com/2', 'http://dummy.com/4']) == 1
+    assert 'http://dummy.com/4' in sut and 'http://dummy.com/5' not in sut
+
+    assert sut.take(2) == ['http://dummy.com/1', 'http://dummy.com/2']
+    sut.mark_done('http://dummy.com/1')
+    sut.mark_failed('http://dummy.com/2', 'Timeout')
+    assert sut.add(['http://dummy.com/1']) == 0
+
+    # Failed URLs are retried after the other ones, until they reach the maximum number of attempts
+    assert sut.take(10) == ['http://dummy.com/3', 'http://dummy.com/4', 'http://dummy.com/2']
+    for url in ('http://dummy.com/3', 'http://dummy.com/4'):
+        sut.mark_done(url)
+    sut.mark_failed('http://dummy.com/2', 'Timeout')
+    assert sut.take(10) == ['http://dummy.com/2']
+    sut.mark_failed('http://dummy.com/2', 'Timeout again')
+    assert sut.take(10) == []
+
+    assert sut.stats() == FrontierStats(pending=0, done=3, failed=1)
+    assert list(sut.failures()) == [('http://dummy.com/2', 'Timeout again')]
+    sut.close()
+
+
+def test_resume(tmp_path: Path):
+    db_path = str(tmp_path / 'frontier.db')
+    crashed = UrlFrontier(db_path, capacity=1000)
+    crashed.add(f'http://dummy.com/{index}' for index in range(10))
+    for url in crashed.take(4)[:2]:
+        crashed.mark_done(url)
+    # The filter bits of the URLs added since the last checkpoint are lost in the crash (no `close()`)
+    bloom_path = Path(f'{db_path}.bloom')
+    bloom_path.write_bytes(bytes(bloom_path.stat().st_size))
+
+    sut = UrlFrontier(db_path, capacity=1000)
+
+    assert sut.stats() == FrontierStats(pending=8, done=2, failed=0)
+    assert sut.add(f'http://dummy.com/{index}' for index in range(12)) == 2
+    # URLs which were being analysed during the crash are taken again
+    assert sut.take(3) == ['http://dummy.com/2', 'http://dummy.com/3', 'http://dummy.com/4']
+    sut.close()
+
+
+def test_crawl_frontier(tmp_path: Path):
+    sut = UrlFrontier(str(tmp_path / 'frontier.db'), capacity=1000)
+    sut.add(['http://dummy.com/1', 'http://dummy.com/broken', 'http://dummy.com/2'])
+    analyser = DocAnalyser(_doc_fetcher_mock)
+
+    analysed_urls = []
+    for result in crawl_frontier(sut, analyser, workers=2, batch_size=2):
+        if result.error is None:
+            analysed_urls.append(result.url)
+            # URLs discovered during the crawl are analysed too
+            sut.add(link.href for link in result.summary.links)
+
+    assert sorted(analysed_urls) == ['http://dummy.com/1', 'http://dummy.com/2', 'http://dummy.com/3']
+    assert sut.stats() == FrontierStats(pending=0, done=3, failed=1)
+    sut.close()
+
+
+def _doc_fetcher_mock(url: str) -> str:
+    if url.endswith('broken'):
+        raise ConnectionError(f'Could not connect to {url}')
+    return f'<html><head><title>{url}</title></head><body><a href="http://dummy.com/3">Next</a></body></html>'
@@ -0,0 +1,194 @@
+import gzip
+import tracemalloc
+import zlib
+from pathlib import Path
+from scraper.doc_analyser import DocAnalyser
+from scraper.local_docs import analyse_local_docs, fetch_file_content, iter_html_files, iter_warc_docs, \
+    iter_warc_records
+
+
+def test_fetch_file_content(tmp_path: Path):
+    html_file = tmp_path / 'page.html'
+    html_file.write_bytes(b'<html><head><title>Hello Plum!</title></head><body>Once upon a time</body></html>')
+
+    sut = DocAnalyser(fetch_file_content)
+
+    assert sut.analyse(html_file.as_uri()).page_title == 'Hello Plum!'
+    assert sut.analyse(str(html_file)).page_title == 'Hello Plum!'
+
+
+def test_iter_html_files(tmp_path: Path):
+    (tmp_path / 'sub').mkdir()
+    (tmp_path / 'a.html').write_bytes(b'<html><head><title>A</title></head><body>one two</body></html>')
+    (tmp_path / 'sub' / 'b.htm').write_bytes(b'<html><head><title>B</title></head><body>three</body></html>')
+    (tmp_path / 'notes.txt').write_bytes(b'not HTML')
+
+    results = list(analyse_local_docs(DocAnalyser(fetch_file_content), iter_html_files(tmp_path)))
+
+    assert [url for url, _ in results] == [(tmp_path / 'a.html').as_uri(), (tmp_path / 'sub' / 'b.htm').as_uri()]
+    assert [summary.page_title for _, summary in results] == ['A', 'B']
+    assert results[0][1].word_count == 2
+
+
+def test_iter_warc_records(tmp_path: Path):
+    warc_file = tmp_path / 'archive.warc'
+    warc_file.write_bytes(_test_warc_content)
+
+    records = [(record.record_type, record.target_uri, record.http_status, bytes(record.payload))
+               for record in iter_warc_records(warc_file)]
+
+    assert records == [
+        ('warcinfo', None, None, b'software: test'),
+        ('response', 'http://dummy.com/', 200, _test_pages[0]),
+        ('response', 'http://dummy.com/missing', 404, b'Not found'),
+        ('response', 'http://dummy.com/other', 200, _test_pages[1]),
+    ]
+
+
+def test_iter_warc_docs(tmp_path: Path):
+    warc_file = tmp_path / 'archive.warc'
+    warc_file.write_bytes(_test_warc_content)
+
+    results = list(analyse_local_docs(DocAnalyser(fetch_file_content), iter_warc_docs(warc_file)))
+
+    assert [(url, summary.page_title) for url, summary in results] == [
+        ('http://dummy.com/', 'Hello Plum!'),
+        ('http://dummy.com/other', 'Hello Plum again!'),
+    ]
+    assert results[1][1].doc_size == len(_test_pages[1])
+
+
+def test_iter_gzipped_warc_docs(tmp_path: Path):
+    warc_file = tmp_path / 'archive.warc.gz'
+    # Gzipped WARCs have one gzip member per record
+    warc_file.write_bytes(b''.join(gzip.compress(record) for record in _test_warc_records))
+
+    results = list(analyse_local_docs(DocAnalyser(fetch_file_content), iter_warc_docs(warc_file)))
+
+    assert [summary.page_title for _, summary in results] == ['Hello Plum!', 'Hello Plum again!']
+
+
+def test_iter_single_member_gzipped_warc_records(tmp_path: Path):
+    warc_file = tmp_path / 'archive.warc.gz'
+    big_page = _test_pages[0].replace(b'Once upon a time', b'Once upon a time ' * 50_000)
+    records = [_warc_record('response', _http_response('200 OK', big_page), f'http://dummy.com/{index}')
+               for index in range(20)]
+    warc_file.write_bytes(gzip.compress(b''.join(records)))
+
+    # Records are decompressed one at a time, not the whole archive at once
+    tracemalloc.start()
+    try:
+        payload_sizes = [len(record.payload) for record in iter_warc_records(warc_file)]
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    assert payload_sizes == [len(big_page)] * 20
+    assert peak_memory < 5 * len(records[0]) < sum(len(record) for record in records)
+
+
+def test_iter_damaged_gzipped_warc_records(tmp_path: Path):
+    warc_file = tmp_path / 'archive.warc.gz'
+    members = [gzip.compress(record) for record in _test_warc_records]
+    # A corrupt member in the middle, and a truncated one at the end
+    corrupt_member = members[1][:20] + bytes(byte ^ 0xff for byte in members[1][20:])
+    warc_file.write_bytes(members[0] + corrupt_member + members[2] + members[3][:len(members[3]) // 2])
+    damaged_members = []
+
+    records = list(iter_warc_records(warc_file, lambda offset, error: damaged_members.append((offset, type(error)))))
+
+    assert [(record.record_type, record.target_uri) for record in records] == [
+        ('warcinfo', None),
+        ('response', 'http://dummy.com/missing'),
+    ]
+    assert damaged_members == [
+        (len(members[0]), zlib.error),
+        (len(members[0] + corrupt_member + members[2]), EOFError),
+    ]
+
+
+def test_iter_warc_records_with_invalid_content_lengths(tmp_path: Path):
+    invalid_records = [
+        _test_warc_records[1].replace(b'Content-Length: ', b'Content-Length: -'),
+        _test_warc_records[3].replace(b'Content-Length: ', b'Content-Length: about '),
+    ]
+    records = [_test_warc_records[0], invalid_records[0], _test_warc_records[2], invalid_records[1]]
+    offsets = [sum(len(record) for record in records[:index]) for index in (1, 3)]
+    for suffix, content in (
+        ('', b''.join(records)),
+        # In one gzip member, and in one member per record
+        ('.gz', gzip.compress(b''.join(records))),
+        ('.gz', b''.join(gzip.compress(record) for record in records)),
+    ):
+        warc_file = tmp_path / f'archive.warc{suffix}'
+        warc_file.write_bytes(content)
+        damaged_records = []
+
+        records_found = list(iter_warc_records(
+            warc_file, on_damaged_record=lambda offset, error: damaged_records.append((offset, str(error))),
+        ))
+
+        assert [(record.record_type, record.target_uri) for record in records_found] == [
+            ('warcinfo', None),
+            ('response', 'http://dummy.com/missing'),
+        ]
+        assert damaged_records == [
+            (offsets[0], 'Invalid WARC record Content-Length: "-125"'),
+            (offsets[1], 'Invalid WARC record Content-Length: "about 146"'),
+        ]
+
+
+def test_iter_encoded_warc_records(tmp_path: Path):
+    raw_deflate = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+    responses = (
+        _http_response('200 OK', _chunked(_test_pages[0]), b'Transfer-Encoding: chunked'),
+        _http_response('200 OK', gzip.compress(_test_pages[0]), b'Content-Encoding: gzip'),
+        _http_response('200 OK', zlib.compress(_test_pages[0]), b'Content-Encoding: deflate'),
+        _http_response('200 OK', raw_deflate.compress(_test_pages[0]) + raw_deflate.flush(), b'Content-Encoding: deflate'),
+        _http_response('200 OK', _chunked(gzip.compress(_test_pages[0])), b'Transfer-Encoding: chunked',
+                       b'Content-Encoding: gzip'),
+        # Already decoded by the crawler, which kept the original headers
+        _http_response('200 OK', _test_pages[0], b'Transfer-Encoding: chunked', b'Content-Encoding: gzip'),
+        # Truncated in its second chunk
+        _http_response('200 OK', _chunked(_test_pages[0])[:len(b'10\r\n') * 2 + 16 + 2 + 10],
+                       b'Transfer-Encoding: chunked'),
+    )
+    warc_file = tmp_path / 'archive.warc'
+    warc_file.write_bytes(b''.join(_warc_record('response', response, 'http://dummy.com/') for response in responses))
+
+    payloads = [bytes(record.payload) for record in iter_warc_records(warc_file)]
+
+    assert payloads == [_test_pages[0]] * 6 + [_test_pages[0][:16 + 10]]
+
+
+def _warc_record(record_type: str, block: bytes, target_uri: str = None) -> bytes:
+    headers = [b'WARC/1.0', b'WARC-Type: ' + record_type.encode()]
+    if target_uri is not None:
+        headers.append(b'WARC-Target-URI: ' + target_uri.encode())
+    headers.append(b'Content-Length: ' + str(len(block)).encode())
+    return b'\r\n'.join(headers) + b'\r\n\r\n' + block + b'\r\n\r\n'
+
+
+def _http_response(status: str, body: bytes, *headers: bytes) -> bytes:
+    return b'HTTP/1.1 ' + status.encode() + b'\r\n' + b''.join(header + b'\r\n' for header in headers) + \
+        b'Content-Type: text/html\r\n\r\n' + body
+
+
+def _chunked(body: bytes, chunk_size: int = 16) -> bytes:
+    chunks = [body[start:start + chunk_size] for start in range(0, len(body), chunk_size)]
+    return b''.join(f'{len(chunk):x}\r\n'.encode() + chunk + b'\r\n' for chunk in chunks) + b'0\r\n\r\n'
+
+
+_test_pages = (
+    b'<html><head><title>Hello Plum!</title></head><body>Once upon a time</body></html>',
+    b'<html><head><title>Hello Plum again!</title></head><body>there were three little sisters</body></html>',
+)
+
+_test_warc_records = (
+    _warc_record('warcinfo', b'software: test'),
+    _warc_record('response', _http_response('200 OK', _test_pages[0]), 'http://dummy.com/'),
+    _warc_record('response', _http_response('404 Not Found', b'Not found'), 'http://dummy.com/missing'),
+    _warc_record('response', _http_response('200 OK', _test_pages[1]), 'http://dummy.com/other'),
+)
+
+_test_warc_content = b''.join(_test_warc_records)
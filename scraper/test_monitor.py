@@ -0,0 +1,201 @@
+from pathlib import Path
+from typing import Dict, Optional
+from scraper.doc_analyser import DocAnalyser, DocMetaTag
+from scraper.doc_fetcher import ConditionalFetch
+from scraper.monitor import CHANGED, NEW, NOT_MODIFIED, UNCHANGED, ERROR, PageMonitor
+
+
+class _FakeSite:
+
+    def __init__(self):
+        self.pages: Dict[str, bytes] = {}
+        self.fetches_count = 0
+
+    def conditional_fetcher(self, url: str, etag: Optional[str] = None, last_modified: Optional[str] = None):
+        self.fetches_count += 1
+        if url not in self.pages:
+            raise IOError('Connection reset')
+        page_etag = f'"{hash(self.pages[url])}"'
+        if url.endswith('/etag') and etag == page_etag:
+            return ConditionalFetch(modified=False, content=None, etag=etag, last_modified=None)
+        return ConditionalFetch(modified=True, content=self.pages[url], etag=page_etag, last_modified=None)
+
+
+def _page(title: str, keywords: str, body: str) -> bytes:
+    return (f'<html><head><title>{title}</title><meta name="keywords" content="{keywords}"></head>'
+            f'<body>{body}</body></html>').encode('utf-8')
+
+
+def test_monitoring_cycles(tmp_path: Path):
+    site = _FakeSite()
+    site.pages['http://dummy.com/'] = _page('Hello Plum!', 'plum', 'Once upon a <a href="/time">time</a>')
+    site.pages['http://dummy.com/etag'] = _page('Hello ETag!', 'etag', 'Once upon a time')
+    sut = PageMonitor(str(tmp_path / 'monitor.db'), conditional_fetcher=site.conditional_fetcher, workers=2)
+
+    changes = {change.url: change for change in sut.check(list(site.pages) + ['http://dummy.com/missing'])}
+    assert changes['http://dummy.com/'].status == NEW
+    assert changes['http://dummy.com/'].reanalysed_sections == ('head', 'body')
+    assert changes['http://dummy.com/etag'].status == NEW
+    assert changes['http://dummy.com/missing'].status == ERROR
+    assert sut.get_fingerprint('http://dummy.com/').summary.page_title == 'Hello Plum!'
+    assert sut.get_fingerprint('http://dummy.com/').summary.body_content == 'Once upon a time'
+
+    changes = {change.url: change for change in sut.check(site.pages)}
+    assert changes['http://dummy.com/'].status == UNCHANGED
+    assert changes['http://dummy.com/'].reanalysed_sections == ()
+    assert changes['http://dummy.com/etag'].status == NOT_MODIFIED
+
+    # Head only change
+    site.pages['http://dummy.com/'] = _page('Hello Plum!', 'plum fairy', 'Once upon a <a href="/time">time</a>')
+    change = sut.check_page('http://dummy.com/')
+    assert change.status == CHANGED
+    assert change.reanalysed_sections == change.changed_sections == ('head',)
+    assert [field_change.field for field_change in change.changes] == ['doc_size', 'meta_tags']
+    assert change.changes[1].added == (DocMetaTag('keywords', 'plum fairy'),)
+    assert change.changes[1].removed == (DocMetaTag('keywords', 'plum'),)
+
+    # Body only change
+    site.pages['http://dummy.com/'] = _page('Hello Plum!', 'plum fairy', 'Once upon a <a href="/times">time</a> again')
+    change = sut.check_page('http://dummy.com/')
+    assert change.status == CHANGED
+    assert change.reanalysed_sections == ('body',)
+    assert change.changed_sections == ('links', 'text')
+    assert [field_change.field for field_change in change.changes] == ['doc_size', 'links', 'body_content']
+    assert change.changes[2].old == 4 and change.changes[2].new == 5
+    assert change.changes[2].added == ('again',)
+    assert sut.get_fingerprint('http://dummy.com/').summary.get_meta_by_name('keywords').content == 'plum fairy'
+
+
+def test_monitoring_pages_without_head_end(tmp_path: Path):
+    site = _FakeSite()
+    site.pages['http://dummy.com/'] = b'<html><title>Hello Plum!</title><meta name="keywords" content="plum">' \
+                                      b'<p>Once upon a <a href="/time">time</a></p>'
+    sut = PageMonitor(str(tmp_path / 'monitor.db'), conditional_fetcher=site.conditional_fetcher)
+
+    assert sut.check_page('http://dummy.com/').status == NEW
+    summary = sut.get_fingerprint('http://dummy.com/').summary
+    assert (summary.page_title, summary.meta_tags) == ('Hello Plum!', [DocMetaTag('keywords', 'plum')])
+    assert summary.body_content.split() == ['Once', 'upon', 'a', 'time']
+
+    # Only the body markup changed: neither the head, nor the links or the text
+    site.pages['http://dummy.com/'] = site.pages['http://dummy.com/'].replace(b'<p>', b'<p class="tale">')
+    change = sut.check_page('http://dummy.com/')
+    assert change.reanalysed_sections == ('body',)
+    assert change.changed_sections == ()
+    assert [field_change.field for field_change in change.changes] == ['doc_size']
+
+
+def test_monitoring_changed_at(tmp_path: Path):
+    site = _FakeSite()
+    site.pages['http://dummy.com/'] = _page('Hello Plum!', 'plum', '<p class="a">Once upon a time</p>')
+    sut = PageMonitor(str(tmp_path / 'monitor.db'), conditional_fetcher=site.conditional_fetcher)
+
+    def get_changed_at() -> float:
+        return sut._db.execute('SELECT changed_at FROM monitored_pages').fetchone()[0]
+
+    assert sut.check_page('http://dummy.com/').status == NEW
+    new_changed_at = get_changed_at()
+
+    # A new document, with the same summary
+    site.pages['http://dummy.com/'] = _page('Hello Plum!', 'plum', '<p class="b">Once upon a time</p>')
+    assert sut.check_page('http://dummy.com/').status == UNCHANGED
+    assert get_changed_at() == new_changed_at
+
+    site.pages['http://dummy.com/'] = _page('Hello Plum!', 'plum', '<p class="b">Once upon a time again</p>')
+    assert sut.check_page('http://dummy.com/').status == CHANGED
+    assert get_changed_at() > new_changed_at
+
+
+def test_monitoring_without_body_content(tmp_path: Path):
+    site = _FakeSite()
+    site.pages['http://dummy.com/'] = _page('Hello Plum!', 'plum', 'Once upon a time')
+    # Approximate analyses skip the body content
+    sut = PageMonitor(str(tmp_path / 'monitor.db'), analyser=DocAnalyser(None, approximate_above=0),
+                      conditional_fetcher=site.conditional_fetcher)
+
+    assert sut.check_page('http://dummy.com/').status == NEW
+    assert sut.get_fingerprint('http://dummy.com/').summary.page_title == 'Hello Plum!'
+    site.pages['http://dummy.com/'] = _page('Hello Plum!', 'plum fairy', 'Once upon a time')
+    assert sut.check_page('http://dummy.com/').status == CHANGED
+
+
+def test_monitoring_with_approximate_analyses(tmp_path: Path):
+    site = _FakeSite()
+    site.pages['http://dummy.com/'] = _page('Hello Plum!', 'plum', 'Once upon a time')
+    # Only the bigger bodies are analysed approximately
+    sut = PageMonitor(str(tmp_path / 'monitor.db'), analyser=DocAnalyser(None, approximate_above=200),
+                      conditional_fetcher=site.conditional_fetcher)
+    assert sut.check_page('http://dummy.com/').status == NEW
+    assert sut.get_fingerprint('http://dummy.com/').summary.skipped_fields == ()
+
+    site.pages['http://dummy.com/'] = _page('Hello Plum!', 'plum', '<p>Once upon a time</p>' * 20)
+    change = sut.check_page('http://dummy.com/')
+    assert change.status == CHANGED
+    body_change = next(field_change for field_change in change.changes if field_change.field == 'body_content')
+    assert (body_change.old, body_change.new, body_change.added) == (4, None, ())
+    summary = sut.get_fingerprint('http://dummy.com/').summary
+    assert summary.skipped_fields == ('body_content',) and summary.word_stats.word_count.value == 80
+
+    # Skipped on both sides: the text isn't compared
+    site.pages['http://dummy.com/'] = _page('Hello Plum!', 'plum', '<p>Once upon a time</p>' * 30)
+    change = sut.check_page('http://dummy.com/')
+    assert [field_change.field for field_change in change.changes] == ['doc_size']
+
+
+def test_monitoring_extras(tmp_path: Path):
+    site = _FakeSite()
+    site.pages['http://dummy.com/'] = _page('Hello Plum!', 'plum', '<h1>Once</h1><p>upon a time</p>').replace(
+        b'</head>', b'<link rel="canonical" href="/plum"></head>')
+    sut = PageMonitor(str(tmp_path / 'monitor.db'), analyser=DocAnalyser(None, extractors=('canonical_url', 'headings')),
+                      conditional_fetcher=site.conditional_fetcher)
+    assert sut.check_page('http://dummy.com/').status == NEW
+    assert sut.get_fingerprint('http://dummy.com/').summary.extras == {
+        'canonical_url': '/plum',
+        'headings': [{'level': 1, 'text': 'Once'}],
+    }
+
+    # The body was not analysed again, but its results are still there
+    site.pages['http://dummy.com/'] = site.pages['http://dummy.com/'].replace(b'/plum"', b'/fairy"')
+    assert sut.check_page('http://dummy.com/').reanalysed_sections == ('head',)
+    assert sut.get_fingerprint('http://dummy.com/').summary.extras == {
+        'canonical_url': '/fairy',
+        'headings': [{'level': 1, 'text': 'Once'}],
+    }
+
+
+def test_monitoring_pages_with_late_meta_tags(tmp_path: Path):
+    # html.parser finds them after the end of the head: the summary is the one of the whole page
+    site = _FakeSite()
+    site.pages['http://dummy.com/'] = _page('Hello Plum!', 'plum', 'Once upon a time').replace(
+        b'</body>', b'<meta name="description" content="fairy tale"><title>Late Plum</title></body>')
+    analyser = DocAnalyser(None, extractors=('headings',))
+    sut = PageMonitor(str(tmp_path / 'monitor.db'), analyser=analyser, conditional_fetcher=site.conditional_fetcher)
+
+    def assert_whole_page_summary():
+        expected = analyser.analyse_doc(site.pages['http://dummy.com/'])
+        summary = sut.get_fingerprint('http://dummy.com/').summary
+        assert summary._replace(extractor_timings=None) == expected._replace(extractor_timings=None)
+        assert summary.page_title == 'Hello Plum!' and summary.get_meta_by_name('description') is not None
+
+    assert sut.check_page('http://dummy.com/').status == NEW
+    assert_whole_page_summary()
+
+    site.pages['http://dummy.com/'] = site.pages['http://dummy.com/'].replace(b'fairy tale', b'<h1>fairy</h1> tale')
+    change = sut.check_page('http://dummy.com/')
+    assert change.reanalysed_sections == ('body',)
+    assert_whole_page_summary()
+
+
+def test_monitoring_analysis_errors(tmp_path: Path):
+    site = _FakeSite()
+    site.pages['http://dummy.com/big'] = _page('Hello Plum!', 'plum', '<p>Once upon a time</p>' * 20)
+    site.pages['http://dummy.com/small'] = _page('Hello Plum!', 'plum', 'Once upon a time')
+    sut = PageMonitor(str(tmp_path / 'monitor.db'), analyser=DocAnalyser(None, max_doc_size=200),
+                      conditional_fetcher=site.conditional_fetcher)
+
+    changes = {change.url: change for change in sut.check(site.pages)}
+
+    assert changes['http://dummy.com/big'].status == ERROR
+    assert changes['http://dummy.com/big'].error.startswith('DocTooLargeError')
+    assert sut.get_fingerprint('http://dummy.com/big') is None
+    assert changes['http://dummy.com/small'].status == NEW
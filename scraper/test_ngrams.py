@@ -0,0 +1,28 @@
+from scraper.doc_analyser import DocSummary
+from scraper.ngrams import SiteNgramStats, count_ngrams, iter_ngrams, most_common_ngrams
+
+
+def _summary(body_content: str) -> DocSummary:
+    return DocSummary(page_title='', meta_tags=[], doc_size=len(body_content), body_content=body_content, links=[])
+
+
+def test_page_ngrams():
+    summary = _summary('once upon a time there was a time machine once upon a time')
+
+    assert list(iter_ngrams(('a', 'b', 'c'), 2)) == [('a', 'b'), ('b', 'c')]
+    assert list(iter_ngrams(('a',), 2)) == []
+    assert count_ngrams(summary, 3)[('once', 'upon', 'a')] == 2
+    assert most_common_ngrams(summary, 2, 2) == [(('a', 'time'), 3), (('once', 'upon'), 2)]
+
+
+def test_site_ngram_stats():
+    sut = SiteNgramStats(sizes=(2, 3), error_rate=0.5)
+    sut.add(_summary('hello plum fairy and hello plum tree'))
+    sut.add(_summary('hello plum again'))
+
+    assert sut.pages_count == 2
+    assert sut.max_error(2) == 4
+    top_bigram = sut.most_common(2, 1)[0]
+    assert top_bigram.item == ('hello', 'plum')
+    assert top_bigram.count >= 3
+    assert len(sut.sketches[3]) == 2
@@ -0,0 +1,126 @@
+import os
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any
+from scraper.doc_analyser import ERROR_STATUS, PARSED, DocAnalyser, DocSummary, FetchResponse
+from scraper.pipeline import AnalysisPipeline
+
+
+def test_pipeline_results():
+    urls = [f'http://dummy.com/{index}' for index in range(20)] + ['http://dummy.com/broken']
+
+    sut = AnalysisPipeline(DocAnalyser(_doc_fetcher_mock), fetch_workers=4, parse_workers=2)
+    results = list(sut.run(iter(urls)))
+
+    assert sorted(result.url for result in results) == sorted(urls)
+    for result in results:
+        if result.url.endswith('/broken'):
+            assert result.summary is None and isinstance(result.error, IOError)
+        else:
+            assert result.error is None and result.summary.page_title == result.url
+
+    stats = {stage_stats.name: stage_stats for stage_stats in sut.stats()}
+    assert stats['fetch'].items == 21
+    assert stats['parse'].items == 20
+    assert stats['consume'].items == 21
+    assert 0 <= stats['fetch'].utilization <= 1
+
+
+def test_pipeline_backpressure():
+    fetched_urls = []
+    fetched_urls_lock = threading.Lock()
+
+    def doc_fetcher(url: str) -> str:
+        with fetched_urls_lock:
+            fetched_urls.append(url)
+        return _doc_fetcher_mock(url)
+
+    sut = AnalysisPipeline(DocAnalyser(doc_fetcher), fetch_workers=2, parse_workers=0,
+                           fetched_queue_size=3, results_queue_size=2)
+    results = sut.run(f'http://dummy.com/{index}' for index in range(1000))
+    next(results)
+    time.sleep(0.3)
+
+    # The consumer doesn't read anything else: the bounded queues and the fetchers fill up, and then block.
+    # (queues sizes + docs in the hands of the fetchers, the parser and the consumer)
+    assert len(fetched_urls) <= 3 + 2 + 2 + 2 + 1
+    stats = {stage_stats.name: stage_stats for stage_stats in sut.stats()}
+    assert stats['parse'].max_input_queue_depth <= 3
+
+    results.close()
+
+
+def test_pipeline_shared_bodies():
+    def doc_fetcher(url: str) -> bytes:
+        title = url.encode('utf-8')
+        filler = b' lorem ipsum' * (10_000 if url.endswith('/big') else 10)
+        return b'<html><head><title>' + title + b'</title></head><body>Once upon a time' + filler + b'</body></html>'
+
+    urls = [f'http://dummy.com/{index}/big' for index in range(4)] + [f'http://dummy.com/{index}' for index in range(4)]
+    sut = AnalysisPipeline(DocAnalyser(doc_fetcher), fetch_workers=2, parse_workers=2, share_bodies_above=10_000)
+    results = list(sut.run(urls))
+
+    for result in results:
+        assert result.error is None and result.summary.page_title == result.url
+        assert result.summary.word_count == (4 + 20_000 if result.url.endswith('/big') else 4 + 20)
+    big_size, small_size = len(doc_fetcher('http://dummy.com/0/big')), len(doc_fetcher('http://dummy.com/0'))
+    handoff_stats = sut.handoff.stats()
+    assert handoff_stats.pages == 8
+    assert handoff_stats.body_bytes == 4 * big_size + 4 * small_size
+    # Big bodies are copied once into shared memory, small ones are pickled
+    assert handoff_stats.estimated_copied_bytes == 4 * big_size + 4 * 3 * small_size
+    # All the shared memory segments were released
+    assert not list(Path('/dev/shm').glob('psm_*'))
+
+
+def test_pipeline_fetch_responses():
+    def doc_fetcher(url: str) -> FetchResponse:
+        filler = b' lorem ipsum' * (10_000 if url.endswith('/big') else 10)
+        return FetchResponse(
+            url=url, redirects=[], status_code=404 if url.endswith('/missing') else 200, content_type='text/html',
+            content=b'<html><head><title>Hello Plum!</title></head><body>Once upon a time' + filler + b'</body></html>',
+            doc_size=None, timings={'headers': 0.1, 'body': 0.2},
+        )
+
+    urls = ['http://dummy.com/big', 'http://dummy.com/small', 'http://dummy.com/missing']
+    sut = AnalysisPipeline(DocAnalyser(doc_fetcher), fetch_workers=2, parse_workers=2, share_bodies_above=10_000)
+    summaries = {result.url: result.summary for result in sut.run(urls)}
+
+    assert summaries['http://dummy.com/big'].word_count == 4 + 20_000
+    assert summaries['http://dummy.com/small'].word_count == 4 + 20
+    assert [summaries[url].outcome for url in urls] == [PARSED, PARSED, ERROR_STATUS]
+    assert summaries['http://dummy.com/big'].final_url == 'http://dummy.com/big'
+    # The error page was never handed over
+    assert sut.handoff.stats().pages == 2
+    assert not list(Path('/dev/shm').glob('psm_*'))
+
+
+def test_pipeline_dead_parse_worker():
+    urls = ['http://dummy.com/crash'] + [f'http://dummy.com/{index}' for index in range(20)]
+
+    sut = AnalysisPipeline(_CrashingDocAnalyser(_doc_fetcher_mock), fetch_workers=2, parse_workers=2)
+    results = list(sut.run(urls))
+
+    # The stream still ends: the docs lost with the pool are reported as failed
+    assert sorted(result.url for result in results) == sorted(urls)
+    crashed, = [result for result in results if result.url.endswith('/crash')]
+    assert crashed.summary is None and isinstance(crashed.error, BrokenProcessPool)
+    for result in results:
+        assert (result.summary is None) == isinstance(result.error, BrokenProcessPool)
+
+
+class _CrashingDocAnalyser(DocAnalyser):
+
+    def analyse_doc(self, html_doc: Any) -> DocSummary:
+        if '/crash' in html_doc:
+            # Like a parser segfault, or the OOM killer
+            os._exit(1)
+        return super().analyse_doc(html_doc)
+
+
+def _doc_fetcher_mock(url: str) -> str:
+    if url.endswith('/broken'):
+        raise IOError('Connection reset')
+    return f'<html><head><title>{url}</title></head><body>Once upon a time</body></html>'
@@ -0,0 +1,147 @@
+import gzip
+import os
+import pstats
+import shutil
+import threading
+import tracemalloc
+from pathlib import Path
+import pytest
+from scraper.doc_analyser import DocAnalyser
+from scraper.profiling import SlowPageProfiler, shared_memory_tracing
+
+_test_page = b'<html><head><title>Hello Plum!</title></head><body>' + b'<p>Once upon a time</p>' * 1000 + b'</body></html>'
+
+
+def test_slow_page_capture(tmp_path: Path):
+    sut = SlowPageProfiler(tmp_path, latency_threshold=0, memory_threshold=None, min_interval=0)
+    analyser = DocAnalyser(lambda url: _test_page, profiler=sut)
+
+    assert analyser.analyse('http://dummy.com/slow').word_count == 4000
+
+    assert sut.wait(timeout=10)
+    capture, = sut.captures()
+    assert capture.url == 'http://dummy.com/slow'
+    assert capture.reasons[0].startswith('latency ')
+    assert capture.doc_size == len(_test_page) and capture.seconds > 0
+    with gzip.open(capture.directory / 'page.html.gz') as page_file:
+        assert page_file.read() == _test_page
+    profile_stats = pstats.Stats(str(capture.directory / 'profile.pstats'))
+    assert any(function_name == 'analyse_doc' for _, _, function_name in profile_stats.stats)
+    assert 'Biggest allocation sites of the parse tree' in (capture.directory / 'allocations.txt').read_text()
+
+
+def test_thresholds(tmp_path: Path):
+    sut = SlowPageProfiler(tmp_path, latency_threshold=60, memory_threshold=None, min_interval=0)
+    DocAnalyser(lambda url: _test_page, profiler=sut).analyse('http://dummy.com/fast')
+    assert sut.captures() == []
+
+    # The peak memory never is below the memory at the start
+    sut = SlowPageProfiler(tmp_path, latency_threshold=None, memory_threshold=-1, min_interval=0)
+    DocAnalyser(lambda url: _test_page, profiler=sut).analyse('http://dummy.com/hungry')
+    assert sut.wait(timeout=10)
+    capture, = sut.captures()
+    assert capture.reasons[0].startswith('peak memory growth ') and capture.memory_growth >= 0
+
+
+def test_memory_hungry_page_after_a_bigger_one(tmp_path: Path):
+    # Each analysis is measured on its own: the peak memory of an earlier, bigger page doesn't hide the later ones
+    big_page = _test_page.replace(b'</body>', b'<p>Once upon a time</p>' * 8000 + b'</body>')
+    docs = {'http://dummy.com/big': big_page, 'http://dummy.com/hungry': _test_page * 4}
+    sut = SlowPageProfiler(tmp_path, latency_threshold=None, memory_threshold=1_000_000, min_interval=0)
+    analyser = DocAnalyser(docs.get, measure_memory=True, profiler=sut)
+
+    for url in docs:
+        analyser.analyse(url)
+        assert sut.wait(timeout=30)
+
+    assert [capture.url for capture in sut.captures()] == ['http://dummy.com/big', 'http://dummy.com/hungry']
+    big_capture, hungry_capture = sut.captures()
+    assert big_capture.memory_growth > hungry_capture.memory_growth > 1_000_000
+
+
+@pytest.mark.skipif(not os.path.exists('/proc/self/clear_refs'), reason='Only Linux can reset the peak resident memory')
+def test_memory_hungry_page_after_a_bigger_one_without_tracing(tmp_path: Path):
+    # Big allocations are given back to the system as soon as they are freed
+    def analyse(html_doc):
+        allocation = html_doc * 20
+        return len(allocation)
+
+    sut = SlowPageProfiler(tmp_path, latency_threshold=None, memory_threshold=25_000_000, min_interval=0)
+    for url, page in (('http://dummy.com/big', b'x' * 10_000_000), ('http://dummy.com/hungry', b'x' * 2_500_000)):
+        sut.profile(url, page, analyse)
+        assert sut.wait(timeout=30)
+
+    assert [capture.url for capture in sut.captures()] == ['http://dummy.com/big', 'http://dummy.com/hungry']
+    assert sut.captures()[1].memory_growth > 40_000_000
+
+
+def test_bounded_captures(tmp_path: Path):
+    now = [0.0]
+    sut = SlowPageProfiler(tmp_path, latency_threshold=0, max_captures=2, min_interval=10, clock=lambda: now[0])
+    analyser = DocAnalyser(lambda url: _test_page, profiler=sut)
+
+    for index in range(6):
+        analyser.analyse(f'http://dummy.com/{index}')
+        assert sut.wait(timeout=10)
+        now[0] += 5
+
+    # One capture every 10s, and only the last 2 are kept
+    assert [capture.url for capture in sut.captures()] == ['http://dummy.com/2', 'http://dummy.com/4']
+    assert sut.skipped_count == 3
+
+    sut.max_total_size = 1
+    now[0] += 10
+    analyser.analyse('http://dummy.com/big')
+    assert sut.wait(timeout=10)
+    assert [capture.url for capture in sut.captures()] == ['http://dummy.com/big']
+
+
+def test_failed_capture(tmp_path: Path):
+    sut = SlowPageProfiler(tmp_path / 'captures', latency_threshold=0, min_interval=0)
+    shutil.rmtree(tmp_path / 'captures')
+
+    # The analysis result is still there
+    assert DocAnalyser(lambda url: _test_page, profiler=sut).analyse('http://dummy.com/').page_title == 'Hello Plum!'
+    assert sut.wait(timeout=10)
+    assert isinstance(sut.last_error, FileNotFoundError)
+
+
+def test_capture_in_background(tmp_path: Path):
+    # The analysis returns without waiting for the capture, and the slow pages which come meanwhile are skipped
+    unblocked = threading.Event()
+
+    def analyse(html_doc):
+        if threading.current_thread().name == 'profile-capture':
+            unblocked.wait()
+        return len(html_doc)
+
+    sut = SlowPageProfiler(tmp_path, latency_threshold=0, min_interval=0)
+    assert sut.profile('http://dummy.com/0', _test_page, analyse) == len(_test_page)
+    assert sut.profile('http://dummy.com/1', _test_page, analyse) == len(_test_page)
+    assert not sut.wait(timeout=0.01)
+
+    unblocked.set()
+    assert sut.wait(timeout=10)
+    assert [capture.url for capture in sut.captures()] == ['http://dummy.com/0']
+    assert sut.skipped_count == 1
+
+
+def test_shared_memory_tracing(tmp_path: Path):
+    # Nested (or concurrent) users: tracing is neither reset nor stopped under the first one
+    outer_baseline = shared_memory_tracing.start()
+    allocation = bytearray(1_000_000)
+    inner_baseline = shared_memory_tracing.start()
+    del allocation
+    assert shared_memory_tracing.stop(inner_baseline) >= 0
+    assert tracemalloc.is_tracing()
+    assert shared_memory_tracing.stop(outer_baseline) >= 1_000_000
+    assert not tracemalloc.is_tracing()
+
+    # Captures don't stop the tracing of the analyses measuring their memory meanwhile
+    baseline = shared_memory_tracing.start()
+    sut = SlowPageProfiler(tmp_path, latency_threshold=0, min_interval=0)
+    DocAnalyser(lambda url: _test_page, profiler=sut).analyse('http://dummy.com/')
+    assert sut.wait(timeout=10) and len(sut.captures()) == 1
+    assert tracemalloc.is_tracing()
+    shared_memory_tracing.stop(baseline)
+    assert not tracemalloc.is_tracing()
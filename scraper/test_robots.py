@@ -0,0 +1,142 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from scraper.robots import DisallowedByRobotsError, RobotsCache, create_robots_aware_fetcher, fetch_robots_txt, \
+    parse_robots_txt
+
+_test_robots_txt = """
+# Comments are ignored
+User-agent: *
+Disallow: /admin/
+Disallow: /private
+Allow: /private/public-page.html
+Disallow: /*.pdf$
+Disallow: /search?*q=
+Crawl-delay: 0.5
+
+User-agent: PlumBot
+User-agent: OtherBot
+Disallow: /
+Allow: /blog/
+"""
+
+
+def test_parse_robots_txt():
+    sut = parse_robots_txt(_test_robots_txt, 'Mozilla/5.0')
+
+    assert sut.is_allowed('/')
+    assert sut.is_allowed('/admin')
+    assert not sut.is_allowed('/admin/users')
+    assert not sut.is_allowed('/private-notes.html')
+    assert sut.is_allowed('/private/public-page.html')
+    assert not sut.is_allowed('/docs/doc.pdf')
+    assert sut.is_allowed('/docs/doc.pdf.html')
+    assert not sut.is_allowed('/search?lang=en&q=plum')
+    assert sut.is_allowed('/search?lang=en')
+    assert sut.crawl_delay == 0.5
+
+
+def test_parse_robots_txt_user_agent_groups():
+    sut = parse_robots_txt(_test_robots_txt, 'PlumBot/1.0')
+
+    assert not sut.is_allowed('/')
+    assert not sut.is_allowed('/admin/users')
+    assert sut.is_allowed('/blog/2017/11/hello-plum.html')
+    assert sut.crawl_delay is None
+
+    assert parse_robots_txt('', 'PlumBot/1.0').is_allowed('/admin')
+    assert parse_robots_txt('User-agent: *\nDisallow:\n', 'PlumBot/1.0').is_allowed('/admin')
+
+
+def test_parse_robots_txt_overlapping_user_agents():
+    robots_txt = 'User-agent: bot\nDisallow: /bot/\n\nUser-agent: plumbot\nDisallow: /plum/\n\n' \
+                 'User-agent: plumbot\nCrawl-delay: 2\n'
+
+    sut = parse_robots_txt(robots_txt, 'PlumBot/1.0')
+
+    # Only the groups of "plumbot", not the ones of "bot"
+    assert sut.is_allowed('/bot/')
+    assert not sut.is_allowed('/plum/')
+    assert sut.crawl_delay == 2
+    # Product tokens are not matched on substrings
+    assert parse_robots_txt(robots_txt, 'OtherBot/1.0').is_allowed('/bot/')
+    assert not parse_robots_txt(robots_txt, 'BOT').is_allowed('/bot/')
+    assert not parse_robots_txt(robots_txt + '\nUser-agent: *\nDisallow: /\n', 'OtherBot/1.0').is_allowed('/bot/')
+
+
+def test_parse_robots_txt_empty_user_agent():
+    sut = parse_robots_txt('User-agent:\nDisallow: /\n\nUser-agent: *\nDisallow: /admin/\n', 'PlumBot/1.0')
+
+    assert sut.is_allowed('/blog/')
+    assert not sut.is_allowed('/admin/users')
+
+
+def test_fetch_robots_txt():
+    robots_txt = 'User-agent: *\nDisallow: /café/\n'.encode('utf-8')
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            # Without a charset, requests guesses ISO-8859-1
+            self.send_header('Content-Type', 'text/plain')
+            self.send_header('Content-Length', str(len(robots_txt)))
+            self.end_headers()
+            self.wfile.write(robots_txt)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.01}, daemon=True).start()
+    try:
+        content, status_code = fetch_robots_txt(f'http://127.0.0.1:{server.server_address[1]}/robots.txt', 'PlumBot')
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert (content, status_code) == ('User-agent: *\nDisallow: /café/\n', 200)
+
+
+def test_robots_cache():
+    fetched_robots_urls = []
+
+    def robots_fetcher(robots_url: str, user_agent: str):
+        fetched_robots_urls.append(robots_url)
+        time.sleep(0.05)
+        if 'down.com' in robots_url:
+            return None, 503
+        if 'none.com' in robots_url:
+            return None, 404
+        return _test_robots_txt, 200
+
+    sut = RobotsCache(user_agent='Mozilla/5.0', robots_fetcher=robots_fetcher)
+
+    threads = [threading.Thread(target=sut.is_allowed, args=(f'http://dummy.com/page-{index}',)) for index in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sut.is_allowed('http://dummy.com/')
+    assert not sut.is_allowed('http://dummy.com/admin/users')
+    assert sut.crawl_delay('http://dummy.com/') == 0.5
+    assert fetched_robots_urls == ['http://dummy.com/robots.txt']
+
+    # Missing robots.txt: everything is allowed, unavailable robots.txt: nothing is
+    assert sut.is_allowed('http://none.com/admin/users')
+    assert not sut.is_allowed('http://down.com/')
+
+
+def test_robots_aware_fetcher():
+    robots_cache = RobotsCache(user_agent='Mozilla/5.0', robots_fetcher=lambda url, user_agent: (_test_robots_txt, 200))
+    sut = create_robots_aware_fetcher(lambda url: f'<html>{url}</html>', robots_cache)
+
+    with pytest.raises(DisallowedByRobotsError):
+        sut('http://dummy.com/admin/users')
+
+    # Crawl-delay: 0.5
+    started_at = time.monotonic()
+    assert sut('http://dummy.com/') == '<html>http://dummy.com/</html>'
+    sut('http://dummy.com/about')
+    sut('http://dummy.com/contact')
+    assert time.monotonic() - started_at >= 1
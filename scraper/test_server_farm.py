@@ -0,0 +1,49 @@
+import requests
+from scraper.doc_analyser import ERROR_STATUS
+from scraper.load_testing import run_load_test
+from scraper.server_farm import REDIRECTED, RESET, SERVED, SERVER_ERROR, STALLED, HostProfile, ServerFarm, mixed_profiles
+
+
+def test_server_farm_failures():
+    profiles = [
+        HostProfile(latency=0.001, redirect_rate=1, max_redirects=1),
+        HostProfile(latency=0.001, error_rate=1),
+        HostProfile(latency=0.001, reset_rate=1),
+        HostProfile(latency=0.001, stall_rate=1, stall_duration=2),
+    ]
+
+    with ServerFarm(profiles, pages_per_host=3, page_size=2_000) as farm:
+        report = run_load_test(farm, workers=4, timeout=0.5)
+
+    assert report.pages == 12
+    # Only the pages behind redirects make it
+    assert report.analysed == 3
+    # 503 responses are not parsed, and stalls time out in the middle of the body
+    assert report.unparsed == {ERROR_STATUS: 3}
+    assert report.errors == {'ConnectionError': 6}
+    assert report.server_outcomes == {REDIRECTED: 3, SERVED: 3, SERVER_ERROR: 3, RESET: 3, STALLED: 3}
+    assert report.latency_percentiles[100] >= 0.5
+    assert report.received_bytes > 3 * 2_000
+
+
+def test_server_farm_bandwidth():
+    with ServerFarm([HostProfile(latency=0.001, bandwidth=100_000)], pages_per_host=1, page_size=20_000) as farm:
+        response = requests.get(farm.urls()[0])
+
+    assert response.status_code == 200
+    # About 20 KB at 100 KB/s
+    assert response.elapsed.total_seconds() < 0.1 < len(response.content) / 100_000
+
+
+def test_server_farm_is_reproducible():
+    profiles = [HostProfile(latency=0.001, error_rate=0.3, reset_rate=0.2, redirect_rate=0.5, max_redirects=3)] * 3
+
+    reports = []
+    for _ in range(2):
+        with ServerFarm(profiles, pages_per_host=10, page_size=1_000, seed=42) as farm:
+            reports.append(run_load_test(farm, workers=4, timeout=5))
+
+    assert reports[0].errors == reports[1].errors and reports[0].errors
+    assert reports[0].server_outcomes == reports[1].server_outcomes
+    assert reports[0].analysed == reports[1].analysed > 0
+    assert mixed_profiles(50, seed=1) == mixed_profiles(50, seed=1) != mixed_profiles(50, seed=2)
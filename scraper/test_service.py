@@ -0,0 +1,112 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Iterator, List
+import pytest
+import requests
+from scraper.doc_analyser import DocAnalyser, DocSummary
+from scraper.service import AnalysisService, create_server
+
+
+@pytest.fixture
+def fetched_urls() -> List[str]:
+    return []
+
+
+@pytest.fixture
+def service(fetched_urls: List[str]) -> Iterator[AnalysisService]:
+    def doc_fetcher(url: str) -> str:
+        fetched_urls.append(url)
+        if url.endswith('/broken'):
+            raise requests.ConnectionError('Connection reset')
+        time.sleep(0.1)
+        return f'<html><head><title>{url}</title><meta name="keywords" content="once time fairy"></head>' \
+               f'<body>Once upon a time once</body></html>'
+
+    service = AnalysisService(DocAnalyser(doc_fetcher), workers=2, cache_ttl=60)
+    yield service
+    service.shutdown()
+
+
+@pytest.fixture
+def service_url(service: AnalysisService) -> Iterator[str]:
+    server = create_server(service, port=0)
+    threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.01}, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+def test_analyse(service: AnalysisService, fetched_urls: List[str]):
+    response = json.loads(service.analyse('http://dummy.com'))
+
+    assert response['page_title'] == 'http://dummy.com'
+    assert response['word_count'] == 5
+    assert response['missing_meta_keywords'] == ['fairy']
+    assert 'body_content' not in response
+    assert json.loads(service.analyse('http://dummy.com', include_body=True))['body_content'] == 'Once upon a time once'
+
+
+def test_request_coalescing_and_cache(service: AnalysisService, fetched_urls: List[str]):
+    responses = []
+    threads = [threading.Thread(target=lambda: responses.append(service.analyse('http://dummy.com')))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    responses.append(service.analyse('http://dummy.com'))
+
+    assert len(set(responses)) == 1
+    assert fetched_urls == ['http://dummy.com']
+    metrics = service.metrics()
+    assert metrics['requests'] == 6
+    assert metrics['coalesced_requests'] + service.cache.hits == 5
+
+
+def test_http_api(service_url: str):
+    response = requests.get(f'{service_url}/analyse', params={'url': 'http://dummy.com/'})
+    assert response.status_code == 200
+    assert response.json()['page_title'] == 'http://dummy.com/'
+
+    assert requests.get(f'{service_url}/analyse', params={'url': 'dummy.com'}).status_code == 400
+    assert requests.get(f'{service_url}/analyse', params={'url': 'http://dummy.com/broken'}).status_code == 502
+    assert requests.get(f'{service_url}/unknown').status_code == 404
+
+    metrics = requests.get(f'{service_url}/metrics').json()
+    assert metrics['requests'] == 2
+    assert metrics['errors'] == 1
+    assert metrics['latency_ms']['p50'] > 0
+    assert metrics['queue_depth'] == 0
+
+
+def test_broken_parsing_pool():
+    def doc_fetcher(url: str) -> str:
+        return f'<html><head><title>{url}</title></head><body>Once upon a time</body></html>'
+
+    service = AnalysisService(_CrashingDocAnalyser(doc_fetcher), workers=2, parse_processes=2)
+    try:
+        assert json.loads(service.analyse('http://dummy.com/0'))['page_title'] == 'http://dummy.com/0'
+
+        # Workers killed from outside (OOM killer): the page is parsed again in a new pool
+        for process in list(service._parsing_pool._processes.values()):
+            process.kill()
+        assert json.loads(service.analyse('http://dummy.com/1'))['page_title'] == 'http://dummy.com/1'
+
+        # A page which kills every worker fails, but not the requests after it
+        with pytest.raises(BrokenProcessPool):
+            service.analyse('http://dummy.com/crash')
+        assert json.loads(service.analyse('http://dummy.com/2'))['page_title'] == 'http://dummy.com/2'
+    finally:
+        service.shutdown()
+
+
+class _CrashingDocAnalyser(DocAnalyser):
+
+    def analyse_doc(self, html_doc: Any) -> DocSummary:
+        if '/crash' in html_doc:
+            # Like a parser segfault
+            os._exit(1)
+        return super().analyse_doc(html_doc)
@@ -0,0 +1,141 @@
+import gzip
+import threading
+from datetime import datetime, timezone, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import pytest
+import requests
+import urllib3
+from scraper.sitemap import iter_sitemap_entries, iter_sitemap_urls, open_sitemap_stream, parse_w3c_datetime
+
+
+def test_iter_sitemap_entries(tmp_path: Path):
+    sitemap_file = tmp_path / 'sitemap.xml'
+    sitemap_file.write_text(_sitemap_content(('http://dummy.com/', '2017-11-05'), ('http://dummy.com/about', None)))
+
+    entries = list(iter_sitemap_entries(str(sitemap_file)))
+
+    assert entries[0].loc == 'http://dummy.com/'
+    assert entries[0].lastmod == datetime(2017, 11, 5, tzinfo=timezone.utc)
+    assert entries[1].loc == 'http://dummy.com/about'
+    assert entries[1].lastmod is None
+
+
+def test_iter_gzipped_sitemap_index(tmp_path: Path):
+    (tmp_path / 'sitemap-pages.xml.gz').write_bytes(gzip.compress(
+        _sitemap_content(('http://dummy.com/', None), ('http://dummy.com/about', None)).encode()
+    ))
+    # Gzipped content is detected even without a ".gz" extension
+    (tmp_path / 'sitemap-posts.xml').write_bytes(gzip.compress(
+        _sitemap_content(('http://dummy.com/posts/1', None),).encode()
+    ))
+    sitemap_index_file = tmp_path / 'sitemap.xml'
+    sitemap_index_file.write_text(_sitemap_index_content(
+        ((tmp_path / 'sitemap-pages.xml.gz').as_uri(), None),
+        ((tmp_path / 'sitemap-posts.xml').as_uri(), None),
+    ))
+
+    assert list(iter_sitemap_urls(sitemap_index_file.as_uri())) == [
+        'http://dummy.com/', 'http://dummy.com/about', 'http://dummy.com/posts/1',
+    ]
+
+
+def test_lastmod_filtering(tmp_path: Path):
+    (tmp_path / 'sitemap-old.xml').write_text(_sitemap_content(('http://dummy.com/old/1', '2017-01-01'),))
+    (tmp_path / 'sitemap-new.xml').write_text(_sitemap_content(
+        ('http://dummy.com/new/1', '2017-11-05T19:20:30+01:00'),
+        ('http://dummy.com/new/2', '2017-06-01'),
+        ('http://dummy.com/new/3', None),
+    ))
+    sitemap_index_file = tmp_path / 'sitemap.xml'
+    sitemap_index_file.write_text(_sitemap_index_content(
+        ((tmp_path / 'sitemap-old.xml').as_uri(), '2017-01-01'),
+        ((tmp_path / 'sitemap-new.xml').as_uri(), '2017-11-05'),
+    ))
+
+    urls = list(iter_sitemap_urls(sitemap_index_file.as_uri(), modified_since=datetime(2017, 10, 1)))
+
+    assert urls == ['http://dummy.com/new/1', 'http://dummy.com/new/3']
+
+
+def test_invalid_lastmod(tmp_path: Path):
+    sitemap_file = tmp_path / 'sitemap.xml'
+    sitemap_file.write_text(_sitemap_content(
+        ('http://dummy.com/1', '2017-13-45'),
+        ('http://dummy.com/2', '2017-11-05T25:00Z'),
+        ('http://dummy.com/3', '2017-01-01'),
+    ))
+
+    entries = list(iter_sitemap_entries(str(sitemap_file), modified_since=datetime(2017, 10, 1)))
+
+    # Unknown dates: the pages may have changed
+    assert [(entry.loc, entry.lastmod) for entry in entries] == [('http://dummy.com/1', None), ('http://dummy.com/2', None)]
+
+
+def test_sitemap_index_cycles(tmp_path: Path):
+    sitemap_index_file = tmp_path / 'sitemap.xml'
+    other_index_file = tmp_path / 'sitemap-other.xml'
+    pages_file = tmp_path / 'sitemap-pages.xml'
+    pages_file.write_text(_sitemap_content(('http://dummy.com/', None),))
+    sitemap_index_file.write_text(_sitemap_index_content(
+        (sitemap_index_file.as_uri(), None), (other_index_file.as_uri(), None), (pages_file.as_uri(), None),
+    ))
+    other_index_file.write_text(_sitemap_index_content((sitemap_index_file.as_uri(), None), (pages_file.as_uri(), None)))
+
+    assert list(iter_sitemap_urls(sitemap_index_file.as_uri())) == ['http://dummy.com/']
+
+
+def test_stalled_sitemap_timeout():
+    stalled_responses_released = threading.Event()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            # The headers and the start of the sitemap come, but not the rest
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/xml')
+            self.end_headers()
+            self.wfile.write(_sitemap_content(('http://dummy.com/', None)).encode('utf-8')[:100])
+            self.wfile.flush()
+            stalled_responses_released.wait(timeout=10)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.01}, daemon=True).start()
+    try:
+        with pytest.raises((requests.Timeout, requests.ConnectionError, urllib3.exceptions.ReadTimeoutError)):
+            list(iter_sitemap_urls(
+                f'http://127.0.0.1:{server.server_address[1]}/sitemap.xml',
+                opener=lambda location: open_sitemap_stream(location, timeout=0.2),
+            ))
+    finally:
+        stalled_responses_released.set()
+        server.shutdown()
+        server.server_close()
+
+
+def test_parse_w3c_datetime():
+    assert parse_w3c_datetime('2017-11-05') == datetime(2017, 11, 5, tzinfo=timezone.utc)
+    assert parse_w3c_datetime('2017-11-05T19:20Z') == datetime(2017, 11, 5, 19, 20, tzinfo=timezone.utc)
+    assert parse_w3c_datetime('2017-11-05T19:20:30.45+01:00') == \
+        datetime(2017, 11, 5, 19, 20, 30, tzinfo=timezone(timedelta(hours=1)))
+    assert parse_w3c_datetime('last week') is None
+    assert parse_w3c_datetime('2017-02-30') is None
+    assert parse_w3c_datetime('2017-11-05T19:20+25:00') is None
+
+
+def _sitemap_content(*entries: tuple) -> str:
+    urls = ''.join(
+        f'<url><loc>{loc}</loc>' + (f'<lastmod>{lastmod}</lastmod>' if lastmod else '') + '</url>'
+        for loc, lastmod in entries
+    )
+    return f'<?xml version="1.0" encoding="UTF-8"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{urls}</urlset>'
+
+
+def _sitemap_index_content(*entries: tuple) -> str:
+    sitemaps = ''.join(
+        f'<sitemap><loc>{loc}</loc>' + (f'<lastmod>{lastmod}</lastmod>' if lastmod else '') + '</sitemap>'
+        for loc, lastmod in entries
+    )
+    return f'<?xml version="1.0" encoding="UTF-8"?><sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{sitemaps}</sitemapindex>'
@@ -0,0 +1,120 @@
+import random
+from collections import Counter
+import pytest
+from scraper.sketches import BloomFilter, HyperLogLog, LogHistogram, SpaceSaving, hash64
+
+
+def test_space_saving():
+    rng = random.Random(42)
+    # Zipf-like stream: a few heavy hitters, and a long tail of rare items
+    stream = [f'word-{int(rng.paretovariate(1))}' for _ in range(20_000)]
+    exact_counts = Counter(stream)
+    sut = SpaceSaving.for_error_rate(0.01)
+    for item in stream:
+        sut.add(item)
+
+    assert sut.capacity == 100
+    assert len(sut) == 100
+    assert sut.max_error == 200
+    for heavy_hitter in sut.most_common(10):
+        assert heavy_hitter.guaranteed_count <= exact_counts[heavy_hitter.item] <= heavy_hitter.count
+        assert heavy_hitter.count - exact_counts[heavy_hitter.item] <= sut.max_error
+    assert [hh.item for hh in sut.most_common(5)] == [item for item, count in exact_counts.most_common(5)]
+
+    with pytest.raises(ValueError):
+        SpaceSaving.for_error_rate(0)
+
+
+def test_hyper_log_log():
+    sut = HyperLogLog(precision=12)
+    assert sut.count() == 0
+
+    for index in range(100):
+        sut.add(f'word-{index}')
+        sut.add(f'word-{index}')
+    # Small cardinalities are almost exact
+    assert 98 <= sut.count() <= 102
+
+    for index in range(100_000):
+        sut.add(f'word-{index}')
+    assert sut.standard_error == pytest.approx(0.01625)
+    assert abs(sut.count() - 100_000) <= 3 * sut.standard_error * 100_000
+
+    with pytest.raises(ValueError):
+        HyperLogLog(precision=20)
+
+
+def test_hash64():
+    assert hash64('plum') == hash64('plum') != hash64('Plum')
+    assert 0 <= hash64('plum') < 2 ** 64
+
+
+def test_space_saving_merge():
+    rng = random.Random(42)
+    streams = [[f'word-{int(rng.paretovariate(1))}' for _ in range(10_000)] for _ in range(3)]
+    sketches = []
+    for stream in streams:
+        sketch = SpaceSaving(100)
+        sketch.update(Counter(stream))
+        sketches.append(sketch)
+    exact_counts = Counter(item for stream in streams for item in stream)
+
+    sut = sketches[0].merge(sketches[1]).merge(sketches[2])
+
+    assert sut.total == 30_000
+    assert len(sut) == 100
+    for heavy_hitter in sut.most_common(20):
+        assert heavy_hitter.guaranteed_count <= exact_counts[heavy_hitter.item] <= heavy_hitter.count
+        assert heavy_hitter.count - exact_counts[heavy_hitter.item] <= sut.max_error
+    assert [hh.item for hh in sut.most_common(5)] == [item for item, count in exact_counts.most_common(5)]
+    # The merge order doesn't matter (beyond the error bounds)
+    other_order = sketches[2].merge(sketches[0].merge(sketches[1]))
+    assert [hh.item for hh in other_order.most_common(5)] == [hh.item for hh in sut.most_common(5)]
+
+    assert SpaceSaving.from_dict(sut.to_dict()).most_common(100) == sut.most_common(100)
+    with pytest.raises(ValueError):
+        sut.merge(SpaceSaving(10))
+
+
+def test_hyper_log_log_merge():
+    first, second, both = HyperLogLog(10), HyperLogLog(10), HyperLogLog(10)
+    first.update(f'word-{index}' for index in range(5000))
+    second.update(f'word-{index}' for index in range(2500, 10_000))
+    both.update(f'word-{index}' for index in range(10_000))
+
+    assert first.merge(second).count() == both.count()
+    assert HyperLogLog.from_dict(both.to_dict()).count() == both.count()
+    with pytest.raises(ValueError):
+        first.merge(HyperLogLog(12))
+
+
+def test_log_histogram():
+    first, second = LogHistogram(), LogHistogram()
+    for value in (0, 1, 3, 3, 100):
+        first.add(value)
+    second.add(5000)
+
+    sut = LogHistogram.from_dict(first.merge(second).to_dict())
+
+    assert sut.count == 6
+    assert sut.mean == 5107 / 6
+    assert sut.buckets() == [(0, 1, 1), (1, 2, 1), (2, 4, 2), (64, 128, 1), (4096, 8192, 1)]
+    assert sut.quantile(0.5) == 4
+    assert sut.quantile(1) == 8192
+
+
+def test_bloom_filter():
+    sut = BloomFilter(capacity=10_000, error_rate=0.01)
+    sut.update(f'http://dummy.com/{index}' for index in range(10_000))
+
+    assert all(f'http://dummy.com/{index}' in sut for index in range(10_000))
+    false_positives_count = sum(f'http://other.com/{index}' in sut for index in range(10_000))
+    assert false_positives_count <= 150
+
+    other = BloomFilter(capacity=10_000, error_rate=0.01)
+    other.add('http://other.com/1')
+    merged = sut.merge(other)
+    assert 'http://other.com/1' in merged and 'http://dummy.com/1' in merged
+
+    with pytest.raises(ValueError):
+        BloomFilter(capacity=10_000, error_rate=0.01, bits=bytearray(10))
@@ -0,0 +1,31 @@
+from bs4 import BeautifulSoup
+from scraper.visible_text import get_visible_text, strip_tags
+
+
+def test_get_visible_text():
+    html_doc = (
+        '<!DOCTYPE html><html><head><title>Hello Plum!</title><style>p { color: plum; }</style></head><body>'
+        '<script>var sisters = ["Elsie", "Lacie", "Tillie"];</script><noscript>Please enable JavaScript</noscript>'
+        '<h1>Once upon a time</h1><p>there were <b>three</b> little<br>sisters</p><!-- Elsie, Lacie and Tillie -->'
+        '<template><p>and their names were</p></template><ul><li>Elsie</li><li>Lacie</li></ul>and Tillie</body></html>'
+    )
+
+    sut = get_visible_text(BeautifulSoup(html_doc, 'html.parser'))
+
+    assert sut.split() == ['Once', 'upon', 'a', 'time', 'there', 'were', 'three', 'little', 'sisters', 'Elsie', 'Lacie',
+                           'and', 'Tillie']
+    # Words of different blocks are never glued together
+    assert 'time\n\nthere' in sut and 'little\n\nsisters' in sut and 'Elsie\n\nLacie' in sut
+
+
+def test_get_visible_text_without_head_end():
+    # html.parser puts the <body> inside the unclosed <head>
+    html_doc = '<html><head><title>Hello Plum!</title><body><p>Once upon a time</p></body></html>'
+
+    assert get_visible_text(BeautifulSoup(html_doc, 'html.parser')).split() == ['Once', 'upon', 'a', 'time']
+
+
+def test_strip_tags():
+    assert strip_tags('<p>Once upon a <b>time</b></p><p>there were</p>three<br/>little sisters').split() == \
+        ['Once', 'upon', 'a', 'time', 'there', 'were', 'three', 'little', 'sisters']
+    assert strip_tags('a < b &amp;&nbsp;c&gt;d').split() == ['a', '<', 'b', '&', 'c>d']
@@ -0,0 +1,74 @@
+from pathlib import Path
+from scraper.doc_analyser import DocAnalyser
+from scraper.work_queue import QueueStats, SqliteWorkQueue, run_worker, wait_until_drained
+
+
+def test_lease_and_ack(tmp_path: Path):
+    sut = SqliteWorkQueue(str(tmp_path / 'queue.db'))
+
+    assert sut.enqueue(['http://dummy.com/1', 'http://dummy.com/2', 'http://dummy.com/3']) == 3
+    # Already enqueued URLs are ignored
+    assert sut.enqueue(['http://dummy.com/1']) == 0
+
+    leased_urls = sut.lease('worker-1', batch_size=2, lease_duration=60)
+    assert leased_urls == ['http://dummy.com/1', 'http://dummy.com/2']
+    assert sut.lease('worker-2', batch_size=2, lease_duration=60) == ['http://dummy.com/3']
+    assert sut.lease('worker-3', batch_size=2, lease_duration=60) == []
+
+    summary = DocAnalyser(_doc_fetcher_mock).analyse('http://dummy.com/1')
+    assert sut.ack('worker-1', 'http://dummy.com/1', summary)
+    assert not sut.ack('worker-2', 'http://dummy.com/2', summary)
+
+    assert sut.stats() == QueueStats(pending=0, leased=2, done=1, failed=0)
+    assert [(url, result.page_title) for url, result in sut.results()] == [('http://dummy.com/1', 'http://dummy.com/1')]
+
+
+def test_expired_leases_are_reclaimed(tmp_path: Path):
+    now = [1000.0]
+    sut = SqliteWorkQueue(str(tmp_path / 'queue.db'), max_attempts=2, clock=lambda: now[0])
+    sut.enqueue(['http://dummy.com/1'])
+
+    assert sut.lease('crashed-worker', batch_size=10, lease_duration=60) == ['http://dummy.com/1']
+    now[0] += 30
+    assert sut.lease('worker-2', batch_size=10, lease_duration=60) == []
+    now[0] += 31
+    # Even before another worker leases it again
+    assert sut.stats() == QueueStats(pending=1, leased=0, done=0, failed=0)
+    assert sut.lease('worker-2', batch_size=10, lease_duration=60) == ['http://dummy.com/1']
+
+    # The crashed worker lost its lease
+    summary = DocAnalyser(_doc_fetcher_mock).analyse('http://dummy.com/1')
+    assert not sut.ack('crashed-worker', 'http://dummy.com/1', summary)
+
+    # ...and once the max attempts count is reached the URL is marked as failed: the queue drains, even without any
+    # worker left
+    now[0] += 61
+    assert sut.stats() == QueueStats(pending=0, leased=0, done=0, failed=1)
+    assert wait_until_drained(sut, poll_interval=0, timeout=1).is_drained
+    assert sut.lease('worker-3', batch_size=10, lease_duration=60) == []
+    assert sut.stats() == QueueStats(pending=0, leased=0, done=0, failed=1)
+
+
+def test_run_worker(tmp_path: Path):
+    db_path = str(tmp_path / 'queue.db')
+    coordinator_queue = SqliteWorkQueue(db_path, max_attempts=2)
+    urls = [f'http://dummy.com/{index}' for index in range(25)] + ['http://dummy.com/broken']
+    coordinator_queue.enqueue(urls)
+
+    worker_results = []
+    processed_count = run_worker(SqliteWorkQueue(db_path, max_attempts=2), DocAnalyser(_doc_fetcher_mock),
+                                 'worker-1', batch_size=4, poll_interval=0,
+                                 on_result=lambda url, summary: worker_results.append(url))
+
+    # The broken URL is tried twice
+    assert processed_count == 27
+    assert coordinator_queue.stats() == QueueStats(pending=0, leased=0, done=25, failed=1)
+    assert sorted(url for url, _ in coordinator_queue.results()) == sorted(urls[:-1])
+    assert sorted(url for url, _ in coordinator_queue.results(page_size=3)) == sorted(worker_results) == sorted(urls[:-1])
+    assert list(coordinator_queue.failures()) == [('http://dummy.com/broken', 'OSError: Connection reset')]
+
+
+def _doc_fetcher_mock(url: str) -> str:
+    if url.endswith('/broken'):
+        raise IOError('Connection reset')
+    return f'<html><head><title>{url}</title></head><body>Once upon a time</body></html>'
@@ -0,0 +1,53 @@
+import html
+import re
+from typing import List
+from bs4 import BeautifulSoup, NavigableString, Tag
+from bs4.element import PreformattedString
+
+# Their content is never rendered as text. Not the <head> as a whole: when its end tag is missing, html.parser puts
+# the whole <body> in it (browsers close it implicitly), and its own content is made of these elements anyway.
+INVISIBLE_ELEMENTS = frozenset(('title', 'script', 'style', 'noscript', 'template'))
+# Browsers render them on their own lines: their text is never part of the words around them
+BLOCK_ELEMENTS = frozenset((
+    'address', 'article', 'aside', 'blockquote', 'br', 'caption', 'dd', 'details', 'dialog', 'div', 'dl', 'dt',
+    'fieldset', 'figcaption', 'figure', 'footer', 'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr', 'li',
+    'main', 'nav', 'ol', 'option', 'p', 'pre', 'section', 'summary', 'table', 'tbody', 'td', 'tfoot', 'th', 'thead',
+    'tr', 'ul',
+))
+
+# Quoted attribute values may contain ">"
+_TAG_ATTRIBUTES = r'(?:[^>"\']|"[^"]*"|\'[^\']*\')*'
+# Like html.parser, a "<" which is not followed by a tag name (or "/", "!", "?") is just text
+TAG_PATTERN = re.compile(rf'<[a-zA-Z/!?]{_TAG_ATTRIBUTES}>')
+_BLOCK_TAG_PATTERN = re.compile(rf'</?(?:{"|".join(sorted(BLOCK_ELEMENTS))})\b{_TAG_ATTRIBUTES}>', re.IGNORECASE)
+
+
+def get_visible_text(soup: BeautifulSoup) -> str:
+    # Unlike `soup.get_text()`, the text of invisible elements (title, scripts, styles...) is skipped - whole
+    # subtrees at once, so that their text is never even joined - and block elements are separated by line breaks.
+    texts: List[str] = []
+    # Stack of the elements being walked, with an iterator on their children
+    stack = [(soup, iter(soup.contents))]
+    while stack:
+        element, children = stack[-1]
+        child = next(children, None)
+        if child is None:
+            stack.pop()
+            if element.name in BLOCK_ELEMENTS:
+                texts.append('\n')
+        elif isinstance(child, Tag):
+            if child.name in INVISIBLE_ELEMENTS:
+                continue
+            if child.name in BLOCK_ELEMENTS:
+                texts.append('\n')
+            stack.append((child, iter(child.contents)))
+        # Comments, doctypes, CDATA sections... are not text either
+        elif isinstance(child, NavigableString) and not isinstance(child, PreformattedString):
+            texts.append(child)
+    return ''.join(texts)
+
+
+def strip_tags(markup: str) -> str:
+    # Regex-based equivalent, for markup which is not parsed into a tree (without its invisible elements and
+    # comments), with its character references decoded
+    return html.unescape(TAG_PATTERN.sub('', _BLOCK_TAG_PATTERN.sub('\n', markup)))
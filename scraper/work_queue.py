@@ -0,0 +1,221 @@
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+from scraper.doc_analyser import DocAnalyser, DocSummary
+
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class QueueStats(NamedTuple):
+    pending: int
+    leased: int
+    done: int
+    failed: int
+
+    @property
+    def is_drained(self) -> bool:
+        return self.pending == 0 and self.leased == 0
+
+
+class WorkQueue(ABC):
+    # Queue backends only have to implement these few operations, so that the coordinator and the workers
+    # don't care whether the queue is a local SQLite file or a shared store.
+
+    @abstractmethod
+    def enqueue(self, urls: Iterable[str]) -> int:
+        pass
+
+    @abstractmethod
+    def lease(self, worker_id: str, batch_size: int, lease_duration: float) -> List[str]:
+        pass
+
+    @abstractmethod
+    def ack(self, worker_id: str, url: str, summary: DocSummary) -> bool:
+        pass
+
+    @abstractmethod
+    def fail(self, worker_id: str, url: str, error: str) -> bool:
+        pass
+
+    @abstractmethod
+    def stats(self) -> QueueStats:
+        pass
+
+    @abstractmethod
+    def results(self) -> Iterator[Tuple[str, DocSummary]]:
+        pass
+
+    @abstractmethod
+    def failures(self) -> Iterator[Tuple[str, str]]:
+        pass
+
+
+class SqliteWorkQueue(WorkQueue):
+    # Fine for several worker processes on one box (or on a filesystem with reliable locking): SQLite
+    # serialises the lease transactions for us.
+
+    def __init__(self, db_path: str, max_attempts: int = 3, clock: Callable[[], float] = time.time):
+        self.max_attempts = max_attempts
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS work_items (
+                url TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                worker_id TEXT,
+                lease_expires_at REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT
+            )
+        """)
+        self._db.execute('CREATE INDEX IF NOT EXISTS work_items_state ON work_items (state, lease_expires_at)')
+
+    def enqueue(self, urls: Iterable[str]) -> int:
+        enqueued_count = 0
+        with self._lock, self._transaction():
+            for url in urls:
+                cursor = self._db.execute(
+                    'INSERT OR IGNORE INTO work_items (url, state) VALUES (?, ?)', (url, PENDING)
+                )
+                enqueued_count += cursor.rowcount
+        return enqueued_count
+
+    def lease(self, worker_id: str, batch_size: int, lease_duration: float) -> List[str]:
+        now = self._clock()
+        with self._lock, self._transaction():
+            # Expired leases are the ones of crashed (or very slow) workers: their URLs go back to the pool,
+            # unless they already used up all their attempts.
+            self._db.execute(
+                'UPDATE work_items SET state = ?, worker_id = NULL, error = ? '
+                'WHERE state = ? AND lease_expires_at < ? AND attempts >= ?',
+                (FAILED, 'Lease expired too many times', LEASED, now, self.max_attempts)
+            )
+            urls = [row[0] for row in self._db.execute(
+                'SELECT url FROM work_items WHERE state = ? OR (state = ? AND lease_expires_at < ?) LIMIT ?',
+                (PENDING, LEASED, now, batch_size)
+            )]
+            self._db.executemany(
+                'UPDATE work_items SET state = ?, worker_id = ?, lease_expires_at = ?, attempts = attempts + 1 '
+                'WHERE url = ?',
+                [(LEASED, worker_id, now + lease_duration, url) for url in urls]
+            )
+        return urls
+
+    def ack(self, worker_id: str, url: str, summary: DocSummary) -> bool:
+        # Only the current lease holder can complete an item: a worker whose lease expired and was taken over
+        # by another worker gets `False` back.
+        with self._lock:
+            cursor = self._db.execute(
+                'UPDATE work_items SET state = ?, worker_id = NULL, lease_expires_at = NULL, result = ?, error = NULL '
+                'WHERE url = ? AND state = ? AND worker_id = ?',
+                (DONE, json.dumps(summary.to_dict()), url, LEASED, worker_id)
+            )
+        return cursor.rowcount == 1
+
+    def fail(self, worker_id: str, url: str, error: str) -> bool:
+        # Failed URLs go back to the pool for another lease, until they reach `max_attempts`
+        with self._lock:
+            cursor = self._db.execute(
+                'UPDATE work_items SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END, '
+                'worker_id = NULL, lease_expires_at = NULL, error = ? '
+                'WHERE url = ? AND state = ? AND worker_id = ?',
+                (self.max_attempts, FAILED, PENDING, error, url, LEASED, worker_id)
+            )
+        return cursor.rowcount == 1
+
+    def stats(self) -> QueueStats:
+        # Expired leases are counted as the next `lease()` will see them: pending again, or failed once they used up
+        # all their attempts. Otherwise the leases of workers which all crashed would never let the queue drain.
+        with self._lock:
+            counts = dict(self._db.execute(
+                'SELECT CASE WHEN state = ? AND lease_expires_at < ? '
+                'THEN CASE WHEN attempts >= ? THEN ? ELSE ? END ELSE state END AS current_state, COUNT(*) '
+                'FROM work_items GROUP BY current_state',
+                (LEASED, self._clock(), self.max_attempts, FAILED, PENDING)
+            ).fetchall())
+        return QueueStats(**{state: counts.get(state, 0) for state in (PENDING, LEASED, DONE, FAILED)})
+
+    def results(self, page_size: int = 1000) -> Iterator[Tuple[str, DocSummary]]:
+        # Page by page, so that huge queues never have all their results in memory
+        last_rowid = 0
+        while True:
+            with self._lock:
+                rows = self._db.execute(
+                    'SELECT rowid, url, result FROM work_items WHERE state = ? AND rowid > ? ORDER BY rowid LIMIT ?',
+                    (DONE, last_rowid, page_size)
+                ).fetchall()
+            if not rows:
+                return
+            for last_rowid, url, result in rows:
+                yield url, DocSummary.from_dict(json.loads(result))
+
+    def failures(self) -> Iterator[Tuple[str, str]]:
+        with self._lock:
+            rows = self._db.execute('SELECT url, error FROM work_items WHERE state = ?', (FAILED,)).fetchall()
+        yield from rows
+
+    def close(self) -> None:
+        self._db.close()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[None]:
+        # "IMMEDIATE" takes the write lock right away, so that two workers can't lease the same URLs
+        self._db.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            self._db.execute('ROLLBACK')
+            raise
+        self._db.execute('COMMIT')
+
+
+def run_worker(
+    queue: WorkQueue,
+    analyser: DocAnalyser,
+    worker_id: str,
+    batch_size: int = 10,
+    lease_duration: float = 300,
+    poll_interval: float = 1,
+    stop_when_drained: bool = True,
+    on_result: Optional[Callable[[str, DocSummary], None]] = None,
+) -> int:
+    # `on_result` sees every summary this worker produced, e.g. to build its share of a `SiteReport`
+    processed_count = 0
+    while True:
+        urls = queue.lease(worker_id, batch_size, lease_duration)
+        if not urls:
+            if stop_when_drained and queue.stats().is_drained:
+                return processed_count
+            # Other workers still hold leases which may expire: wait for them
+            time.sleep(poll_interval)
+            continue
+
+        for url in urls:
+            try:
+                summary = analyser.analyse(url)
+            except Exception as e:
+                queue.fail(worker_id, url, f'{type(e).__name__}: {e}')
+            else:
+                # A worker whose lease was taken over doesn't own this result anymore
+                if queue.ack(worker_id, url, summary) and on_result is not None:
+                    on_result(url, summary)
+            processed_count += 1
+
+
+def wait_until_drained(queue: WorkQueue, poll_interval: float = 1, timeout: Optional[float] = None) -> QueueStats:
+    started_at = time.monotonic()
+    while True:
+        stats = queue.stats()
+        if stats.is_drained or (timeout is not None and time.monotonic() - started_at > timeout):
+            return stats
+        time.sleep(poll_interval)
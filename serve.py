@@ -0,0 +1,68 @@
+import argparse
+from scraper.dns_cache import DnsCache
+from scraper.doc_analyser import DocAnalyser
+from scraper.doc_fetcher import create_http2_fetcher, create_pooled_fetcher
+from scraper.extractors import available_extractors
+from scraper.profiling import SlowPageProfiler
+from scraper.service import AnalysisService, create_server
+
+arg_parser = argparse.ArgumentParser(description='Page analysis HTTP service (GET /analyse?url=..., GET /metrics).')
+arg_parser.add_argument('--host', default='0.0.0.0')
+arg_parser.add_argument('--port', type=int, default=8080)
+arg_parser.add_argument('--workers', type=int, default=8, help='pages fetched and parsed at the same time')
+arg_parser.add_argument('--parse-processes', type=int, default=0, help='size of the parsing process pool (0: parse in threads)')
+arg_parser.add_argument('--share-bodies-above', type=int, default=256 * 1024,
+                        help='hand bodies bigger than this (in bytes) to the parsing processes through shared memory')
+arg_parser.add_argument('--timeout', type=float, default=30,
+                        help='fetch timeout, in seconds (for the connection, and each wait for data)')
+arg_parser.add_argument('--cache-ttl', type=float, default=60, help='in seconds')
+arg_parser.add_argument('--cache-size', type=int, default=1000)
+arg_parser.add_argument('--max-doc-size', type=int, default=None, help='in bytes')
+arg_parser.add_argument('--approximate-above', type=int, default=None, help='only estimate the words stats of pages bigger than this (in bytes)')
+arg_parser.add_argument('--http2', action='store_true', help='multiplex the fetches to each site over a single HTTP/2 connection (needs httpx[http2])')
+arg_parser.add_argument('--dns-cache-ttl', type=float, default=300,
+                        help='keep the resolved host addresses this long, in seconds (0: resolve them for each new '
+                             'connection, not used with --http2)')
+arg_parser.add_argument('--profile-dir', default=None,
+                        help='save the profiles of the slowest and most memory hungry pages in this directory '
+                             '(pages parsed in the request threads only, not with --parse-processes)')
+arg_parser.add_argument('--profile-latency', type=float, default=5, help='profile pages analysed slower than this (in seconds)')
+arg_parser.add_argument('--profile-memory', type=int, default=256 * 1024 * 1024,
+                        help='profile pages whose analysis peaks at more than this memory (in bytes)')
+arg_parser.add_argument('--extract', metavar='EXTRACTOR', action='append', default=[],
+                        help=f'extract more data from the pages, among: {", ".join(available_extractors())}')
+args = arg_parser.parse_args()
+
+dns_cache = DnsCache(ttl=args.dns_cache_ttl) if args.dns_cache_ttl > 0 and not args.http2 else None
+if args.http2:
+    doc_fetcher = create_http2_fetcher(max_size=args.max_doc_size, html_only=True, timeout=args.timeout)
+else:
+    # Error pages and non-HTML documents are not parsed: their analysis only gives their status and content type
+    doc_fetcher = create_pooled_fetcher(pool_size=args.workers, max_size=args.max_doc_size, timeout=args.timeout,
+                                        dns_cache=dns_cache, structured=True)
+service = AnalysisService(
+    DocAnalyser(
+        doc_fetcher,
+        max_doc_size=args.max_doc_size,
+        html_only=True,
+        approximate_above=args.approximate_above,
+        extractors=args.extract,
+        profiler=SlowPageProfiler(args.profile_dir, latency_threshold=args.profile_latency,
+                                  memory_threshold=args.profile_memory) if args.profile_dir else None,
+    ),
+    workers=args.workers,
+    parse_processes=args.parse_processes,
+    share_bodies_above=args.share_bodies_above,
+    cache_ttl=args.cache_ttl,
+    cache_size=args.cache_size,
+    dns_cache=dns_cache,
+)
+server = create_server(service, args.host, args.port)
+print(f'Listening on http://{args.host}:{args.port}')
+try:
+    server.serve_forever()
+except KeyboardInterrupt:
+    pass
+finally:
+    server.server_close()
+    service.shutdown()